@@ -24,6 +24,11 @@ def test_isa_detection():
     print(f"AVX512 支持: {mm.has_avx512()}")
     print(f"NEON 支持: {mm.has_neon()}")
     print(f"FMA 支持: {mm.has_fma()}")
+    print()
+
+    print("=== 运行时分发 ===")
+    print(f"可用内核版本: {', '.join(mm.get_supported_isas())}")
+    print(f"当前内核版本: {mm.get_dispatch_isa()}")
 
 
 if __name__ == "__main__":
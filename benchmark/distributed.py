@@ -0,0 +1,521 @@
+#!/usr/bin/env python3
+"""
+多进程 / 多机的分块矩阵乘法 (SUMMA).
+
+C 按 pr x pc 的进程网格分成 tile, 每个 worker 负责一个. 内维按 panel 列宽切分,
+第 k 步把 A 的第 k 个列 panel 沿网格的行, B 的第 k 个行 panel 沿网格的列广播,
+各 worker 用 libmatmul 的内核原地累加 C_ij += A_ik @ B_kj (out= 与 beta=1,
+没有临时数组).
+
+传输方式可替换 (见 Transport):
+- SharedMemoryTransport: 单机. A, B, C 放在 multiprocessing.shared_memory 中, 广播 panel
+  就是把它写入共享内存并通知 worker; 协调者写第 k + 1 个 panel 时 worker 在计算第 k 个.
+- SocketTransport: 多机. panel 经 TCP 发送 (长度前缀的 JSON 头 + 原始字节), 每个 worker
+  由一个发送线程供给, worker 的接收线程最多预读两个 panel, 通信与计算重叠.
+  在其他主机上用 `python distributed.py --serve HOST:PORT` 启动 worker. 协议没有认证,
+  省略 HOST 时只监听 127.0.0.1, 只应在可信网络中监听其他地址.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import multiprocessing as mp
+import os
+import queue
+import socket
+import struct
+import sys
+import threading
+import traceback
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.connection import Connection
+from types import TracebackType
+from typing import Any, TypeAlias
+
+import libmatmul as matmul
+import numpy as np
+from numpy.typing import NDArray
+
+Array: TypeAlias = NDArray[Any]
+Range: TypeAlias = tuple[int, int]
+Panel: TypeAlias = tuple[Array, Array]
+
+DTYPES = (np.int32, np.int64, np.float32, np.float64)
+
+
+@dataclass(frozen=True)
+class Tile:
+    """一个 worker 负责的 C[rows[0]:rows[1], cols[0]:cols[1]]"""
+
+    rows: Range
+    cols: Range
+
+
+@dataclass(frozen=True)
+class Job:
+    """一次乘法: C[n x p] = A[n x m] @ B[m x p], 内维按 panels 切分"""
+
+    n: int
+    m: int
+    p: int
+    dtype: str
+    tiles: list[Tile]
+    panels: list[Range]
+    kernel: str
+    threads: int
+
+
+def split(n: int, parts: int) -> list[Range]:
+    """把 [0, n) 均匀分成 parts 段"""
+    return [(n * i // parts, n * (i + 1) // parts) for i in range(parts)]
+
+
+def grid_of(workers: int, n: int, p: int) -> tuple[int, int]:
+    """选择 pr x pc = workers 的进程网格, 使每个 worker 每步收到的 panel 元素
+    (n / pr + p / pc) 最少; 正方形的 C 得到接近正方形的网格"""
+    best = (1, workers)
+    for pr in range(1, workers + 1):
+        if workers % pr == 0:
+            pc = workers // pr
+            if n / pr + p / pc < n / best[0] + p / best[1]:
+                best = (pr, pc)
+    return best
+
+
+class Transport(ABC):
+    """协调者与 worker 之间的传输. Cluster.matmul 依次调用 start, 每个 panel 一次
+    broadcast, 最后 gather; broadcast 应尽快返回, 让 panel 的传输与 worker 的计算重叠"""
+
+    workers: int
+
+    @abstractmethod
+    def start(self, job: Job, a: Array, b: Array) -> None:
+        """把任务与各自的 tile 交给 worker"""
+
+    @abstractmethod
+    def broadcast(self, k: int) -> None:
+        """把第 k 个 panel (A[:, K] 与 B[K, :]) 交给需要它的 worker"""
+
+    @abstractmethod
+    def gather(self, c: Array) -> None:
+        """等待所有 worker 完成, 把各 tile 写入 c"""
+
+    @abstractmethod
+    def close(self) -> None:
+        """结束 worker 并释放资源"""
+
+
+def _compute(job: Job, k: int, a: Array, b: Array, c: Array) -> None:
+    """c (worker 的 tile) 累加第 k 个 panel 的乘积; 第一个 panel 覆盖 c"""
+    if c.size == 0:
+        return
+    kernel = getattr(matmul, job.kernel)
+    kernel(a, b, out=c, beta=0 if k == 0 else 1, threads=job.threads or None)
+
+
+# ---- 共享内存 ----
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """打开协调者创建的共享内存. 生命周期由协调者管理, 不登记到 resource_tracker,
+    否则 worker 退出时会被当作泄漏而删除"""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    resource_tracker.unregister(shm._name, "shared_memory")  # type: ignore[attr-defined]
+    return shm
+
+
+def _shm_worker(conn: Connection) -> None:
+    """共享内存 worker: 收到任务后按 panel 通知逐个计算, 完成后回复 done"""
+    while True:
+        message = conn.recv()
+        if message is None:
+            return
+        job, tile, names = message
+        segments = [_attach(name) for name in names]
+        try:
+            dtype = np.dtype(job.dtype)
+            a = np.ndarray((job.n, job.m), dtype, segments[0].buf)
+            b = np.ndarray((job.m, job.p), dtype, segments[1].buf)
+            c = np.ndarray((job.n, job.p), dtype, segments[2].buf)
+            (i0, i1), (j0, j1) = tile.rows, tile.cols
+            error = None
+            for k in range(len(job.panels)):
+                k0, k1 = conn.recv()
+                if error is None:
+                    # 内核的任何错误都转发给协调者, 在那里重新抛出
+                    try:
+                        x, y = a[i0:i1, k0:k1], b[k0:k1, j0:j1]
+                        _compute(job, k, x, y, c[i0:i1, j0:j1])
+                    except Exception:  # noqa: BLE001
+                        error = traceback.format_exc()
+            del a, b, c
+            conn.send(error)
+        finally:
+            for shm in segments:
+                shm.close()
+
+
+class SharedMemoryTransport(Transport):
+    """单机传输: workers 个本地进程, 操作数与结果放在共享内存中"""
+
+    def __init__(self, workers: int) -> None:
+        self.workers = workers
+        context = mp.get_context()
+        self.conns: list[Connection] = []
+        self.processes: list[Any] = []
+        for _ in range(workers):
+            parent, child = context.Pipe()
+            process = context.Process(target=_shm_worker, args=(child,), daemon=True)
+            process.start()
+            child.close()
+            self.conns.append(parent)
+            self.processes.append(process)
+        self.segments: list[shared_memory.SharedMemory] = []
+
+    def _segment(self, shape: tuple[int, int], dtype: np.dtype[Any]) -> Array:
+        size = max(1, shape[0] * shape[1] * dtype.itemsize)
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        self.segments.append(shm)
+        return np.ndarray(shape, dtype, shm.buf)
+
+    def start(self, job: Job, a: Array, b: Array) -> None:
+        self._release()
+        self.a, self.b = a, b
+        self.job = job
+        dtype = np.dtype(job.dtype)
+        self.a_shared = self._segment((job.n, job.m), dtype)
+        self.b_shared = self._segment((job.m, job.p), dtype)
+        self.c_shared = self._segment((job.n, job.p), dtype)
+        names = [shm.name for shm in self.segments]
+        for conn, tile in zip(self.conns, job.tiles, strict=True):
+            conn.send((job, tile, names))
+
+    def broadcast(self, k: int) -> None:
+        k0, k1 = self.job.panels[k]
+        self.a_shared[:, k0:k1] = self.a[:, k0:k1]
+        self.b_shared[k0:k1] = self.b[k0:k1]
+        for conn in self.conns:
+            conn.send((k0, k1))
+
+    def gather(self, c: Array) -> None:
+        errors = [conn.recv() for conn in self.conns]
+        failed = [e for e in errors if e is not None]
+        if not failed:
+            np.copyto(c, self.c_shared)
+        del self.a, self.b
+        self._release()
+        if failed:
+            raise RuntimeError("worker failed:\n" + failed[0])
+
+    def _release(self) -> None:
+        for name in ("a_shared", "b_shared", "c_shared"):
+            self.__dict__.pop(name, None)
+        for shm in self.segments:
+            shm.close()
+            shm.unlink()
+        self.segments = []
+
+    def close(self) -> None:
+        self._release()
+        for conn in self.conns:
+            with contextlib.suppress(OSError):
+                conn.send(None)
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for conn in self.conns:
+            conn.close()
+
+
+# ---- 套接字 ----
+
+_HEADER = struct.Struct("!Q")
+
+
+def send_message(sock: socket.socket, header: dict[str, Any], *arrays: Array) -> None:
+    """发送长度前缀的 JSON 头, 随后依次是各数组的原始字节 (行主序)"""
+    arrays = tuple(np.ascontiguousarray(x) for x in arrays)
+    header = dict(header, arrays=[[x.dtype.str, list(x.shape)] for x in arrays])
+    data = json.dumps(header).encode()
+    sock.sendall(_HEADER.pack(len(data)) + data)
+    for x in arrays:
+        if x.nbytes:
+            sock.sendall(memoryview(x).cast("B"))
+
+
+def _recv_exact(sock: socket.socket, buffer: memoryview) -> None:
+    while len(buffer):
+        count = sock.recv_into(buffer)
+        if count == 0:
+            raise ConnectionError("connection closed")
+        buffer = buffer[count:]
+
+
+def recv_message(sock: socket.socket) -> tuple[dict[str, Any], list[Array]]:
+    """接收 send_message 发送的消息, 数组直接读入新分配的缓冲区"""
+    size = bytearray(_HEADER.size)
+    _recv_exact(sock, memoryview(size))
+    data = bytearray(_HEADER.unpack(size)[0])
+    _recv_exact(sock, memoryview(data))
+    header = json.loads(data)
+    arrays = []
+    for dtype, shape in header.pop("arrays"):
+        x = np.empty(shape, dtype=np.dtype(dtype))
+        if x.nbytes:
+            _recv_exact(sock, memoryview(x).cast("B"))
+        arrays.append(x)
+    return header, arrays
+
+
+def _receive(sock: socket.socket, count: int,
+             panels: queue.Queue[Panel | BaseException]) -> None:
+    """worker 的接收线程: 依次读入 count 个 panel 放入 panels, 出错时放入异常"""
+    try:
+        for _ in range(count):
+            _, (a, b) = recv_message(sock)
+            panels.put((a, b))
+    except BaseException as e:  # noqa: BLE001 - 交给计算线程重新抛出
+        panels.put(e)
+
+
+def _serve_connection(sock: socket.socket) -> None:
+    """处理一个协调者连接上的任务, 直到收到 close 或连接断开"""
+    while True:
+        header, _ = recv_message(sock)
+        if header["op"] == "close":
+            return
+        fields = header["job"]
+        ranges = [tuple(r) for r in fields["panels"]]
+        job = Job(**{**fields, "tiles": [], "panels": ranges})
+        rows, cols = header["rows"], header["cols"]
+        # 接收线程预读 panel, 与计算重叠; 最多缓存两个, 控制内存
+        panels: queue.Queue[Panel | BaseException] = queue.Queue(maxsize=2)
+        receiver = threading.Thread(
+            target=_receive, args=(sock, len(job.panels), panels), daemon=True)
+        receiver.start()
+        c = np.empty((rows, cols), dtype=np.dtype(job.dtype))
+        error = None
+        for k in range(len(job.panels)):
+            item = panels.get()
+            if isinstance(item, BaseException):
+                raise item
+            if error is None:
+                try:
+                    _compute(job, k, item[0], item[1], c)
+                except Exception:  # noqa: BLE001 - 发回协调者
+                    error = traceback.format_exc()
+        receiver.join()
+        if error is None:
+            send_message(sock, {"op": "result"}, c)
+        else:
+            send_message(sock, {"op": "error", "message": error})
+
+
+def serve(listener: socket.socket) -> None:
+    """socket worker: 逐个接受协调者的连接并处理, 协调者关闭连接后等待下一个"""
+    while True:
+        sock, _ = listener.accept()
+        with sock:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with contextlib.suppress(ConnectionError):
+                _serve_connection(sock)
+
+
+def _serve_local(conn: Connection) -> None:
+    """本地替身: 在 127.0.0.1 的任意端口上监听, 把端口告诉父进程"""
+    listener = socket.create_server(("127.0.0.1", 0))
+    conn.send(listener.getsockname()[1])
+    conn.close()
+    serve(listener)
+
+
+class SocketTransport(Transport):
+    """多机传输: 连接到 addresses 上运行 serve 的 worker, panel 与 tile 经 TCP 传输"""
+
+    def __init__(self, addresses: list[tuple[str, int]],
+                 processes: list[Any] | None = None) -> None:
+        self.workers = len(addresses)
+        self.socks = [socket.create_connection(address) for address in addresses]
+        for sock in self.socks:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.processes = processes or []
+        self.senders: list[threading.Thread] = []
+
+    @classmethod
+    def local(cls, workers: int) -> SocketTransport:
+        """在本机启动 workers 个监听 localhost 的 worker 进程, 代替远程主机"""
+        context = mp.get_context()
+        addresses, processes = [], []
+        for _ in range(workers):
+            parent, child = context.Pipe()
+            process = context.Process(target=_serve_local, args=(child,), daemon=True)
+            process.start()
+            child.close()
+            addresses.append(("127.0.0.1", parent.recv()))
+            parent.close()
+            processes.append(process)
+        return cls(addresses, processes)
+
+    def _send(self, w: int, tile: Tile, c: Array) -> None:
+        """worker w 的发送线程: 按顺序发送任务与各 panel 中属于它的部分,
+        然后接收 tile"""
+        sock, pending = self.socks[w], self.pending[w]
+        (i0, i1), (j0, j1) = tile.rows, tile.cols
+        try:
+            job = self.job
+            ranges = [list(r) for r in job.panels]
+            send_message(sock, {
+                "op": "job", "rows": i1 - i0, "cols": j1 - j0,
+                "job": {**job.__dict__, "tiles": [], "panels": ranges},
+            })
+            for _ in job.panels:
+                k0, k1 = pending.get()
+                x, y = self.a[i0:i1, k0:k1], self.b[k0:k1, j0:j1]
+                send_message(sock, {"op": "panel"}, x, y)
+            header, arrays = recv_message(sock)
+            if header["op"] == "error":
+                raise RuntimeError("worker failed:\n" + header["message"])
+            c[i0:i1, j0:j1] = arrays[0]
+        except BaseException as e:  # noqa: BLE001 - 由 gather 重新抛出
+            self.errors.append(e)
+
+    def start(self, job: Job, a: Array, b: Array) -> None:
+        self.job, self.a, self.b = job, a, b
+        self.pending: list[queue.Queue[Range]] = [queue.Queue() for _ in self.socks]
+        self.errors: list[BaseException] = []
+        self.result = np.empty((job.n, job.p), dtype=np.dtype(job.dtype))
+        self.senders = [
+            threading.Thread(
+                target=self._send, args=(w, tile, self.result), daemon=True)
+            for w, tile in enumerate(job.tiles)
+        ]
+        for sender in self.senders:
+            sender.start()
+
+    def broadcast(self, k: int) -> None:
+        for pending in self.pending:
+            pending.put(self.job.panels[k])
+
+    def gather(self, c: Array) -> None:
+        for sender in self.senders:
+            sender.join()
+        self.senders = []
+        del self.a, self.b
+        if self.errors:
+            # 连接的状态已不确定, 不再使用
+            self.close()
+            raise self.errors[0]
+        np.copyto(c, self.result)
+        del self.result
+
+    def close(self) -> None:
+        for sock in self.socks:
+            with contextlib.suppress(OSError):
+                send_message(sock, {"op": "close"})
+            sock.close()
+        self.socks = []
+        for process in self.processes:
+            process.terminate()
+            process.join(timeout=5)
+        self.processes = []
+
+
+# ---- 协调者 ----
+
+
+class Cluster:
+    """一组 worker; 用作上下文管理器, 退出时关闭 worker"""
+
+    def __init__(self, transport: Transport) -> None:
+        self.transport = transport
+
+    def matmul(self, a: Array, b: Array, *, out: Array | None = None,
+               kernel: str = "gemm", panel: int = 256,
+               threads: int | None = None) -> Array:
+        """计算 a @ b, 未给出 out 时返回新数组.
+
+        kernel 为 libmatmul 的内核名称; 共享内存传输中 panel 是大矩阵的切片,
+        需要接受任意步长的内核 (gemm, multithread_gemm). threads 为每个 worker
+        的线程数, 默认平分本机的 CPU.
+        """
+        if a.ndim != 2 or b.ndim != 2:
+            raise RuntimeError("Matrix multiplication expects 2-D arrays")
+        if a.dtype != b.dtype or a.dtype.type not in DTYPES:
+            raise TypeError("`a` and `b` must have the same dtype, "
+                            "one of int32, int64, float32, float64")
+        if a.shape[1] != b.shape[0]:
+            raise RuntimeError("Incompatible shapes for matrix multiplication")
+        if panel < 1:
+            raise ValueError("`panel` must be positive")
+        if not hasattr(matmul, kernel):
+            raise ValueError(f"Unknown kernel: {kernel}")
+        (n, m), p = a.shape, b.shape[1]
+        if out is None:
+            out = np.empty((n, p), dtype=a.dtype)
+        elif out.shape != (n, p) or out.dtype != a.dtype:
+            raise ValueError(f"`out` must be a {a.dtype} array of shape ({n}, {p})")
+        if m == 0:
+            out[...] = 0
+            return out
+        workers = self.transport.workers
+        pr, pc = grid_of(workers, n, p)
+        tiles = [Tile(rows, cols) for rows in split(n, pr) for cols in split(p, pc)]
+        if threads is None:
+            threads = max(1, (os.cpu_count() or 1) // workers)
+        panels = [(k, min(k + panel, m)) for k in range(0, m, panel)]
+        job = Job(n, m, p, a.dtype.str, tiles, panels, kernel, threads)
+        self.transport.start(job, a, b)
+        for k in range(len(job.panels)):
+            self.transport.broadcast(k)
+        self.transport.gather(out)
+        return out
+
+    def close(self) -> None:
+        self.transport.close()
+
+    def __enter__(self) -> Cluster:
+        return self
+
+    def __exit__(self, kind: type[BaseException] | None, value: BaseException | None,
+                 tb: TracebackType | None) -> None:
+        self.close()
+
+
+def local_cluster(workers: int = 2, transport: str = "shm") -> Cluster:
+    """本机的 workers 个 worker 进程; transport 为 "shm" (共享内存)
+    或 "socket" (localhost TCP)"""
+    if workers < 1:
+        raise ValueError("`workers` must be positive")
+    if transport == "shm":
+        return Cluster(SharedMemoryTransport(workers))
+    if transport == "socket":
+        return Cluster(SocketTransport.local(workers))
+    raise ValueError(f"Unknown transport: {transport}")
+
+
+def remote_cluster(addresses: list[tuple[str, int]]) -> Cluster:
+    """连接到各主机上用 --serve 启动的 worker"""
+    return Cluster(SocketTransport(addresses))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Distributed SUMMA worker")
+    parser.add_argument("--serve", metavar="HOST:PORT", required=True,
+                        help="listen for a coordinator on this address; the protocol "
+                             "is unauthenticated, so HOST defaults to 127.0.0.1 and "
+                             "should only be opened on a trusted network")
+    args = parser.parse_args()
+    host, _, port = args.serve.rpartition(":")
+    with socket.create_server((host or "127.0.0.1", int(port))) as listener:
+        serve(listener)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,39 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from collections.abc import Callable
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, TypeAlias
+
 import libmatmul as matmul
-from typing import Any, Callable, TypeAlias
 import numpy as np
-import time
-from timeit import repeat
 from numpy.typing import NDArray
-import argparse
-import matplotlib.pyplot as plt
-from matplotlib.figure import Figure
 
 # Type aliases
 IntArray: TypeAlias = NDArray[np.int32]
 MatmulFunc: TypeAlias = Callable[[IntArray, IntArray], IntArray]
+Shape: TypeAlias = tuple[int, int, int]
+Record: TypeAlias = dict[str, Any]
+
+# 默认扫描的形状 (N, M, P): 方阵, 矩形, 以及不是 SIMD 宽度倍数的奇数尺寸
+SQUARE_SHAPES: list[Shape] = [(n, n, n) for n in (64, 128, 256, 512, 1024)]
+RECT_SHAPES: list[Shape] = [
+    (1024, 64, 1024), (64, 1024, 64), (2048, 256, 32), (32, 256, 2048), (4096, 4096, 1),
+]
+ODD_SHAPES: list[Shape] = [
+    (127, 255, 129), (333, 517, 191), (1000, 3, 1000), (17, 999, 33),
+]
+SHAPE_SETS: dict[str, list[Shape]] = {
+    "square": SQUARE_SHAPES, "rect": RECT_SHAPES, "odd": ODD_SHAPES,
+}
+
+DTYPES: dict[str, type] = {
+    "int32": np.int32, "int64": np.int64, "float32": np.float32, "float64": np.float64,
+}
 
 
 def py_matmul(a: IntArray, b: IntArray) -> IntArray:
@@ -18,7 +41,7 @@ def py_matmul(a: IntArray, b: IntArray) -> IntArray:
     assert a.shape[1] == b.shape[0], "Incompatible shapes for matrix multiplication"
     m = a.shape[1]
     p = b.shape[1]
-    c = np.zeros((n, p), dtype=np.int32)
+    c = np.zeros((n, p), dtype=a.dtype)
     for i in range(n):
         for j in range(p):
             for k in range(m):
@@ -26,45 +49,211 @@ def py_matmul(a: IntArray, b: IntArray) -> IntArray:
     return c
 
 
-def run(func: Callable[..., Any], n_warmup: int = 1, n_iters: int = 3) -> float:
-    nums = 2
-    times = repeat(func, number=nums, repeat=n_iters)
-    return np.mean(times[n_warmup:]).item() / nums
+def run(
+    func: Callable[[], Any],
+    min_time: float = 0.2,
+    min_repeat: int = 5,
+    max_repeat: int = 100,
+    max_warmup: int = 10,
+) -> list[float]:
+    """计时 func 的单次调用, 返回各次的秒数.
 
+    预热直到相邻两次耗时相差不到 10% (缓存, 页表与线程池都已就绪)
+    或达到 max_warmup 次;
+    之后至少采样 min_repeat 次, 并继续采样到累计 min_time 秒或 max_repeat 次.
+    """
+    previous = None
+    for _ in range(max_warmup):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if previous is not None and abs(elapsed - previous) <= 0.1 * previous:
+            break
+        previous = elapsed
+        # 单次就超过 min_time 的慢内核不再继续预热
+        if elapsed > min_time:
+            break
+    samples: list[float] = []
+    while len(samples) < max_repeat and (
+        len(samples) < min_repeat or sum(samples) < min_time
+    ):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
 
-def benchmark(func: MatmulFunc, name: str, n: int = 512) -> float:
-    print(f"benchmarking {name} with N={n}...", end=" ")
-    a = np.random.randint(-10, 10, size=(n, n), dtype=np.int32)
-    b = np.random.randint(-10, 10, size=(n, n), dtype=np.int32)
-    t0 = run(lambda: func(a, b)) * 1000
-    print(f"{t0:.4f}ms")
-    return t0
 
+def random_operands(
+    shape: Shape, dtype: type, seed: int = 0
+) -> tuple[NDArray[Any], NDArray[Any]]:
+    n, m, p = shape
+    rng = np.random.default_rng(seed)
+    a = rng.integers(-10, 10, size=(n, m)).astype(dtype)
+    b = rng.integers(-10, 10, size=(m, p)).astype(dtype)
+    return a, b
 
-def visualize_markdown(
-    funcs: list[tuple[MatmulFunc, str]], n: int = 512, gap: int = 10
-) -> None:
-    results: list[tuple[str, float, float]] = []
 
-    for func, name in funcs:
-        time_ms = benchmark(func, name, n)
-        results.append((name, time_ms, 0.0))
-        time.sleep(gap)
+def check(c: NDArray[Any], expected: NDArray[Any]) -> bool:
+    if np.issubdtype(expected.dtype, np.integer):
+        return bool(np.array_equal(c, expected))
+    # 操作数是小整数, 浮点误差只来自超过尾数精度的部分和
+    rtol = 1e-5 if expected.dtype == np.float32 else 1e-12
+    return bool(np.allclose(c, expected, rtol=rtol, atol=rtol * expected.shape[0]))
+
+
+def profile(func: MatmulFunc, a: NDArray[Any], b: NDArray[Any],
+            events: list[str]) -> Record | None:
+    """用 libmatmul.profile 统计一次调用的性能计数器 (各线程之和).
+
+    非 libmatmul 内核为 None.
+    """
+    try:
+        return dict(matmul.profile(func, a, b, events or None)["events"])
+    except (ValueError, TypeError):
+        return None
+
+
+def benchmark(func: MatmulFunc, name: str, shape: Shape, dtype: type = np.int32, *,
+              min_time: float = 0.2, counters: list[str] | None = None) -> Record:
+    n, m, p = shape
+    print(f"benchmarking {name} with {n}x{m}x{p} {np.dtype(dtype).name}...",
+          end=" ", flush=True)
+    a, b = random_operands(shape, dtype)
+    correct = check(func(a, b), np.matmul(a, b))
+    samples = np.array(run(lambda: func(a, b), min_time=min_time))
+    median = float(np.median(samples))
+    record: Record = {
+        "kernel": name,
+        "dtype": np.dtype(dtype).name,
+        "shape": [n, m, p],
+        "samples": len(samples),
+        "median": median,
+        "p5": float(np.percentile(samples, 5)),
+        "p95": float(np.percentile(samples, 95)),
+        # 每次乘加记作两次运算; 整数类型同样计入, 单位为 GOP/s
+        "gops": 2 * n * m * p / median / 1e9,
+        "correct": correct,
+    }
+    if counters is not None:
+        record["counters"] = profile(func, a, b, counters)
+    status = "" if correct else "  WRONG RESULT"
+    print(f"{median * 1000:.4f}ms  {record['gops']:.2f} GOP/s{status}")
+    return record
 
-    for i, (name, time_ms, _) in enumerate(results):
-        speedup = results[0][1] / time_ms
-        results[i] = (name, time_ms, speedup)
 
+def host_info() -> Record:
+    return {
+        "time": datetime.now(timezone.utc).isoformat(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "isa": matmul.get_dispatch_isa(),
+        "threads": matmul.get_num_threads(),
+        "affinity": matmul.get_affinity(),
+        "compiler": matmul.get_compiler_info(),
+        "build": matmul.get_build_info(),
+        "numpy": np.__version__,
+    }
+
+
+def measure_peaks(
+    dtypes: list[type], size: int = 1024, min_time: float = 0.2
+) -> Record:
+    """测量本机的峰值, 作为 roofline 的上界.
+
+    计算峰值取 numpy 与 multithread_gemm 在 size 方阵上较高的 GOP/s (按类型),
+    内存带宽取复制 256 MiB 数组的 GB/s (读写各计一次).
+    """
+    gops: dict[str, float] = {}
+    for dtype in dtypes:
+        a, b = random_operands((size, size, size), dtype)
+        best = min(
+            float(np.median(run(lambda f=f, a=a, b=b: f(a, b), min_time=min_time)))
+            for f in (np.matmul, matmul.multithread_gemm)
+        )
+        gops[np.dtype(dtype).name] = 2 * size**3 / best / 1e9
+    src = np.ones(1 << 25, dtype=np.float64)
+    dst = np.empty_like(src)
+    seconds = float(np.median(run(lambda: np.copyto(dst, src), min_time=min_time)))
+    peaks: Record = {"gops": gops, "bandwidth": 2 * src.nbytes / seconds / 1e9}
+    print(f"peaks: {', '.join(f'{k} {v:.1f} GOP/s' for k, v in gops.items())}, "
+          f"memory {peaks['bandwidth']:.1f} GB/s")
+    return peaks
+
+
+def sweep(funcs: list[tuple[MatmulFunc, str]], shapes: list[Shape], dtypes: list[type],
+          *, gap: float = 0.0, min_time: float = 0.2,
+          counters: list[str] | None = None) -> list[Record]:
+    results: list[Record] = []
+    for dtype in dtypes:
+        for shape in shapes:
+            for func, name in funcs:
+                results.append(benchmark(func, name, shape, dtype,
+                                         min_time=min_time, counters=counters))
+                time.sleep(gap)
+    return results
+
+
+def compare(
+    results: list[Record], baseline: list[Record], threshold: float = 0.05
+) -> list[Record]:
+    """对比基线, 返回退化的条目.
+
+    中位数变慢超过 threshold, 且本次的 p5 仍慢于基线的 p95 (两次的分布不重叠)
+    时记为退化, 以免把噪声当作退化.
+    """
+    def key(r: Record) -> tuple[str, str, tuple[int, ...]]:
+        return r["kernel"], r["dtype"], tuple(r["shape"])
+
+    base = {key(r): r for r in baseline}
+    regressions: list[Record] = []
+    print("\n| Kernel              | dtype   | Shape            | Baseline(ms) "
+          "| Now(ms)  | Change  |")
+    print("|---------------------|---------|------------------|--------------|----------"
+          "|---------|")
+    for r in results:
+        b = base.get(key(r))
+        if b is None:
+            continue
+        change = r["median"] / b["median"] - 1
+        regressed = change > threshold and r["p5"] > b["p95"]
+        if regressed:
+            regressions.append({**r, "baseline": b["median"], "change": change})
+        shape = "x".join(map(str, r["shape"]))
+        flag = "  REGRESSION" if regressed else ""
+        print(f"| {r['kernel']:<19} | {r['dtype']:<7} | {shape:<16} | "
+              f"{b['median'] * 1000:12.4f} | {r['median'] * 1000:8.4f} | "
+              f"{change:+7.1%} |{flag}")
+    return regressions
+
+
+def visualize_markdown(results: list[Record]) -> None:
     print("\nResult")
-    print("| Method              | Time(ms) | Speedup over `np.matmul` |")
-    print("|---------------------|----------|--------------------------|")
-    for name, time_ms, speedup in results:
-        print(f"| {name:<19} | {time_ms:8.4f} | {speedup:8.4f}x                |")
+    print("| Method              | dtype   | Shape            | Median(ms) "
+          "| p5-p95(ms)          | GOP/s    | Speedup over `np.matmul` |")
+    print("|---------------------|---------|------------------|------------"
+          "|---------------------|----------|--------------------------|")
+    numpy_time = {(r["dtype"], tuple(r["shape"])): r["median"]
+                  for r in results if r["kernel"] == "numpy"}
+    for r in results:
+        base = numpy_time.get((r["dtype"], tuple(r["shape"])))
+        speedup = f"{base / r['median']:8.4f}x" if base else "       -"
+        shape = "x".join(map(str, r["shape"]))
+        spread = f"{r['p5'] * 1000:.4f}-{r['p95'] * 1000:.4f}"
+        wrong = " (wrong)" if not r["correct"] else ""
+        print(f"| {r['kernel']:<19} | {r['dtype']:<7} | {shape:<16} "
+              f"| {r['median'] * 1000:10.4f} | {spread:<19} | {r['gops']:8.2f} "
+              f"| {speedup}{wrong:<15} |")
+
 
+def visualize_matplotlib(
+    funcs: list[tuple[MatmulFunc, str]], n: int, gap: float
+) -> None:
+    # 只有画图时才需要 matplotlib
+    import matplotlib.pyplot as plt
 
-def visualize_matplotlib(funcs: list[tuple[MatmulFunc, str]], n: int, gap: int) -> None:
     # 创建两个子图
-    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 6))
+    _, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 6))
 
     # 图1: 不同矩阵大小的耗时曲线
     sizes: list[int] = [64]
@@ -76,8 +265,7 @@ def visualize_matplotlib(funcs: list[tuple[MatmulFunc, str]], n: int, gap: int)
     for i, (func, name) in enumerate(funcs):
         times = []
         for size in sizes:
-            time_ms = benchmark(func, name, size)
-            times.append(time_ms)
+            times.append(benchmark(func, name, (size, size, size))["median"] * 1000)
 
         ax1.plot(sizes, times, marker="o", label=name,
                  color=colors[i], linewidth=2)
@@ -98,9 +286,8 @@ def visualize_matplotlib(funcs: list[tuple[MatmulFunc, str]], n: int, gap: int)
     times = []
 
     for func, name in funcs:
-        time_ms = benchmark(func, name, n)
         names.append(name)
-        times.append(time_ms)
+        times.append(benchmark(func, name, (n, n, n))["median"] * 1000)
         time.sleep(gap)
 
     bars = ax2.bar(range(len(names)), times,
@@ -113,7 +300,7 @@ def visualize_matplotlib(funcs: list[tuple[MatmulFunc, str]], n: int, gap: int)
     ax2.grid(True, alpha=0.3, axis="y")
 
     # 在柱状图上显示数值
-    for bar, time_ms in zip(bars, times):
+    for bar, time_ms in zip(bars, times, strict=True):
         height = bar.get_height()
         ax2.text(
             bar.get_x() + bar.get_width() / 2.0,
@@ -130,19 +317,78 @@ def visualize_matplotlib(funcs: list[tuple[MatmulFunc, str]], n: int, gap: int)
     # 计算并打印加速比
     print(f"\nSpeedup over numpy (size={n}):")
     baseline_time = times[0]  # numpy 的时间
-    for name, time_ms in zip(names, times):
+    for name, time_ms in zip(names, times, strict=True):
         speedup = baseline_time / time_ms
         print(f"  {name:<19}: {speedup:.4f}x")
 
 
+def parse_shape(text: str) -> list[Shape]:
+    if text in SHAPE_SETS:
+        return SHAPE_SETS[text]
+    parts = [int(x) for x in text.lower().replace("x", ",").split(",")]
+    if len(parts) == 1:
+        parts *= 3
+    if len(parts) != 3:
+        raise argparse.ArgumentTypeError(
+            f"invalid shape {text!r}, expected N, NxMxP or a set name")
+    n, m, p = parts
+    return [(n, m, p)]
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(
         description="Matrix multiplication benchmark")
     parser.add_argument(
-        "--size", type=int, default=512, help="size of the matrices (default: 512)"
+        "--size", type=int, default=512,
+        help="size of the square matrices for --matplotlib (default: 512)"
+    )
+    parser.add_argument(
+        "--shapes", nargs="+", type=parse_shape, default=None,
+        help="shapes to sweep: N, NxMxP, or a set name "
+             f"({', '.join(SHAPE_SETS)}; default: all sets)"
+    )
+    parser.add_argument(
+        "--dtypes", nargs="+", choices=list(DTYPES), default=["int32"],
+        help="element types to sweep (default: int32)"
+    )
+    parser.add_argument(
+        "--kernels", nargs="+", default=None,
+        help="only benchmark kernels whose name contains one of these strings"
+    )
+    parser.add_argument(
+        "--threads", type=int, default=None,
+        help="number of kernel threads (default: libmatmul's default)"
+    )
+    parser.add_argument(
+        "--affinity", choices=["none", "compact", "spread"], default="compact",
+        help="thread pinning mode (default: compact)"
+    )
+    parser.add_argument(
+        "--min-time", type=float, default=0.2,
+        help="minimum measured seconds per kernel and shape (default: 0.2)"
     )
     parser.add_argument(
-        "--gap", type=int, default=10, help="time gap between methods (default: 10)"
+        "--counters", nargs="*", metavar="EVENT", default=None,
+        help="record perf counters of one extra call per libmatmul kernel "
+             "(default events without arguments; see libmatmul.get_profile_events())"
+    )
+    parser.add_argument(
+        "--gap", type=float, default=0.0, help="time gap between methods (default: 0)"
+    )
+    parser.add_argument(
+        "--json", metavar="PATH", default=None, help="write the results as JSON to PATH"
+    )
+    parser.add_argument(
+        "--no-peaks", action="store_true", default=False,
+        help="do not measure peak compute and memory bandwidth for --json"
+    )
+    parser.add_argument(
+        "--compare", metavar="BASELINE", default=None,
+        help="compare against a JSON file written by --json; exit with 1 on regressions"
+    )
+    parser.add_argument(
+        "--threshold", type=float, default=0.05,
+        help="relative slowdown of the median counted as a regression (default: 0.05)"
     )
     parser.add_argument(
         "--matplotlib",
@@ -170,14 +416,60 @@ def main() -> None:
         (matmul.simd, "SIMD (manual)"),
         (matmul.simd_optimized, "SIMD (optimized)"),
         (matmul.multithread_simd, "SIMD, multi-thread"),
+        (matmul.gemm, "GEMM (packed)"),
+        (matmul.multithread_gemm, "GEMM, multi-thread"),
+        (matmul.strassen, "Strassen"),
+        (matmul.matmul, "auto (tuned)"),
     ]
     if args.python:
         funcs.append((py_matmul, "pure Python"))
+    if args.kernels:
+        # numpy 作为加速比的基准总是保留
+        funcs = [
+            (f, name) for f, name in funcs
+            if name == "numpy" or any(k.lower() in name.lower() for k in args.kernels)
+        ]
+
+    matmul.set_affinity(args.affinity)
+    if args.threads is not None:
+        matmul.set_num_threads(args.threads)
 
     if args.matplotlib:
         visualize_matplotlib(funcs, n=args.size, gap=args.gap)
-    else:
-        visualize_markdown(funcs, n=args.size, gap=args.gap)
+        return
+
+    shapes = ([s for group in args.shapes for s in group] if args.shapes
+              else [s for group in SHAPE_SETS.values() for s in group])
+    dtypes = [DTYPES[d] for d in args.dtypes]
+    if args.counters is not None:
+        # 在开始扫描前确认本机可以计数, 而不是在每个内核上报错
+        a, b = random_operands((8, 8, 8), np.float32)
+        matmul.profile(matmul.gemm, a, b, args.counters or None)
+    results = sweep(funcs, shapes, dtypes, gap=args.gap, min_time=args.min_time,
+                    counters=args.counters)
+    visualize_markdown(results)
+
+    if args.json:
+        report: Record = {"host": host_info()}
+        if not args.no_peaks:
+            report["peaks"] = measure_peaks(dtypes, min_time=args.min_time)
+        report["results"] = results
+        with Path(args.json).open("w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nwrote {len(results)} results to {args.json}")
+
+    failed = [r for r in results if not r["correct"]]
+    for r in failed:
+        shape = "x".join(map(str, r["shape"]))
+        print(f"wrong result: {r['kernel']} {r['dtype']} {shape}")
+    regressions: list[Record] = []
+    if args.compare:
+        with Path(args.compare).open() as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}")
+    if failed or regressions:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
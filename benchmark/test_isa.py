@@ -39,6 +39,10 @@ def test_isa_detection():
     else:
         print("? Target: Unknown architecture")
 
+    print("\n=== Runtime Dispatch ===")
+    print(f"Supported kernel variants: {', '.join(mm.get_supported_isas())}")
+    print(f"Selected kernel variant: {mm.get_dispatch_isa()}")
+
 
 if __name__ == "__main__":
     test_isa_detection()
@@ -1,7 +1,11 @@
 import libmatmul as matmul
+import distributed
+import asyncio
 import os
+import pathlib
+import tempfile
 import numpy as np
-from timeit import timeit
+import pytest
 
 
 def test_hello():
@@ -10,10 +14,10 @@ def test_hello():
 def check(func):
     a = np.array([
         [1, 2, 3, 4], [5, 6, 7, 8]
-    ])
+    ], dtype=np.int32)
     b = np.array([
         [1, 2], [3, 4], [5, 6], [7, 8]
-    ])
+    ], dtype=np.int32)
     # a = np.array([[1, 2, 3, 4]])
     # b = np.array([[1], [2], [3], [4]])
     c = func(a, b)
@@ -44,6 +48,932 @@ def test_simd_optimized():
     check(matmul.simd_optimized)
     pass
 
+def check_blocked(func):
+    # 覆盖多个 KC/MC 分块以及不足 MR/NR 的边缘 tile
+    rng = np.random.default_rng(0)
+    a = rng.integers(-10, 10, size=(301, 517), dtype=np.int32)
+    b = rng.integers(-10, 10, size=(517, 129), dtype=np.int32)
+    assert np.array_equal(func(a, b), np.matmul(a, b))
+
+def test_gemm():
+    check(matmul.gemm)
+    check_blocked(matmul.gemm)
+
+def test_multithread_gemm():
+    check(matmul.multithread_gemm)
+    check_blocked(matmul.multithread_gemm)
+
+def test_dispatch():
+    isas = matmul.get_supported_isas()
+    assert isas[-1] == "baseline"
+    default = matmul.get_dispatch_isa()
+    assert default in isas
+    try:
+        for isa in isas:
+            matmul.set_dispatch_isa(isa)
+            assert matmul.get_dispatch_isa() == isa
+            for func in [matmul.auto_simd, matmul.simd, matmul.simd_optimized,
+                         matmul.multithread_simd, matmul.gemm, matmul.multithread_gemm]:
+                check(func)
+            check_blocked(matmul.gemm)
+    finally:
+        matmul.set_dispatch_isa(default)
+
+def test_submit():
+    rng = np.random.default_rng(1)
+    pairs = [(rng.integers(-10, 10, size=(n, n + 3), dtype=np.int32),
+              rng.integers(-10, 10, size=(n + 3, n), dtype=np.int32))
+             for n in (17, 64, 130)]
+    futures = [matmul.submit(a, b) for a, b in pairs]
+    futures.append(matmul.submit(*pairs[0], kernel="auto_simd"))
+    for future, (a, b) in zip(futures, pairs + pairs[:1], strict=True):
+        assert np.array_equal(future.result(timeout=30), np.matmul(a, b))
+
+def test_matmul_async():
+    a = np.arange(12, dtype=np.int32).reshape(3, 4)
+    b = np.arange(8, dtype=np.int32).reshape(4, 2)
+
+    async def run():
+        return await asyncio.gather(*[matmul.matmul_async(a, b) for _ in range(4)])
+
+    for c in asyncio.run(run()):
+        assert np.array_equal(c, np.matmul(a, b))
+
+KERNELS = [matmul.trivial, matmul.transpose_iter, matmul.multithread, matmul.chunk,
+           matmul.multithread_chunk, matmul.transpose, matmul.auto_simd, matmul.simd,
+           matmul.simd_optimized, matmul.multithread_simd, matmul.gemm,
+           matmul.multithread_gemm, matmul.strassen]
+BT_KERNELS = [matmul.transpose, matmul.auto_simd, matmul.simd, matmul.simd_optimized,
+              matmul.multithread_simd, matmul.gemm, matmul.multithread_gemm]
+STRIDED_KERNELS = [matmul.gemm, matmul.multithread_gemm, matmul.strassen]
+
+def test_layouts():
+    rng = np.random.default_rng(2)
+    a = rng.integers(-10, 10, size=(70, 90), dtype=np.int32)
+    b = rng.integers(-10, 10, size=(90, 66), dtype=np.int32)
+    b_t = np.ascontiguousarray(b.T).T
+    b_f = np.asfortranarray(b)
+    b_strided = rng.integers(-10, 10, size=(180, 132), dtype=np.int32)[::2, ::2]
+    a_strided = np.asfortranarray(a)
+    expected = np.matmul(a, b)
+    for func in KERNELS:
+        assert np.array_equal(func(a, b), expected)
+    for func in BT_KERNELS:
+        for bb in (b_t, b_f, b_strided):
+            assert np.array_equal(func(a, bb), np.matmul(a, bb))
+    for func in STRIDED_KERNELS:
+        assert np.array_equal(
+            func(a_strided, b_strided), np.matmul(a_strided, b_strided))
+        assert np.array_equal(func(a[::-1], b[:, ::3]), np.matmul(a[::-1], b[:, ::3]))
+    # 空矩阵的步长 (如 (0, 0)) 不影响布局判断
+    assert matmul.simd(np.ones((0, 5)), np.ones((5, 4))).shape == (0, 4)
+    empty = matmul.trivial(np.ones((3, 0)), np.ones((0, 5)))
+    assert np.array_equal(empty, np.zeros((3, 5)))
+
+def test_layout_errors():
+    a = np.ones((4, 6), dtype=np.int32)
+    b = np.ones((6, 5), dtype=np.int32)
+    with pytest.raises(TypeError):
+        matmul.auto_simd(a.astype(np.int64), b)
+    with pytest.raises(TypeError):
+        matmul.gemm(a.tolist(), b)
+    with pytest.raises(ValueError, match="C-contiguous `a`"):
+        matmul.auto_simd(np.asfortranarray(a), b)
+    with pytest.raises(ValueError, match="C-contiguous `b`"):
+        matmul.trivial(a, np.asfortranarray(b))
+    readonly = b.copy()
+    readonly.flags.writeable = False
+    assert np.array_equal(matmul.simd(a, readonly), np.matmul(a, b))
+
+def test_packed_matrix():
+    rng = np.random.default_rng(3)
+    a = rng.integers(-10, 10, size=(45, 300), dtype=np.int32)
+    b = rng.integers(-10, 10, size=(300, 37), dtype=np.int32)
+    packed = matmul.PackedMatrix(b)
+    assert packed.shape == b.shape
+    assert np.array_equal(packed.numpy(), b)
+    b[0, 0] += 1  # 打包的是快照, 之后修改 b 不影响结果
+    expected = np.matmul(a, packed.numpy())
+    for func in KERNELS:
+        assert np.array_equal(func(a, packed), expected)
+    assert np.array_equal(matmul.gemm(np.asfortranarray(a), packed), expected)
+    assert np.array_equal(matmul.submit(a, packed).result(timeout=30), expected)
+    with pytest.raises(RuntimeError):
+        matmul.gemm(a.T, packed)
+
+def test_pack_cache():
+    rng = np.random.default_rng(4)
+    a = rng.integers(-10, 10, size=(20, 64), dtype=np.int32)
+    b = rng.integers(-10, 10, size=(64, 48), dtype=np.int32)
+    matmul.set_pack_cache_size(1 << 20)
+    try:
+        matmul.clear_pack_cache()
+        start = matmul.pack_cache_info()
+        for _ in range(3):
+            assert np.array_equal(matmul.gemm(a, b), np.matmul(a, b))
+            assert np.array_equal(matmul.auto_simd(a, b), np.matmul(a, b))
+        info = matmul.pack_cache_info()
+        assert info["misses"] - start["misses"] == 1
+        assert info["hits"] - start["hits"] == 5
+        assert 0 < info["nbytes"] <= info["capacity"]
+
+        b += 1
+        matmul.invalidate_pack_cache(b)
+        assert np.array_equal(matmul.gemm(a, b), np.matmul(a, b))
+        view = b[:, :40]  # 视图的版本号记在 b 名下
+        assert np.array_equal(matmul.gemm(a, view), np.matmul(a, view))
+        view -= 2
+        matmul.invalidate_pack_cache(view)
+        assert np.array_equal(matmul.gemm(a, view), np.matmul(a, view))
+        del view
+
+        # 新数组复用已释放的 B 的地址时不能取到旧的打包结果
+        matmul.set_pack_cache_size(1 << 26)
+        for i in range(20):
+            b = np.full((64, 48), i, dtype=np.int32)
+            assert np.array_equal(matmul.gemm(a, b), np.matmul(a, b))
+            assert np.array_equal(matmul.matmul_batched(a[None], b)[0], np.matmul(a, b))
+            del b
+        assert matmul.pack_cache_info()["entries"] == 0
+        b = rng.integers(-10, 10, size=(64, 48), dtype=np.int32)
+
+        matmul.set_pack_cache_size(1)  # 放不下任何一项
+        assert np.array_equal(matmul.gemm(a, b), np.matmul(a, b))
+        assert matmul.pack_cache_info()["entries"] == 0
+    finally:
+        matmul.set_pack_cache_size(0)
+
+def test_out_alpha_beta():
+    rng = np.random.default_rng(5)
+    a = rng.integers(-10, 10, size=(37, 300), dtype=np.int32)
+    b = rng.integers(-10, 10, size=(300, 41), dtype=np.int32)
+    c0 = rng.integers(-10, 10, size=(37, 41), dtype=np.int32)
+    packed = matmul.PackedMatrix(b)
+    ab = np.matmul(a, b)
+    for func in KERNELS:
+        for bb in (b, packed):
+            out = np.empty_like(c0)
+            assert func(a, bb, out=out) is out
+            assert np.array_equal(out, ab)
+            assert np.array_equal(func(a, bb, alpha=3), 3 * ab)
+            out = c0.copy()
+            func(a, bb, out=out, alpha=2, beta=-1)
+            assert np.array_equal(out, 2 * ab - c0)
+            out = c0.copy()
+            func(a, bb, out=out, beta=1)
+            assert np.array_equal(out, ab + c0)
+    for func in STRIDED_KERNELS:
+        big = np.tile(c0, (1, 3))
+        out = big[:, 10:51]  # 行距不等于列数
+        initial = out.copy()
+        func(a, b, out=out, beta=2)
+        assert np.array_equal(out, ab + 2 * initial)
+        assert np.array_equal(big[:, :10], c0[:, :10])
+    out = c0.copy()
+    matmul.submit(a, b, out=out, alpha=-1, beta=1).result(timeout=30)
+    assert np.array_equal(out, c0 - ab)
+
+def test_out_errors():
+    a = np.ones((4, 6), dtype=np.int32)
+    b = np.ones((6, 5), dtype=np.int32)
+    with pytest.raises(ValueError, match="requires `out`"):
+        matmul.gemm(a, b, beta=1)
+    with pytest.raises(ValueError, match="shape"):
+        matmul.gemm(a, b, out=np.empty((5, 4), dtype=np.int32))
+    with pytest.raises(TypeError):
+        matmul.gemm(a, b, out=np.empty((4, 5), dtype=np.int64))
+    with pytest.raises(TypeError):
+        matmul.gemm(a, b, np.empty((4, 5), dtype=np.int32))
+    readonly = np.empty((4, 5), dtype=np.int32)
+    readonly.flags.writeable = False
+    with pytest.raises(ValueError, match="read-only"):
+        matmul.gemm(a, b, out=readonly)
+    with pytest.raises(ValueError, match="contiguous rows"):
+        matmul.gemm(a, b, out=np.empty((5, 4), dtype=np.int32).T)
+    # 空的 out 没有可检查的行, 任意步长都可接受
+    empty = np.empty((0, 5), dtype=np.int32)
+    assert matmul.simd(np.ones((0, 6), dtype=np.int32), b, out=empty) is empty
+    with pytest.raises(ValueError, match="C-contiguous `out`"):
+        matmul.auto_simd(a, b, out=np.empty((4, 8), dtype=np.int32)[:, :5])
+    square = np.ones((4, 4), dtype=np.int32)
+    with pytest.raises(ValueError, match="overlap"):
+        matmul.gemm(square, square, out=square)
+
+def test_matmul_batched():
+    rng = np.random.default_rng(6)
+    shapes = [(64, 32, 32, 32), (5, 33, 300, 47), (3, 130, 140, 150), (1, 7, 0, 5)]
+    for batch, n, m, p in shapes:
+        a = rng.integers(-10, 10, size=(batch, n, m), dtype=np.int32)
+        b = rng.integers(-10, 10, size=(batch, m, p), dtype=np.int32)
+        assert np.array_equal(matmul.matmul_batched(a, b), np.matmul(a, b))
+        # 单个 B 广播到所有批次
+        assert np.array_equal(matmul.matmul_batched(a, b[0]), np.matmul(a, b[0]))
+        assert np.array_equal(matmul.matmul_batched(a, b[:1]), np.matmul(a, b[:1]))
+        assert np.array_equal(
+            matmul.matmul_batched(a, matmul.PackedMatrix(b[0])), np.matmul(a, b[0]))
+        assert np.array_equal(matmul.matmul_batched(a[0], b), np.matmul(a[0], b))
+        # 任意步长的输入
+        a_f = a.transpose(0, 2, 1).copy().transpose(0, 2, 1)
+        assert np.array_equal(
+            matmul.matmul_batched(a_f, b[:, ::-1]), np.matmul(a_f, b[:, ::-1]))
+        out = rng.integers(-10, 10, size=(batch, n, p), dtype=np.int32)
+        expected = 2 * np.matmul(a, b) + out
+        assert matmul.matmul_batched(a, b, out=out, alpha=2, beta=1) is out
+        assert np.array_equal(out, expected)
+
+def test_matmul_batched_errors():
+    a = np.ones((4, 3, 5), dtype=np.int32)
+    with pytest.raises(RuntimeError, match="batch sizes"):
+        matmul.matmul_batched(a, np.ones((3, 5, 2), dtype=np.int32))
+    with pytest.raises(RuntimeError, match="shapes"):
+        matmul.matmul_batched(a, np.ones((4, 4, 2), dtype=np.int32))
+    with pytest.raises(RuntimeError, match="2-D or 3-D"):
+        matmul.matmul_batched(a[None], np.ones((5, 2), dtype=np.int32))
+    with pytest.raises(ValueError, match="shape"):
+        matmul.matmul_batched(
+            a, np.ones((5, 2), dtype=np.int32), out=np.empty((3, 2), np.int32))
+
+    # 空的 out 的批维步长为 0, 不算广播
+    for n, m, p in ((0, 5, 4), (3, 5, 0), (3, 0, 4)):
+        out = np.empty((3, n, p), dtype=np.int32)
+        x, y = np.ones((3, n, m), dtype=np.int32), np.ones((m, p), dtype=np.int32)
+        assert matmul.matmul_batched(x, y, out=out) is out
+        assert np.array_equal(out, np.matmul(x, y))
+
+DTYPES = [np.int32, np.int64, np.float32, np.float64]
+
+def test_dtypes():
+    rng = np.random.default_rng(7)
+    a = rng.integers(-10, 10, size=(37, 300))
+    b = rng.integers(-10, 10, size=(300, 41))
+    for dtype in DTYPES:
+        aa, bb = a.astype(dtype), b.astype(dtype)
+        expected = np.matmul(aa, bb)
+        for func in KERNELS:
+            c = func(aa, bb)
+            assert c.dtype == dtype
+            assert np.array_equal(c, expected)
+        for func in BT_KERNELS:
+            assert np.array_equal(func(aa, np.asfortranarray(bb)), expected)
+        packed = matmul.PackedMatrix(bb)
+        assert packed.dtype == dtype
+        assert np.array_equal(matmul.gemm(aa, packed), expected)
+        assert np.array_equal(matmul.auto_simd(aa, packed), expected)
+        assert np.array_equal(matmul.submit(aa, bb).result(timeout=30), expected)
+        batched = np.stack([aa, aa[::-1]])
+        assert np.array_equal(
+            matmul.matmul_batched(batched, bb), np.matmul(batched, bb))
+
+def test_dtype_values():
+    rng = np.random.default_rng(8)
+    # int32 会溢出的乘积
+    a = rng.integers(-100000, 100000, size=(20, 70), dtype=np.int64)
+    b = rng.integers(-100000, 100000, size=(70, 30), dtype=np.int64)
+    for func in (
+        matmul.gemm, matmul.multithread_gemm, matmul.auto_simd, matmul.trivial,
+    ):
+        assert np.array_equal(func(a, b), np.matmul(a, b))
+
+    for dtype in (np.float32, np.float64):
+        a = rng.standard_normal((65, 130)).astype(dtype)
+        b = rng.standard_normal((130, 50)).astype(dtype)
+        out = rng.standard_normal((65, 50)).astype(dtype)
+        expected = 0.5 * np.matmul(a, b) - 2.0 * out
+        for func in KERNELS:
+            c = out.copy()
+            func(a, b, out=c, alpha=0.5, beta=-2.0)
+            np.testing.assert_allclose(c, expected, rtol=1e-4, atol=1e-4)
+
+def test_dtype_errors():
+    a = np.ones((4, 6), dtype=np.float32)
+    b = np.ones((6, 5), dtype=np.float32)
+    with pytest.raises(TypeError, match="same dtype"):
+        matmul.gemm(a, b.astype(np.float64))
+    with pytest.raises(TypeError, match="same dtype"):
+        matmul.gemm(a, matmul.PackedMatrix(b.astype(np.int32)))
+    with pytest.raises(TypeError, match="same dtype"):
+        matmul.gemm(a, b, out=np.empty((4, 5), dtype=np.float64))
+    with pytest.raises(TypeError):
+        matmul.gemm(a.astype(np.int16), b.astype(np.int16))
+    with pytest.raises(TypeError, match="alpha"):
+        matmul.gemm(a.astype(np.int32), b.astype(np.int32), alpha=0.5)
+
+def test_threads():
+    rng = np.random.default_rng(10)
+    # 矮而宽的 C 需要按列划分才能分给多个线程
+    shapes = ((3, 200, 1500), (150, 70, 90))
+    default = matmul.get_num_threads()
+    cpus = os.sched_getaffinity(0)
+    try:
+        for affinity in ("compact", "spread", "none"):
+            matmul.set_affinity(affinity)
+            assert matmul.get_affinity() == affinity
+            for n, m, p in shapes:
+                a = rng.integers(-10, 10, size=(n, m), dtype=np.int32)
+                b = rng.integers(-10, 10, size=(m, p), dtype=np.int32)
+                expected = np.matmul(a, b)
+                for threads in (1, 3, 8):
+                    for func in KERNELS:
+                        assert np.array_equal(func(a, b, threads=threads), expected)
+                    batched = matmul.matmul_batched(
+                        np.stack([a, a]), b, threads=threads)
+
+                    assert np.array_equal(batched[1], expected)
+                    future = matmul.submit(a, b, "multithread_gemm", threads=threads)
+                    assert np.array_equal(future.result(timeout=30), expected)
+                    # 调用方线程只在并行区域内绑定
+                    assert os.sched_getaffinity(0) == cpus
+        matmul.set_num_threads(3)
+        assert matmul.get_num_threads() == 3
+        assert np.array_equal(matmul.multithread_gemm(a, b), expected)
+        with pytest.raises(ValueError):
+            matmul.gemm(a, b, threads=0)
+        with pytest.raises(ValueError):
+            matmul.set_affinity("scatter")
+    finally:
+        matmul.set_affinity("none")
+        matmul.set_num_threads(0)
+    assert matmul.get_num_threads() == default
+
+def test_empty():
+    # 空矩阵没有可划分的行块, 多线程内核 (及 strassen 的回退) 不能除以零
+    shapes = (((0, 5), (5, 5)), ((5, 0), (0, 5)), ((5, 5), (5, 0)), ((0, 0), (0, 0)))
+    for dtype in (np.int32, np.float64):
+        for (n, m), (_, p) in shapes:
+            a, b = np.ones((n, m), dtype=dtype), np.ones((m, p), dtype=dtype)
+            for func in KERNELS:
+                for threads in (1, 4):
+                    c = func(a, b, threads=threads)
+                    assert c.shape == (n, p) and not c.any()
+        for func in (matmul.gemm_int8, matmul.multithread_gemm_int8):
+            c = func(np.ones((n, m), dtype=np.int8), np.ones((m, p), dtype=np.int8))
+            assert c.shape == (n, p) and not c.any()
+
+def test_strassen():
+    rng = np.random.default_rng(9)
+    default = matmul.get_strassen_cutoff()
+    try:
+        # 较小的截止尺寸使递归展开多层, 奇数与非方阵尺寸需要补齐
+        matmul.set_strassen_cutoff(16)
+        for shape in ((64, 64, 64), (101, 67, 45), (130, 257, 33), (3, 100, 100)):
+            n, m, p = shape
+            for dtype in DTYPES:
+                a = rng.integers(-10, 10, size=(n, m)).astype(dtype)
+                b = rng.integers(-10, 10, size=(m, p)).astype(dtype)
+                assert np.array_equal(
+                    matmul.strassen(a, b), np.matmul(a, b)), (shape, dtype)
+            a = rng.integers(-10, 10, size=(n, m), dtype=np.int32)
+            b = rng.integers(-10, 10, size=(m, p), dtype=np.int32)
+            out = rng.integers(-10, 10, size=(n, p), dtype=np.int32)
+            expected = 2 * np.matmul(a, b) - out
+            matmul.strassen(
+                np.asfortranarray(a), b[::-1][::-1], out=out, alpha=2, beta=-1)
+
+            assert np.array_equal(out, expected)
+        with pytest.raises(ValueError):
+            matmul.set_strassen_cutoff(0)
+    finally:
+        matmul.set_strassen_cutoff(default)
+
+def test_int8():
+    rng = np.random.default_rng(0)
+    default = matmul.get_dispatch_isa()
+    try:
+        for isa in matmul.get_supported_isas():
+            matmul.set_dispatch_isa(isa)
+            for dtype in (np.uint8, np.int8):
+                info = np.iinfo(dtype)
+                # 行数不是 MR 的倍数, M 超过 KC 且不是 4 的倍数
+                a = rng.integers(info.min, info.max + 1, size=(37, 1030), dtype=dtype)
+                b = rng.integers(-128, 128, size=(1030, 70), dtype=np.int8)
+                expected = a.astype(np.int32) @ b.astype(np.int32)
+                for func in (matmul.gemm_int8, matmul.multithread_gemm_int8):
+                    c = func(a, b)
+                    assert c.dtype == np.int32
+                    assert np.array_equal(c, expected), (isa, dtype, func.__name__)
+                a_f, b_s = np.asfortranarray(a[:, :515]), b[:515, ::-2]
+                c = matmul.gemm_int8(a_f, b_s)
+                assert np.array_equal(c, a_f.astype(np.int32) @ b_s.astype(np.int32))
+                out = np.ones((37, 70), dtype=np.int32)
+                matmul.gemm_int8(a, b, out=out, alpha=2, beta=3)
+                assert np.array_equal(out, 2 * expected + 3)
+    finally:
+        matmul.set_dispatch_isa(default)
+
+def test_int8_errors():
+    a = np.ones((4, 6), dtype=np.uint8)
+    b = np.ones((6, 5), dtype=np.int8)
+    with pytest.raises(TypeError):
+        matmul.gemm_int8(a, b.astype(np.uint8))
+    with pytest.raises(TypeError):
+        matmul.gemm_int8(a.astype(np.int32), b)
+    with pytest.raises(TypeError):
+        matmul.gemm_int8(a, b, out=np.empty((4, 5), dtype=np.int64))
+    with pytest.raises(ValueError, match="shape"):
+        matmul.gemm_int8(a, b, out=np.empty((5, 4), dtype=np.int32))
+    with pytest.raises(RuntimeError, match="Incompatible"):
+        matmul.gemm_int8(a, b[:5])
+
+def test_tune(tmp_path):
+    path = tmp_path / "tuning.txt"
+    saved = matmul.get_tuning_cache_path()
+    matmul.set_tuning_cache_path(str(path))
+    try:
+        a = np.arange(24 * 40, dtype=np.float32).reshape(24, 40) % 7
+        b = np.arange(40 * 18, dtype=np.float32).reshape(40, 18) % 5
+        assert matmul.matmul_plan(a, b)["source"] == "default"
+        assert np.allclose(matmul.matmul(a, b), a @ b)
+
+        results = matmul.tune(
+            shapes=[(24, 40, 18)], dtypes=[np.float32],
+            kernels=["gemm", "chunk", "transpose"], repeat=1)
+        assert len(results) == 1
+        assert results[0]["kernel"] in ("gemm", "chunk", "transpose")
+        plan = matmul.matmul_plan(a, b)
+        assert plan["source"] == "tuned" and plan["kernel"] == results[0]["kernel"]
+        # 同一桶内的其他形状, 以及相邻的桶
+        assert matmul.matmul_plan(a[:20], b[:, :17])["source"] == "tuned"
+        wider = np.ones((64, 40), np.float32)
+        assert matmul.matmul_plan(wider, b)["source"] == "nearest"
+        x, y = a.astype(np.int32), b.astype(np.int32)
+        assert matmul.matmul_plan(x, y)["source"] == "default"
+
+        # 结果写入缓存文件, 重新读取后仍然有效
+        assert path.exists()
+        assert list(tmp_path.iterdir()) == [path]  # 临时文件已改名
+
+        matmul.set_tuning_cache_path(str(path))
+        assert matmul.matmul_plan(a, b) == plan
+
+        # 非连续输入与 out/alpha/beta 在选中的内核不支持时回退到 gemm
+        out = np.ones((24, 30), dtype=np.float32)[:, :18]
+        matmul.matmul(a.copy(order="F"), b, out=out, alpha=2, beta=1)
+        assert np.allclose(out, 2 * (a @ b) + 1)
+        for dtype in (np.int32, np.int64, np.float64):
+            x, y = a.astype(dtype), b.astype(dtype)
+            assert np.allclose(matmul.matmul(x, y, threads=1), x @ y)
+
+        with pytest.raises(ValueError):
+            matmul.tune(shapes=[(0, 4, 4)])
+        with pytest.raises(ValueError):
+            matmul.tune(shapes=[(4, 4, 4)], kernels=["nope"])
+        with pytest.raises(TypeError):
+            matmul.tune(shapes=[(4, 4, 4)], dtypes=[np.int8])
+
+        matmul.clear_tuning_cache()
+        assert not path.exists()
+
+        assert matmul.matmul_plan(a, b)["source"] == "default"
+    finally:
+        matmul.set_tuning_cache_path(saved)
+
+def test_out_of_core(tmp_path):
+    a = np.arange(70 * 90, dtype=np.int32).reshape(70, 90) % 11 - 5
+    b = np.arange(90 * 50, dtype=np.int32).reshape(90, 50) % 7 - 3
+    expected = a @ b
+    # 预算只够很小的 tile, 覆盖多个行块, 列块与深度块
+    budget = 2 * 2 * 32 * 32 * 4
+    assert np.array_equal(matmul.matmul_out_of_core(a, b, memory=budget), expected)
+    c = matmul.matmul_out_of_core(np.asfortranarray(a), b.T.copy().T, memory=budget)
+    assert np.array_equal(c, expected)
+
+    np.save(tmp_path / "a.npy", a)
+    b.tofile(tmp_path / "b.raw")
+    c = matmul.matmul_out_of_core(
+        tmp_path / "a.npy", str(tmp_path / "b.raw"), tmp_path / "c.npy", dtype=np.int32,
+        b_shape=(90, 50), memory=budget)
+    assert isinstance(c, np.memmap)
+    assert np.array_equal(np.load(tmp_path / "c.npy"), expected)
+    # beta != 0 时累加到已有的文件
+    matmul.matmul_out_of_core(
+        np.load(tmp_path / "a.npy", mmap_mode="r"), b, tmp_path / "c.npy",
+        memory=budget, alpha=2, beta=-1)
+
+    assert np.array_equal(np.load(tmp_path / "c.npy"), expected)
+
+    out = np.zeros((70, 50), dtype=np.float64)
+    matmul.matmul_out_of_core(
+        a.astype(np.float64), b.astype(np.float64), out, memory=budget, threads=1)
+    assert np.allclose(out, expected)
+
+    with pytest.raises(ValueError):
+        matmul.matmul_out_of_core(a, b, memory=64)
+    with pytest.raises(ValueError):
+        matmul.matmul_out_of_core(tmp_path / "b.raw", b)
+    with pytest.raises(TypeError):
+        matmul.matmul_out_of_core(a, b.astype(np.int64))
+    with pytest.raises(RuntimeError):
+        matmul.matmul_out_of_core(a, a)
+
+def to_csr(dense, index=np.int32):
+    indptr, indices, data = [0], [], []
+    for row in dense:
+        nz = np.flatnonzero(row)
+        indices.extend(nz)
+        data.extend(row[nz])
+        indptr.append(len(indices))
+    return (np.array(data, dtype=dense.dtype), np.array(indices, dtype=index),
+            np.array(indptr, dtype=index))
+
+class FakeSparse:
+    # 与 scipy.sparse 的 CSR/CSC 矩阵相同的属性
+    def __init__(self, dense, kind):
+        self.format, self.shape = kind, dense.shape
+        csr = to_csr(dense if kind == "csr" else dense.T)
+        self.data, self.indices, self.indptr = csr
+
+
+def test_sparse():
+    rng = np.random.default_rng(0)
+    saved = matmul.get_sparse_density_threshold()
+    try:
+        for threshold in (2.0, 0.0):
+            # 2 总是使用稀疏内核, 0 总是展开后使用 gemm
+            matmul.set_sparse_density_threshold(threshold)
+            for dtype in (np.int32, np.int64, np.float32, np.float64):
+                for index in (np.int32, np.int64):
+                    mask = rng.random((37, 45)) < 0.1
+                    a = (mask * rng.integers(-5, 6, (37, 45))).astype(dtype)
+                    a[3] = 0
+                    b = rng.integers(-5, 6, (45, 300)).astype(dtype)
+                    csr = to_csr(a, index)
+                    assert np.array_equal(matmul.csr_dense(csr, b), a @ b)
+                    assert np.array_equal(matmul.csr_dense(csr, b.T.copy().T), a @ b)
+                    # a 的 CSR 即 a.T 的 CSC
+                    assert np.array_equal(matmul.dense_csc(b.T, csr), b.T @ a.T)
+                    bt = np.ascontiguousarray(b.T)
+                    c = matmul.dense_csc(bt, FakeSparse(a.T, "csc"))
+                    assert np.array_equal(c, bt @ a.T)
+
+                    c = matmul.csr_dense(FakeSparse(a, "csr"), b, threads=2)
+                    assert np.array_equal(c, a @ b)
+                    out = np.ones((37, 300), dtype=dtype)
+                    matmul.csr_dense(to_csr(a, index), b, out=out, alpha=2, beta=3)
+                    assert np.array_equal(out, 2 * (a @ b) + 3)
+        a = np.eye(4, dtype=np.float32)
+        with pytest.raises(TypeError):
+            matmul.csr_dense(FakeSparse(a, "csc"), a)
+        with pytest.raises(TypeError):
+            matmul.csr_dense(to_csr(a), a.astype(np.float64))
+        with pytest.raises(TypeError):
+            matmul.csr_dense(a, a)
+        data, indices, indptr = to_csr(a)
+        with pytest.raises(TypeError):
+            matmul.csr_dense((data, indices, indptr.astype(np.int64)), a)
+        with pytest.raises(ValueError):
+            matmul.csr_dense((data, indices + 4, indptr), a)
+        with pytest.raises(ValueError):
+            matmul.csr_dense((data, indices, indptr[::-1].copy()), a)
+        with pytest.raises(RuntimeError):
+            matmul.csr_dense(FakeSparse(a, "csr"), np.ones((5, 2), dtype=np.float32))
+        with pytest.raises(ValueError):
+            matmul.set_sparse_density_threshold(-1)
+    finally:
+        matmul.set_sparse_density_threshold(saved)
+
+def test_skinny():
+    rng = np.random.default_rng(11)
+    # GEMV, 向量乘矩阵与只有几行/几列的 C; M 较大时多线程会沿 M 切分
+    shapes = ((300, 70, 1), (1, 70, 300), (130, 90, 8), (5, 90, 130), (1, 1, 1),
+              (2, 5000, 3), (3, 5000, 70), (2, 40000, 3))
+
+    for dtype in (np.int32, np.int64, np.float32, np.float64):
+        for n, m, p in shapes:
+            a = rng.integers(-10, 10, size=(n, m)).astype(dtype)
+            b = rng.integers(-10, 10, size=(m, p)).astype(dtype)
+            expected = a @ b
+            for func in (matmul.gemm, matmul.multithread_gemm, matmul.simd_optimized,
+                         matmul.multithread_simd, matmul.simd, matmul.auto_simd):
+                assert np.array_equal(func(a, b), expected)
+            for threads in (1, 3):
+                assert np.array_equal(matmul.gemm(a, b, threads=threads), expected)
+                assert np.array_equal(
+                    matmul.multithread_gemm(a, b, threads=threads), expected)
+            # 任意步长的 A 与 B
+            a_t = np.asfortranarray(a)
+            b_s = np.repeat(b, 2, axis=1)[:, ::2]
+            assert np.array_equal(matmul.gemm(a_t, b_s), expected)
+            assert np.array_equal(matmul.multithread_gemm(a_t, b.T.copy().T), expected)
+            out = np.ones((n, p), dtype=dtype)
+            matmul.gemm(a, b, out=out, alpha=2, beta=3)
+            assert np.array_equal(out, 2 * expected + 3)
+
+def test_profile():
+    a = np.ones((100, 80), dtype=np.float32)
+    b = np.ones((80, 60), dtype=np.float32)
+    assert "cycles" in matmul.get_profile_events()
+    with pytest.raises(ValueError):
+        matmul.profile("gemm", a, b, ["no-such-event"])
+    with pytest.raises(ValueError):
+        matmul.profile("no_such_kernel", a, b, ["task-clock"])
+    try:
+        # 软件事件在没有硬件计数器的虚拟机中也可用
+        report = matmul.profile(
+            matmul.multithread_gemm, a, b, ["task-clock", "cycles"], threads=3)
+    except RuntimeError:
+        pytest.skip("perf_event_open is not available")
+    assert report["kernel"] == "multithread_gemm"
+    assert report["seconds"] > 0
+    assert len(report["threads"]) == 3
+    assert report["events"]["task-clock"] > 0
+    per_thread = sum(t["task-clock"] for t in report["threads"])
+    assert report["events"]["task-clock"] == per_thread
+
+    assert ("cycles" in report["unavailable"]) == (report["events"]["cycles"] is None)
+
+def test_phase_timing():
+    a = np.ones((40, 30), dtype=np.float32)
+    b = np.ones((30, 20), dtype=np.float32)
+    saved = matmul.get_phase_timing()
+    try:
+        matmul.set_phase_timing(False)
+        matmul.clear_phase_stats()
+        matmul.gemm(a, b)
+        assert matmul.phase_stats() == []
+        matmul.set_phase_timing(True)
+        for _ in range(3):
+            matmul.transpose(a, b)
+            matmul.gemm(a, b)
+        stats = {s["kernel"]: s for s in matmul.phase_stats()}
+        assert set(stats) == {"transpose", "gemm"}
+        for s in stats.values():
+            assert s["count"] == 3
+            assert s["shape"] == (64, 32, 32)
+            assert s["phases"]["compute"]["mean"] > 0
+            parts = sum(p["mean"] for p in s["phases"].values())
+            assert parts <= s["total"]["mean"] * 1.0001
+        assert stats["transpose"]["phases"]["transpose"]["mean"] > 0
+        assert stats["gemm"]["phases"]["transpose"]["mean"] == 0
+        matmul.clear_phase_stats()
+        assert matmul.phase_stats() == []
+    finally:
+        matmul.set_phase_timing(saved)
+        matmul.clear_phase_stats()
+
+def test_thread_pool():
+    import threading
+    rng = np.random.default_rng(12)
+    # 小问题在调用方线程上运行, 较大的问题使用常驻线程; 线程数在调用之间变化
+    pairs = [(rng.integers(-10, 10, size=(n, m), dtype=np.int64),
+              rng.integers(-10, 10, size=(m, p), dtype=np.int64))
+             for n, m, p in ((8, 8, 8), (150, 70, 90), (257, 130, 3), (40, 300, 260))]
+    for _ in range(3):
+        for threads in (1, 2, 5, 3):
+            for a, b in pairs:
+                for func in (matmul.multithread, matmul.multithread_gemm,
+                             matmul.multithread_simd, matmul.strassen):
+                    assert np.array_equal(func(a, b, threads=threads), a @ b)
+    # 线程池忙时其他线程发起的调用单线程运行
+    a, b = pairs[-1]
+    errors = []
+    def worker():
+        for _ in range(20):
+            if not np.array_equal(matmul.multithread_gemm(a, b, threads=4), a @ b):
+                errors.append("mismatch")
+    workers = [threading.Thread(target=worker) for _ in range(4)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    assert errors == []
+    if hasattr(os, "fork"):
+        # fork 出的子进程重新创建工作线程
+        pid = os.fork()
+        if pid == 0:
+            c = matmul.multithread_gemm(a, b, threads=4)
+            os._exit(0 if np.array_equal(c, a @ b) else 1)
+
+        assert os.waitpid(pid, 0)[1] == 0
+
+def test_c_api():
+    import ctypes
+    lib = ctypes.CDLL(matmul.__file__)
+    ptr = ctypes.c_void_p
+    lib.libmatmul_dgemm.argtypes = [
+        ctypes.c_char_p, ctypes.c_char, ctypes.c_char, ctypes.c_int, ctypes.c_int,
+        ctypes.c_int, ctypes.c_double, ptr, ctypes.c_ssize_t, ptr, ctypes.c_ssize_t,
+        ctypes.c_double, ptr, ctypes.c_ssize_t, ctypes.c_int]
+    lib.libmatmul_last_error.restype = ctypes.c_char_p
+    lib.libmatmul_kernel_name.restype = ctypes.c_char_p
+    count = lib.libmatmul_kernel_count()
+    names = [lib.libmatmul_kernel_name(i).decode() for i in range(count)]
+    assert {"gemm", "multithread_gemm", "strassen"} <= set(names)
+    assert lib.libmatmul_kernel_name(len(names)) is None
+
+    rng = np.random.default_rng(13)
+    a = rng.integers(-10, 10, size=(37, 53)).astype(np.float64)
+    b = rng.integers(-10, 10, size=(53, 29)).astype(np.float64)
+    c0 = rng.integers(-10, 10, size=(37, 29)).astype(np.float64)
+    # trans 为 A, B 的转置标志, 如 b"NT"
+    def dgemm(kernel, trans, x, y, c, *, alpha=1.0, beta=0.0, threads=0):
+        ta, tb = trans[:1], trans[1:]
+        m, k = x.shape[::-1] if ta == b"T" else x.shape
+        n = y.shape[0] if tb == b"T" else y.shape[1]
+        return lib.libmatmul_dgemm(
+            kernel, ta, tb, m, n, k, alpha, x.ctypes.data, x.strides[0] // 8,
+            y.ctypes.data, y.strides[0] // 8, beta, c.ctypes.data, c.strides[0] // 8,
+            threads)
+    # 在更大的缓冲区中按行距取子矩阵, 结果直接写入 C 的列切片
+    big = np.zeros((37, 40))
+    for kernel in (b"gemm", b"multithread_gemm", b"strassen", None):
+        for threads in (0, 3):
+            big[:] = 7
+            c = big[:, 5:34]
+            c[:] = c0
+            assert dgemm(kernel, b"NN", a, b, c, alpha=2.0, beta=-1.0,
+                         threads=threads) == 0
+            assert np.array_equal(c, 2 * a @ b - c0)
+            assert np.array_equal(big[:, :5], np.full((37, 5), 7.0))
+            at, bt = np.ascontiguousarray(a.T), np.ascontiguousarray(b.T)
+            assert dgemm(kernel, b"TT", at, bt, c) == 0
+            assert np.array_equal(c, a @ b)
+    c = np.empty((37, 29))
+    assert dgemm(b"simd", b"NN", a, b, c) == 0
+    assert np.array_equal(c, a @ b)
+
+    # 其他 dtype 通过 libmatmul_gemm 传入标量指针, NULL 表示 alpha = 1, beta = 0
+    ai, bi = a.astype(np.int32), b.astype(np.int32)
+    ci = np.empty((37, 29), dtype=np.int32)
+    lib.libmatmul_gemm.argtypes = [
+        ctypes.c_char_p, ctypes.c_int, ctypes.c_char, ctypes.c_char, ctypes.c_int,
+        ctypes.c_int, ctypes.c_int, ptr, ptr, ctypes.c_ssize_t, ptr, ctypes.c_ssize_t,
+        ptr, ptr, ctypes.c_ssize_t, ctypes.c_int]
+    assert lib.libmatmul_gemm(
+        b"gemm", 0, b"N", b"N", 37, 29, 53, None, ai.ctypes.data, 53, bi.ctypes.data,
+        29, None, ci.ctypes.data, 29, 0) == 0
+    assert np.array_equal(ci, ai @ bi)
+    for dtype in (-1, 4, 1 << 30):
+        assert lib.libmatmul_gemm(
+            b"gemm", dtype, b"N", b"N", 37, 29, 53, None, ai.ctypes.data, 53,
+            bi.ctypes.data, 29, None, ci.ctypes.data, 29, 0) == 1
+        assert b"Unknown dtype" in lib.libmatmul_last_error()
+
+    assert dgemm(b"nope", b"NN", a, b, c) == 1
+    assert b"Unknown kernel" in lib.libmatmul_last_error()
+    assert dgemm(b"gemm", b"XN", a, b, c) == 1
+    assert lib.libmatmul_dgemm(
+        b"gemm", b"N", b"N", 37, 29, 53, 1.0, a.ctypes.data, 10, b.ctypes.data, 29, 0.0,
+        c.ctypes.data, 29, 0) == 1
+    assert b"lda" in lib.libmatmul_last_error()
+    assert dgemm(b"simd", b"TN", np.ascontiguousarray(a.T), b, c) == 1
+
+
+def test_epilogue():
+    rng = np.random.default_rng(5)
+    for n, k, p in ((70, 300, 90), (3, 200, 150), (150, 300, 5), (260, 700, 300)):
+        a = rng.integers(-20, 20, size=(n, k), dtype=np.int32)
+        b = rng.integers(-20, 20, size=(k, p), dtype=np.int32)
+        bias = rng.integers(-500, 500, size=p, dtype=np.int32)
+        relu = np.maximum(a @ b + bias, 0)
+        scale = rng.random(p) * 1e-3
+        quantized = np.clip(np.rint(((a @ b + bias) * scale.astype(np.float32) + 3)
+                                    .astype(np.float32)), -128, 127)
+        for func in (matmul.gemm, matmul.multithread_gemm, matmul.strassen,
+                     matmul.simd_optimized, matmul.trivial):
+            assert np.array_equal(func(a, b, bias=bias, clip=(0, None)), relu)
+            c = func(a, b, bias=bias, scale=scale, shift=3, dtype=np.int8)
+            assert c.dtype == np.int8
+            assert np.abs(c.astype(np.int32) - quantized).max() <= 1
+        out = np.empty((n, p), dtype=np.uint8)
+        matmul.gemm(a, b, out=out, scale=0.5, clip=(10, 20), dtype=np.uint8)
+        assert np.array_equal(out, np.clip(np.rint((a @ b) * 0.5), 10, 20))
+    x = rng.standard_normal((40, 50))
+    y = rng.standard_normal((50, 30))
+    c = matmul.gemm(x, y, alpha=2.0, clip=(-1, 1), dtype=np.float32)
+    np.testing.assert_allclose(c, np.clip(2 * x @ y, -1, 1), rtol=1e-5, atol=1e-6)
+    a8 = rng.integers(0, 256, size=(64, 128), dtype=np.uint8)
+    b8 = rng.integers(-128, 128, size=(128, 48), dtype=np.int8)
+    acc = a8.astype(np.int32) @ b8
+    c = matmul.gemm_int8(a8, b8, scale=np.float32(1 / 256), dtype=np.int8)
+    assert np.array_equal(c, np.clip(np.rint(acc / 256), -128, 127))
+    with pytest.raises(ValueError, match="bias"):
+        matmul.gemm(x, y, bias=np.ones(31))
+    with pytest.raises(ValueError, match="scale"):
+        matmul.gemm(x, y, scale=np.ones((2, 30)))
+    with pytest.raises(ValueError, match="clip"):
+        matmul.gemm(x, y, clip=(1, 0))
+    with pytest.raises(ValueError, match="dtype"):
+        matmul.gemm(x, y, out=np.zeros((40, 30), dtype=np.float32), beta=1.0,
+                    dtype=np.float32)
+
+    with pytest.raises(TypeError, match="same dtype"):
+        matmul.gemm(x, y, out=np.zeros((40, 30)), dtype=np.float32)
+    with pytest.raises(TypeError, match="dtype"):
+        matmul.gemm(x, y, dtype=np.complex64)
+
+def test_matmul_chain(tmp_path):
+    saved = matmul.get_tuning_cache_path()
+    matmul.set_tuning_cache_path(str(tmp_path / "tuning.txt"))
+    try:
+        rng = np.random.default_rng(6)
+        shapes = [(10, 300), (300, 20), (20, 250), (250, 5), (5, 200)]
+        xs = [rng.standard_normal(s) for s in shapes]
+        plan = matmul.matmul_chain_plan(xs)
+        # 未调优时按乘加次数选择, 与 np.linalg.multi_dot 的括号化相同
+        assert plan["order"] == ((0, (1, (2, 3))), 4) and plan["seconds"] is None
+        assert plan["multiply_adds"] == (
+            20 * 250 * 5 + 300 * 20 * 5 + 10 * 300 * 5 + 10 * 5 * 200)
+        np.testing.assert_allclose(
+            matmul.matmul_chain(xs), np.linalg.multi_dot(xs), rtol=1e-10)
+
+        ints = [rng.integers(-5, 5, size=s, dtype=np.int32)
+                for s in ((40, 70), (70, 8), (8, 90), (90, 33))]
+        ints[0] = np.asfortranarray(ints[0])
+        ints[2] = np.repeat(ints[2], 2, axis=1)[:, ::2]
+        out = np.empty((40, 33), dtype=np.int32)
+        matmul.matmul_chain(ints, out=out, threads=2)
+        assert np.array_equal(out, np.linalg.multi_dot(ints))
+        assert np.array_equal(matmul.matmul_chain(ints[1:3]), ints[1] @ ints[2])
+
+        matmul.tune(shapes=[(16, 16, 16)], dtypes=[np.float64], kernels=["gemm"],
+                    repeat=1, save=False)
+
+        assert matmul.matmul_chain_plan(xs)["seconds"] > 0
+
+        with pytest.raises(ValueError, match="two"):
+            matmul.matmul_chain(xs[:1])
+        with pytest.raises(RuntimeError, match="Incompatible"):
+            matmul.matmul_chain([xs[0], xs[2]])
+        with pytest.raises(TypeError, match="same dtype"):
+            matmul.matmul_chain([xs[0], xs[1].astype(np.float32)])
+    finally:
+        matmul.set_tuning_cache_path(saved)
+
+def test_matrix_power():
+    rng = np.random.default_rng(7)
+
+    def reference(a, k, p):
+        r = np.eye(len(a), dtype=np.int64).astype(object) % p
+        x = a.astype(object) % p
+        for bit in bin(k)[2:]:
+            r = r.dot(r) % p
+            if bit == "1":
+                r = r.dot(x) % p
+        return r
+
+    for n in (1, 6, 45, 90):
+        a = rng.integers(0, 2, size=(n, n), dtype=np.int32)
+        for k in (0, 1, 2, 7, 20):
+            assert np.array_equal(
+                matmul.matrix_power(a, k), np.linalg.matrix_power(a, k))
+            for p in (1, 97, 2**31 - 1):
+                c = matmul.matrix_power(a, k, mod=p)
+                assert c.dtype == np.int32 and np.array_equal(c, reference(a, k, p))
+        x = rng.standard_normal((n, n)) / n
+        np.testing.assert_allclose(
+            matmul.matrix_power(x, 9), np.linalg.matrix_power(x, 9), rtol=1e-8,
+            atol=1e-12)
+
+    # 模很大时每累加一项就取一次模
+    a = rng.integers(-5, 5, size=(20, 20), dtype=np.int64)
+    assert np.array_equal(matmul.matrix_power(a, 11, mod=3_000_000_019),
+                          reference(a, 11, 3_000_000_019))
+    a = rng.integers(0, 2, size=(30, 30), dtype=np.int32)
+    out = np.zeros((30, 64), dtype=np.int32)[:, :30]
+    matmul.matrix_power(a, 6, out=out, threads=2)
+    assert np.array_equal(out, np.linalg.matrix_power(a, 6))
+    with pytest.raises(ValueError, match="square"):
+        matmul.matrix_power(a[:, :5], 2)
+    with pytest.raises(ValueError, match="non-negative"):
+        matmul.matrix_power(a, -1)
+    with pytest.raises(ValueError, match="integer"):
+        matmul.matrix_power(a.astype(np.float32), 2, mod=7)
+    with pytest.raises(ValueError, match="fit"):
+        matmul.matrix_power(a, 2, mod=2**32)
+    with pytest.raises(ValueError, match="too large"):
+        matmul.matrix_power(a.astype(np.int64), 2, mod=2**40)
+
+def test_distributed():
+    rng = np.random.default_rng(8)
+    for transport in ("shm", "socket"):
+        with distributed.local_cluster(3, transport) as cluster:
+            for n, m, p in ((1, 1, 1), (2, 5, 1), (70, 300, 50), (33, 700, 91)):
+                a = rng.integers(-9, 9, size=(n, m), dtype=np.int64)
+                b = rng.integers(-9, 9, size=(m, p), dtype=np.int64)
+                assert np.array_equal(cluster.matmul(a, b, panel=64), a @ b)
+                x, y = a.astype(np.float32), b.astype(np.float32)
+                np.testing.assert_allclose(
+                    cluster.matmul(x, y, panel=100), x @ y, rtol=1e-5)
+            out = np.empty((4, 3))
+            assert cluster.matmul(np.ones((4, 0)), np.ones((0, 3)), out=out) is out
+            assert not out.any()
+            with pytest.raises(TypeError):
+                cluster.matmul(x, b)
+            with pytest.raises(RuntimeError, match="Incompatible"):
+                cluster.matmul(a, a)
+            with pytest.raises(ValueError, match="kernel"):
+                cluster.matmul(a, b, kernel="nope")
+    # 共享内存中的 panel 是切片, 只接受连续输入的内核在 worker 中失败, 集群仍可继续使用
+    with distributed.local_cluster(2) as cluster:
+        a = rng.standard_normal((40, 40))
+        with pytest.raises(RuntimeError, match="C-contiguous"):
+            cluster.matmul(a, a, kernel="chunk", panel=16)
+        np.testing.assert_allclose(
+            cluster.matmul(a, a, kernel="multithread_gemm"), a @ a)
+
+    assert distributed.grid_of(4, 100, 100) == (2, 2)
+    assert distributed.grid_of(4, 1000, 10) == (4, 1)
+
 if __name__ == "__main__":
     test_hello()
     test_trivial()
@@ -52,4 +982,37 @@ if __name__ == "__main__":
     test_transpose()
     test_autosimd()
     test_simd()
-    test_simd_optimized()
\ No newline at end of file
+    test_simd_optimized()
+    test_gemm()
+    test_multithread_gemm()
+    test_dispatch()
+    test_submit()
+    test_matmul_async()
+    test_layouts()
+    test_layout_errors()
+    test_packed_matrix()
+    test_pack_cache()
+    test_out_alpha_beta()
+    test_out_errors()
+    test_matmul_batched()
+    test_matmul_batched_errors()
+    test_dtypes()
+    test_dtype_values()
+    test_dtype_errors()
+    test_threads()
+    test_empty()
+    test_strassen()
+    test_int8()
+    test_int8_errors()
+    test_tune(pathlib.Path(tempfile.mkdtemp()))
+    test_out_of_core(pathlib.Path(tempfile.mkdtemp()))
+    test_sparse()
+    test_skinny()
+    test_profile()
+    test_phase_timing()
+    test_thread_pool()
+    test_c_api()
+    test_epilogue()
+    test_matmul_chain(pathlib.Path(tempfile.mkdtemp()))
+    test_matrix_power()
+    test_distributed()
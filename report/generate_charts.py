@@ -1,298 +1,420 @@
 #!/usr/bin/env python3
 """
 矩阵乘法性能分析图表生成脚本
+
+读取 benchmark/main.py --json 的输出, 生成各内核的耗时, GOP/s 与 roofline 图表:
+
+    uv run benchmark/main.py --json report/benchmark.json
+    uv run report/generate_charts.py report/benchmark.json
 """
 
+import argparse
+import json
+from pathlib import Path
+from typing import Any
+
+import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-from typing import Dict, List, Tuple
 
 # 设置中文字体
-plt.rcParams['font.sans-serif'] = ['SimHei', 'Arial Unicode MS', 'DejaVu Sans']
-plt.rcParams['axes.unicode_minus'] = False
-
-# 性能数据 (从benchmark结果中提取)
-performance_data = {
-    'numpy': [0.0722, 0.6631, 9.8778, 80.7523, 950.1124, 11928.2853, 259570.5816],
-    'trivial': [0.1160, 1.2753, 13.7274, 120.6185, 859.7644, 9677.0381, 211787.5126],
-    'transpose loop iter': [0.0502, 0.4082, 2.5376, 8.8812, 66.0672, 527.7147, 4244.6427],
-    'multi-thread': [0.0640, 0.3820, 1.5725, 11.5955, 84.4738, 662.8226, 6127.7839],
-    'chunk': [0.1018, 0.3982, 2.8003, 11.9732, 100.5427, 873.4043, 8381.0507],
-    'chunk, multi-thread': [0.5588, 1.7377, 3.1473, 13.0390, 105.2605, 830.2613, 8694.7662],
-    'transpose matrix B': [0.0305, 0.2732, 2.0661, 8.4455, 58.6889, 471.1689, 4177.3346],
-    'SIMD (auto)': [0.0786, 0.3009, 2.5551, 8.5047, 57.9486, 466.4718, 4165.2117],
-    'SIMD (manual)': [0.0564, 0.7533, 2.6572, 16.3190, 132.4153, 1302.4115, 11850.1109],
-    'SIMD (optimized)': [0.0541, 0.6838, 1.0338, 7.6023, 59.8543, 481.0391, 4162.3652],
-    'SIMD, multi-thread': [0.1015, 0.8904, 1.2360, 2.8579, 15.5927, 120.3897, 1514.3115]
-}
+plt.rcParams["font.sans-serif"] = ["SimHei", "Arial Unicode MS", "DejaVu Sans"]
+plt.rcParams["axes.unicode_minus"] = False
+
+Record = dict[str, Any]
+Shape = tuple[int, int, int]
 
-matrix_sizes = [64, 128, 256, 512, 1024, 2048, 4096]
-
-# 颜色映射
-colors = {
-    'numpy': '#1f77b4',
-    'trivial': '#ff7f0e',
-    'transpose loop iter': '#2ca02c',
-    'multi-thread': '#d62728',
-    'chunk': '#9467bd',
-    'chunk, multi-thread': '#8c564b',
-    'transpose matrix B': '#e377c2',
-    'SIMD (auto)': '#7f7f7f',
-    'SIMD (manual)': '#bcbd22',
-    'SIMD (optimized)': '#17becf',
-    'SIMD, multi-thread': '#ff9896'
+# 按优化技术分组, 只保留结果中出现的方法
+technique_groups = {
+    "基础实现": ["numpy", "trivial"],
+    "循环优化": ["transpose loop iter", "transpose matrix B"],
+    "并行化": ["multi-thread", "chunk, multi-thread"],
+    "缓存优化": ["chunk"],
+    "SIMD优化": [
+        "SIMD (auto)", "SIMD (manual)", "SIMD (optimized)", "SIMD, multi-thread",
+    ],
+    "分块打包": ["GEMM (packed)", "GEMM, multi-thread", "Strassen", "auto (tuned)"],
 }
 
-def create_performance_comparison_chart():
+
+class Report:
+    """一次基准测试的结果, 按元素类型筛选"""
+
+    def __init__(self, path: str, dtype: str | None = None):
+        with Path(path).open() as f:
+            data = json.load(f)
+        self.host: Record = data.get("host", {})
+        self.peaks: Record | None = data.get("peaks")
+        results: list[Record] = data["results"]
+        dtypes = list(dict.fromkeys(r["dtype"] for r in results))
+        self.dtype = dtype or dtypes[0]
+        if self.dtype not in dtypes:
+            available = ", ".join(dtypes)
+            raise SystemExit(
+                f"no results for dtype {self.dtype} (available: {available})")
+        self.results = [r for r in results if r["dtype"] == self.dtype]
+        self.methods = list(dict.fromkeys(r["kernel"] for r in self.results))
+        self.shapes: list[Shape] = list(
+            dict.fromkeys(tuple(r["shape"]) for r in self.results))
+        self.by_key = {(r["kernel"], tuple(r["shape"])): r for r in self.results}
+        # 方阵单独取出, 用于随尺寸变化的曲线
+        self.matrix_sizes = sorted(n for n, m, p in self.shapes if n == m == p)
+        cmap = matplotlib.colormaps["tab20"]
+        self.colors = {method: cmap(i % 20) for i, method in enumerate(self.methods)}
+
+    def get(self, method: str, shape: Shape, field: str = "median") -> float:
+        r = self.by_key.get((method, shape))
+        return float(r[field]) if r else float("nan")
+
+    def square_times(self, method: str) -> list[float]:
+        """method 在各方阵尺寸下的中位耗时 (ms)"""
+        return [self.get(method, (n, n, n)) * 1000 for n in self.matrix_sizes]
+
+    def peak_gops(self) -> float:
+        if self.peaks and self.dtype in self.peaks.get("gops", {}):
+            return float(self.peaks["gops"][self.dtype])
+        # 没有测量峰值时以观测到的最高值代替
+        return max(r["gops"] for r in self.results)
+
+    def bandwidth(self) -> float | None:
+        return float(self.peaks["bandwidth"]) if self.peaks else None
+
+
+def shape_label(shape: Shape) -> str:
+    return "x".join(map(str, shape))
+
+
+def arithmetic_intensity(shape: Shape, itemsize: int) -> float:
+    """每字节的运算次数, 按只读写一次 A, B, C 的最少访存量计算"""
+    n, m, p = shape
+    return 2 * n * m * p / (itemsize * (n * m + m * p + n * p))
+
+
+def label_bars(ax, bars, values, fmt: str) -> None:
+    for bar, value in zip(bars, values, strict=True):
+        height = bar.get_height()
+        ax.text(bar.get_x() + bar.get_width() / 2.0, height,
+                fmt.format(value), ha="center", va="bottom", fontsize=9)
+
+
+def create_performance_comparison_chart(report: Report, size: int, output: Path):
     """创建性能对比图表"""
-    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 6))
-    
+    _, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 6))
+
     # 图1: 不同矩阵大小的性能曲线
-    for method, times in performance_data.items():
-        ax1.plot(matrix_sizes, times, marker='o', label=method, 
-                color=colors.get(method, '#000000'), linewidth=2, markersize=4)
-    
-    ax1.set_xlabel('矩阵大小 (N)', fontsize=12)
-    ax1.set_ylabel('执行时间 (ms)', fontsize=12)
-    ax1.set_title('不同矩阵大小下的性能对比', fontsize=14)
-    ax1.legend(bbox_to_anchor=(1.05, 1), loc='upper left', fontsize=10)
+    for method in report.methods:
+        ax1.plot(report.matrix_sizes, report.square_times(method), marker="o",
+                 label=method, color=report.colors[method], linewidth=2, markersize=4)
+
+    ax1.set_xlabel("矩阵大小 (N)", fontsize=12)
+    ax1.set_ylabel("执行时间 (ms)", fontsize=12)
+    ax1.set_title(f"不同矩阵大小下的性能对比 ({report.dtype})", fontsize=14)
+    ax1.legend(bbox_to_anchor=(1.05, 1), loc="upper left", fontsize=10)
     ax1.grid(True, alpha=0.3)
-    ax1.set_xscale('log', base=2)
-    ax1.set_yscale('log')
-    
-    # 图2: N=4096时的柱状图
-    n4096_times = [performance_data[method][6] for method in performance_data.keys()]
-    methods = list(performance_data.keys())
-    
-    bars = ax2.bar(range(len(methods)), n4096_times, 
-                   color=[colors.get(method, '#000000') for method in methods], alpha=0.7)
-    ax2.set_xlabel('实现方法', fontsize=12)
-    ax2.set_ylabel('执行时间 (ms)', fontsize=12)
-    ax2.set_title('N=4096时的性能对比', fontsize=14)
+    ax1.set_xscale("log", base=2)
+    ax1.set_yscale("log")
+
+    # 图2: N=size 时的柱状图
+    methods = report.methods
+    times = [report.get(method, (size, size, size)) * 1000 for method in methods]
+
+    bars = ax2.bar(range(len(methods)), times,
+                   color=[report.colors[method] for method in methods], alpha=0.7)
+    ax2.set_xlabel("实现方法", fontsize=12)
+    ax2.set_ylabel("执行时间 (ms)", fontsize=12)
+    ax2.set_title(f"N={size}时的性能对比", fontsize=14)
     ax2.set_xticks(range(len(methods)))
-    ax2.set_xticklabels(methods, rotation=45, ha='right', fontsize=10)
-    ax2.grid(True, alpha=0.3, axis='y')
-    
-    # 在柱状图上显示数值
-    for bar, time_ms in zip(bars, n4096_times):
-        height = bar.get_height()
-        ax2.text(bar.get_x() + bar.get_width() / 2.0, height,
-                f'{time_ms:.1f}', ha='center', va='bottom', fontsize=9)
-    
+    ax2.set_xticklabels(methods, rotation=45, ha="right", fontsize=10)
+    ax2.grid(True, alpha=0.3, axis="y")
+    label_bars(ax2, bars, times, "{:.1f}")
+
     plt.tight_layout()
-    plt.savefig('report/performance_comparison.png', dpi=300, bbox_inches='tight')
-    plt.show()
+    plt.savefig(output / "performance_comparison.png", dpi=300, bbox_inches="tight")
 
-def create_speedup_analysis():
+def create_speedup_analysis(report: Report, size: int, output: Path):
     """创建加速比分析图表"""
-    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 6))
-    
+    _, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 6))
+
     # 计算加速比 (相对于numpy)
+    numpy_times = report.square_times("numpy")
     speedup_data = {}
-    numpy_times = performance_data['numpy']
-    
-    for method, times in performance_data.items():
-        if method != 'numpy':
-            speedups = [numpy_times[i] / times[i] for i in range(len(times))]
-            speedup_data[method] = speedups
-    
+    for method in report.methods:
+        if method != "numpy":
+            times = report.square_times(method)
+            speedup_data[method] = [
+                base / time for base, time in zip(numpy_times, times, strict=True)]
+
     # 图1: 加速比随矩阵大小的变化
     for method, speedups in speedup_data.items():
-        ax1.plot(matrix_sizes, speedups, marker='o', label=method,
-                color=colors.get(method, '#000000'), linewidth=2, markersize=4)
-    
-    ax1.set_xlabel('矩阵大小 (N)', fontsize=12)
-    ax1.set_ylabel('加速比 (相对于numpy)', fontsize=12)
-    ax1.set_title('加速比随矩阵大小的变化', fontsize=14)
-    ax1.legend(bbox_to_anchor=(1.05, 1), loc='upper left', fontsize=10)
+        ax1.plot(report.matrix_sizes, speedups, marker="o", label=method,
+                 color=report.colors[method], linewidth=2, markersize=4)
+
+    ax1.set_xlabel("矩阵大小 (N)", fontsize=12)
+    ax1.set_ylabel("加速比 (相对于numpy)", fontsize=12)
+    ax1.set_title("加速比随矩阵大小的变化", fontsize=14)
+    ax1.legend(bbox_to_anchor=(1.05, 1), loc="upper left", fontsize=10)
     ax1.grid(True, alpha=0.3)
-    ax1.set_xscale('log', base=2)
-    
-    # 图2: N=4096时的加速比柱状图
-    n4096_speedups = [speedup_data[method][6] for method in speedup_data.keys()]
-    methods = list(speedup_data.keys())
-    
-    # 按加速比排序
-    sorted_data = sorted(zip(methods, n4096_speedups), key=lambda x: x[1], reverse=True)
-    sorted_methods, sorted_speedups = zip(*sorted_data)
-    
+    ax1.set_xscale("log", base=2)
+
+    # 图2: N=size 时的加速比柱状图, 按加速比排序
+    index = report.matrix_sizes.index(size)
+    sorted_data = sorted(
+        ((method, speedups[index]) for method, speedups in speedup_data.items()),
+        key=lambda x: x[1], reverse=True)
+    sorted_methods = [method for method, _ in sorted_data]
+    sorted_speedups = [speedup for _, speedup in sorted_data]
+
     bars = ax2.bar(range(len(sorted_methods)), sorted_speedups,
-                   color=[colors.get(method, '#000000') for method in sorted_methods], alpha=0.7)
-    ax2.set_xlabel('实现方法', fontsize=12)
-    ax2.set_ylabel('加速比', fontsize=12)
-    ax2.set_title('N=4096时的加速比排名', fontsize=14)
+                   color=[report.colors[method] for method in sorted_methods],
+                   alpha=0.7)
+    ax2.set_xlabel("实现方法", fontsize=12)
+    ax2.set_ylabel("加速比", fontsize=12)
+    ax2.set_title(f"N={size}时的加速比排名", fontsize=14)
     ax2.set_xticks(range(len(sorted_methods)))
-    ax2.set_xticklabels(sorted_methods, rotation=45, ha='right', fontsize=10)
-    ax2.grid(True, alpha=0.3, axis='y')
-    
-    # 在柱状图上显示数值
-    for bar, speedup in zip(bars, sorted_speedups):
-        height = bar.get_height()
-        ax2.text(bar.get_x() + bar.get_width() / 2.0, height,
-                f'{speedup:.1f}x', ha='center', va='bottom', fontsize=9)
-    
+    ax2.set_xticklabels(sorted_methods, rotation=45, ha="right", fontsize=10)
+    ax2.grid(True, alpha=0.3, axis="y")
+    label_bars(ax2, bars, sorted_speedups, "{:.1f}x")
+
     plt.tight_layout()
-    plt.savefig('report/speedup_analysis.png', dpi=300, bbox_inches='tight')
-    plt.show()
+    plt.savefig(output / "speedup_analysis.png", dpi=300, bbox_inches="tight")
 
-def create_optimization_technique_analysis():
+def create_optimization_technique_analysis(report: Report, size: int, output: Path):
     """创建优化技术分析图表"""
-    fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(16, 12))
-    
-    # 按优化技术分组
-    technique_groups = {
-        '基础实现': ['numpy', 'trivial'],
-        '循环优化': ['transpose loop iter', 'transpose matrix B'],
-        '并行化': ['multi-thread', 'chunk, multi-thread'],
-        '缓存优化': ['chunk'],
-        'SIMD优化': ['SIMD (auto)', 'SIMD (manual)', 'SIMD (optimized)', 'SIMD, multi-thread']
-    }
-    
-    # 图1: 不同优化技术的性能对比 (N=4096)
-    n4096_times = performance_data['numpy'][6]  # numpy基准时间
+    _, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(16, 12))
+    square = (size, size, size)
+
+    # 图1: 不同优化技术的最佳性能 (N=size)
+    numpy_time = report.get("numpy", square) * 1000
     technique_performance = {}
-    
     for technique, methods in technique_groups.items():
-        if technique == '基础实现':
-            technique_performance[technique] = n4096_times
-        else:
-            min_time = min(performance_data[method][6] for method in methods)
-            technique_performance[technique] = min_time
-    
+        present = [method for method in methods if method in report.methods]
+        if technique == "基础实现":
+            technique_performance[technique] = numpy_time
+        elif present:
+            technique_performance[technique] = min(
+                report.get(method, square) * 1000 for method in present)
+
     techniques = list(technique_performance.keys())
     times = list(technique_performance.values())
-    
+
     bars = ax1.bar(techniques, times, alpha=0.7)
-    ax1.set_ylabel('执行时间 (ms)', fontsize=12)
-    ax1.set_title('不同优化技术的最佳性能 (N=4096)', fontsize=14)
-    ax1.set_xticklabels(techniques, rotation=45, ha='right')
-    ax1.grid(True, alpha=0.3, axis='y')
-    
-    # 在柱状图上显示数值
-    for bar, time_ms in zip(bars, times):
-        height = bar.get_height()
-        ax1.text(bar.get_x() + bar.get_width() / 2.0, height,
-                f'{time_ms:.1f}', ha='center', va='bottom', fontsize=9)
-    
+    ax1.set_ylabel("执行时间 (ms)", fontsize=12)
+    ax1.set_title(f"不同优化技术的最佳性能 (N={size})", fontsize=14)
+    ax1.set_xticks(range(len(techniques)))
+    ax1.set_xticklabels(techniques, rotation=45, ha="right")
+    ax1.grid(True, alpha=0.3, axis="y")
+    label_bars(ax1, bars, times, "{:.1f}")
+
     # 图2: 优化技术加速比
-    speedups = [n4096_times / time for time in times]
+    speedups = [numpy_time / time for time in times]
     bars = ax2.bar(techniques, speedups, alpha=0.7)
-    ax2.set_ylabel('加速比', fontsize=12)
-    ax2.set_title('不同优化技术的加速比 (N=4096)', fontsize=14)
-    ax2.set_xticklabels(techniques, rotation=45, ha='right')
-    ax2.grid(True, alpha=0.3, axis='y')
-    
-    # 在柱状图上显示数值
-    for bar, speedup in zip(bars, speedups):
-        height = bar.get_height()
-        ax2.text(bar.get_x() + bar.get_width() / 2.0, height,
-                f'{speedup:.1f}x', ha='center', va='bottom', fontsize=9)
-    
+    ax2.set_ylabel("加速比", fontsize=12)
+    ax2.set_title(f"不同优化技术的加速比 (N={size})", fontsize=14)
+    ax2.set_xticks(range(len(techniques)))
+    ax2.set_xticklabels(techniques, rotation=45, ha="right")
+    ax2.grid(True, alpha=0.3, axis="y")
+    label_bars(ax2, bars, speedups, "{:.1f}x")
+
     # 图3: 矩阵大小对性能的影响
-    selected_methods = ['numpy', 'transpose matrix B', 'SIMD (auto)', 'SIMD, multi-thread']
+    selected_methods = ["numpy", "transpose matrix B", "SIMD (auto)",
+                        "SIMD, multi-thread", "GEMM, multi-thread"]
     for method in selected_methods:
-        ax3.plot(matrix_sizes, performance_data[method], marker='o', label=method,
-                color=colors.get(method, '#000000'), linewidth=2, markersize=4)
-    
-    ax3.set_xlabel('矩阵大小 (N)', fontsize=12)
-    ax3.set_ylabel('执行时间 (ms)', fontsize=12)
-    ax3.set_title('关键方法的性能随矩阵大小变化', fontsize=14)
+        if method in report.methods:
+            ax3.plot(report.matrix_sizes, report.square_times(method), marker="o",
+                     label=method, color=report.colors[method], linewidth=2,
+                     markersize=4)
+
+    ax3.set_xlabel("矩阵大小 (N)", fontsize=12)
+    ax3.set_ylabel("执行时间 (ms)", fontsize=12)
+    ax3.set_title("关键方法的性能随矩阵大小变化", fontsize=14)
     ax3.legend()
     ax3.grid(True, alpha=0.3)
-    ax3.set_xscale('log', base=2)
-    ax3.set_yscale('log')
-    
-    # 图4: 性能瓶颈分析
-    # 计算不同矩阵大小下的最佳方法
-    best_methods = []
-    best_times = []
-    
-    for i, size in enumerate(matrix_sizes):
-        min_time = float('inf')
-        best_method = ''
-        for method, times in performance_data.items():
-            if times[i] < min_time:
-                min_time = times[i]
-                best_method = method
-        best_methods.append(best_method)
-        best_times.append(min_time)
-    
-    # 统计每种方法成为最佳的次数
-    method_counts = {}
-    for method in best_methods:
-        method_counts[method] = method_counts.get(method, 0) + 1
-    
+    ax3.set_xscale("log", base=2)
+    ax3.set_yscale("log")
+
+    # 图4: 所有形状 (含矩形与奇数尺寸) 中每种方法成为最佳的次数
+    method_counts: dict[str, int] = {}
+    for shape in report.shapes:
+        best_method = min(report.methods, key=lambda method: np.nan_to_num(
+            report.get(method, shape), nan=float("inf")))
+        method_counts[best_method] = method_counts.get(best_method, 0) + 1
+
     methods = list(method_counts.keys())
     counts = list(method_counts.values())
-    
+
     bars = ax4.bar(methods, counts, alpha=0.7)
-    ax4.set_ylabel('成为最佳方法的次数', fontsize=12)
-    ax4.set_title('不同矩阵大小下的最佳方法统计', fontsize=14)
-    ax4.set_xticklabels(methods, rotation=45, ha='right')
-    ax4.grid(True, alpha=0.3, axis='y')
-    
-    # 在柱状图上显示数值
-    for bar, count in zip(bars, counts):
-        height = bar.get_height()
-        ax4.text(bar.get_x() + bar.get_width() / 2.0, height,
-                str(count), ha='center', va='bottom', fontsize=9)
-    
+    ax4.set_ylabel("成为最佳方法的次数", fontsize=12)
+    ax4.set_title("不同形状下的最佳方法统计", fontsize=14)
+    ax4.set_xticks(range(len(methods)))
+    ax4.set_xticklabels(methods, rotation=45, ha="right")
+    ax4.grid(True, alpha=0.3, axis="y")
+    label_bars(ax4, bars, counts, "{}")
+
     plt.tight_layout()
-    plt.savefig('report/optimization_technique_analysis.png', dpi=300, bbox_inches='tight')
-    plt.show()
+    plt.savefig(output / "optimization_technique_analysis.png", dpi=300,
+                bbox_inches="tight")
+
+def create_shape_charts(report: Report, output: Path):
+    """创建各形状下的耗时与 GOP/s 图表 (含矩形与奇数尺寸)"""
+    _, (ax1, ax2) = plt.subplots(2, 1, figsize=(16, 12))
+    x = np.arange(len(report.shapes))
+    width = 0.8 / len(report.methods)
+
+    for i, method in enumerate(report.methods):
+        times = [report.get(method, shape) * 1000 for shape in report.shapes]
+        gops = [report.get(method, shape, "gops") for shape in report.shapes]
+        offset = x - 0.4 + (i + 0.5) * width
+        ax1.bar(offset, times, width, label=method, color=report.colors[method])
+        ax2.bar(offset, gops, width, label=method, color=report.colors[method])
+
+    labels = [shape_label(shape) for shape in report.shapes]
+    ax1.set_ylabel("执行时间 (ms)", fontsize=12)
+    ax1.set_title(f"各形状 (N x M x P) 的执行时间 ({report.dtype})", fontsize=14)
+    ax1.set_yscale("log")
+    ax2.set_ylabel("GOP/s", fontsize=12)
+    ax2.set_title(f"各形状 (N x M x P) 的吞吐量 ({report.dtype})", fontsize=14)
+    for ax in (ax1, ax2):
+        ax.set_xticks(x)
+        ax.set_xticklabels(labels, rotation=45, ha="right", fontsize=9)
+        ax.grid(True, alpha=0.3, axis="y")
+    ax1.legend(bbox_to_anchor=(1.01, 1), loc="upper left", fontsize=9)
+
+    plt.tight_layout()
+    plt.savefig(output / "shape_performance.png", dpi=300, bbox_inches="tight")
+
+def create_roofline_chart(report: Report, output: Path) -> pd.DataFrame:
+    """创建 roofline 图表, 并判断每个 (方法, 形状) 受带宽还是计算限制"""
+    itemsize = np.dtype(report.dtype).itemsize
+    peak = report.peak_gops()
+    bandwidth = report.bandwidth()
+    ridge = peak / bandwidth if bandwidth else 0.0
 
-def create_summary_table():
+    rows = []
+    for r in report.results:
+        shape = tuple(r["shape"])
+        intensity = arithmetic_intensity(shape, itemsize)
+        roof = min(peak, bandwidth * intensity) if bandwidth else peak
+        rows.append({
+            "方法": r["kernel"],
+            "形状": shape_label(shape),
+            "运算强度(op/B)": intensity,
+            "GOP/s": r["gops"],
+            "上界(GOP/s)": roof,
+            "达到上界": r["gops"] / roof,
+            "瓶颈": "带宽" if intensity < ridge else "计算",
+        })
+    df = pd.DataFrame(rows)
+
+    _, ax = plt.subplots(figsize=(12, 8))
+    lo = min(df["运算强度(op/B)"].min(), ridge or np.inf) / 2
+    hi = df["运算强度(op/B)"].max() * 2
+    xs = np.logspace(np.log10(lo), np.log10(hi), 200)
+    if bandwidth:
+        ax.plot(xs, np.minimum(peak, bandwidth * xs), color="black", linewidth=2,
+                label=f"roofline: {peak:.1f} GOP/s, {bandwidth:.1f} GB/s")
+        ax.axvline(ridge, color="gray", linestyle="--", alpha=0.5)
+    else:
+        ax.axhline(peak, color="black", linewidth=2, label=f"观测峰值 {peak:.1f} GOP/s")
+    for method in report.methods:
+        part = df[df["方法"] == method]
+        ax.scatter(part["运算强度(op/B)"], part["GOP/s"], label=method,
+                   color=report.colors[method], s=30, alpha=0.8)
+
+    ax.set_xscale("log")
+    ax.set_yscale("log")
+    ax.set_xlabel("运算强度 (op/byte)", fontsize=12)
+    ax.set_ylabel("GOP/s", fontsize=12)
+    ax.set_title(f'Roofline ({report.dtype}, {report.host.get("isa", "")}, '
+                 f'{report.host.get("threads", "?")} 线程)', fontsize=14)
+    ax.legend(bbox_to_anchor=(1.01, 1), loc="upper left", fontsize=9)
+    ax.grid(True, which="both", alpha=0.3)
+
+    plt.tight_layout()
+    plt.savefig(output / "roofline.png", dpi=300, bbox_inches="tight")
+    return df
+
+def create_summary_table(report: Report, size: int, output: Path):
     """创建性能总结表格"""
-    # 计算N=4096时的性能数据
-    n4096_data = []
-    numpy_baseline = performance_data['numpy'][6]
-    
-    for method, times in performance_data.items():
-        time_ms = times[6]  # N=4096的时间
+    square = (size, size, size)
+    numpy_baseline = report.get("numpy", square) * 1000
+    summary = []
+    for method in report.methods:
+        time_ms = report.get(method, square) * 1000
         speedup = numpy_baseline / time_ms
-        n4096_data.append({
-            '方法': method,
-            '执行时间(ms)': f'{time_ms:.2f}',
-            '加速比': f'{speedup:.2f}x',
-            '相对性能': f'{speedup/numpy_baseline*100:.1f}%'
+        summary.append({
+            "方法": method,
+            "执行时间(ms)": f"{time_ms:.2f}",
+            "p5-p95(ms)": f'{report.get(method, square, "p5") * 1000:.2f}-'
+                          f'{report.get(method, square, "p95") * 1000:.2f}',
+            "GOP/s": f'{report.get(method, square, "gops"):.2f}',
+            "加速比": f"{speedup:.2f}x",
         })
-    
+
     # 按加速比排序
-    n4096_data.sort(key=lambda x: float(x['加速比'].replace('x', '')), reverse=True)
-    
+    summary.sort(key=lambda x: float(x["加速比"].replace("x", "")), reverse=True)
+
     # 创建DataFrame并保存为CSV
-    df = pd.DataFrame(n4096_data)
-    df.to_csv('report/performance_summary.csv', index=False, encoding='utf-8-sig')
-    
+    df = pd.DataFrame(summary)
+    df.to_csv(output / "performance_summary.csv", index=False, encoding="utf-8-sig")
+
     # 打印表格
-    print("矩阵乘法性能总结 (N=4096)")
+    print(f"矩阵乘法性能总结 (N={size}, {report.dtype})")
     print("=" * 80)
-    print(f"{'方法':<20} {'执行时间(ms)':<12} {'加速比':<10} {'相对性能':<12}")
+    print(f"{'方法':<20} {'执行时间(ms)':<12} {'GOP/s':<10} {'加速比':<10}")
     print("-" * 80)
-    for row in n4096_data:
-        print(f"{row['方法']:<20} {row['执行时间(ms)']:<12} {row['加速比']:<10} {row['相对性能']:<12}")
-    
+    for row in summary:
+        print(f"{row['方法']:<20} {row['执行时间(ms)']:<12} {row['GOP/s']:<10} "
+              f"{row['加速比']:<10}")
+
     return df
 
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(
+        description="Generate report charts from benchmark JSON")
+    parser.add_argument("results", help="JSON written by benchmark/main.py --json")
+    parser.add_argument("--dtype", default=None,
+                        help="element type to plot (default: the first in the results)")
+    parser.add_argument("--size", type=int, default=None,
+                        help="square size for the bar charts (default: the largest)")
+    parser.add_argument("--output", type=Path, default=Path(__file__).resolve().parent,
+                        help="output directory (default: report/)")
+    parser.add_argument("--show", action="store_true", help="show the charts")
+    args = parser.parse_args()
+
+    report = Report(args.results, args.dtype)
+    if "numpy" not in report.methods or not report.matrix_sizes:
+        raise SystemExit("the results need numpy and at least one square shape")
+    size = args.size or report.matrix_sizes[-1]
+    if size not in report.matrix_sizes:
+        raise SystemExit(f"no square results for N={size}")
+    args.output.mkdir(parents=True, exist_ok=True)
+
     print("生成矩阵乘法性能分析图表...")
-    
+
     # 创建各种图表
-    create_performance_comparison_chart()
-    create_speedup_analysis()
-    create_optimization_technique_analysis()
-    
+    create_performance_comparison_chart(report, size, args.output)
+    create_speedup_analysis(report, size, args.output)
+    create_optimization_technique_analysis(report, size, args.output)
+    create_shape_charts(report, args.output)
+    roofline = create_roofline_chart(report, args.output)
+
     # 创建总结表格
-    summary_df = create_summary_table()
-    
-    print("\n图表生成完成！")
-    print("生成的文件：")
-    print("- report/performance_comparison.png")
-    print("- report/speedup_analysis.png")
-    print("- report/optimization_technique_analysis.png")
-    print("- report/performance_summary.csv")
+    create_summary_table(report, size, args.output)
+    roofline.to_csv(args.output / "roofline.csv", index=False, encoding="utf-8-sig")
+    if report.bandwidth() is None:
+        print("\n结果中没有测量的峰值, roofline 只画出观测到的最高 GOP/s")
+
+    if args.show:
+        plt.show()
+
+    print("\n图表生成完成!")
+    print("生成的文件:")
+    for name in ("performance_comparison.png", "speedup_analysis.png",
+                 "optimization_technique_analysis.png", "shape_performance.png",
+                 "roofline.png", "performance_summary.csv", "roofline.csv"):
+        print(f"- {args.output / name}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -12,7 +12,8 @@ from pathlib import Path
 
 def process_stub_file(stub_file: Path) -> None:
     """
-    Process the generated stub file, replacing numpy.ndarray[numpy.int32] with NDArray[np.int32]
+    Process the generated stub file, replacing numpy.ndarray[numpy.<dtype>] (and the
+    numpy.typing.NDArray spelling of newer pybind11) with NDArray[np.<dtype>]
     """
     with open(stub_file, 'r', encoding='utf-8') as f:
         content = f.read()
@@ -26,9 +27,9 @@ def process_stub_file(stub_file: Path) -> None:
     new_imports = r'\1from numpy.typing import NDArray\nimport numpy as np\n'
     content = re.sub(import_pattern, new_imports, content)
 
-    # Replace all numpy.ndarray[numpy.int32] with NDArray[np.int32]
+    # Replace numpy.ndarray[numpy.<dtype>] with NDArray[np.<dtype>] for every element type
     content = re.sub(
-        r'numpy\.ndarray\[numpy\.int32\]', 'NDArray[np.int32]', content)
+        r'numpy\.(?:typing\.NDArray|ndarray)\[numpy\.(\w+)\]', r'NDArray[np.\1]', content)
 
     # Write back to file
     with open(stub_file, 'w', encoding='utf-8') as f:
@@ -0,0 +1,100 @@
+#include "dispatch.hpp"
+#include "gemm.hpp"
+#include "int8.hpp"
+#include "isa.hpp"
+#include "simd.hpp"
+#include "sparse.hpp"
+#include "strassen.hpp"
+
+#include <atomic>
+#include <cstdlib>
+#include <stdexcept>
+
+MATMUL_DISPATCH_TABLE
+
+namespace dispatch {
+
+namespace {
+
+bool is_supported(const table& t) {
+    const std::string isa = t.isa;
+#ifdef MATMUL_DISPATCH_X86
+    const auto& cpu = isa::runtime::cpu();
+    const bool avx512 = cpu.avx512f && cpu.avx512dq && cpu.avx512bw && cpu.avx512vl &&
+                        cpu.avx2 && cpu.fma;
+    if (isa == "avx512_vnni") {
+        return avx512 && cpu.avx512_vnni;
+    }
+    if (isa == "avx512") {
+        return avx512;
+    }
+    if (isa == "avx_vnni") {
+        return cpu.avx2 && cpu.fma && cpu.avx_vnni;
+    }
+    if (isa == "avx2") {
+        return cpu.avx2 && cpu.fma;
+    }
+    if (isa == "sse4") {
+        return cpu.sse4_2 && cpu.popcnt;
+    }
+#endif
+    return isa == "baseline";
+}
+
+const table* all[] = {
+#ifdef MATMUL_DISPATCH_X86
+    &tables::avx512_vnni,
+    &tables::avx512,
+    &tables::avx_vnni,
+    &tables::avx2,
+    &tables::sse4,
+#endif
+    &tables::baseline,
+};
+
+const table* initial() {
+    // 允许通过环境变量 LIBMATMUL_ISA 固定内核版本, 不支持时回退到自动选择
+    if (const char* env = std::getenv("LIBMATMUL_ISA")) {
+        for (auto t : all) {
+            if (env == std::string(t->isa) && is_supported(*t)) {
+                return t;
+            }
+        }
+    }
+    return supported().front();
+}
+
+std::atomic<const table*>& current() {
+    static std::atomic<const table*> t{initial()};
+    return t;
+}
+
+}  // namespace
+
+std::vector<const table*> supported() {
+    std::vector<const table*> result;
+    for (auto t : all) {
+        if (is_supported(*t)) {
+            result.push_back(t);
+        }
+    }
+    return result;
+}
+
+const table& active() { return *current().load(std::memory_order_relaxed); }
+
+void select(const std::string& isa) {
+    for (auto t : all) {
+        if (isa != t->isa) {
+            continue;
+        }
+        if (!is_supported(*t)) {
+            throw std::invalid_argument("ISA not supported by this CPU: " + isa);
+        }
+        current().store(t, std::memory_order_relaxed);
+        return;
+    }
+    throw std::invalid_argument("Unknown ISA: " + isa);
+}
+
+}  // namespace dispatch
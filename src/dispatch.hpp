@@ -0,0 +1,201 @@
+#pragma once
+
+#include "epilogue.hpp"
+#include "typedef.h"
+
+#include <cstddef>
+#include <cstdint>
+#include <string>
+#include <vector>
+
+// 运行时指令集分发: 同一组内核以多种指令集编译进同一个库,
+// 导入时根据 cpuid 检测结果选择当前 CPU 支持的最快版本
+namespace dispatch {
+
+// 所有入口都计算 C = alpha * A @ B + beta * C (见 epilogue), beta 为 0 时不读取 C.
+// 每个入口按元素类型 T 实例化, T 取自 element_types
+
+// A, B, C 均为行主序连续存储
+template <typename T>
+using kernel_fn =
+    void (*)(const T* a, const T* b, T* c, int N, int M, int P, const epilogue<T>& ep);
+
+// b_tr 为 B 的转置 (P x M, 行主序连续存储)
+template <typename T>
+using kernel_bt_fn =
+    void (*)(const T* a, const T* b_tr, T* c, int N, int M, int P, const epilogue<T>& ep);
+
+// A, B 的行/列步长任意 (以元素为单位), C 为行主序, 行距 ldc
+template <typename T>
+using kernel_strided_fn = void (*)(
+    int N, int M, int P, const T* a, std::ptrdiff_t rsa, std::ptrdiff_t csa, const T* b,
+    std::ptrdiff_t rsb, std::ptrdiff_t csb, T* c, std::ptrdiff_t ldc, const epilogue<T>& ep);
+
+// 预打包的 B 格式: size(M, P) 为所需元素个数, pack 按该格式写入 dst (64 字节对齐).
+// 格式与指令集相关, 以 packing 对象的地址区分
+template <typename T> struct packing {
+    std::size_t (*size)(int M, int P);
+    void (*pack)(const T* b, std::ptrdiff_t rsb, std::ptrdiff_t csb, int M, int P, T* dst);
+};
+
+// A 的步长任意, b_packed 为按 kernel_entry::b_packing 格式打包的 B
+template <typename T>
+using kernel_prepacked_fn = void (*)(
+    int N, int M, int P, const T* a, std::ptrdiff_t rsa, std::ptrdiff_t csa, const T* b_packed,
+    T* c, std::ptrdiff_t ldc, const epilogue<T>& ep);
+
+// 批量乘法 C[i] = A[i] @ B[i], bsa/bsb/bsc 为批维步长 (0 表示广播);
+// b_packed 非空时为按 gemm 的 b_packing 格式打包的广播 B
+template <typename T>
+using kernel_batched_fn = void (*)(
+    int batch, int N, int M, int P, const T* a, std::ptrdiff_t bsa, std::ptrdiff_t rsa,
+    std::ptrdiff_t csa, const T* b, std::ptrdiff_t bsb, std::ptrdiff_t rsb, std::ptrdiff_t csb,
+    const T* b_packed, T* c, std::ptrdiff_t bsc, std::ptrdiff_t ldc, const epilogue<T>& ep);
+
+// 量化的 int8 乘法: A 为 TA (u8 或 s8), B 为 s8, C 为 int32 并按 int32 累加.
+// A, B 的行/列步长任意 (以元素为单位), C 为行主序, 行距 ldc
+template <typename TA>
+using kernel_int8_fn = void (*)(
+    int N, int M, int P, const TA* a, std::ptrdiff_t rsa, std::ptrdiff_t csa,
+    const std::int8_t* b, std::ptrdiff_t rsb, std::ptrdiff_t csb, std::int32_t* c,
+    std::ptrdiff_t ldc, const epilogue<std::int32_t>& ep);
+
+// 稀疏 x 稠密乘法, I 为下标类型 (取自 index_types), C 为行主序, 行距 ldc.
+// csr_dense: A 为 N x M 的 CSR (indptr 长 N + 1, indices 为列号), B 的步长任意
+template <typename T, typename I>
+using kernel_csr_fn = void (*)(
+    int N, int M, int P, const I* indptr, const I* indices, const T* values, const T* b,
+    std::ptrdiff_t rsb, std::ptrdiff_t csb, T* c, std::ptrdiff_t ldc, const epilogue<T>& ep);
+
+// dense_csc: B 为 M x P 的 CSC (indptr 长 P + 1, indices 为行号), A 的步长任意
+template <typename T, typename I>
+using kernel_csc_fn = void (*)(
+    int N, int M, int P, const T* a, std::ptrdiff_t rsa, std::ptrdiff_t csa, const I* indptr,
+    const I* indices, const T* values, T* c, std::ptrdiff_t ldc, const epilogue<T>& ep);
+
+// 一个内核的各个入口, 调用方按输入布局选择, 可选入口为空表示不支持
+template <typename T> struct kernel_entry {
+    kernel_fn<T> plain;
+    kernel_bt_fn<T> bt = nullptr;
+    kernel_strided_fn<T> strided = nullptr;
+    kernel_prepacked_fn<T> prepacked = nullptr;
+    const packing<T>* b_packing = nullptr;
+};
+
+// 一种元素类型的全部分发内核
+template <typename T> struct kernels {
+    kernel_entry<T> auto_simd;
+    kernel_entry<T> simd;
+    kernel_entry<T> simd_optimized;
+    kernel_entry<T> multithread_simd;
+    kernel_entry<T> gemm;
+    kernel_entry<T> multithread_gemm;
+    kernel_entry<T> strassen;
+    kernel_batched_fn<T> gemm_batched;
+};
+
+// 一种 A 元素类型的 int8 内核
+template <typename TA> struct int8_kernels {
+    kernel_int8_fn<TA> gemm;
+    kernel_int8_fn<TA> multithread_gemm;
+};
+
+// 一种元素类型, 一种下标类型的稀疏内核
+template <typename T, typename I> struct sparse_entry {
+    kernel_csr_fn<T, I> csr_dense;
+    kernel_csc_fn<T, I> dense_csc;
+};
+
+template <typename T> struct sparse_kernels {
+    template <typename I> using entry = sparse_entry<T, I>;
+
+    index_types::tuple<entry> indexed;
+
+    template <typename I> const sparse_entry<T, I>& of() const {
+        return std::get<sparse_entry<T, I>>(indexed);
+    }
+};
+
+struct table {
+    const char* isa;
+    element_types::tuple<kernels> typed;
+    int8_types::tuple<int8_kernels> int8;
+    element_types::tuple<sparse_kernels> sparse;
+
+    template <typename T> const kernels<T>& of() const { return std::get<kernels<T>>(typed); }
+
+    template <typename TA> const int8_kernels<TA>& int8_of() const {
+        return std::get<int8_kernels<TA>>(int8);
+    }
+
+    template <typename T> const sparse_kernels<T>& sparse_of() const {
+        return std::get<sparse_kernels<T>>(sparse);
+    }
+};
+
+// 各翻译单元中的内核表, 由 MATMUL_DISPATCH_TABLE 定义
+namespace tables {
+extern const table baseline;
+#ifdef MATMUL_DISPATCH_X86
+extern const table sse4;
+extern const table avx2;
+extern const table avx512;
+extern const table avx_vnni;
+extern const table avx512_vnni;
+#endif
+}  // namespace tables
+
+// 当前 CPU 支持的内核表, 按性能从高到低排列
+std::vector<const table*> supported();
+
+// 当前绑定的内核表, 默认为 supported() 中的第一个
+const table& active();
+
+// 按名称切换内核表, 名称不存在或当前 CPU 不支持时抛出 std::invalid_argument
+void select(const std::string& isa);
+
+}  // namespace dispatch
+
+#define MATMUL_DISPATCH_STR_(x) #x
+#define MATMUL_DISPATCH_STR(x) MATMUL_DISPATCH_STR_(x)
+
+// 在包含了 simd.hpp, gemm.hpp, int8.hpp, sparse.hpp 与 strassen.hpp 的翻译单元中
+// 定义 dispatch::tables::MATMUL_ISA
+#define MATMUL_DISPATCH_TABLE                                                                 \
+    namespace dispatch::tables {                                                              \
+    extern const table MATMUL_ISA;                                                            \
+    template <typename T>                                                                     \
+    static const packing<T> gemm_panels = {                                                   \
+        kernel::packed::packed_b_size<T>, kernel::packed::pack_b<T>};                         \
+    template <typename T> static kernels<T> make_kernels() {                                  \
+        return {                                                                              \
+            {kernel::auto_simd<T>, kernel::auto_simd_bt<T>},                                  \
+            {kernel::simd<T>, kernel::simd_bt<T>},                                            \
+            {kernel::simd_optimized<T>, kernel::simd_optimized_bt<T>},                        \
+            {kernel::multithread_simd<T>, kernel::multithread_simd_bt<T>},                    \
+            {kernel::gemm<T>, nullptr, kernel::packed::gemm<T>,                               \
+             kernel::packed::gemm_prepacked<T>, &gemm_panels<T>},                             \
+            {kernel::multithread_gemm<T>, nullptr, kernel::packed::gemm_parallel<T>,          \
+             kernel::packed::gemm_prepacked_parallel<T>, &gemm_panels<T>},                    \
+            {kernel::strassen_gemm<T>, nullptr, kernel::strassen::gemm<T>},                   \
+            kernel::packed::gemm_batched<T>,                                                  \
+        };                                                                                    \
+    }                                                                                         \
+    template <typename T> static sparse_kernels<T> make_sparse() {                            \
+        return {{                                                                             \
+            {kernel::sparse::csr_dense<T, std::int32_t>,                                      \
+             kernel::sparse::dense_csc<T, std::int32_t>},                                     \
+            {kernel::sparse::csr_dense<T, std::int64_t>,                                      \
+             kernel::sparse::dense_csc<T, std::int64_t>},                                     \
+        }};                                                                                   \
+    }                                                                                         \
+    const table MATMUL_ISA = {                                                                \
+        MATMUL_DISPATCH_STR(MATMUL_ISA),                                                      \
+        {make_kernels<std::int32_t>(), make_kernels<std::int64_t>(), make_kernels<float>(),   \
+         make_kernels<double>()},                                                             \
+        {{kernel::int8::gemm<std::uint8_t>, kernel::int8::gemm_parallel<std::uint8_t>},       \
+         {kernel::int8::gemm<std::int8_t>, kernel::int8::gemm_parallel<std::int8_t>}},        \
+        {make_sparse<std::int32_t>(), make_sparse<std::int64_t>(), make_sparse<float>(),      \
+         make_sparse<double>()},                                                              \
+    };                                                                                        \
+    }
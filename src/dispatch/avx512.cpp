@@ -0,0 +1,10 @@
+#define MATMUL_ISA avx512
+
+#include "../dispatch.hpp"
+#include "../gemm.hpp"
+#include "../int8.hpp"
+#include "../simd.hpp"
+#include "../sparse.hpp"
+#include "../strassen.hpp"
+
+MATMUL_DISPATCH_TABLE
@@ -0,0 +1,117 @@
+#include "epilogue.hpp"
+
+// 以基础指令集编译, 见 epilogue.hpp
+
+namespace postop {
+
+// 写出 O 类型时的取值范围; 浮点类型不饱和
+template <typename O> constexpr double lowest() {
+    return std::is_integral_v<O> ? double(std::numeric_limits<O>::min()) : -HUGE_VAL;
+}
+template <typename O> constexpr double highest() {
+    return std::is_integral_v<O> ? double(std::numeric_limits<O>::max()) : HUGE_VAL;
+}
+
+// double 边界在 U 中不越过它的值: 下界向上取整, 上界向下取整, 超出 U 的范围时取 U 的极值
+template <typename U> U bound_of(double v, bool upper) {
+    if constexpr (std::is_integral_v<U>) {
+        v = upper ? std::floor(v) : std::ceil(v);
+        if (v <= double(std::numeric_limits<U>::min())) {
+            return std::numeric_limits<U>::min();
+        }
+        if (v >= std::ldexp(1.0, std::numeric_limits<U>::digits)) {
+            return std::numeric_limits<U>::max();
+        }
+        return U(v);
+    } else {
+        return U(v);
+    }
+}
+
+// 整数 v 在浮点类型 R 中不越过它的值 (如 int32 的最大值在 float 中会向上舍入到 2^31)
+template <typename R, typename O> R inside(O v) {
+    R r = R(v);
+    if (std::abs(static_cast<long double>(r)) > std::abs(static_cast<long double>(v))) {
+        r = std::nextafter(r, R(0));
+    }
+    return r;
+}
+
+}  // namespace postop
+
+template <typename T> void postops<T>::apply(const T* c, int rows, int cols) const {
+    if (rows == 0 || cols == 0) {
+        return;
+    }
+    const std::ptrdiff_t offset = c - base, i0 = offset / ldc;
+    const int j0 = static_cast<int>(offset % ldc);
+    std::visit(
+        [&](const auto& o) {
+            for (int i = 0; i < rows; ++i) {
+                row(c + i * ldc, j0, cols, o.data + (i0 + i) * o.ld + j0);
+            }
+        },
+        out);
+}
+
+template <typename T>
+template <typename O>
+void postops<T>::row(const T* x, int j0, int n, O* y) const {
+    const T* b = bias ? bias + j0 : nullptr;
+    const double l = std::max(lo, postop::lowest<O>()), h = std::min(hi, postop::highest<O>());
+    // 没有缩放且无需舍入时直接在 T 中计算, 整数的 C 保持精确
+    if (!scale && !shift && !(std::is_integral_v<O> && !std::is_integral_v<T>)) {
+        const T tl = postop::bound_of<T>(l, false), th = postop::bound_of<T>(h, true);
+#pragma omp simd
+        for (int j = 0; j < n; ++j) {
+            const T v = b ? x[j] + b[j] : x[j];
+            y[j] = static_cast<O>(std::max(tl, std::min(th, v)));
+        }
+        return;
+    }
+    const real one = 1, zero = 0;
+    const real* s = scale ? scale + j0 * scale_step : &one;
+    const real* t = shift ? shift + j0 * shift_step : &zero;
+    const std::ptrdiff_t ss = scale ? scale_step : 0, ts = shift ? shift_step : 0;
+    real rl = real(l), rh = real(h);
+    if constexpr (std::is_integral_v<O>) {
+        rl = postop::inside<real>(postop::bound_of<O>(l, false));
+        rh = postop::inside<real>(postop::bound_of<O>(h, true));
+    }
+#pragma omp simd
+    for (int j = 0; j < n; ++j) {
+        real r = real(b ? x[j] + b[j] : x[j]) * s[j * ss] + t[j * ts];
+        if constexpr (std::is_integral_v<O>) {
+            r = std::nearbyint(r);
+        }
+        // NaN 按 hi 处理, 转为整数时不会越界
+        y[j] = static_cast<O>(std::max(rl, std::min(rh, r)));
+    }
+}
+
+template <typename T> void epilogue<T>::init(T* c, int N, int P, std::ptrdiff_t ldc) const {
+    if (beta == 1) {
+        return;
+    }
+    phases::scope timing(phases::phase::init);
+    for (int i = 0; i < N; ++i) {
+        T* row = c + i * ldc;
+        if (beta == 0) {
+            std::memset(row, 0, P * sizeof(T));
+            continue;
+        }
+        for (int j = 0; j < P; ++j) {
+            row[j] *= beta;
+        }
+    }
+}
+
+template struct postops<std::int32_t>;
+template struct postops<std::int64_t>;
+template struct postops<float>;
+template struct postops<double>;
+
+template struct epilogue<std::int32_t>;
+template struct epilogue<std::int64_t>;
+template struct epilogue<float>;
+template struct epilogue<double>;
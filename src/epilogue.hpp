@@ -0,0 +1,71 @@
+#pragma once
+
+#include "phases.hpp"
+#include "typedef.h"
+
+#include <algorithm>
+#include <cmath>
+#include <cstddef>
+#include <cstring>
+#include <limits>
+#include <type_traits>
+#include <variant>
+
+// epilogue 与 postops 是各指令集内核表共用的接口类型, 不能放进 MATMUL_ISA 命名空间.
+// 它们的成员若在各指令集翻译单元中生成外联副本, 链接器只保留其中一份, 可能在不支持的 CPU
+// 上执行. 因此循环 (init, apply) 在 epilogue.cpp 中以基础指令集编译, 头文件中只保留总是
+// 内联的 store 与 finish
+
+// 后处理结果的写出位置: data 为与 C 同形的矩阵, 行距 ld
+template <typename O> struct output {
+    O* data = nullptr;
+    std::ptrdiff_t ld = 0;
+};
+
+// 在 C 的元素得到最终值之后融合执行的逐元素后处理, 依次为: 加按列的 bias, 乘 scale 再加
+// shift (标量或按列, 以 real 计算), 截断到 [lo, hi], 写到 out. 写出整数类型时就近舍入
+// (偶数优先) 并饱和到该类型的范围. base/ldc 为 C 的起点与行距, 由块的地址求出其所在的行列
+template <typename T> struct postops {
+    using real = std::conditional_t<sizeof(T) == 8, double, float>;
+
+    const T* base = nullptr;
+    std::ptrdiff_t ldc = 0;
+    const T* bias = nullptr;
+    // step 为 0 时是标量, 为 1 时按列
+    const real* scale = nullptr;
+    std::ptrdiff_t scale_step = 0;
+    const real* shift = nullptr;
+    std::ptrdiff_t shift_step = 0;
+    double lo = -HUGE_VAL, hi = HUGE_VAL;
+    output_types::variant<output> out;
+
+    // 处理 C 中的块 c[rows x cols] (行距 ldc), 写到 out 的对应位置; out 可以就是 C
+    void apply(const T* c, int rows, int cols) const;
+
+  private:
+    // 第 j0 列起的 n 个元素 x 处理后写到 y
+    template <typename O> void row(const T* x, int j0, int n, O* y) const;
+};
+
+// 写回 C 时的变换: C = alpha * (A @ B) + beta * C
+template <typename T> struct epilogue {
+    T alpha = 1;
+    T beta = 0;
+    // 非空时, 支持融合的内核在每个块得到最终值后 (仍在 L1 中时) 调用 finish
+    const postops<T>* post = nullptr;
+
+    // 写入一个完整求和的元素; beta 为 0 时不读取 c, 因此 c 可以未初始化
+    [[gnu::always_inline]] void store(T* c, T sum) const {
+        *c = beta == 0 ? alpha * sum : alpha * sum + beta * *c;
+    }
+
+    // 逐项累加到 C 的内核在累加前按 beta 初始化 C, 并把 alpha 乘到 A 的元素上
+    void init(T* c, int N, int P, std::ptrdiff_t ldc) const;
+
+    // 块 c[rows x cols] (行距为 C 的行距) 已是最终结果; 未设置 post 时什么也不做
+    [[gnu::always_inline]] void finish(const T* c, int rows, int cols) const {
+        if (post) {
+            post->apply(c, rows, cols);
+        }
+    }
+};
@@ -0,0 +1,81 @@
+#pragma once
+
+#include <algorithm>
+#include <condition_variable>
+#include <deque>
+#include <functional>
+#include <mutex>
+#include <stdexcept>
+#include <thread>
+#include <vector>
+
+namespace executor {
+
+// 固定数量工作线程的 FIFO 任务队列, 用于异步提交矩阵乘法
+class worker_queue {
+public:
+    explicit worker_queue(unsigned n_workers) {
+        n_workers = std::max(1u, n_workers);
+        for (unsigned i = 0; i < n_workers; ++i) {
+            workers.emplace_back([this] { work(); });
+        }
+    }
+
+    worker_queue(const worker_queue&) = delete;
+    worker_queue& operator=(const worker_queue&) = delete;
+
+    ~worker_queue() { shutdown(); }
+
+    void submit(std::function<void()> job) {
+        {
+            std::lock_guard<std::mutex> lock(mutex);
+            if (stopped) {
+                throw std::runtime_error("worker queue has been shut down");
+            }
+            jobs.push_back(std::move(job));
+        }
+        cv.notify_one();
+    }
+
+    // 拒绝新任务, 执行完队列中剩余的任务后等待所有工作线程退出
+    void shutdown() {
+        {
+            std::lock_guard<std::mutex> lock(mutex);
+            stopped = true;
+        }
+        cv.notify_all();
+        for (auto& worker : workers) {
+            if (worker.joinable()) {
+                worker.join();
+            }
+        }
+        workers.clear();
+    }
+
+    unsigned size() const { return static_cast<unsigned>(workers.size()); }
+
+private:
+    void work() {
+        for (;;) {
+            std::function<void()> job;
+            {
+                std::unique_lock<std::mutex> lock(mutex);
+                cv.wait(lock, [this] { return stopped || !jobs.empty(); });
+                if (jobs.empty()) {
+                    return;
+                }
+                job = std::move(jobs.front());
+                jobs.pop_front();
+            }
+            job();
+        }
+    }
+
+    std::mutex mutex;
+    std::condition_variable cv;
+    std::deque<std::function<void()>> jobs;
+    std::vector<std::thread> workers;
+    bool stopped = false;
+};
+
+}  // namespace executor
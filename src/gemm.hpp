@@ -0,0 +1,422 @@
+#pragma once
+
+#include "epilogue.hpp"
+#include "skinny.hpp"
+#include "target.hpp"
+#include "threading.hpp"
+#include "vec.hpp"
+
+#include <algorithm>
+#include <cstddef>
+#include <cstdint>
+#include <cstdlib>
+#include <cstring>
+#include <memory>
+
+namespace kernel {
+
+inline namespace MATMUL_ISA {
+
+// GotoBLAS/BLIS 风格的分块矩阵乘法:
+//   jc (NC 列, B 块驻留 L3) -> pc (KC, 打包 B) -> ic (MC 行, 打包 A, 驻留 L2)
+//   -> jr (NR) -> ir (MR) -> 寄存器分块的外积微内核
+namespace packed {
+
+// 寄存器分块 MR x NR: 每行 NR 个元素占两个向量寄存器; 没有对应向量指令的类型使用标量内核
+template <typename T>
+constexpr int NR = vec<T>::enabled ? 2 * vec<T>::lanes : 8;
+
+#if defined(__AVX512F__)
+template <typename T>
+constexpr int MR = vec<T>::enabled ? 8 : 4;
+#elif defined(__AVX2__)
+template <typename T>
+constexpr int MR = vec<T>::enabled ? 6 : 4;
+#else
+template <typename T>
+constexpr int MR = 4;
+#endif
+
+constexpr int KC = 256;
+template <typename T>
+constexpr int MC = MR<T> * 24;
+template <typename T>
+constexpr int NC = NR<T> * 128;
+
+constexpr std::size_t alignment = 64;
+
+struct aligned_deleter {
+    void operator()(void* p) const { std::free(p); }
+};
+
+template <typename T>
+using buffer = std::unique_ptr<T[], aligned_deleter>;
+
+template <typename T>
+inline buffer<T> make_buffer(std::size_t count) {
+    std::size_t bytes = (count * sizeof(T) + alignment - 1) / alignment * alignment;
+    return buffer<T>(static_cast<T*>(std::aligned_alloc(alignment, bytes)));
+}
+
+// 将 A[ic:ic+mc, pc:pc+kc] 打包为 MR 行的面板, 面板内按 k 主序, 不足 MR 的部分补零
+template <typename T>
+inline void pack_a(const T* a, std::ptrdiff_t rsa, std::ptrdiff_t csa, int mc, int kc, T* dst) {
+    constexpr int mr_max = MR<T>;
+    for (int ir = 0; ir < mc; ir += mr_max) {
+        const int mr = std::min(mr_max, mc - ir);
+        for (int k = 0; k < kc; ++k) {
+            int i = 0;
+            for (; i < mr; ++i) {
+                dst[i] = a[(ir + i) * rsa + k * csa];
+            }
+            for (; i < mr_max; ++i) {
+                dst[i] = 0;
+            }
+            dst += mr_max;
+        }
+    }
+}
+
+// 将 B[pc:pc+kc, jr:jr+NR] 打包为一个 NR 列的面板, 不足 NR 的部分补零
+template <typename T>
+inline void pack_b_panel(
+    const T* b, std::ptrdiff_t rsb, std::ptrdiff_t csb, int kc, int nr, T* dst) {
+    for (int k = 0; k < kc; ++k) {
+        int j = 0;
+        if (csb == 1) {
+            std::memcpy(dst, b + k * rsb, nr * sizeof(T));
+            j = nr;
+        } else {
+            for (; j < nr; ++j) {
+                dst[j] = b[k * rsb + j * csb];
+            }
+        }
+        for (; j < NR<T>; ++j) {
+            dst[j] = 0;
+        }
+        dst += NR<T>;
+    }
+}
+
+// c[MR x NR] = alpha * a_panel[kc x MR]^T * b_panel[kc x NR] + beta * c, beta 为 0 时不读取 c.
+// 向量版本中 b 面板的每一行是两个对齐的寄存器, 浮点类型使用 FMA 累加
+template <typename T>
+inline void micro_kernel(
+    int kc, const T* a, const T* b, T* c, std::ptrdiff_t ldc, T alpha, T beta) {
+    constexpr int mr = MR<T>, nr = NR<T>;
+    if constexpr (vec<T>::enabled) {
+        using V = vec<T>;
+        constexpr int lanes = V::lanes;
+        typename V::type acc[mr][2];
+        for (int i = 0; i < mr; ++i) {
+            acc[i][0] = V::zero();
+            acc[i][1] = V::zero();
+        }
+        for (int k = 0; k < kc; ++k) {
+            const auto b0 = V::load(b);
+            const auto b1 = V::load(b + lanes);
+            for (int i = 0; i < mr; ++i) {
+                const auto av = V::set1(a[i]);
+                acc[i][0] = V::madd(acc[i][0], av, b0);
+                acc[i][1] = V::madd(acc[i][1], av, b1);
+            }
+            a += mr;
+            b += nr;
+        }
+        const auto alpha_vec = V::set1(alpha);
+        const auto beta_vec = V::set1(beta);
+        for (int i = 0; i < mr; ++i) {
+            T* row = c + i * ldc;
+            for (int h = 0; h < 2; ++h) {
+                auto r = alpha == 1 ? acc[i][h] : V::mul(acc[i][h], alpha_vec);
+                if (beta == 1) {
+                    r = V::add(r, V::loadu(row + lanes * h));
+                } else if (beta != 0) {
+                    r = V::madd(r, V::loadu(row + lanes * h), beta_vec);
+                }
+                V::storeu(row + lanes * h, r);
+            }
+        }
+    } else {
+        T acc[mr][nr] = {};
+        for (int k = 0; k < kc; ++k) {
+            for (int i = 0; i < mr; ++i) {
+#pragma omp simd
+                for (int j = 0; j < nr; ++j) {
+                    acc[i][j] += a[i] * b[j];
+                }
+            }
+            a += mr;
+            b += nr;
+        }
+        for (int i = 0; i < mr; ++i) {
+            for (int j = 0; j < nr; ++j) {
+                T* dst = c + i * ldc + j;
+                *dst = beta == 0 ? alpha * acc[i][j] : alpha * acc[i][j] + beta * *dst;
+            }
+        }
+    }
+}
+
+// 处理 C 的 mc x nc 块, 边缘的不完整 tile 先写入临时缓冲区.
+// 第一个 KC 块按 ep 写回, 之后的块累加到 C 上; 最后一个 KC 块在每个 tile 写回后立即
+// 执行 ep.finish, 后处理读到的 tile 仍在 L1 中
+template <typename T>
+inline void macro_kernel(
+    int mc, int nc, int kc, const T* a_pack, const T* b_pack, T* c, std::ptrdiff_t ldc,
+    const epilogue<T>& ep, bool first, bool last) {
+    constexpr int mr_max = MR<T>, nr_max = NR<T>;
+    const T beta = first ? ep.beta : 1;
+    alignas(alignment) T tmp[mr_max * nr_max];
+    for (int jr = 0; jr < nc; jr += nr_max) {
+        const int nr = std::min(nr_max, nc - jr);
+        const T* b_panel = b_pack + static_cast<std::ptrdiff_t>(jr) * kc;
+        for (int ir = 0; ir < mc; ir += mr_max) {
+            const int mr = std::min(mr_max, mc - ir);
+            const T* a_panel = a_pack + static_cast<std::ptrdiff_t>(ir) * kc;
+            T* c_tile = c + ir * ldc + jr;
+            if (mr == mr_max && nr == nr_max) {
+                micro_kernel(kc, a_panel, b_panel, c_tile, ldc, ep.alpha, beta);
+            } else {
+                micro_kernel<T>(kc, a_panel, b_panel, tmp, nr_max, 1, 0);
+                for (int i = 0; i < mr; ++i) {
+                    for (int j = 0; j < nr; ++j) {
+                        T* dst = c_tile + i * ldc + j;
+                        const T sum = ep.alpha * tmp[i * nr_max + j];
+                        *dst = beta == 0 ? sum : sum + beta * *dst;
+                    }
+                }
+            }
+            if (last) {
+                ep.finish(c_tile, mr, nr);
+            }
+        }
+    }
+}
+
+// 预打包整个 B 所需的元素个数: 每个 KC 行块按 NR 列面板依次存放, 列数补齐到 NR 的倍数
+template <typename T>
+inline std::size_t packed_b_size(int M, int P) {
+    return static_cast<std::size_t>(M) * ((P + NR<T> - 1) / NR<T> * NR<T>);
+}
+
+// 一次性打包整个 B, (pc, jc) 块的面板起始于 dst + pc * round_up(P, NR) + jc * kc,
+// 与运行时逐块打包得到的布局相同
+template <typename T>
+inline void pack_b(const T* b, std::ptrdiff_t rsb, std::ptrdiff_t csb, int M, int P, T* dst) {
+    const std::ptrdiff_t p_padded = (P + NR<T> - 1) / NR<T> * NR<T>;
+    for (int pc = 0; pc < M; pc += KC) {
+        const int kc = std::min(KC, M - pc);
+        for (int j = 0; j < P; j += NR<T>) {
+            pack_b_panel(
+                b + pc * rsb + j * csb, rsb, csb, kc, std::min(NR<T>, P - j),
+                dst + pc * p_padded + static_cast<std::ptrdiff_t>(j) * kc);
+        }
+    }
+}
+
+template <typename T>
+inline const T* packed_b_block(const T* b_packed, int P, int jc, int pc, int kc) {
+    const std::ptrdiff_t p_padded = (P + NR<T> - 1) / NR<T> * NR<T>;
+    return b_packed + pc * p_padded + static_cast<std::ptrdiff_t>(jc) * kc;
+}
+
+// C[N x P] = A[N x M] * B[M x P], A/B 以任意行列步长给出 (以元素为单位), C 行主序.
+// b_packed 非空时使用 pack_b 预先打包好的 B, 跳过逐块打包.
+// a_pack (MC x KC) 与 b_pack (KC x NC, b_packed 非空时不使用) 由调用方提供
+template <typename T>
+inline void gemm_serial(
+    int N, int M, int P, const T* a, std::ptrdiff_t rsa, std::ptrdiff_t csa, const T* b,
+    std::ptrdiff_t rsb, std::ptrdiff_t csb, const T* b_packed, T* c, std::ptrdiff_t ldc,
+    const epilogue<T>& ep, T* a_pack, T* b_pack) {
+    if (M == 0) {
+        ep.init(c, N, P, ldc);
+        return ep.finish(c, N, P);
+    }
+    for (int jc = 0; jc < P; jc += NC<T>) {
+        const int nc = std::min(NC<T>, P - jc);
+        for (int pc = 0; pc < M; pc += KC) {
+            const int kc = std::min(KC, M - pc);
+            const T* b_block = b_packed ? packed_b_block(b_packed, P, jc, pc, kc) : b_pack;
+            if (!b_packed) {
+                for (int jr = 0; jr < nc; jr += NR<T>) {
+                    pack_b_panel(
+                        b + pc * rsb + (jc + jr) * csb, rsb, csb, kc, std::min(NR<T>, nc - jr),
+                        b_pack + static_cast<std::ptrdiff_t>(jr) * kc);
+                }
+            }
+            for (int ic = 0; ic < N; ic += MC<T>) {
+                const int mc = std::min(MC<T>, N - ic);
+                pack_a(a + ic * rsa + pc * csa, rsa, csa, mc, kc, a_pack);
+                macro_kernel(
+                    mc, nc, kc, a_pack, b_block, c + ic * ldc + jc, ldc, ep, pc == 0,
+                    pc + kc == M);
+            }
+        }
+    }
+}
+
+template <typename T>
+inline void gemm_blocked(
+    int N, int M, int P, const T* a, std::ptrdiff_t rsa, std::ptrdiff_t csa, const T* b,
+    std::ptrdiff_t rsb, std::ptrdiff_t csb, const T* b_packed, T* c, std::ptrdiff_t ldc,
+    const epilogue<T>& ep) {
+    if (M == 0) {
+        ep.init(c, N, P, ldc);
+        return ep.finish(c, N, P);
+    }
+    buffer<T> a_pack = make_buffer<T>(static_cast<std::size_t>(MC<T>) * KC);
+    buffer<T> b_pack =
+        b_packed ? nullptr : make_buffer<T>(static_cast<std::size_t>(KC) * NC<T>);
+    gemm_serial<T>(
+        N, M, P, a, rsa, csa, b, rsb, csb, b_packed, c, ldc, ep, a_pack.get(), b_pack.get());
+}
+
+// 多线程版本: B 面板由所有线程协作打包并共享, 每个线程独立打包自己的 A 块.
+// C 的每个 NC 块按 (行块, 列段) 二维划分; 行块少于线程数 (矮而宽的 C) 时列段多于一个.
+// 绑定线程时 B 面板按 NUMA 节点各打包一份, 由该节点上的线程写入并读取
+template <typename T>
+inline void gemm_blocked_parallel(
+    int N, int M, int P, const T* a, std::ptrdiff_t rsa, std::ptrdiff_t csa, const T* b,
+    std::ptrdiff_t rsb, std::ptrdiff_t csb, const T* b_packed, T* c, std::ptrdiff_t ldc,
+    const epilogue<T>& ep) {
+    // 空矩阵没有可划分的行块, 由串行版本处理
+    if (N == 0 || M == 0 || P == 0) {
+        return gemm_blocked<T>(N, M, P, a, rsa, csa, b, rsb, csb, b_packed, c, ldc, ep);
+    }
+    const int n_threads = threading::threads_for(std::int64_t(N) * M * P, threading::count());
+    // 行数不足时缩小 MC, 保证每个线程都能分到 ic 块
+    const int rows_per_thread = (N + n_threads - 1) / n_threads;
+    constexpr int mr = MR<T>, nr = NR<T>;
+    const int mc_block = std::max(mr, std::min(MC<T>, (rows_per_thread + mr - 1) / mr * mr));
+    const int row_blocks = (N + mc_block - 1) / mc_block;
+    const int col_groups = std::min((n_threads + row_blocks - 1) / row_blocks, NC<T> / nr);
+    const int replicas = b_packed ? 1 : threading::replicas(n_threads);
+    const std::size_t b_block_size = static_cast<std::size_t>(KC) * NC<T>;
+    buffer<T> b_pack = b_packed ? nullptr : make_buffer<T>(b_block_size * replicas);
+    threading::parallel(n_threads, [&] {
+        threading::pin();
+        const auto slot = threading::slot_of(threading::thread_num(), threading::team_size());
+        T* b_local = b_pack ? b_pack.get() + slot.replica * b_block_size : nullptr;
+        buffer<T> a_pack = make_buffer<T>(static_cast<std::size_t>(mc_block) * KC);
+        for (int jc = 0; jc < P; jc += NC<T>) {
+            const int nc = std::min(NC<T>, P - jc);
+            const int panels = (nc + nr - 1) / nr;
+            const int group = (panels + col_groups - 1) / col_groups * nr;
+            const int groups = (nc + group - 1) / group;
+            for (int pc = 0; pc < M; pc += KC) {
+                const int kc = std::min(KC, M - pc);
+                const T* b_block = b_packed ? packed_b_block(b_packed, P, jc, pc, kc) : b_local;
+                if (!b_packed) {
+                    for (int jr = slot.rank * nr; jr < nc; jr += slot.size * nr) {
+                        pack_b_panel(
+                            b + pc * rsb + (jc + jr) * csb, rsb, csb, kc, std::min(nr, nc - jr),
+                            b_local + static_cast<std::ptrdiff_t>(jr) * kc);
+                    }
+                    threading::barrier();
+                }
+                threading::for_each(row_blocks * groups, [&](int t) {
+                    const int ic = t / groups * mc_block, jg = t % groups * group;
+                    const int mc = std::min(mc_block, N - ic);
+                    pack_a(a + ic * rsa + pc * csa, rsa, csa, mc, kc, a_pack.get());
+                    macro_kernel(
+                        mc, std::min(group, nc - jg), kc, a_pack.get(),
+                        b_block + static_cast<std::ptrdiff_t>(jg) * kc, c + ic * ldc + jc + jg, ldc,
+                        ep, pc == 0, pc + kc == M);
+                });
+            }
+        }
+    });
+}
+
+// 单个乘法的 N * M * P 超过该值时按 tile 并行, 否则按批并行
+constexpr std::int64_t TILE_PARALLEL_WORK = std::int64_t(1) << 21;
+
+// 批量 C[i] = A[i] * B[i], bsa/bsb/bsc 为相邻两个矩阵间的步长, 为 0 表示广播.
+// 小矩阵按批并行, 每个线程复用自己的打包缓冲区; 大矩阵逐个按 tile 并行.
+// 广播的 B 只打包一次
+template <typename T>
+inline void gemm_batched(
+    int batch, int N, int M, int P, const T* a, std::ptrdiff_t bsa, std::ptrdiff_t rsa,
+    std::ptrdiff_t csa, const T* b, std::ptrdiff_t bsb, std::ptrdiff_t rsb, std::ptrdiff_t csb,
+    const T* b_packed, T* c, std::ptrdiff_t bsc, std::ptrdiff_t ldc, const epilogue<T>& ep) {
+    buffer<T> b_shared;
+    if (!b_packed && bsb == 0 && batch > 1 && M > 0) {
+        b_shared = make_buffer<T>(packed_b_size<T>(M, P));
+        pack_b(b, rsb, csb, M, P, b_shared.get());
+        b_packed = b_shared.get();
+    }
+    if (batch == 1 || static_cast<std::int64_t>(N) * M * P > TILE_PARALLEL_WORK) {
+        for (int i = 0; i < batch; ++i) {
+            gemm_blocked_parallel<T>(
+                N, M, P, a + i * bsa, rsa, csa, b + i * bsb, rsb, csb, b_packed, c + i * bsc,
+                ldc, ep);
+        }
+        return;
+    }
+    const int n_threads =
+        threading::threads_for(std::int64_t(batch) * N * M * P, threading::count());
+    threading::parallel(n_threads, [&] {
+        threading::pin();
+        buffer<T> a_pack = make_buffer<T>(static_cast<std::size_t>(MC<T>) * KC);
+        buffer<T> b_pack =
+            b_packed ? nullptr : make_buffer<T>(static_cast<std::size_t>(KC) * NC<T>);
+        threading::for_each(batch, [&](int i) {
+            gemm_serial<T>(
+                N, M, P, a + i * bsa, rsa, csa, b + i * bsb, rsb, csb, b_packed, c + i * bsc, ldc,
+                ep, a_pack.get(), b_pack.get());
+        });
+    });
+}
+
+// C 只有几行或几列时打包 B 的开销无法摊销, 交给 skinny 内核
+template <typename T>
+inline void gemm(
+    int N, int M, int P, const T* a, std::ptrdiff_t rsa, std::ptrdiff_t csa, const T* b,
+    std::ptrdiff_t rsb, std::ptrdiff_t csb, T* c, std::ptrdiff_t ldc, const epilogue<T>& ep) {
+    if (skinny::applies(N, M, P)) {
+        return skinny::gemm(N, M, P, a, rsa, csa, b, rsb, csb, c, ldc, ep, false);
+    }
+    gemm_blocked<T>(N, M, P, a, rsa, csa, b, rsb, csb, nullptr, c, ldc, ep);
+}
+
+template <typename T>
+inline void gemm_parallel(
+    int N, int M, int P, const T* a, std::ptrdiff_t rsa, std::ptrdiff_t csa, const T* b,
+    std::ptrdiff_t rsb, std::ptrdiff_t csb, T* c, std::ptrdiff_t ldc, const epilogue<T>& ep) {
+    if (skinny::applies(N, M, P)) {
+        return skinny::gemm(N, M, P, a, rsa, csa, b, rsb, csb, c, ldc, ep, true);
+    }
+    gemm_blocked_parallel<T>(N, M, P, a, rsa, csa, b, rsb, csb, nullptr, c, ldc, ep);
+}
+
+template <typename T>
+inline void gemm_prepacked(
+    int N, int M, int P, const T* a, std::ptrdiff_t rsa, std::ptrdiff_t csa, const T* b_packed,
+    T* c, std::ptrdiff_t ldc, const epilogue<T>& ep) {
+    gemm_blocked<T>(N, M, P, a, rsa, csa, nullptr, 0, 0, b_packed, c, ldc, ep);
+}
+
+template <typename T>
+inline void gemm_prepacked_parallel(
+    int N, int M, int P, const T* a, std::ptrdiff_t rsa, std::ptrdiff_t csa, const T* b_packed,
+    T* c, std::ptrdiff_t ldc, const epilogue<T>& ep) {
+    gemm_blocked_parallel<T>(N, M, P, a, rsa, csa, nullptr, 0, 0, b_packed, c, ldc, ep);
+}
+
+}  // namespace packed
+
+template <typename T>
+inline void gemm(const T* a, const T* b, T* c, int N, int M, int P, const epilogue<T>& ep) {
+    packed::gemm(N, M, P, a, M, 1, b, P, 1, c, P, ep);
+}
+
+template <typename T>
+inline void multithread_gemm(
+    const T* a, const T* b, T* c, int N, int M, int P, const epilogue<T>& ep) {
+    packed::gemm_parallel(N, M, P, a, M, 1, b, P, 1, c, P, ep);
+}
+
+}  // namespace MATMUL_ISA
+
+}  // namespace kernel
@@ -0,0 +1,322 @@
+#pragma once
+
+#include "epilogue.hpp"
+#include "gemm.hpp"
+#include "target.hpp"
+#include "threading.hpp"
+#include "vec.hpp"
+
+#include <algorithm>
+#include <cstddef>
+#include <cstdint>
+#include <cstring>
+#include <type_traits>
+
+namespace kernel {
+
+inline namespace MATMUL_ISA {
+
+// 量化的 int8 矩阵乘法: A 为 u8 或 s8, B 为 s8, 按 int32 累加.
+// 分块方式与 packed 相同, 但 k 方向以 4 个元素为一组打包, 使每个 32 位通道恰好
+// 对应一次 vpdpbusd (4 对 u8 x s8 乘积之和). s8 的 A 打包时加 128 转为 u8,
+// 多出的 128 * sum_k B[k][j] 预先从累加器的初值中减去
+namespace int8 {
+
+using packed::alignment;
+using packed::buffer;
+using packed::make_buffer;
+
+#if defined(__AVX512F__)
+#if defined(__AVX512VNNI__)
+constexpr bool enabled = true;
+inline __m512i dpbusd(__m512i acc, __m512i a, __m512i b) {
+    return _mm512_dpbusd_epi32(acc, a, b);
+}
+#elif defined(__AVX512BW__)
+constexpr bool enabled = true;
+// 没有 VNNI 时用 pmaddubsw + pmaddwd 代替. pmaddubsw 的 16 位结果会饱和
+// (255 * 127 * 2 > 32767), 因此把 A 拆成高低 4 位分别相乘, 高位的部分和在 pmaddwd
+// 中乘 16 合并, 结果是精确的
+inline __m512i dpbusd(__m512i acc, __m512i a, __m512i b) {
+    const auto low = _mm512_set1_epi8(0x0F);
+    const auto ones = _mm512_set1_epi16(1), sixteen = _mm512_set1_epi16(16);
+    const auto lo = _mm512_and_si512(a, low);
+    const auto hi = _mm512_and_si512(_mm512_srli_epi16(a, 4), low);
+    const auto p_lo = _mm512_madd_epi16(_mm512_maddubs_epi16(lo, b), ones);
+    const auto p_hi = _mm512_madd_epi16(_mm512_maddubs_epi16(hi, b), sixteen);
+    return _mm512_add_epi32(acc, _mm512_add_epi32(p_lo, p_hi));
+}
+#else
+constexpr bool enabled = false;
+#endif
+#elif defined(__AVXVNNI__)
+constexpr bool enabled = true;
+inline __m256i dpbusd(__m256i acc, __m256i a, __m256i b) {
+    return _mm256_dpbusd_avx_epi32(acc, a, b);
+}
+#elif defined(__AVX2__)
+constexpr bool enabled = true;
+inline __m256i dpbusd(__m256i acc, __m256i a, __m256i b) {
+    const auto low = _mm256_set1_epi8(0x0F);
+    const auto ones = _mm256_set1_epi16(1), sixteen = _mm256_set1_epi16(16);
+    const auto lo = _mm256_and_si256(a, low);
+    const auto hi = _mm256_and_si256(_mm256_srli_epi16(a, 4), low);
+    const auto p_lo = _mm256_madd_epi16(_mm256_maddubs_epi16(lo, b), ones);
+    const auto p_hi = _mm256_madd_epi16(_mm256_maddubs_epi16(hi, b), sixteen);
+    return _mm256_add_epi32(acc, _mm256_add_epi32(p_lo, p_hi));
+}
+#else
+constexpr bool enabled = false;
+#endif
+
+// 每行 NR 个 int32 累加器占两个向量寄存器; 拆分高低位的版本需要更多临时寄存器, MR 较小
+constexpr int NR = enabled ? 2 * vec<std::int32_t>::lanes : 8;
+#if defined(__AVX512F__)
+constexpr int MR = enabled ? 8 : 4;
+#elif defined(__AVXVNNI__)
+constexpr int MR = 6;
+#else
+constexpr int MR = 4;
+#endif
+
+// KC 必须是 4 的倍数
+constexpr int KC = 512;
+constexpr int MC = MR * 24;
+constexpr int NC = NR * 128;
+
+inline int round_up4(int k) { return (k + 3) / 4 * 4; }
+
+// 将 A[ic:ic+mc, pc:pc+kc] 打包为 MR 行的面板, 面板内按 [k/4][MR][4] 存放,
+// s8 的元素异或 0x80 (即加 128) 转为 u8, 不足的行与 k 补零
+template <typename TA>
+inline void pack_a(
+    const TA* a, std::ptrdiff_t rsa, std::ptrdiff_t csa, int mc, int kc, std::uint8_t* dst) {
+    const std::uint8_t shift = std::is_signed_v<TA> ? 0x80 : 0;
+    for (int ir = 0; ir < mc; ir += MR) {
+        const int mr = std::min(MR, mc - ir);
+        for (int k0 = 0; k0 < kc; k0 += 4) {
+            for (int i = 0; i < MR; ++i) {
+                for (int t = 0; t < 4; ++t) {
+                    const int k = k0 + t;
+                    dst[t] = i < mr && k < kc
+                                 ? static_cast<std::uint8_t>(a[(ir + i) * rsa + k * csa]) ^ shift
+                                 : 0;
+                }
+                dst += 4;
+            }
+        }
+    }
+}
+
+// 将 B[pc:pc+kc, jr:jr+NR] 打包为 [k/4][NR][4] 的面板, 不足的列与 k 补零.
+// comp 非空时写入每列的 -128 * sum_k B[k][j], 作为 s8 x s8 累加器的初值
+inline void pack_b_panel(
+    const std::int8_t* b, std::ptrdiff_t rsb, std::ptrdiff_t csb, int kc, int nr,
+    std::int8_t* dst, std::int32_t* comp) {
+    for (int k0 = 0; k0 < kc; k0 += 4) {
+        for (int j = 0; j < NR; ++j) {
+            for (int t = 0; t < 4; ++t) {
+                const int k = k0 + t;
+                dst[t] = j < nr && k < kc ? b[k * rsb + j * csb] : 0;
+            }
+            dst += 4;
+        }
+    }
+    if (comp) {
+        for (int j = 0; j < NR; ++j) {
+            std::int32_t sum = 0;
+            for (int k = 0; j < nr && k < kc; ++k) {
+                sum += b[k * rsb + j * csb];
+            }
+            comp[j] = -128 * sum;
+        }
+    }
+}
+
+// c[MR x NR] = alpha * a_panel^T * b_panel + beta * c, kg 为 k 的组数, beta 为 0 时不读取 c.
+// T 为累加器类型 (int32), 作为模板参数使没有向量实现的指令集不实例化向量分支
+template <typename T = std::int32_t>
+inline void micro_kernel(
+    int kg, const std::uint8_t* a, const std::int8_t* b, const T* comp, T* c,
+    std::ptrdiff_t ldc, T alpha, T beta) {
+    if constexpr (enabled) {
+        using V = vec<T>;
+        constexpr int lanes = V::lanes;
+        typename V::type acc[MR][2];
+        for (int i = 0; i < MR; ++i) {
+            acc[i][0] = comp ? V::load(comp) : V::zero();
+            acc[i][1] = comp ? V::load(comp + lanes) : V::zero();
+        }
+        for (int g = 0; g < kg; ++g) {
+            const auto b0 = V::load(reinterpret_cast<const T*>(b));
+            const auto b1 = V::load(reinterpret_cast<const T*>(b) + lanes);
+            for (int i = 0; i < MR; ++i) {
+                T word;
+                std::memcpy(&word, a + 4 * i, sizeof(word));
+                const auto av = V::set1(word);
+                acc[i][0] = dpbusd(acc[i][0], av, b0);
+                acc[i][1] = dpbusd(acc[i][1], av, b1);
+            }
+            a += 4 * MR;
+            b += 4 * NR;
+        }
+        const auto alpha_vec = V::set1(alpha);
+        const auto beta_vec = V::set1(beta);
+        for (int i = 0; i < MR; ++i) {
+            T* row = c + i * ldc;
+            for (int h = 0; h < 2; ++h) {
+                auto r = alpha == 1 ? acc[i][h] : V::mul(acc[i][h], alpha_vec);
+                if (beta == 1) {
+                    r = V::add(r, V::loadu(row + lanes * h));
+                } else if (beta != 0) {
+                    r = V::madd(r, V::loadu(row + lanes * h), beta_vec);
+                }
+                V::storeu(row + lanes * h, r);
+            }
+        }
+    } else {
+        T acc[MR][NR];
+        for (int i = 0; i < MR; ++i) {
+            for (int j = 0; j < NR; ++j) {
+                acc[i][j] = comp ? comp[j] : 0;
+            }
+        }
+        for (int g = 0; g < kg; ++g) {
+            for (int i = 0; i < MR; ++i) {
+                for (int j = 0; j < NR; ++j) {
+                    for (int t = 0; t < 4; ++t) {
+                        acc[i][j] += T(a[4 * i + t]) * T(b[4 * j + t]);
+                    }
+                }
+            }
+            a += 4 * MR;
+            b += 4 * NR;
+        }
+        for (int i = 0; i < MR; ++i) {
+            for (int j = 0; j < NR; ++j) {
+                T* dst = c + i * ldc + j;
+                *dst = beta == 0 ? alpha * acc[i][j] : alpha * acc[i][j] + beta * *dst;
+            }
+        }
+    }
+}
+
+// 处理 C 的 mc x nc 块, 边缘的不完整 tile 先写入临时缓冲区.
+// 第一个 KC 块按 ep 写回, 之后的块累加到 C 上; 最后一个 KC 块在每个 tile 写回后立即
+// 执行 ep.finish, 后处理读到的 tile 仍在 L1 中
+inline void macro_kernel(
+    int mc, int nc, int kc, const std::uint8_t* a_pack, const std::int8_t* b_pack,
+    const std::int32_t* comp, std::int32_t* c, std::ptrdiff_t ldc,
+    const epilogue<std::int32_t>& ep, bool first, bool last) {
+    const int kcp = round_up4(kc);
+    const std::int32_t beta = first ? ep.beta : 1;
+    alignas(alignment) std::int32_t tmp[MR * NR];
+    for (int jr = 0; jr < nc; jr += NR) {
+        const int nr = std::min(NR, nc - jr);
+        const std::int8_t* b_panel = b_pack + static_cast<std::ptrdiff_t>(jr) * kcp;
+        const std::int32_t* comp_panel = comp ? comp + jr : nullptr;
+        for (int ir = 0; ir < mc; ir += MR) {
+            const int mr = std::min(MR, mc - ir);
+            const std::uint8_t* a_panel = a_pack + static_cast<std::ptrdiff_t>(ir) * kcp;
+            std::int32_t* c_tile = c + ir * ldc + jr;
+            if (mr == MR && nr == NR) {
+                micro_kernel(kcp / 4, a_panel, b_panel, comp_panel, c_tile, ldc, ep.alpha, beta);
+            } else {
+                micro_kernel(kcp / 4, a_panel, b_panel, comp_panel, tmp, NR, 1, 0);
+                for (int i = 0; i < mr; ++i) {
+                    for (int j = 0; j < nr; ++j) {
+                        std::int32_t* dst = c_tile + i * ldc + j;
+                        const std::int32_t sum = ep.alpha * tmp[i * NR + j];
+                        *dst = beta == 0 ? sum : sum + beta * *dst;
+                    }
+                }
+            }
+            if (last) {
+                ep.finish(c_tile, mr, nr);
+            }
+        }
+    }
+}
+
+// C[N x P] = A[N x M] * B[M x P], A 为 u8 或 s8, B 为 s8, 步长任意 (以元素为单位),
+// C 为 int32 行主序. parallel 时的划分与 packed::gemm_blocked_parallel 相同:
+// B 面板由线程协作打包 (绑定线程时每个 NUMA 节点一份), C 按 (行块, 列段) 二维划分
+template <typename TA>
+inline void gemm_blocked(
+    int N, int M, int P, const TA* a, std::ptrdiff_t rsa, std::ptrdiff_t csa,
+    const std::int8_t* b, std::ptrdiff_t rsb, std::ptrdiff_t csb, std::int32_t* c,
+    std::ptrdiff_t ldc, const epilogue<std::int32_t>& ep, bool parallel) {
+    // 空矩阵没有可划分的行块; M == 0 时 C = beta * C
+    if (N == 0 || M == 0 || P == 0) {
+        ep.init(c, N, P, ldc);
+        return ep.finish(c, N, P);
+    }
+    const int n_threads =
+        parallel ? threading::threads_for(std::int64_t(N) * M * P, threading::count()) : 1;
+    const int rows_per_thread = (N + n_threads - 1) / n_threads;
+    const int mc_block = std::max(MR, std::min(MC, (rows_per_thread + MR - 1) / MR * MR));
+    const int row_blocks = (N + mc_block - 1) / mc_block;
+    const int col_groups = std::min((n_threads + row_blocks - 1) / row_blocks, NC / NR);
+    const int replicas = threading::replicas(n_threads);
+    const std::size_t b_block_size = static_cast<std::size_t>(KC) * NC;
+    buffer<std::int8_t> b_pack = make_buffer<std::int8_t>(b_block_size * replicas);
+    buffer<std::int32_t> comp =
+        std::is_signed_v<TA> ? make_buffer<std::int32_t>(static_cast<std::size_t>(NC) * replicas)
+                             : nullptr;
+    threading::parallel(n_threads, [&] {
+        threading::pin();
+        const auto slot = threading::slot_of(threading::thread_num(), threading::team_size());
+        std::int8_t* b_local = b_pack.get() + slot.replica * b_block_size;
+        std::int32_t* comp_local = comp ? comp.get() + slot.replica * NC : nullptr;
+        buffer<std::uint8_t> a_pack =
+            make_buffer<std::uint8_t>(static_cast<std::size_t>(mc_block) * KC);
+        for (int jc = 0; jc < P; jc += NC) {
+            const int nc = std::min(NC, P - jc);
+            const int panels = (nc + NR - 1) / NR;
+            const int group = (panels + col_groups - 1) / col_groups * NR;
+            const int groups = (nc + group - 1) / group;
+            for (int pc = 0; pc < M; pc += KC) {
+                const int kc = std::min(KC, M - pc), kcp = round_up4(kc);
+                for (int jr = slot.rank * NR; jr < nc; jr += slot.size * NR) {
+                    pack_b_panel(
+                        b + pc * rsb + (jc + jr) * csb, rsb, csb, kc, std::min(NR, nc - jr),
+                        b_local + static_cast<std::ptrdiff_t>(jr) * kcp,
+                        comp_local ? comp_local + jr : nullptr);
+                }
+                threading::barrier();
+                threading::for_each(row_blocks * groups, [&](int t) {
+                    const int ic = t / groups * mc_block, jg = t % groups * group;
+                    const int mc = std::min(mc_block, N - ic);
+                    pack_a(a + ic * rsa + pc * csa, rsa, csa, mc, kc, a_pack.get());
+                    macro_kernel(
+                        mc, std::min(group, nc - jg), kc, a_pack.get(),
+                        b_local + static_cast<std::ptrdiff_t>(jg) * kcp,
+                        comp_local ? comp_local + jg : nullptr, c + ic * ldc + jc + jg, ldc, ep,
+                        pc == 0, pc + kc == M);
+                });
+            }
+        }
+    });
+}
+
+template <typename TA>
+inline void gemm(
+    int N, int M, int P, const TA* a, std::ptrdiff_t rsa, std::ptrdiff_t csa,
+    const std::int8_t* b, std::ptrdiff_t rsb, std::ptrdiff_t csb, std::int32_t* c,
+    std::ptrdiff_t ldc, const epilogue<std::int32_t>& ep) {
+    gemm_blocked<TA>(N, M, P, a, rsa, csa, b, rsb, csb, c, ldc, ep, false);
+}
+
+template <typename TA>
+inline void gemm_parallel(
+    int N, int M, int P, const TA* a, std::ptrdiff_t rsa, std::ptrdiff_t csa,
+    const std::int8_t* b, std::ptrdiff_t rsb, std::ptrdiff_t csb, std::int32_t* c,
+    std::ptrdiff_t ldc, const epilogue<std::int32_t>& ep) {
+    gemm_blocked<TA>(N, M, P, a, rsa, csa, b, rsb, csb, c, ldc, ep, true);
+}
+
+}  // namespace int8
+
+}  // namespace MATMUL_ISA
+
+}  // namespace kernel
@@ -1,29 +1,8 @@
 #pragma once
 
-#include <string>
-
-// 条件包含指令集头文件
-#if defined(__ARM_NEON) || defined(__ARM_NEON__)
-#include <arm_neon.h>
-#endif
+#include "target.hpp"
 
-// ARM SME 指令集头文件
-#if defined(__ARM_FEATURE_SME)
-#include <arm_sme.h>
-#endif
-
-// x86/x86_64 SIMD 指令集头文件
-#if defined(__AVX512F__) || defined(__AVX2__) || defined(__AVX__) || defined(__SSE4_2__) || \
-    defined(__SSE4_1__) || defined(__SSSE3__) || defined(__SSE3__) || defined(__SSE2__) ||  \
-    defined(__SSE__)
-#include <immintrin.h>
-#endif
-
-// 如果需要单独的 x86intrin.h (某些编译器可能需要)
-#if (defined(__x86_64__) || defined(_M_X64) || defined(__i386__) || defined(_M_IX86)) && \
-    defined(__GNUC__)
-#include <x86intrin.h>
-#endif
+#include <string>
 
 namespace isa {
 
@@ -161,42 +140,98 @@ inline std::string get_full_info() {
     return get_target_info() + "\n" + get_compiler_info() + "\n" + get_build_info();
 }
 
-// 检查特定指令集是否可用
-namespace check {
-
-inline constexpr bool has_sse2() {
-#ifdef __SSE2__
-    return true;
-#else
-    return false;
-#endif
+// 运行时检测当前 CPU 支持的指令集 (x86 上通过 cpuid/xgetbv, 与编译参数无关)
+namespace runtime {
+
+struct features {
+    bool sse2 = false;
+    bool sse4_2 = false;
+    bool popcnt = false;
+    bool avx = false;
+    bool avx2 = false;
+    bool fma = false;
+    bool avx512f = false;
+    bool avx512dq = false;
+    bool avx512bw = false;
+    bool avx512vl = false;
+    bool avx512_vnni = false;
+    bool avx_vnni = false;
+};
+
+#if (defined(__x86_64__) || defined(__i386__)) && defined(__GNUC__)
+inline void cpuid(unsigned leaf, unsigned subleaf, unsigned regs[4]) {
+    __cpuid_count(leaf, subleaf, regs[0], regs[1], regs[2], regs[3]);
 }
 
-inline constexpr bool has_avx() {
-#ifdef __AVX__
-    return true;
-#else
-    return false;
-#endif
+inline unsigned long long xgetbv(unsigned index) {
+    unsigned eax, edx;
+    __asm__ volatile("xgetbv" : "=a"(eax), "=d"(edx) : "c"(index));
+    return (static_cast<unsigned long long>(edx) << 32) | eax;
 }
 
-inline constexpr bool has_avx2() {
-#ifdef __AVX2__
-    return true;
-#else
-    return false;
-#endif
-}
+inline features detect() {
+    features f;
+    unsigned regs[4];
+    cpuid(0, 0, regs);
+    const unsigned max_leaf = regs[0];
+    if (max_leaf < 1) {
+        return f;
+    }
 
-inline constexpr bool has_avx512() {
-#ifdef __AVX512F__
-    return true;
+    cpuid(1, 0, regs);
+    const unsigned ecx1 = regs[2], edx1 = regs[3];
+    f.sse2 = edx1 & (1u << 26);
+    f.sse4_2 = ecx1 & (1u << 20);
+    f.popcnt = ecx1 & (1u << 23);
+
+    // AVX/AVX-512 还需要操作系统在 XCR0 中开启对应的寄存器状态保存
+    const bool osxsave = ecx1 & (1u << 27);
+    const unsigned long long xcr0 = osxsave ? xgetbv(0) : 0;
+    const bool os_avx = (xcr0 & 0x6) == 0x6;
+    const bool os_avx512 = os_avx && (xcr0 & 0xe0) == 0xe0;
+
+    f.avx = os_avx && (ecx1 & (1u << 28));
+    f.fma = f.avx && (ecx1 & (1u << 12));
+    if (max_leaf < 7) {
+        return f;
+    }
+
+    cpuid(7, 0, regs);
+    const unsigned ebx7 = regs[1], ecx7 = regs[2];
+    f.avx2 = f.avx && (ebx7 & (1u << 5));
+    f.avx512f = os_avx512 && (ebx7 & (1u << 16));
+    f.avx512dq = f.avx512f && (ebx7 & (1u << 17));
+    f.avx512bw = f.avx512f && (ebx7 & (1u << 30));
+    f.avx512vl = f.avx512f && (ebx7 & (1u << 31));
+    f.avx512_vnni = f.avx512f && (ecx7 & (1u << 11));
+
+    cpuid(7, 1, regs);
+    f.avx_vnni = f.avx2 && (regs[0] & (1u << 4));
+    return f;
+}
 #else
-    return false;
+inline features detect() { return features{}; }
 #endif
+
+inline const features& cpu() {
+    static const features f = detect();
+    return f;
 }
 
-inline constexpr bool has_neon() {
+}  // namespace runtime
+
+// 检查特定指令集是否可用 (x86 为运行时检测结果, ARM 为编译目标)
+namespace check {
+
+inline bool has_sse2() { return runtime::cpu().sse2; }
+
+inline bool has_avx() { return runtime::cpu().avx; }
+
+inline bool has_avx2() { return runtime::cpu().avx2; }
+
+inline bool has_avx512() { return runtime::cpu().avx512f; }
+
+inline bool has_neon() {
 #if defined(__ARM_NEON) || defined(__ARM_NEON__)
     return true;
 #else
@@ -204,7 +239,7 @@ inline constexpr bool has_neon() {
 #endif
 }
 
-inline constexpr bool has_sme() {
+inline bool has_sme() {
 #if defined(__ARM_FEATURE_SME)
     return true;
 #else
@@ -212,11 +247,11 @@ inline constexpr bool has_sme() {
 #endif
 }
 
-inline constexpr bool has_fma() {
-#ifdef __FMA__
+inline bool has_fma() {
+#if defined(__aarch64__)
     return true;
 #else
-    return false;
+    return runtime::cpu().fma;
 #endif
 }
 
@@ -0,0 +1,90 @@
+#ifndef LIBMATMUL_H
+#define LIBMATMUL_H
+
+/*
+ * libmatmul 的 C 接口. 矩阵按行主序存储, 与 BLAS 的命名一致:
+ * op(A) 为 M x K, op(B) 为 K x N, C 为 M x N, 计算 C = alpha * op(A) @ op(B) + beta * C.
+ * trans 为 'N' 时 op(X) = X, 为 'T' 时 op(X) = X^T (X 按转置前的形状存储).
+ * lda/ldb/ldc 为相邻两行的元素间距, 至少为所存矩阵的列数. 缓冲区直接传给内核, 不做复制.
+ *
+ * kernel 为内核名称 (与 Python 绑定同名, 如 "gemm", "multithread_gemm", "strassen"),
+ * NULL 或 "auto" 按调优缓存选择 (同 libmatmul.matmul). gemm, multithread_gemm 与 strassen
+ * 接受任意 lda/ldb/ldc 与转置; 其余内核要求 A 与 C 连续存储且 A 不转置, 内核无法读取的布局
+ * 返回 LIBMATMUL_INVALID_ARGUMENT. threads 为 0 时使用全局设置 (或调优结果).
+ *
+ * 返回 LIBMATMUL_OK 或错误码, libmatmul_last_error() 给出调用线程最近一次错误的说明.
+ * 函数不访问 Python 对象, 可在不持有 GIL 的线程上调用 (ctypes 调用时会释放 GIL).
+ * 库同时是 Python 扩展模块, C 程序链接时还需链接 libpython (python3-config --embed --ldflags)
+ */
+
+#include <stddef.h>
+#include <stdint.h>
+
+/* 库以 -fvisibility=hidden 编译, 接口函数需显式导出 */
+#if defined(__GNUC__)
+#define LIBMATMUL_API __attribute__((visibility("default")))
+#else
+#define LIBMATMUL_API
+#endif
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+typedef enum libmatmul_dtype {
+    LIBMATMUL_INT32 = 0,
+    LIBMATMUL_INT64 = 1,
+    LIBMATMUL_FLOAT32 = 2,
+    LIBMATMUL_FLOAT64 = 3
+} libmatmul_dtype;
+
+enum {
+    LIBMATMUL_OK = 0,
+    /* 未知内核, 非法的形状, 步长, 线程数或内核无法读取的布局 */
+    LIBMATMUL_INVALID_ARGUMENT = 1,
+    /* 内存不足等运行时错误 */
+    LIBMATMUL_RUNTIME_ERROR = 2
+};
+
+/* dtype 为 libmatmul_dtype 的取值, 其他值返回 LIBMATMUL_INVALID_ARGUMENT. alpha/beta 指向
+ * dtype 类型的标量, NULL 分别表示 1 与 0. beta 为 0 时不读取 C */
+LIBMATMUL_API int libmatmul_gemm(
+    const char* kernel, int dtype, char trans_a, char trans_b, int M, int N, int K,
+    const void* alpha, const void* a, ptrdiff_t lda, const void* b, ptrdiff_t ldb,
+    const void* beta, void* c, ptrdiff_t ldc, int threads);
+
+LIBMATMUL_API int libmatmul_sgemm(
+    const char* kernel, char trans_a, char trans_b, int M, int N, int K, float alpha,
+    const float* a, ptrdiff_t lda, const float* b, ptrdiff_t ldb, float beta, float* c,
+    ptrdiff_t ldc, int threads);
+
+LIBMATMUL_API int libmatmul_dgemm(
+    const char* kernel, char trans_a, char trans_b, int M, int N, int K, double alpha,
+    const double* a, ptrdiff_t lda, const double* b, ptrdiff_t ldb, double beta, double* c,
+    ptrdiff_t ldc, int threads);
+
+LIBMATMUL_API int libmatmul_igemm(
+    const char* kernel, char trans_a, char trans_b, int M, int N, int K, int32_t alpha,
+    const int32_t* a, ptrdiff_t lda, const int32_t* b, ptrdiff_t ldb, int32_t beta, int32_t* c,
+    ptrdiff_t ldc, int threads);
+
+LIBMATMUL_API int libmatmul_lgemm(
+    const char* kernel, char trans_a, char trans_b, int M, int N, int K, int64_t alpha,
+    const int64_t* a, ptrdiff_t lda, const int64_t* b, ptrdiff_t ldb, int64_t beta, int64_t* c,
+    ptrdiff_t ldc, int threads);
+
+/* 调用线程最近一次失败的说明, 没有失败时为空字符串 */
+LIBMATMUL_API const char* libmatmul_last_error(void);
+
+/* 可用的内核名称: index 从 0 到 libmatmul_kernel_count() - 1, 越界时返回 NULL */
+LIBMATMUL_API int libmatmul_kernel_count(void);
+LIBMATMUL_API const char* libmatmul_kernel_name(int index);
+
+/* 旧接口: N x N 的 int 矩阵, 以行指针数组给出; 会复制输入与结果 */
+LIBMATMUL_API void matrixmultiply(int N, int** matrixA, int** matrixB, int** matrixC);
+
+#ifdef __cplusplus
+}
+#endif
+
+#endif /* LIBMATMUL_H */
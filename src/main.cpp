@@ -1,10 +1,41 @@
+#include "dispatch.hpp"
+#include "executor.hpp"
+#include "gemm.hpp"
 #include "isa.hpp"
+#include "libmatmul.h"
+#include "matrix.hpp"
+#include "outofcore.hpp"
+#include "phases.hpp"
+#include "prepack.hpp"
+#include "profile.hpp"
 #include "simd.hpp"
+#include "strassen.hpp"
+#include "threading.hpp"
+#include "tuning.hpp"
 #include "typedef.h"
 
+#include <algorithm>
+#include <atomic>
+#include <chrono>
+#include <cstring>
+#include <functional>
+#include <initializer_list>
+#include <limits>
+#include <map>
 #include <memory>
+#include <optional>
+#include <random>
+#include <set>
+#include <stdexcept>
+#include <string>
+#include <thread>
+#include <tuple>
+#include <type_traits>
+#include <variant>
+#include <vector>
 #include <pybind11/numpy.h>
 #include <pybind11/pybind11.h>
+#include <pybind11/stl.h>
 
 using namespace pybind11::literals;
 
@@ -12,24 +43,25 @@ namespace py = pybind11;
 
 namespace kernel {
 
-void trivial(const T* a, const T* b, T* c, int N, int M, int P) {
-    memset(c, 0, N * P * sizeof(T));
+template <typename T>
+void trivial(const T* a, const T* b, T* c, int N, int M, int P, const epilogue<T>& ep) {
     for (int i = 0; i < N; ++i) {
         for (int j = 0; j < P; ++j) {
             T sum = 0;
             for (int k = 0; k < M; ++k) {
                 sum += a[i * M + k] * b[k * P + j];
             }
-            c[i * P + j] = sum;
+            ep.store(&c[i * P + j], sum);
         }
     }
 }
 
-void transpose_iter(const T* a, const T* b, T* c, int N, int M, int P) {
-    memset(c, 0, N * P * sizeof(T));
+template <typename T>
+void transpose_iter(const T* a, const T* b, T* c, int N, int M, int P, const epilogue<T>& ep) {
+    ep.init(c, N, P, P);
     for (int i = 0; i < N; ++i) {
         for (int k = 0; k < M; ++k) {
-            auto tmp = a[i * M + k];
+            auto tmp = ep.alpha * a[i * M + k];
             for (int j = 0; j < P; ++j) {
                 c[i * P + j] += tmp * b[k * P + j];
             }
@@ -37,111 +69,2020 @@ void transpose_iter(const T* a, const T* b, T* c, int N, int M, int P) {
     }
 }
 
-inline void multithread(const T* a, const T* b, T* c, int N, int M, int P) {
-    memset(c, 0, N * P * sizeof(T));
-#pragma omp parallel for
+template <typename T>
+inline void multithread(const T* a, const T* b, T* c, int N, int M, int P, const epilogue<T>& ep) {
+    ep.init(c, N, P, P);
+    threading::for_each_tile(N, M, P, [&](const threading::grid::range& r) {
+        for (int i = r.i0; i < r.i1; ++i) {
+            for (int k = 0; k < M; ++k) {
+                auto tmp = ep.alpha * a[i * M + k];
+                for (int j = r.j0; j < r.j1; ++j) {
+                    c[i * P + j] += tmp * b[k * P + j];
+                }
+            }
+        }
+    });
+}
+
+template <typename T>
+void chunk(const T* a, const T* b, T* c, int N, int M, int P, const epilogue<T>& ep) {
+    ep.init(c, N, P, P);
+    const int chunk_size = tuning::block(64);
+    for (int ii = 0; ii < N; ii += chunk_size) {
+        for (int kk = 0; kk < M; kk += chunk_size) {
+            for (int jj = 0; jj < P; jj += chunk_size) {
+                for (int i = ii; i < std::min(ii + chunk_size, N); ++i) {
+                    for (int k = kk; k < std::min(kk + chunk_size, M); ++k) {
+                        T tmp = ep.alpha * a[i * M + k];
+                        for (int j = jj; j < std::min(jj + chunk_size, P); ++j) {
+                            c[i * P + j] += tmp * b[k * P + j];
+                        }
+                    }
+                }
+            }
+        }
+    }
+}
+
+template <typename T>
+void multithread_chunk(const T* a, const T* b, T* c, int N, int M, int P, const epilogue<T>& ep) {
+    ep.init(c, N, P, P);
+    const int chunk_size = tuning::block(64);
+    // 每个 tile 内部再按 chunk_size 分块
+    threading::for_each_tile(N, M, P, [&](const threading::grid::range& r) {
+        for (int ii = r.i0; ii < r.i1; ii += chunk_size) {
+            for (int kk = 0; kk < M; kk += chunk_size) {
+                for (int jj = r.j0; jj < r.j1; jj += chunk_size) {
+                    for (int i = ii; i < std::min(ii + chunk_size, r.i1); ++i) {
+                        for (int k = kk; k < std::min(kk + chunk_size, M); ++k) {
+                            T tmp = ep.alpha * a[i * M + k];
+                            for (int j = jj; j < std::min(jj + chunk_size, r.j1); ++j) {
+                                c[i * P + j] += tmp * b[k * P + j];
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    });
+}
+
+template <typename T>
+void transpose_data_bt(
+    const T* a, const T* b_tr, T* c, int N, int M, int P, const epilogue<T>& ep) {
     for (int i = 0; i < N; ++i) {
-        for (int k = 0; k < M; ++k) {
-            auto tmp = a[i * M + k];
+        for (int j = 0; j < P; ++j) {
+            T sum = 0;
+            for (int k = 0; k < M; ++k) {
+                sum += a[i * M + k] * b_tr[j * M + k];
+            }
+            ep.store(&c[i * P + j], sum);
+        }
+    }
+}
+
+template <typename T>
+void transpose_data(const T* a, const T* b, T* c, int N, int M, int P, const epilogue<T>& ep) {
+    auto b_tr = transpose_of(b, M, P);
+    transpose_data_bt(a, b_tr ? b_tr.get() : b, c, N, M, P, ep);
+}
+
+}  // namespace kernel
+
+// 内核族: 每种元素类型一个 kernel_entry. bind 注册的泛型 lambda 按类型转换为函数指针,
+// 每次调用时求值, 以便跟随运行时选中的指令集
+template <typename T> struct tag {
+    using type = T;
+};
+
+template <typename Tag> using element_t = typename Tag::type;
+
+template <typename T> using resolver = dispatch::kernel_entry<T> (*)(tag<T>);
+
+using family = element_types::tuple<resolver>;
+
+template <typename... Ts, typename F> family family_of(type_list<Ts...>, F resolve) {
+    return {static_cast<resolver<Ts>>(resolve)...};
+}
+
+template <typename T> dispatch::kernel_entry<T> resolve(const family& f) {
+    return std::get<resolver<T>>(f)(tag<T>{});
+}
+
+template <typename T>
+dispatch::kernel_entry<T> entry_of(
+    dispatch::kernel_fn<T> plain, dispatch::kernel_bt_fn<T> bt = nullptr) {
+    return {plain, bt};
+}
+
+// 内置内核: 名称, 各元素类型的入口与说明. resolve 为泛型 lambda, 对 tag<T> 返回元素类型 T 的
+// kernel_entry
+struct builtin {
+    const char* name;
+    family f;
+    const char* desc;
+};
+
+template <typename F> builtin builtin_of(const char* name, F resolve, const char* desc) {
+    return {name, family_of(element_types{}, resolve), desc};
+}
+
+const std::vector<builtin>& builtins() {
+    static const std::vector<builtin> list{
+        builtin_of(
+            "trivial", [](auto t) { return entry_of(kernel::trivial<element_t<decltype(t)>>); },
+            "Matrix multiplication using a trivial implementation"),
+        builtin_of(
+            "transpose_iter",
+            [](auto t) { return entry_of(kernel::transpose_iter<element_t<decltype(t)>>); },
+            "Matrix multiplication using a transposed loop iterator implementation"),
+        builtin_of(
+            "multithread",
+            [](auto t) { return entry_of(kernel::multithread<element_t<decltype(t)>>); },
+            "Matrix multiplication using a multithreaded implementation"),
+        builtin_of(
+            "multithread_chunk",
+            [](auto t) { return entry_of(kernel::multithread_chunk<element_t<decltype(t)>>); },
+            "Matrix multiplication using a multithreaded chunked implementation"),
+        builtin_of(
+            "auto_simd",
+            [](auto t) { return dispatch::active().of<element_t<decltype(t)>>().auto_simd; },
+            "Matrix multiplication using a SIMD implementation (auto generated by libomp)"),
+        builtin_of(
+            "chunk", [](auto t) { return entry_of(kernel::chunk<element_t<decltype(t)>>); },
+            "Matrix multiplication using a chunked implementation"),
+        builtin_of(
+            "transpose",
+            [](auto t) {
+                using T = element_t<decltype(t)>;
+                return entry_of(kernel::transpose_data<T>, kernel::transpose_data_bt<T>);
+            },
+            "Matrix multiplication using a transposed implementation"),
+        builtin_of(
+            "multithread_simd",
+            [](auto t) { return dispatch::active().of<element_t<decltype(t)>>().multithread_simd; },
+            "Matrix multiplication using a multithreaded SIMD implementation"),
+        builtin_of(
+            "gemm", [](auto t) { return dispatch::active().of<element_t<decltype(t)>>().gemm; },
+            "Matrix multiplication using packed panels and a register-blocked micro-kernel"),
+        builtin_of(
+            "multithread_gemm",
+            [](auto t) { return dispatch::active().of<element_t<decltype(t)>>().multithread_gemm; },
+            "Matrix multiplication using a multithreaded packed-panel implementation"),
+        builtin_of(
+            "strassen",
+            [](auto t) { return dispatch::active().of<element_t<decltype(t)>>().strassen; },
+            "Matrix multiplication using Strassen-Winograd recursion down to the gemm kernel"),
+        builtin_of(
+            "simd", [](auto t) { return dispatch::active().of<element_t<decltype(t)>>().simd; },
+            "Matrix multiplication using a SIMD implementation (manually generated)"),
+        builtin_of(
+            "simd_optimized",
+            [](auto t) { return dispatch::active().of<element_t<decltype(t)>>().simd_optimized; },
+            "Matrix multiplication using an optimized SIMD implementation with prefetch"),
+        builtin_of(
+            "simd_arm_sme",
+            [](auto t) { return entry_of(kernel::simd_arm_sme<element_t<decltype(t)>>); },
+            "Matrix multiplication using ARM SME instructions"),
+    };
+    return list;
+}
+
+// 所有已绑定的内核, 供 submit() 等按名称选择. 首次使用时由 builtins() 填充, 不依赖
+// Python 模块的初始化, C 接口也可使用
+const std::map<std::string, family>& kernels() {
+    static const std::map<std::string, family> registry = [] {
+        std::map<std::string, family> r;
+        for (const auto& k : builtins()) {
+            r.emplace(k.name, k.f);
+        }
+        return r;
+    }();
+    return registry;
+}
+
+const family& find_kernel(const std::string& name) {
+    auto it = kernels().find(name);
+    if (it == kernels().end()) {
+        throw std::invalid_argument("Unknown kernel: " + name);
+    }
+    return it->second;
+}
+
+// 不指定 forcecast/c_style, pybind11 不会为了类型或布局转换而复制输入;
+// 配合 noconvert() 使用, dtype 不在 element_types 中时直接报错
+template <typename T> using ndarray = py::array_t<T, 0>;
+
+// 任一支持的 dtype 的数组, 内核按其元素类型实例化
+using any_array = element_types::variant<ndarray>;
+
+template <typename A> using element_of = typename std::decay_t<A>::value_type;
+
+// 其余操作数必须与 a 的 dtype 相同, 不做隐式转换
+template <typename T> const ndarray<T>& same_dtype(const any_array& x, const char* name) {
+    if (auto array = std::get_if<ndarray<T>>(&x)) {
+        return *array;
+    }
+    throw py::type_error(std::string("`") + name + "` must have the same dtype as `a`");
+}
+
+template <typename T> epilogue<T> epilogue_of(py::handle alpha, py::handle beta) {
+    try {
+        return {alpha.cast<T>(), beta.cast<T>()};
+    } catch (const py::cast_error&) {
+        throw py::type_error("`alpha` and `beta` must be convertible to the dtype of `a`");
+    }
+}
+
+// 调用级的 threads=, 为空时使用 set_num_threads 的全局设置 (返回 0)
+int threads_of(const std::optional<int>& threads) {
+    if (threads && *threads < 1) {
+        throw std::invalid_argument("`threads` must be positive");
+    }
+    return threads.value_or(0);
+}
+
+// x 的最后两维; 更高的维度由调用方处理
+template <typename T> matrix_view<T> view_of(const ndarray<T>& x, const char* name) {
+    for (py::ssize_t d = 0; d < x.ndim(); ++d) {
+        if (x.strides(d) % static_cast<py::ssize_t>(sizeof(T)) != 0) {
+            throw std::invalid_argument(
+                std::string("Strides of `") + name + "` are not a multiple of the item size");
+        }
+    }
+    const auto d = x.ndim() - 2;
+    return {
+        x.data(),
+        static_cast<int>(x.shape(d)),
+        static_cast<int>(x.shape(d + 1)),
+        x.strides(d) / static_cast<py::ssize_t>(sizeof(T)),
+        x.strides(d + 1) / static_cast<py::ssize_t>(sizeof(T))};
+}
+
+// 预打包的 B: 构造时复制为行主序快照, 各内核需要的布局在首次使用时生成并保留
+template <typename T> struct packed_operand {
+    using value_type = T;
+
+    int M, P;
+    std::unique_ptr<T[]> rows;
+    std::shared_ptr<prepack::operand<T>> layouts;
+
+    matrix_view<T> view() const { return {rows.get(), M, P, P, 1}; }
+};
+
+class packed_matrix {
+public:
+    template <typename T> explicit packed_matrix(const ndarray<T>& b) {
+        if (b.ndim() != 2) {
+            throw std::runtime_error("PackedMatrix expects a 2-D array");
+        }
+        const auto src = view_of(b, "b");
+        M = src.rows;
+        P = src.cols;
+        std::unique_ptr<T[]> rows(new T[static_cast<std::size_t>(M) * P]);
+        for (int i = 0; i < M; ++i) {
             for (int j = 0; j < P; ++j) {
-                c[i * P + j] += tmp * b[k * P + j];
+                rows[i * P + j] = src.data[i * src.rs + j * src.cs];
+            }
+        }
+        typed = packed_operand<T>{
+            M, P, std::move(rows), std::make_shared<prepack::operand<T>>(M, P)};
+    }
+
+    int M, P;
+    element_types::variant<packed_operand> typed;
+};
+
+// 右操作数可以是普通数组或 PackedMatrix
+using operand_b = std::variant<any_array, const packed_matrix*>;
+
+const py::array* array_of(const operand_b& b) {
+    if (auto array = std::get_if<any_array>(&b)) {
+        return std::visit([](const py::array& x) { return &x; }, *array);
+    }
+    return nullptr;
+}
+
+// 弱引用按所有者登记一次; 有意不释放, 避免解释器退出后析构 Python 对象
+py::dict& registered_owners() {
+    static auto* registered = new py::dict();
+    return *registered;
+}
+
+// b 的缓冲区的所有者: 沿 base 找到的最底层对象
+py::object owner_of(const py::array& b) {
+    py::object owner = b;
+    // 持有自身内存的数组 base 为空指针, 经 Python 读取时为 None
+    for (py::object base = b.base(); base && !base.is_none(); base = owner.attr("base")) {
+        owner = base;
+        if (!py::isinstance<py::array>(owner)) {
+            break;
+        }
+    }
+    return owner;
+}
+
+py::int_ owner_key(const void* id) { return py::int_(reinterpret_cast<std::uintptr_t>(id)); }
+
+// pack cache 以地址为键, B 的缓冲区被释放后新数组可能复用同一地址. 因此为缓冲区的所有者
+// 注册弱引用, 所有者被回收时丢弃它的缓存项. 返回所有者, 作为缓存键的一部分; 缓存禁用或
+// 所有者不支持弱引用时返回空指针, 不进入缓存
+const void* cache_owner(const py::array& b) {
+    if (!prepack::cache().enabled()) {
+        return nullptr;
+    }
+    py::object owner = owner_of(b);
+    const void* id = owner.ptr();
+    py::int_ key = owner_key(id);
+    if (registered_owners().contains(key)) {
+        return id;
+    }
+    auto forget = py::cpp_function([id, key](py::handle) {
+        prepack::cache().release(id);
+        registered_owners().attr("pop")(key, py::none());
+    });
+    try {
+        registered_owners()[key] = py::weakref(owner, forget);
+    } catch (py::error_already_set& e) {
+        if (!e.matches(PyExc_TypeError)) {
+            throw;
+        }
+        return nullptr;
+    }
+    return id;
+}
+
+// 已注册的所有者; 未注册的所有者没有缓存项, 也无需记录版本
+const void* registered_owner(const py::array& b) {
+    const void* id = owner_of(b).ptr();
+    return registered_owners().contains(owner_key(id)) ? id : nullptr;
+}
+
+template <typename T> struct operands {
+    matrix_view<T> a, b;
+    // B 的打包布局: 来自 PackedMatrix 或 pack cache, 为空时每次调用重新转置/打包
+    std::shared_ptr<prepack::operand<T>> packed_b = nullptr;
+    bool cached = false;
+    // B 缓冲区的所有者 (见 cache_owner), 为空时不使用 pack cache
+    const void* owner = nullptr;
+};
+
+template <typename T> operands<T> check_shapes(const ndarray<T>& a, const operand_b& b) {
+    if (a.ndim() != 2) {
+        throw std::runtime_error("Matrix multiplication expects 2-D arrays");
+    }
+    operands<T> in{view_of(a, "a"), {}};
+    if (auto packed = std::get_if<const packed_matrix*>(&b)) {
+        auto typed = std::get_if<packed_operand<T>>(&(*packed)->typed);
+        if (!typed) {
+            throw py::type_error("`b` must have the same dtype as `a`");
+        }
+        in.b = typed->view();
+        in.packed_b = typed->layouts;
+    } else {
+        const auto& array = same_dtype<T>(std::get<any_array>(b), "b");
+        if (array.ndim() != 2) {
+            throw std::runtime_error("Matrix multiplication expects 2-D arrays");
+        }
+        in.b = view_of(array, "b");
+        in.owner = cache_owner(array);
+    }
+    if (in.a.cols != in.b.rows) {
+        throw std::runtime_error("Incompatible shapes for matrix multiplication");
+    }
+    return in;
+}
+
+py::object as_object(const operand_b& b) {
+    if (auto packed = std::get_if<const packed_matrix*>(&b)) {
+        return py::cast(*packed, py::return_value_policy::reference);
+    }
+    return py::reinterpret_borrow<py::object>(*array_of(b));
+}
+
+// 结果数组: 给出 out 时原地写入 (需行内连续且不与输入重叠), 否则新分配.
+// beta 非 0 时内核会读取 C, 因此必须给出 out. ldc 为行距, bs 为批维步长
+template <typename T> struct result {
+    ndarray<T> c;
+    std::ptrdiff_t ldc, bs = 0;
+};
+
+bool overlaps(const py::array& x, const py::array& y) {
+    auto extent = [](const py::array& v) {
+        auto lo = reinterpret_cast<const char*>(v.data()), hi = lo;
+        for (py::ssize_t d = 0; d < v.ndim(); ++d) {
+            if (v.shape(d) == 0) {
+                return std::make_pair(lo, lo);
+            }
+            const auto span = (v.shape(d) - 1) * v.strides(d);
+            (span < 0 ? lo : hi) += span;
+        }
+        return std::make_pair(lo, hi + v.itemsize());
+    };
+    const auto [xl, xh] = extent(x);
+    const auto [yl, yh] = extent(y);
+    return xl < yh && yl < xh;
+}
+
+// 检查给出的 out 并返回其行距与批维步长
+template <typename U>
+std::pair<std::ptrdiff_t, std::ptrdiff_t> check_out(
+    const ndarray<U>& c, const std::vector<py::ssize_t>& shape,
+    std::initializer_list<const py::array*> inputs) {
+    const auto rows = shape.end()[-2], cols = shape.back();
+    if (std::vector<py::ssize_t>(c.shape(), c.shape() + c.ndim()) != shape) {
+        std::string expected;
+        for (auto n : shape) {
+            expected += (expected.empty() ? "" : ", ") + std::to_string(n);
+        }
+        throw std::invalid_argument("`out` must have shape (" + expected + ")");
+    }
+    if (!c.writeable()) {
+        throw std::invalid_argument("`out` is read-only");
+    }
+    const auto view = view_of(c, "out");
+    if (view.cs != 1 && cols > 1 && rows > 0) {
+        throw std::invalid_argument("`out` must have contiguous rows");
+    }
+    for (auto x : inputs) {
+        if (x && overlaps(c, *x)) {
+            throw std::invalid_argument("`out` must not overlap the inputs");
+        }
+    }
+    const std::ptrdiff_t bs = c.ndim() > 2 ? c.strides(0) / c.itemsize() : 0;
+    // 空的 out 没有元素, NumPy 给出的批维步长可以是 0
+    if (c.ndim() > 2 && bs == 0 && shape[0] > 1 && c.size() > 0) {
+        throw std::invalid_argument("`out` must not broadcast over the batch");
+    }
+    return {rows > 1 ? view.rs : cols, bs};
+}
+
+template <typename T>
+result<T> output_of(
+    const std::vector<py::ssize_t>& shape, std::initializer_list<const py::array*> inputs,
+    const std::optional<any_array>& out, const epilogue<T>& ep) {
+    if (!out) {
+        if (ep.beta != 0) {
+            throw std::invalid_argument("beta != 0 requires `out` to accumulate into");
+        }
+        const auto rows = shape.end()[-2], cols = shape.back();
+        return {ndarray<T>(shape), cols, rows * cols};
+    }
+    const auto& c = same_dtype<T>(*out, "out");
+    const auto [ldc, bs] = check_out(c, shape, inputs);
+    return {c, ldc, bs};
+}
+
+// 依次以 tag<U> 调用 f, 直到某次返回 true
+template <typename... Us, typename F> bool find_type(type_list<Us...>, F&& f) {
+    return (f(tag<Us>{}) || ...);
+}
+
+// 融合后处理的 out 可以是 output_types 中的任一 dtype
+using output_array = output_types::variant<ndarray>;
+
+// 绑定的 bias= / scale= / shift= / clip= / dtype= 参数, 全部为 None 时不做后处理
+struct postops_args {
+    py::object bias, scale, shift, clip, dtype;
+
+    bool empty() const {
+        return bias.is_none() && scale.is_none() && shift.is_none() && clip.is_none() &&
+               dtype.is_none();
+    }
+};
+
+// 由 postops_args 构造的 postops<T> 与它引用的数组. bias 转为 T, scale/shift 转为 real,
+// 都很小, 复制的开销可以忽略. base/ldc/out 由 destination_of 填写
+template <typename T> struct postops_of {
+    using real = typename postops<T>::real;
+
+    postops<T> ops;
+    py::array_t<T, py::array::c_style | py::array::forcecast> bias;
+    py::array_t<real, py::array::c_style | py::array::forcecast> scale, shift;
+
+    postops_of(const postops_args& args, py::ssize_t P) {
+        // 标量返回步长 0, 长 P 的一维数组返回 1
+        auto step_of = [P](const py::array& x, const char* name, bool scalar) -> py::ssize_t {
+            if (scalar && x.ndim() == 0) {
+                return 0;
+            }
+            if (x.ndim() != 1 || x.shape(0) != P) {
+                throw std::invalid_argument(
+                    std::string("`") + name + "` must be " + (scalar ? "a scalar or " : "") +
+                    "a 1-D array with one element per column of the result");
+            }
+            return 1;
+        };
+        if (!args.bias.is_none()) {
+            bias = decltype(bias)::ensure(args.bias);
+            if (!bias) {
+                throw py::type_error("`bias` must be convertible to the dtype of `a`");
+            }
+            step_of(bias, "bias", false);
+            ops.bias = bias.data();
+        }
+        auto factor = [&](const py::object& x, const char* name, auto& array, const real*& data,
+                          std::ptrdiff_t& step) {
+            if (x.is_none()) {
+                return;
+            }
+            array = std::remove_reference_t<decltype(array)>::ensure(x);
+            if (!array) {
+                throw py::type_error(std::string("`") + name + "` must be numeric");
+            }
+            step = step_of(array, name, true);
+            data = array.data();
+        };
+        factor(args.scale, "scale", scale, ops.scale, ops.scale_step);
+        factor(args.shift, "shift", shift, ops.shift, ops.shift_step);
+        if (!args.clip.is_none()) {
+            const auto [lo, hi] = args.clip.cast<std::pair<py::object, py::object>>();
+            ops.lo = lo.is_none() ? -HUGE_VAL : lo.cast<double>();
+            ops.hi = hi.is_none() ? HUGE_VAL : hi.cast<double>();
+            if (!(ops.lo <= ops.hi)) {
+                throw std::invalid_argument("`clip` must be (lo, hi) with lo <= hi");
+            }
+        }
+    }
+};
+
+// 带后处理时的结果: 返回 result, 内核写 c (行距 ldc). 结果的 dtype 与 a 不同时 c 为与结果
+// 同形的临时缓冲区: 内核沿内维分块把部分和累加在 C 中, 块只有在最后一个 KC 块之后才是最终
+// 值, 因此无法只用一个 tile 大小的缓冲区. 各块的最终值由 post 转换后写到 result
+template <typename T> struct destination {
+    py::array result;
+    T* c;
+    std::ptrdiff_t ldc;
+    std::unique_ptr<T[]> scratch;
+    std::unique_ptr<postops_of<T>> post;
+};
+
+// 按 dtype= (默认与 a 相同) 准备结果, 并让 ep 带上后处理
+template <typename T>
+destination<T> destination_of(
+    py::ssize_t N, py::ssize_t P, std::initializer_list<const py::array*> inputs,
+    const std::optional<output_array>& out, epilogue<T>& ep, const postops_args& args) {
+    const std::vector<py::ssize_t> shape{N, P};
+    const py::dtype type =
+        args.dtype.is_none() ? py::dtype::of<T>() : py::dtype::from_args(args.dtype);
+    destination<T> dst;
+    if (!args.empty()) {
+        dst.post = std::make_unique<postops_of<T>>(args, P);
+    }
+    auto found = [&](auto t) {
+        using O = element_t<decltype(t)>;
+        if (!type.equal(py::dtype::of<O>())) {
+            return false;
+        }
+        ndarray<O> c;
+        std::ptrdiff_t ld = P;
+        if (out) {
+            auto typed = std::get_if<ndarray<O>>(&*out);
+            if (!typed) {
+                throw py::type_error(
+                    "`out` must have the same dtype as the result (" +
+                    py::str(type).cast<std::string>() + ")");
+            }
+            c = *typed;
+            ld = check_out(c, shape, inputs).first;
+        } else {
+            if (ep.beta != 0) {
+                throw std::invalid_argument("beta != 0 requires `out` to accumulate into");
+            }
+            c = ndarray<O>(shape);
+        }
+        dst.result = c;
+        if constexpr (std::is_same_v<O, T>) {
+            dst.c = c.mutable_data(), dst.ldc = ld;
+        } else {
+            if (ep.beta != 0) {
+                throw std::invalid_argument("beta != 0 requires `dtype` to match `a`");
+            }
+            dst.scratch.reset(new T[static_cast<std::size_t>(N) * P]);
+            dst.c = dst.scratch.get(), dst.ldc = P;
+        }
+        if (dst.post) {
+            auto& ops = dst.post->ops;
+            ops.base = dst.c, ops.ldc = dst.ldc, ops.out = output<O>{c.mutable_data(), ld};
+            ep.post = &ops;
+        }
+        return true;
+    };
+    if (!find_type(output_types{}, found)) {
+        throw py::type_error(
+            "`dtype` must be one of int8, uint8, int16, int32, int64, float32, float64");
+    }
+    return dst;
+}
+
+// 按输入布局选择内核入口, 返回的调用不访问 Python 对象, 可在释放 GIL 后执行.
+// 内核无法直接读取的布局会报错, 而不是隐式复制. C 的行距为 ldc, 只有 strided/prepacked
+// 入口支持 ldc != P. use_cache 为 false 时不使用 pack cache (调优时测量完整的打包开销)
+template <typename T>
+std::function<void()> prepare(
+    const std::string& name, const dispatch::kernel_entry<T>& k, operands<T> in, T* c,
+    std::ptrdiff_t ldc, const epilogue<T>& ep, bool use_cache = true) {
+    const auto a = in.a, b = in.b;
+    const int N = a.rows, M = a.cols, P = b.cols;
+    // 只有 strided/prepacked 入口在写回各块时融合 ep.post; 其余入口不带后处理计算,
+    // 再对整个 C 执行一次 finish
+    epilogue<T> unfused = ep;
+    unfused.post = nullptr;
+    auto require_contiguous = [&](const char* operand, bool contiguous) {
+        if (!contiguous) {
+            throw std::invalid_argument(
+                name + " requires a C-contiguous `" + operand + "`; pass np.ascontiguousarray(" +
+                operand + ") or use gemm");
+        }
+    };
+    // F 序的 B 可直接作为 *_bt 入口的输入, 无需缓存
+    if (use_cache && !in.packed_b && (k.prepacked || (k.bt && !b.col_major()))) {
+        in.packed_b = prepack::cache().acquire(b, in.owner);
+        in.cached = in.packed_b != nullptr;
+    }
+    if (auto packed_b = in.packed_b; packed_b && (k.prepacked || k.bt)) {
+        if (!k.prepacked) {
+            require_contiguous("a", a.row_major());
+            require_contiguous("out", ldc == P);
+        }
+        return [=] {
+            if (k.prepacked) {
+                k.prepacked(
+                    N, M, P, a.data, a.rs, a.cs, packed_b->packed(k.b_packing, b), c, ldc, ep);
+            } else {
+                k.bt(a.data, packed_b->transposed(b), c, N, M, P, unfused);
+                ep.finish(c, N, P);
+            }
+            if (in.cached) {
+                prepack::cache().account(b, in.owner);
+            }
+        };
+    }
+    if (k.strided) {
+        return [=] { k.strided(N, M, P, a.data, a.rs, a.cs, b.data, b.rs, b.cs, c, ldc, ep); };
+    }
+    require_contiguous("a", a.row_major());
+    require_contiguous("out", ldc == P);
+    if (b.row_major()) {
+        return [=] {
+            k.plain(a.data, b.data, c, N, M, P, unfused);
+            ep.finish(c, N, P);
+        };
+    }
+    require_contiguous("b", k.bt != nullptr);
+    if (b.col_major()) {
+        // B 按列连续存储 (如 b.T 视图或 Fortran 序), 其转置即内核需要的布局, 无需再转置
+        return [=] {
+            k.bt(a.data, b.data, c, N, M, P, unfused);
+            ep.finish(c, N, P);
+        };
+    }
+    // 这些内核本就需要转置 B, 转置时直接按步长读取
+    return [=] {
+        std::unique_ptr<T[]> b_tr(kernel::transpose(b.data, b.rs, b.cs, M, P));
+        k.bt(a.data, b_tr.get(), c, N, M, P, unfused);
+        ep.finish(c, N, P);
+    };
+}
+
+// 计算 out = post(alpha * a @ b + beta * out), 未给出 out 时返回新数组
+template <typename T>
+py::array np_matmul(
+    const std::string& name, const dispatch::kernel_entry<T>& k, const ndarray<T>& a,
+    const operand_b& b, const std::optional<output_array>& out, epilogue<T> ep,
+    const postops_args& post) {
+    phases::call timing(name);
+    std::optional<phases::scope> step(phases::phase::convert);
+    const auto in = check_shapes(a, b);
+    timing.shape(in.a.rows, in.a.cols, in.b.cols);
+    step.emplace(phases::phase::output);
+    const auto dst = destination_of<T>(in.a.rows, in.b.cols, {&a, array_of(b)}, out, ep, post);
+    step.emplace(phases::phase::convert);
+    auto run = prepare(name, k, in, dst.c, dst.ldc, ep);
+    step.reset();
+
+    // 重新获取 GIL 与返回结果计入 wrap
+    std::optional<phases::scope> wrap;
+    {
+        // a, b, c 在返回前一直被持有, 释放 GIL 期间缓冲区不会被回收
+        py::gil_scoped_release release;
+        {
+            phases::scope compute(phases::phase::compute);
+            run();
+        }
+        wrap.emplace(phases::phase::wrap);
+    }
+    return dst.result;
+}
+
+// 按 a 的 dtype 选择内核实例
+py::array np_matmul(
+    const std::string& name, const family& f, const any_array& a, const operand_b& b,
+    const std::optional<output_array>& out, py::object alpha, py::object beta,
+    const postops_args& post) {
+    return std::visit(
+        [&](const auto& a) -> py::array {
+            using T = element_of<decltype(a)>;
+            return np_matmul(name, resolve<T>(f), a, b, out, epilogue_of<T>(alpha, beta), post);
+        },
+        a);
+}
+
+// int8 内核的 A 为 u8 或 s8, B 固定为 s8, 结果与 out 为 int32
+using int8_array = int8_types::variant<ndarray>;
+
+// 后处理可把 int32 结果重新量化为 int8/uint8 (dtype=), 每个块在写回时转换
+template <typename TA>
+py::array np_matmul_int8(
+    dispatch::kernel_int8_fn<TA> k, const ndarray<TA>& a, const ndarray<std::int8_t>& b,
+    const std::optional<output_array>& out, epilogue<std::int32_t> ep,
+    const postops_args& post) {
+    if (a.ndim() != 2 || b.ndim() != 2) {
+        throw std::runtime_error("Matrix multiplication expects 2-D arrays");
+    }
+    const auto av = view_of(a, "a"), bv = view_of(b, "b");
+    if (av.cols != bv.rows) {
+        throw std::runtime_error("Incompatible shapes for matrix multiplication");
+    }
+    const auto dst = destination_of<std::int32_t>(av.rows, bv.cols, {&a, &b}, out, ep, post);
+    {
+        py::gil_scoped_release release;
+        k(av.rows, av.cols, bv.cols, av.data, av.rs, av.cs, bv.data, bv.rs, bv.cs, dst.c,
+          dst.ldc, ep);
+    }
+    return dst.result;
+}
+
+// 与 py::arg(...).noconvert() 相同, 不做 dtype 转换, 类型不符时返回空
+template <typename V> std::optional<V> exact_cast(const py::handle& x) {
+    py::detail::make_caster<V> caster;
+    if (!caster.load(x, false)) {
+        return std::nullopt;
+    }
+    return py::detail::cast_op<V>(std::move(caster));
+}
+
+// 稀疏 x 稠密乘法的稀疏操作数: scipy.sparse 的 CSR/CSC 矩阵或 (data, indices, indptr) 元组,
+// 直接引用其中的三个数组而不复制. 非零元比例达到阈值时展开为稠密矩阵, 改用 gemm
+namespace sparse {
+
+std::atomic<double>& density_threshold() {
+    static std::atomic<double> density{0.1};
+    return density;
+}
+
+using any_index = index_types::variant<ndarray>;
+
+struct compressed {
+    any_array data;
+    any_index indices, indptr;
+    // 元组形式没有 shape, 由稠密操作数推出
+    std::optional<std::pair<py::ssize_t, py::ssize_t>> shape;
+};
+
+template <typename V> V vector_of(const py::handle& x, const std::string& name) {
+    auto array = exact_cast<V>(x);
+    if (!array) {
+        throw py::type_error(
+            "`" + name + "` must be an array of a supported dtype (values: int32, int64, "
+            "float32, float64; indices: int32, int64)");
+    }
+    const auto& a = std::visit([](const py::array& a) -> const py::array& { return a; }, *array);
+    if (a.ndim() != 1 || (a.size() > 1 && a.strides(0) != a.itemsize())) {
+        throw std::invalid_argument("`" + name + "` must be a contiguous 1-D array");
+    }
+    return *array;
+}
+
+compressed parse(const py::handle& x, const std::string& format, const char* name) {
+    py::object data, indices, indptr;
+    compressed m{any_array{}, any_index{}, any_index{}, std::nullopt};
+    if (py::isinstance<py::tuple>(x) && py::len(x) == 3) {
+        auto t = py::reinterpret_borrow<py::tuple>(x);
+        data = t[0], indices = t[1], indptr = t[2];
+    } else if (
+        py::hasattr(x, "indptr") && py::hasattr(x, "indices") && py::hasattr(x, "data")) {
+        if (py::hasattr(x, "format") && x.attr("format").cast<std::string>() != format) {
+            throw py::type_error(
+                std::string("`") + name + "` must be in " + format + " format; use " + name +
+                ".to" + format + "()");
+        }
+        data = x.attr("data"), indices = x.attr("indices"), indptr = x.attr("indptr");
+        const auto shape = x.attr("shape").cast<std::pair<py::ssize_t, py::ssize_t>>();
+        m.shape = shape;
+    } else {
+        throw py::type_error(
+            std::string("`") + name + "` must be a scipy.sparse " + format +
+            " matrix or a (data, indices, indptr) tuple");
+    }
+    m.data = vector_of<any_array>(data, std::string(name) + ".data");
+    m.indices = vector_of<any_index>(indices, std::string(name) + ".indices");
+    m.indptr = vector_of<any_index>(indptr, std::string(name) + ".indptr");
+    return m;
+}
+
+// 检查 indptr 单调且不越界, 下标都小于 inner, 内核因此不需要再做边界检查
+template <typename T, typename I>
+void validate(
+    int outer, int inner, const ndarray<I>& indptr, const ndarray<I>& indices,
+    const ndarray<T>& data, const char* format) {
+    auto fail = [&](const std::string& what) {
+        throw std::invalid_argument(std::string("Malformed ") + format + " matrix: " + what);
+    };
+    const I* ptr = indptr.data();
+    if (ptr[0] < 0 || ptr[outer] > indices.size() || ptr[outer] > data.size()) {
+        fail("indptr is out of range");
+    }
+    for (int i = 0; i < outer; ++i) {
+        if (ptr[i + 1] < ptr[i]) {
+            fail("indptr is not non-decreasing");
+        }
+    }
+    const I* idx = indices.data();
+    for (auto p = ptr[0]; p < ptr[outer]; ++p) {
+        if (idx[p] < 0 || idx[p] >= inner) {
+            fail("index out of range");
+        }
+    }
+}
+
+template <typename T, typename I> struct operand {
+    const ndarray<T>& data;
+    const ndarray<I>& indices;
+    const ndarray<I>& indptr;
+    std::optional<std::pair<py::ssize_t, py::ssize_t>> shape;
+
+    // 外层维度 (CSR 的行数, CSC 的列数)
+    int outer() const {
+        if (indptr.size() < 1) {
+            throw std::invalid_argument("Malformed sparse matrix: indptr is empty");
+        }
+        return static_cast<int>(indptr.size() - 1);
+    }
+    std::size_t nnz() const { return indptr.data()[outer()] - indptr.data()[0]; }
+};
+
+bool use_dense(std::size_t nnz, int rows, int cols) {
+    const double size = double(rows) * cols;
+    return size > 0 && nnz >= density_threshold().load(std::memory_order_relaxed) * size;
+}
+
+// 稀疏矩阵的稠密副本, csr 为 false 时按 CSC 解释
+template <typename T, typename I>
+std::unique_ptr<T[]> densify(const operand<T, I>& x, int rows, int cols, bool csr) {
+    std::unique_ptr<T[]> dense(new T[static_cast<std::size_t>(rows) * cols]());
+    const I *ptr = x.indptr.data(), *idx = x.indices.data();
+    const T* values = x.data.data();
+    for (int o = 0; o < (csr ? rows : cols); ++o) {
+        for (auto p = ptr[o]; p < ptr[o + 1]; ++p) {
+            const auto at = csr ? std::size_t(o) * cols + idx[p] : std::size_t(idx[p]) * cols + o;
+            dense[at] += values[p];
+        }
+    }
+    return dense;
+}
+
+// out = alpha * a @ b + beta * out, a 为 CSR
+template <typename T, typename I>
+ndarray<T> csr_dense(
+    const operand<T, I>& a, const ndarray<T>& b, const std::optional<any_array>& out,
+    const epilogue<T>& ep) {
+    if (b.ndim() != 2) {
+        throw std::runtime_error("Matrix multiplication expects 2-D arrays");
+    }
+    const auto bv = view_of(b, "b");
+    const int N = a.outer(), M = bv.rows, P = bv.cols;
+    if (a.shape && (a.shape->first != N || a.shape->second != M)) {
+        throw std::runtime_error("Incompatible shapes for matrix multiplication");
+    }
+    validate(N, M, a.indptr, a.indices, a.data, "CSR");
+    auto [c, ldc, bs] = output_of({N, P}, {&a.data, &b}, out, ep);
+    const auto& k = dispatch::active().sparse_of<T>().template of<I>();
+    const auto gemm = dispatch::active().of<T>().multithread_gemm.strided;
+    T* dst = c.mutable_data();
+    {
+        py::gil_scoped_release release;
+        if (use_dense(a.nnz(), N, M)) {
+            const auto dense = densify(a, N, M, true);
+            gemm(N, M, P, dense.get(), M, 1, bv.data, bv.rs, bv.cs, dst, ldc, ep);
+        } else {
+            k.csr_dense(
+                N, M, P, a.indptr.data(), a.indices.data(), a.data.data(), bv.data, bv.rs, bv.cs,
+                dst, ldc, ep);
+        }
+    }
+    return c;
+}
+
+// out = alpha * a @ b + beta * out, b 为 CSC
+template <typename T, typename I>
+ndarray<T> dense_csc(
+    const ndarray<T>& a, const operand<T, I>& b, const std::optional<any_array>& out,
+    const epilogue<T>& ep) {
+    if (a.ndim() != 2) {
+        throw std::runtime_error("Matrix multiplication expects 2-D arrays");
+    }
+    const auto av = view_of(a, "a");
+    const int N = av.rows, M = av.cols, P = b.outer();
+    if (b.shape && (b.shape->first != M || b.shape->second != P)) {
+        throw std::runtime_error("Incompatible shapes for matrix multiplication");
+    }
+    validate(P, M, b.indptr, b.indices, b.data, "CSC");
+    auto [c, ldc, bs] = output_of({N, P}, {&a, &b.data}, out, ep);
+    const auto& k = dispatch::active().sparse_of<T>().template of<I>();
+    const auto gemm = dispatch::active().of<T>().multithread_gemm.strided;
+    T* dst = c.mutable_data();
+    {
+        py::gil_scoped_release release;
+        if (use_dense(b.nnz(), M, P)) {
+            const auto dense = densify(b, M, P, false);
+            gemm(N, M, P, av.data, av.rs, av.cs, dense.get(), P, 1, dst, ldc, ep);
+        } else {
+            k.dense_csc(
+                N, M, P, av.data, av.rs, av.cs, b.indptr.data(), b.indices.data(), b.data.data(),
+                dst, ldc, ep);
+        }
+    }
+    return c;
+}
+
+// 按 data 的 dtype 与 indptr 的下标类型实例化; dense 为另一操作数, 必须与 data 同 dtype
+template <typename F>
+py::array visit(const compressed& m, const any_array& dense, const char* name, F&& f) {
+    return std::visit(
+        [&](const auto& data, const auto& indices, const auto& indptr) -> py::array {
+            using T = element_of<decltype(data)>;
+            using I = element_of<decltype(indptr)>;
+            if constexpr (!std::is_same_v<I, element_of<decltype(indices)>>) {
+                throw py::type_error("`indices` and `indptr` must have the same dtype");
+            } else {
+                return f(
+                    operand<T, I>{data, indices, indptr, m.shape},
+                    same_dtype<T>(dense, name));
+            }
+        },
+        m.data, m.indices, m.indptr);
+}
+
+}  // namespace sparse
+
+// 核外乘法的操作数与输出可以是数组 (包括 np.memmap) 或文件路径. 路径以内存映射方式打开:
+// .npy 文件按其文件头解释, 其余文件按 dtype 与 shape 解释为行主序的原始数据
+namespace mapped {
+
+bool is_path(const py::handle& x) {
+    return py::isinstance<py::str>(x) ||
+           py::isinstance(x, py::module_::import("os").attr("PathLike"));
+}
+
+std::string path_of(const py::handle& x) {
+    return py::module_::import("os").attr("fspath")(x).cast<std::string>();
+}
+
+bool is_npy(const std::string& path) {
+    return path.size() >= 4 && path.compare(path.size() - 4, 4, ".npy") == 0;
+}
+
+py::object open_input(
+    py::object x, const py::object& dtype, const std::optional<std::vector<py::ssize_t>>& shape,
+    const std::string& name) {
+    if (!is_path(x)) {
+        return x;
+    }
+    const auto path = path_of(x);
+    auto np = py::module_::import("numpy");
+    if (is_npy(path)) {
+        return np.attr("load")(path, "mmap_mode"_a = "r");
+    }
+    if (dtype.is_none() || !shape) {
+        throw std::invalid_argument(
+            "Raw file `" + name + "` requires `dtype` and `" + name + "_shape`");
+    }
+    return np.attr("memmap")(path, "dtype"_a = dtype, "mode"_a = "r", "shape"_a = py::cast(*shape));
+}
+
+// beta 非 0 时打开已有文件累加, 否则创建 (或覆盖) 文件
+py::object open_output(
+    py::object out, const py::dtype& dtype, py::ssize_t rows, py::ssize_t cols, bool accumulate) {
+    if (!is_path(out)) {
+        return out;
+    }
+    const auto path = path_of(out);
+    auto np = py::module_::import("numpy");
+    const auto shape = py::make_tuple(rows, cols);
+    if (is_npy(path)) {
+        if (accumulate) {
+            return np.attr("load")(path, "mmap_mode"_a = "r+");
+        }
+        return np.attr("lib").attr("format").attr("open_memmap")(
+            path, "mode"_a = "w+", "dtype"_a = dtype, "shape"_a = shape);
+    }
+    return np.attr("memmap")(
+        path, "dtype"_a = dtype, "mode"_a = accumulate ? "r+" : "w+", "shape"_a = shape);
+}
+
+any_array as_array(const py::handle& x, const char* name) {
+    if (auto array = exact_cast<any_array>(x)) {
+        return *array;
+    }
+    throw py::type_error(
+        std::string("`") + name + "` must be an array (or file path) of a supported dtype");
+}
+
+}  // namespace mapped
+
+// 以 budget 字节的 tile 缓冲区计算 out = alpha * a @ b + beta * out, out 为路径时写入该文件
+template <typename T>
+py::object np_matmul_out_of_core(
+    const ndarray<T>& a, const any_array& b, py::object out, const epilogue<T>& ep,
+    std::size_t budget) {
+    const auto in = check_shapes(a, operand_b(b));
+    std::optional<any_array> target;
+    if (!out.is_none()) {
+        out = mapped::open_output(out, py::dtype::of<T>(), in.a.rows, in.b.cols, ep.beta != 0);
+        target = mapped::as_array(out, "out");
+    }
+    auto [c, ldc, bs] = output_of({in.a.rows, in.b.cols}, {&a, array_of(b)}, target, ep);
+    const auto gemm = dispatch::active().of<T>().multithread_gemm.strided;
+    T* data = c.mutable_data();
+    {
+        py::gil_scoped_release release;
+        outofcore::multiply(in.a, in.b, data, ldc, ep, budget, gemm);
+    }
+    if (out.is_none()) {
+        return std::move(c);
+    }
+    if (py::hasattr(out, "flush")) {
+        out.attr("flush")();
+    }
+    return out;
+}
+
+// 批量乘法的一个操作数: 三维数组的批维步长与每个矩阵的视图. 二维数组, 批维为 1 的
+// 数组和 PackedMatrix 广播到所有批次 (bs 为 0)
+template <typename T> struct batch_operand {
+    int batch;
+    std::ptrdiff_t bs;
+    matrix_view<T> m;
+};
+
+template <typename T> batch_operand<T> batch_view_of(const ndarray<T>& x, const char* name) {
+    if (x.ndim() != 2 && x.ndim() != 3) {
+        throw std::runtime_error("matmul_batched expects 2-D or 3-D arrays");
+    }
+    const auto m = view_of(x, name);
+    if (x.ndim() == 2 || x.shape(0) == 1) {
+        return {1, 0, m};
+    }
+    return {static_cast<int>(x.shape(0)), x.strides(0) / x.itemsize(), m};
+}
+
+// out[i] = alpha * a[i] @ b[i] + beta * out[i], 使用当前指令集的 gemm 引擎
+template <typename T>
+ndarray<T> np_matmul_batched(
+    const ndarray<T>& a, const operand_b& b, const std::optional<any_array>& out,
+    const epilogue<T>& ep) {
+    const auto x = batch_view_of(a, "a");
+    batch_operand<T> y;
+    std::shared_ptr<prepack::operand<T>> packed_b;
+    bool cached = false;
+    const void* owner = nullptr;
+    if (auto packed = std::get_if<const packed_matrix*>(&b)) {
+        auto typed = std::get_if<packed_operand<T>>(&(*packed)->typed);
+        if (!typed) {
+            throw py::type_error("`b` must have the same dtype as `a`");
+        }
+        y = {1, 0, typed->view()};
+        packed_b = typed->layouts;
+    } else {
+        const auto& array = same_dtype<T>(std::get<any_array>(b), "b");
+        y = batch_view_of(array, "b");
+        if (y.bs == 0) {
+            owner = cache_owner(array);
+            packed_b = prepack::cache().acquire(y.m, owner);
+            cached = packed_b != nullptr;
+        }
+    }
+    if (x.m.cols != y.m.rows) {
+        throw std::runtime_error("Incompatible shapes for matrix multiplication");
+    }
+    if (x.batch != y.batch && x.batch != 1 && y.batch != 1) {
+        throw std::runtime_error("Incompatible batch sizes for matrix multiplication");
+    }
+    const int batch = std::max(x.batch, y.batch), N = x.m.rows, M = x.m.cols, P = y.m.cols;
+    auto [c, ldc, bs] = output_of({batch, N, P}, {&a, array_of(b)}, out, ep);
+    T* dst = c.mutable_data();
+
+    const auto& k = dispatch::active().of<T>();
+    {
+        py::gil_scoped_release release;
+        const T* b_packed = packed_b ? packed_b->packed(k.gemm.b_packing, y.m) : nullptr;
+        k.gemm_batched(
+            batch, N, M, P, x.m.data, x.bs, x.m.rs, x.m.cs, y.m.data, y.bs, y.m.rs, y.m.cs,
+            b_packed, dst, bs, ldc, ep);
+        if (cached) {
+            prepack::cache().account(y.m, owner);
+        }
+    }
+    return c;
+}
+
+py::array np_matmul_batched(
+    const any_array& a, const operand_b& b, const std::optional<any_array>& out,
+    py::object alpha, py::object beta) {
+    return std::visit(
+        [&](const auto& a) -> py::array {
+            using T = element_of<decltype(a)>;
+            return np_matmul_batched(a, b, out, epilogue_of<T>(alpha, beta));
+        },
+        a);
+}
+
+// 异步提交: 内核在原生工作线程中运行 (不持有 GIL), 结果通过 concurrent.futures.Future 返回
+namespace async {
+
+executor::worker_queue*& queue() {
+    static executor::worker_queue* q = nullptr;
+    return q;
+}
+
+// 调用方需持有 GIL
+executor::worker_queue& get_queue() {
+    auto& q = queue();
+    if (q == nullptr) {
+        q = new executor::worker_queue(std::thread::hardware_concurrency());
+    }
+    return *q;
+}
+
+// 在解释器退出前执行完剩余任务; 任务完成时需要 GIL, 因此等待期间释放
+void shutdown() {
+    if (auto q = queue()) {
+        py::gil_scoped_release release;
+        q->shutdown();
+    }
+}
+
+// 任务持有的 Python 对象只在持有 GIL 时创建和释放
+struct pending {
+    py::object a, b, c, future;
+
+    void clear() { a = b = c = future = py::object(); }
+};
+
+template <typename T>
+py::object submit(
+    const ndarray<T>& a, const operand_b& b, const std::string& kernel,
+    const std::optional<any_array>& out, const epilogue<T>& ep, int threads) {
+    const auto impl = resolve<T>(find_kernel(kernel));
+    const auto in = check_shapes(a, b);
+    auto [c, ldc, bs] = output_of({in.a.rows, in.b.cols}, {&a, array_of(b)}, out, ep);
+    auto run = prepare(kernel, impl, in, c.mutable_data(), ldc, ep);
+
+    auto job = std::make_shared<pending>();
+    job->a = a;
+    job->b = as_object(b);
+    job->c = c;
+    job->future = py::module_::import("concurrent.futures").attr("Future")();
+    get_queue().submit([job, run, threads] {
+        py::gil_scoped_acquire gil;
+        try {
+            if (job->future.attr("set_running_or_notify_cancel")().cast<bool>()) {
+                std::string error;
+                {
+                    py::gil_scoped_release release;
+                    try {
+                        threading::scope limit(threads);
+                        run();
+                    } catch (const std::exception& e) {
+                        error = e.what();
+                    }
+                }
+                if (error.empty()) {
+                    job->future.attr("set_result")(job->c);
+                } else {
+                    job->future.attr("set_exception")(
+                        py::reinterpret_borrow<py::object>(PyExc_RuntimeError)(error));
+                }
+            }
+        } catch (py::error_already_set& e) {
+            e.discard_as_unraisable("libmatmul worker");
+        }
+        job->clear();
+    });
+    return job->future;
+}
+
+py::object submit(
+    const any_array& a, const operand_b& b, const std::string& kernel,
+    const std::optional<any_array>& out, py::object alpha, py::object beta,
+    const std::optional<int>& threads) {
+    return std::visit(
+        [&](const auto& a) {
+            using T = element_of<decltype(a)>;
+            return submit(a, b, kernel, out, epilogue_of<T>(alpha, beta), threads_of(threads));
+        },
+        a);
+}
+
+}  // namespace async
+
+// 性能计数: 在各线程上统计一次内核调用的硬件计数器
+namespace profiling {
+
+// 内核可按名称或绑定的函数 (如 libmatmul.gemm) 给出
+std::string kernel_name(const py::handle& kernel) {
+    if (py::isinstance<py::str>(kernel)) {
+        return kernel.cast<std::string>();
+    }
+    if (py::hasattr(kernel, "__name__")) {
+        return kernel.attr("__name__").cast<std::string>();
+    }
+    throw py::type_error("`kernel` must be a kernel name or a libmatmul kernel function");
+}
+
+py::object value_of(const std::optional<double>& x) {
+    return x ? py::object(py::float_(*x)) : py::object(py::none());
+}
+
+template <typename T>
+py::dict profile(
+    const std::string& kernel, const ndarray<T>& a, const operand_b& b,
+    const std::vector<std::string>& events, int threads) {
+    const auto impl = resolve<T>(find_kernel(kernel));
+    const auto in = check_shapes(a, b);
+    auto [c, ldc, bs] = output_of<T>({in.a.rows, in.b.cols}, {&a, array_of(b)}, {}, {});
+    auto run = prepare(kernel, impl, in, c.mutable_data(), ldc, {});
+
+    profile::report r;
+    {
+        py::gil_scoped_release release;
+        threading::scope limit(threads);
+        r = profile::measure(events, threading::count(), run);
+    }
+    py::dict totals;
+    for (std::size_t e = 0; e < r.events.size(); ++e) {
+        totals[py::str(r.events[e])] = value_of(r.total(e));
+    }
+    py::list per_thread;
+    for (const auto& t : r.threads) {
+        py::dict counts;
+        counts["tid"] = t.tid;
+        for (std::size_t e = 0; e < r.events.size(); ++e) {
+            counts[py::str(r.events[e])] = value_of(t.values[e]);
+        }
+        per_thread.append(counts);
+    }
+    return py::dict(
+        "kernel"_a = kernel, "seconds"_a = r.seconds, "events"_a = totals,
+        "threads"_a = per_thread, "unavailable"_a = r.unavailable);
+}
+
+py::dict profile(
+    const py::handle& kernel, const any_array& a, const operand_b& b,
+    const std::optional<std::vector<std::string>>& events, const std::optional<int>& threads) {
+    const auto name = kernel_name(kernel);
+    return std::visit(
+        [&](const auto& a) {
+            using T = element_of<decltype(a)>;
+            return profile<T>(
+                name, a, b, events.value_or(profile::default_events()), threads_of(threads));
+        },
+        a);
+}
+
+}  // namespace profiling
+
+// 自动调优: 在当前主机上测量各内核及其线程数与分块参数, 每个形状桶的最快组合保存在
+// tuning::results() 中, matmul 按该结果分派
+namespace autotune {
+
+// 结果只对同一内核版本和同样多的硬件线程有效
+std::string host() {
+    return std::string(dispatch::active().isa) + "/" +
+           std::to_string(std::thread::hardware_concurrency());
+}
+
+// 与 numpy 的 dtype 名称相同. 不调用 Python, C 接口在不持有 GIL 时也会用到
+template <typename T> std::string dtype_name() {
+    if constexpr (std::is_same_v<T, std::int32_t>) {
+        return "int32";
+    } else if constexpr (std::is_same_v<T, std::int64_t>) {
+        return "int64";
+    } else if constexpr (std::is_same_v<T, float>) {
+        return "float32";
+    } else {
+        static_assert(std::is_same_v<T, double>);
+        return "float64";
+    }
+}
+
+// 按 dtype 对象选择元素类型
+template <typename... Ts, typename F>
+void visit_dtype(type_list<Ts...>, const py::dtype& dtype, F&& f) {
+    const bool found = ((dtype.equal(py::dtype::of<Ts>()) && (f(tag<Ts>{}), true)) || ...);
+    if (!found) {
+        throw py::type_error("Unsupported dtype: " + py::str(dtype).cast<std::string>());
+    }
+}
+
+// 调用级 threads= 会改变其线程数的内核, 其余内核只测量默认设置
+bool threaded(const std::string& name) {
+    static const std::set<std::string> names{
+        "multithread", "multithread_chunk", "multithread_simd", "multithread_gemm", "strassen"};
+    return names.count(name) > 0;
+}
+
+std::vector<int> thread_counts(const std::string& name) {
+    if (!threaded(name)) {
+        return {0};
+    }
+    const int n = threading::count();
+    std::vector<int> candidates{1};
+    if (n > 2) {
+        candidates.push_back(n / 2);
+    }
+    if (n > 1) {
+        candidates.push_back(n);
+    }
+    return candidates;
+}
+
+// 各内核可调的分块参数, 含义见 tuning::block
+std::vector<int> blocks_of(const std::string& name) {
+    if (name == "chunk" || name == "multithread_chunk") {
+        return {32, 64, 128};
+    }
+    if (name == "strassen") {
+        return {128, 256, 512};
+    }
+    if (name == "simd_optimized") {
+        return {16, 64};
+    }
+    return {0};
+}
+
+// 落后最快者超过该倍数的内核在同一 dtype 的更大形状上不再测量
+constexpr double drop_ratio = 8;
+
+template <typename T> ndarray<T> random_matrix(int rows, int cols, std::mt19937& rng) {
+    ndarray<T> x({rows, cols});
+    std::uniform_int_distribution<int> value(-4, 4);
+    std::generate(x.mutable_data(), x.mutable_data() + x.size(), [&] { return T(value(rng)); });
+    return x;
+}
+
+// 在 N x M x P 上测量 names 中未被淘汰的内核的所有参数组合, 返回最快者
+template <typename T>
+tuning::choice measure(
+    int N, int M, int P, const std::vector<std::string>& names, int repeat,
+    std::set<std::string>& dropped) {
+    std::mt19937 rng(N * 31 + M * 17 + P);
+    const auto a = random_matrix<T>(N, M, rng);
+    const auto b = random_matrix<T>(M, P, rng);
+    ndarray<T> c({N, P});
+    const auto in = check_shapes(a, operand_b(any_array(b)));
+
+    struct trial {
+        std::string kernel;
+        int threads, block;
+        std::function<void()> run;
+    };
+    std::vector<trial> trials;
+    for (const auto& name : names) {
+        if (dropped.count(name)) {
+            continue;
+        }
+        auto run = prepare(name, resolve<T>(find_kernel(name)), in, c.mutable_data(), P, {}, false);
+        for (int threads : thread_counts(name)) {
+            for (int block : blocks_of(name)) {
+                trials.push_back({name, threads, block, run});
             }
         }
     }
-}
 
-void chunk(const T* a, const T* b, T* c, int N, int M, int P) {
-    memset(c, 0, N * P * sizeof(T));
-    const int chunk_size = 64;
-    for (int ii = 0; ii < N; ii += chunk_size) {
-        for (int kk = 0; kk < M; kk += chunk_size) {
-            for (int jj = 0; jj < P; jj += chunk_size) {
-                for (int i = ii; i < std::min(ii + chunk_size, N); ++i) {
-                    for (int k = kk; k < std::min(kk + chunk_size, M); ++k) {
-                        T tmp = a[i * M + k];
-                        for (int j = jj; j < std::min(jj + chunk_size, P); ++j) {
-                            c[i * P + j] += tmp * b[k * P + j];
-                        }
-                    }
+    tuning::choice best;
+    best.seconds = std::numeric_limits<double>::infinity();
+    std::map<std::string, double> fastest;
+    {
+        py::gil_scoped_release release;
+        for (const auto& t : trials) {
+            threading::scope limit(t.threads);
+            tuning::scope block(t.block);
+            auto time = [&] {
+                const auto start = std::chrono::steady_clock::now();
+                t.run();
+                return std::chrono::duration<double>(std::chrono::steady_clock::now() - start)
+                    .count();
+            };
+            // 首次运行作为预热; 明显慢于当前最快者时不再重复
+            double seconds = time();
+            if (seconds < 4 * best.seconds) {
+                seconds = std::numeric_limits<double>::infinity();
+                for (int r = 0; r < repeat; ++r) {
+                    seconds = std::min(seconds, time());
                 }
             }
+            auto [it, inserted] = fastest.emplace(t.kernel, seconds);
+            it->second = std::min(it->second, seconds);
+            if (seconds < best.seconds) {
+                best = {t.kernel, t.threads, t.block, seconds};
+            }
+        }
+    }
+    for (const auto& [name, seconds] : fastest) {
+        if (seconds > drop_ratio * best.seconds) {
+            dropped.insert(name);
         }
     }
+    return best;
 }
 
-void multithread_chunk(const T* a, const T* b, T* c, int N, int M, int P) {
-    memset(c, 0, N * P * sizeof(T));
-    const int chunk_size = 64;
-#pragma omp parallel for
-    for (int ii = 0; ii < N; ii += chunk_size) {
-        for (int kk = 0; kk < M; kk += chunk_size) {
-            for (int jj = 0; jj < P; jj += chunk_size) {
-                for (int i = ii; i < std::min(ii + chunk_size, N); ++i) {
-                    for (int k = kk; k < std::min(kk + chunk_size, M); ++k) {
-                        T tmp = a[i * M + k];
-                        for (int j = jj; j < std::min(jj + chunk_size, P); ++j) {
-                            c[i * P + j] += tmp * b[k * P + j];
-                        }
-                    }
-                }
+using shape = std::tuple<int, int, int>;
+
+py::list tune(
+    const std::optional<std::vector<shape>>& shapes, const std::optional<py::list>& dtypes,
+    const std::optional<std::vector<std::string>>& names, int repeat, bool save) {
+    if (repeat < 1) {
+        throw std::invalid_argument("`repeat` must be positive");
+    }
+    std::vector<shape> todo;
+    if (shapes) {
+        todo = *shapes;
+    } else {
+        for (int n = 64; n <= 1024; n *= 2) {
+            todo.emplace_back(n, n, n);
+        }
+    }
+    for (const auto& [N, M, P] : todo) {
+        if (N < 1 || M < 1 || P < 1) {
+            throw std::invalid_argument("Tuning shapes must be positive");
+        }
+    }
+    // 从小到大测量, 以便尽早淘汰慢的内核
+    std::stable_sort(todo.begin(), todo.end(), [](const shape& x, const shape& y) {
+        auto volume = [](const shape& s) {
+            return double(std::get<0>(s)) * std::get<1>(s) * std::get<2>(s);
+        };
+        return volume(x) < volume(y);
+    });
+    std::vector<std::string> candidates;
+    if (names) {
+        for (const auto& name : *names) {
+            find_kernel(name);
+        }
+        candidates = *names;
+    } else {
+        for (const auto& [name, f] : kernels()) {
+            candidates.push_back(name);
+        }
+    }
+    std::vector<py::dtype> types;
+    if (dtypes) {
+        for (auto d : *dtypes) {
+            types.push_back(py::dtype::from_args(py::reinterpret_borrow<py::object>(d)));
+        }
+    } else {
+        for (auto d : {"int32", "int64", "float32", "float64"}) {
+            types.push_back(py::dtype(d));
+        }
+    }
+
+    py::list report;
+    for (const auto& dtype : types) {
+        visit_dtype(element_types{}, dtype, [&](auto t) {
+            using T = element_t<decltype(t)>;
+            std::set<std::string> dropped;
+            for (const auto& [N, M, P] : todo) {
+                const auto best = measure<T>(N, M, P, candidates, repeat, dropped);
+                const tuning::key k{host(), dtype_name<T>(), tuning::bucket_of(N, M, P)};
+                tuning::results().store(k, best);
+                report.append(py::dict(
+                    "dtype"_a = dtype_name<T>(), "shape"_a = py::make_tuple(N, M, P),
+                    "kernel"_a = best.kernel, "threads"_a = best.threads, "block"_a = best.block,
+                    "seconds"_a = best.seconds));
             }
+        });
+    }
+    if (save) {
+        tuning::results().save();
+    }
+    return report;
+}
+
+// matmul 对 N x M x P 的选择及其来源: 本桶的调优结果, 最近的已调优桶, 或默认选择
+struct plan {
+    tuning::choice choice;
+    const char* source;
+};
+
+// 最近的桶在各维上合计最多相差 4 倍
+constexpr int nearest_distance = 2;
+
+template <typename T> plan plan_of(int N, int M, int P) {
+    const tuning::key k{host(), dtype_name<T>(), tuning::bucket_of(N, M, P)};
+    // 缓存文件可能来自注册了其他内核的版本
+    auto usable = [](const std::optional<tuning::choice>& c) {
+        return c && kernels().count(c->kernel);
+    };
+    if (auto c = tuning::results().find(k); usable(c)) {
+        return {*c, "tuned"};
+    }
+    if (auto c = tuning::results().nearest(k, nearest_distance); usable(c)) {
+        return {*c, "nearest"};
+    }
+    const bool large = double(N) * M * P >= double(1 << 18);
+    tuning::choice fallback;
+    fallback.kernel = large && threading::count() > 1 ? "multithread_gemm" : "gemm";
+    return {fallback, "default"};
+}
+
+// 调优时的操作数都是行主序; 选中的内核不能直接读取当前布局时改用 gemm
+template <typename T> tuning::choice choose(const operands<T>& in, std::ptrdiff_t ldc) {
+    auto choice = plan_of<T>(in.a.rows, in.a.cols, in.b.cols).choice;
+    const auto k = resolve<T>(find_kernel(choice.kernel));
+    if (!k.strided && !k.prepacked &&
+        !(in.a.row_major() && ldc == in.b.cols && (in.b.row_major() || k.bt))) {
+        choice = {"gemm"};
+    }
+    return choice;
+}
+
+template <typename T>
+ndarray<T> matmul(
+    const ndarray<T>& a, const operand_b& b, const std::optional<any_array>& out,
+    const epilogue<T>& ep, int threads) {
+    phases::call timing("matmul");
+    std::optional<phases::scope> step(phases::phase::convert);
+    const auto in = check_shapes(a, b);
+    const int N = in.a.rows, M = in.a.cols, P = in.b.cols;
+    timing.shape(N, M, P);
+    step.emplace(phases::phase::output);
+    auto [c, ldc, bs] = output_of({N, P}, {&a, array_of(b)}, out, ep);
+    step.emplace(phases::phase::convert);
+    const auto choice = choose<T>(in, ldc);
+    auto run = prepare(
+        choice.kernel, resolve<T>(find_kernel(choice.kernel)), in, c.mutable_data(), ldc, ep);
+    step.reset();
+    std::optional<phases::scope> wrap;
+    {
+        threading::scope limit(threads > 0 ? threads : choice.threads);
+        tuning::scope block(choice.block);
+        py::gil_scoped_release release;
+        {
+            phases::scope compute(phases::phase::compute);
+            run();
         }
+        wrap.emplace(phases::phase::wrap);
     }
+    return c;
 }
 
-T* transpose(const T* b, int M, int P) {
-    T* b_tr = new T[M * P];
-    for (int i = 0; i < M; ++i) {
-        for (int j = 0; j < P; ++j) {
-            b_tr[j * M + i] = b[i * P + j];
+}  // namespace autotune
+
+// 矩阵链乘 A0 @ A1 @ ... @ An-1: 按矩阵链动态规划选择括号化, 每一步的代价为该形状的预计耗时.
+// 中间结果放在可复用的临时缓冲区中, 最后一步直接写入结果
+namespace chain {
+
+// 每个形状桶的吞吐量 (每秒乘加次数), 来自同一主机与 dtype 的调优结果
+struct rates {
+    std::vector<std::pair<tuning::bucket, double>> tuned;
+
+    // 本桶或 (各维指数的 L1 距离) 最近的已调优桶的吞吐量; 没有调优结果时为 0
+    double of(int N, int M, int P) const {
+        const auto b = tuning::bucket_of(N, M, P);
+        double rate = 0;
+        int best = std::numeric_limits<int>::max();
+        for (const auto& [t, r] : tuned) {
+            const int distance = std::abs(t.n - b.n) + std::abs(t.m - b.m) + std::abs(t.p - b.p);
+            if (distance < best) {
+                best = distance, rate = r;
+            }
+        }
+        return rate;
+    }
+};
+
+template <typename T> rates rates_of() {
+    rates r;
+    const auto host = autotune::host(), dtype = autotune::dtype_name<T>();
+    for (const auto& [k, c] : tuning::results().entries()) {
+        if (k.host == host && k.dtype == dtype && c.seconds > 0) {
+            const double volume = double(tuning::size_of(k.shape.n)) *
+                                  tuning::size_of(k.shape.m) * tuning::size_of(k.shape.p);
+            r.tuned.emplace_back(k.shape, volume / c.seconds);
         }
     }
-    // printf("M = %d, P = %d\n", M, P);
-    // for (int i = 0; i < M * P; i++) {
-    //     printf("%d ", b[i]);
-    // }
-    // printf("\n");
-    // for (int i = 0; i < M * P; i++) {
-    //     printf("%d ", b_tr[i]);
-    // }
-    // printf("\n");
-    return b_tr;
+    return r;
 }
 
-void transpose_data(const T* a, const T* b, T* c, int N, int M, int P) {
-    memset(c, 0, N * P * sizeof(T));
-    std::unique_ptr<T[]> b_tr(transpose(b, M, P));
-    for (int i = 0; i < N; ++i) {
-        for (int j = 0; j < P; ++j) {
-            T sum = 0;
-            for (int k = 0; k < M; ++k) {
-                sum += a[i * M + k] * b_tr[j * M + k];
+// dims[i] x dims[i + 1] 为第 i 个矩阵的形状. split[i][j] = k 表示第 i..j 个矩阵之积按
+// (i..k) @ (k+1..j) 计算. 有调优结果时 cost 为预计秒数, 否则为乘加次数
+struct order {
+    std::vector<std::vector<int>> split;
+    std::vector<std::vector<double>> cost;
+};
+
+inline order order_of(const std::vector<int>& dims, const rates& r) {
+    const int n = static_cast<int>(dims.size()) - 1;
+    order o{
+        std::vector<std::vector<int>>(n, std::vector<int>(n, 0)),
+        std::vector<std::vector<double>>(n, std::vector<double>(n, 0))};
+    auto step = [&](int N, int M, int P) {
+        const double volume = double(N) * M * P;
+        if (r.tuned.empty()) {
+            return volume;
+        }
+        return volume / r.of(N, M, P);
+    };
+    for (int len = 2; len <= n; ++len) {
+        for (int i = 0; i + len <= n; ++i) {
+            const int j = i + len - 1;
+            o.cost[i][j] = std::numeric_limits<double>::infinity();
+            for (int k = i; k < j; ++k) {
+                const double c =
+                    o.cost[i][k] + o.cost[k + 1][j] + step(dims[i], dims[k + 1], dims[j + 1]);
+                if (c < o.cost[i][j]) {
+                    o.cost[i][j] = c, o.split[i][j] = k;
+                }
             }
-            c[i * P + j] = sum;
         }
     }
+    return o;
 }
 
-}  // namespace kernel
+// 中间结果的临时缓冲区. 取用时选能容纳的最小空闲缓冲区, 都不够时替换最大的空闲缓冲区
+template <typename T> class scratch {
+public:
+    struct block {
+        std::unique_ptr<T[]> data;
+        std::size_t size = 0;
+    };
 
-template <auto impl> py::array_t<T> np_matmul(py::array_t<T> a, py::array_t<T> b) {
-    auto a_shape = a.shape();
-    auto b_shape = b.shape();
-    if (a_shape[1] != b_shape[0]) {
-        throw std::runtime_error("Incompatible shapes for matrix multiplication");
+    block acquire(std::size_t n) {
+        auto fit = free.end(), largest = free.end();
+        for (auto it = free.begin(); it != free.end(); ++it) {
+            if (it->size >= n && (fit == free.end() || it->size < fit->size)) {
+                fit = it;
+            }
+            if (largest == free.end() || it->size > largest->size) {
+                largest = it;
+            }
+        }
+        if (fit == free.end()) {
+            if (largest != free.end()) {
+                free.erase(largest);
+            }
+            return {std::unique_ptr<T[]>(new T[n]), n};
+        }
+        block b = std::move(*fit);
+        free.erase(fit);
+        return b;
+    }
+
+    void release(block b) {
+        if (b.data) {
+            free.push_back(std::move(b));
+        }
+    }
+
+private:
+    std::vector<block> free;
+};
+
+// 按 order 求值. 叶子为输入矩阵, 内部结点的结果在 scratch 中, 根结点写入 c
+template <typename T> class evaluator {
+public:
+    // threads 为调用级 threads=, 为 0 时各步使用调优得到的线程数
+    // owners 为各输入缓冲区的所有者 (见 cache_owner)
+    evaluator(
+        const std::vector<matrix_view<T>>& inputs, const std::vector<const void*>& owners,
+        const order& o, int threads)
+        : inputs(inputs), owners(owners), plan(o), threads(threads) {}
+
+    void run(T* c, std::ptrdiff_t ldc) {
+        const int n = static_cast<int>(inputs.size());
+        multiply(0, n - 1, c, ldc);
+    }
+
+private:
+    struct node {
+        matrix_view<T> view;
+        typename scratch<T>::block buffer;
+        // 临时缓冲区的地址会被复用, 没有所有者, 不能进入 pack cache
+        const void* owner = nullptr;
+    };
+
+    node evaluate(int i, int j) {
+        if (i == j) {
+            return {inputs[i], {}, owners[i]};
+        }
+        const int rows = inputs[i].rows, cols = inputs[j].cols;
+        auto buffer = pool.acquire(std::size_t(rows) * cols);
+        T* c = buffer.data.get();
+        multiply(i, j, c, cols);
+        return {{c, rows, cols, cols, 1}, std::move(buffer)};
+    }
+
+    // 两侧子链先求值, 再用为该形状选出的内核相乘; 子链的缓冲区在相乘后归还
+    void multiply(int i, int j, T* c, std::ptrdiff_t ldc) {
+        const int k = plan.split[i][j];
+        node left = evaluate(i, k), right = evaluate(k + 1, j);
+        operands<T> in{left.view, right.view};
+        in.owner = right.owner;
+        const auto choice = autotune::choose<T>(in, ldc);
+        auto run = prepare(choice.kernel, resolve<T>(find_kernel(choice.kernel)), in, c, ldc, {});
+        {
+            threading::scope limit(threads > 0 ? threads : choice.threads);
+            tuning::scope block(choice.block);
+            run();
+        }
+        pool.release(std::move(left.buffer));
+        pool.release(std::move(right.buffer));
+    }
+
+    const std::vector<matrix_view<T>>& inputs;
+    const std::vector<const void*>& owners;
+    const order& plan;
+    const int threads;
+    scratch<T> pool;
+};
+
+// 检查各矩阵的 dtype 与形状, 返回 dims
+template <typename T>
+std::vector<int> dims_of(const std::vector<any_array>& matrices, std::vector<ndarray<T>>& typed) {
+    std::vector<int> dims;
+    for (std::size_t i = 0; i < matrices.size(); ++i) {
+        const auto& x = same_dtype<T>(matrices[i], "matrices");
+        if (x.ndim() != 2) {
+            throw std::runtime_error("Matrix multiplication expects 2-D arrays");
+        }
+        if (i == 0) {
+            dims.push_back(static_cast<int>(x.shape(0)));
+        } else if (x.shape(0) != dims.back()) {
+            throw std::runtime_error("Incompatible shapes for matrix multiplication");
+        }
+        dims.push_back(static_cast<int>(x.shape(1)));
+        typed.push_back(x);
+    }
+    return dims;
+}
+
+// 按第一个矩阵的 dtype 调用 f
+template <typename F> auto with_dtype(const std::vector<any_array>& matrices, F&& f) {
+    if (matrices.size() < 2) {
+        throw std::invalid_argument("matmul_chain needs at least two matrices");
+    }
+    return std::visit(f, matrices[0]);
+}
+
+// 第 i..j 个矩阵的括号化, 叶子为下标, 内部结点为 (左, 右)
+py::object nested(const order& o, int i, int j) {
+    if (i == j) {
+        return py::int_(i);
+    }
+    const int k = o.split[i][j];
+    return py::make_tuple(nested(o, i, k), nested(o, k + 1, j));
+}
+
+py::dict plan(const std::vector<any_array>& matrices) {
+    return with_dtype(matrices, [&](const auto& first) {
+        using T = element_of<decltype(first)>;
+        std::vector<ndarray<T>> typed;
+        const auto dims = dims_of<T>(matrices, typed);
+        const auto r = rates_of<T>();
+        const auto o = order_of(dims, r);
+        const int n = static_cast<int>(dims.size()) - 1;
+        double multiply_adds = 0;
+        std::function<void(int, int)> count = [&](int i, int j) {
+            if (i == j) {
+                return;
+            }
+            const int k = o.split[i][j];
+            multiply_adds += double(dims[i]) * dims[k + 1] * dims[j + 1];
+            count(i, k), count(k + 1, j);
+        };
+        count(0, n - 1);
+        return py::dict(
+            "order"_a = nested(o, 0, n - 1), "multiply_adds"_a = multiply_adds,
+            "seconds"_a = r.tuned.empty() ? py::object(py::none())
+                                          : py::object(py::float_(o.cost[0][n - 1])));
+    });
+}
+
+py::array matmul(
+    const std::vector<any_array>& matrices, const std::optional<any_array>& out, int threads) {
+    return with_dtype(matrices, [&](const auto& first) -> py::array {
+        using T = element_of<decltype(first)>;
+        std::vector<ndarray<T>> typed;
+        const auto dims = dims_of<T>(matrices, typed);
+        auto [c, ldc, bs] = output_of({dims.front(), dims.back()}, {}, out, epilogue<T>{});
+        std::vector<matrix_view<T>> inputs;
+        std::vector<const void*> owners;
+        for (const auto& x : typed) {
+            if (out && overlaps(c, x)) {
+                throw std::invalid_argument("`out` must not overlap the inputs");
+            }
+            inputs.push_back(view_of(x, "matrices"));
+            owners.push_back(cache_owner(x));
+        }
+        const auto o = order_of(dims, rates_of<T>());
+        T* data = c.mutable_data();
+        {
+            py::gil_scoped_release release;
+            evaluator<T>(inputs, owners, o, threads).run(data, ldc);
+        }
+        return c;
+    });
+}
+
+}  // namespace chain
+
+// 方阵的 k 次幂: 从最高位起的二进制快速幂, 每一位 R = R @ R, 该位为 1 时再 R = R @ A.
+// 各步在两块缓冲区之间交替写入, 使最后一步正好写入结果. A 作为右操作数的布局 (打包或
+// 转置) 只生成一次. 给出 mod 时在 int64 中计算, 每累加 chunk 项取一次模, 结果精确且不溢出
+namespace power {
+
+// 取模前最多可累加的乘积项数: 部分和 (< mod) 加上 chunk 个 (mod - 1)^2 不超过 int64
+inline std::int64_t chunk_of(std::int64_t mod) {
+    if (mod <= 1) {
+        return std::numeric_limits<std::int64_t>::max();
+    }
+    const std::int64_t limit = std::numeric_limits<std::int64_t>::max() - (mod - 1);
+    const std::int64_t square = (mod - 1) > limit / (mod - 1) ? 0 : (mod - 1) * (mod - 1);
+    return square == 0 ? 0 : limit / square;
+}
+
+// 在 W 中计算, mod 为 0 时不取模. W 与 T 相同时结果 c 兼作一块缓冲区
+template <typename T, typename W>
+void run(
+    const matrix_view<T>& a, long long k, W mod, T* c, std::ptrdiff_t ldc, int threads) {
+    const int N = a.rows;
+    const std::size_t size = std::size_t(N) * N;
+    auto store = [&](const W* x) {
+        for (int i = 0; i < N; ++i) {
+            for (int j = 0; j < N; ++j) {
+                c[i * ldc + j] = static_cast<T>(x[std::size_t(i) * N + j]);
+            }
+        }
+    };
+    if (k == 0) {
+        for (int i = 0; i < N; ++i) {
+            std::fill(c + i * ldc, c + i * ldc + N, T(0));
+            c[i * ldc + i] = mod == 1 ? 0 : 1;
+        }
+        return;
+    }
+    // 底数: 不取模时直接使用 a, 否则为化到 [0, mod) 的行主序副本
+    std::unique_ptr<W[]> reduced;
+    matrix_view<W> base;
+    if constexpr (std::is_same_v<W, T>) {
+        base = a;
+    }
+    if constexpr (std::is_integral_v<W>) {
+        if (mod != 0) {
+            reduced.reset(new W[size]);
+            for (int i = 0; i < N; ++i) {
+                for (int j = 0; j < N; ++j) {
+                    const W x = static_cast<W>(a.data[i * a.rs + j * a.cs]) % mod;
+                    reduced[std::size_t(i) * N + j] = x < 0 ? x + mod : x;
+                }
+            }
+            base = {reduced.get(), N, N, N, 1};
+        }
+    }
+    int top = 0;
+    while (k >> (top + 1)) {
+        ++top;
+    }
+    const int steps = top + __builtin_popcountll(static_cast<unsigned long long>(k)) - 1;
+    if (steps == 0) {
+        if constexpr (std::is_same_v<W, T>) {
+            if (mod == 0) {
+                for (int i = 0; i < N; ++i) {
+                    for (int j = 0; j < N; ++j) {
+                        c[i * ldc + j] = a.data[i * a.rs + j * a.cs];
+                    }
+                }
+                return;
+            }
+        }
+        return store(reduced.get());
     }
-    const auto N = a_shape[0], M = a_shape[1], P = b_shape[1];
 
-    auto c = py::array_t<T>({a_shape[0], b_shape[1]});
-    auto a_ptr = a.mutable_data();
-    auto b_ptr = b.mutable_data();
-    auto c_ptr = c.mutable_data();
+    // 第 s 步 (从 1 起) 写入 targets[(steps - s) % 2], 最后一步写入 targets[0]
+    std::unique_ptr<W[]> scratch[2];
+    std::pair<W*, std::ptrdiff_t> targets[2];
+    for (int t = 0; t < 2; ++t) {
+        if constexpr (std::is_same_v<W, T>) {
+            if (t == 0) {
+                targets[t] = {c, ldc};
+                continue;
+            }
+        }
+        scratch[t].reset(new W[size]);
+        targets[t] = {scratch[t].get(), N};
+    }
+    const auto packed_base = std::make_shared<prepack::operand<W>>(N, N);
+    std::int64_t chunk = N;
+    if constexpr (std::is_integral_v<W>) {
+        chunk = mod != 0 ? chunk_of(mod) : N;
+    }
+    // dst = x @ y, 取模时按 chunk 项分段累加, 每段之后取模
+    auto multiply = [&](const matrix_view<W>& x, const matrix_view<W>& y, bool y_is_base,
+                        W* dst, std::ptrdiff_t ld) {
+        for (int k0 = 0; k0 < N; k0 += static_cast<int>(std::min<std::int64_t>(chunk, N))) {
+            const int len = static_cast<int>(std::min<std::int64_t>(chunk, N - k0));
+            operands<W> in{
+                {x.data + k0 * x.cs, N, len, x.rs, x.cs}, {y.data + k0 * y.rs, len, N, y.rs, y.cs}};
+            if (y_is_base && len == N) {
+                in.packed_b = packed_base;
+            }
+            const auto choice = autotune::choose<W>(in, ld);
+            epilogue<W> ep;
+            ep.beta = k0 == 0 ? 0 : 1;
+            auto run = prepare(
+                choice.kernel, resolve<W>(find_kernel(choice.kernel)), in, dst, ld, ep, false);
+            {
+                threading::scope limit(threads > 0 ? threads : choice.threads);
+                tuning::scope block(choice.block);
+                run();
+            }
+            if constexpr (std::is_integral_v<W>) {
+                if (mod != 0) {
+                    for (int i = 0; i < N; ++i) {
+                        for (int j = 0; j < N; ++j) {
+                            dst[i * ld + j] %= mod;
+                        }
+                    }
+                }
+            }
+        }
+    };
+    matrix_view<W> r = base;
+    int step = 0;
+    auto advance = [&](const matrix_view<W>& y, bool y_is_base) {
+        ++step;
+        const auto [dst, ld] = targets[(steps - step) % 2];
+        multiply(r, y, y_is_base, dst, ld);
+        r = {dst, N, N, ld, 1};
+    };
+    for (int bit = top - 1; bit >= 0; --bit) {
+        advance(r, false);
+        if (k >> bit & 1) {
+            advance(base, true);
+        }
+    }
+    if constexpr (!std::is_same_v<W, T>) {
+        store(targets[0].first);
+    }
+}
 
-    impl(a_ptr, b_ptr, c_ptr, N, M, P);
+template <typename T>
+ndarray<T> matrix_power(
+    const ndarray<T>& a, long long k, const std::optional<long long>& mod,
+    const std::optional<any_array>& out, int threads) {
+    if (a.ndim() != 2 || a.shape(0) != a.shape(1)) {
+        throw std::invalid_argument("matrix_power expects a square 2-D array");
+    }
+    if (k < 0) {
+        throw std::invalid_argument("`k` must be non-negative");
+    }
+    if (mod) {
+        if (!std::is_integral_v<T>) {
+            throw std::invalid_argument("`mod` requires an integer dtype");
+        }
+        if (*mod < 1 || static_cast<unsigned long long>(*mod - 1) >
+                            static_cast<unsigned long long>(std::numeric_limits<T>::max())) {
+            throw std::invalid_argument("`mod` must be positive and fit in the dtype of `a`");
+        }
+        if (chunk_of(*mod) == 0) {
+            throw std::invalid_argument("`mod` is too large to reduce exactly in int64");
+        }
+    }
+    const int N = static_cast<int>(a.shape(0));
+    auto [c, ldc, bs] = output_of({N, N}, {&a}, out, epilogue<T>{});
+    const auto av = view_of(a, "a");
+    T* data = c.mutable_data();
+    {
+        py::gil_scoped_release release;
+        if constexpr (std::is_integral_v<T>) {
+            if (mod) {
+                run<T, std::int64_t>(av, k, *mod, data, ldc, threads);
+            } else {
+                run<T, T>(av, k, 0, data, ldc, threads);
+            }
+        } else {
+            run<T, T>(av, k, 0, data, ldc, threads);
+        }
+    }
     return c;
 }
 
-template <auto impl> void c_matmul(int N, int** matrixA, int** matrixB, int** matrixC) {
+}  // namespace power
+
+void c_matmul(
+    const dispatch::kernel_entry<int>& k, int N, int** matrixA, int** matrixB, int** matrixC) {
     std::unique_ptr<int[]> a(new int[N * N]);
     std::unique_ptr<int[]> b(new int[N * N]);
     std::unique_ptr<int[]> c(new int[N * N]);
@@ -149,15 +2090,175 @@ template <auto impl> void c_matmul(int N, int** matrixA, int** matrixB, int** ma
         memcpy(a.get() + i * N, matrixA[i], N * sizeof(int));
         memcpy(b.get() + i * N, matrixB[i], N * sizeof(int));
     }
-    impl(a.get(), b.get(), c.get(), N, N, N);
+    k.plain(a.get(), b.get(), c.get(), N, N, N, {});
     for (int i = 0; i < N; ++i) {
         memcpy(matrixC[i], c.get() + i * N, N * sizeof(int));
     }
 }
 
+// libmatmul.h 中的 C 接口: 行主序缓冲区与 BLAS 式的 M, N, K 和行距, 直接传给内核
+namespace capi {
+
+thread_local std::string last_error;
+
+bool transposed(char trans, const char* name) {
+    switch (trans) {
+    case 'N':
+    case 'n':
+        return false;
+    case 'T':
+    case 't':
+        return true;
+    }
+    throw std::invalid_argument(std::string("`") + name + "` must be 'N' or 'T'");
+}
+
+// op(A) 为 M x K, op(B) 为 K x N; 对应内核的 N, M, P 分别为 M, K, N
+template <typename T>
+void gemm(
+    const char* kernel, char trans_a, char trans_b, int M, int N, int K, T alpha, const T* a,
+    std::ptrdiff_t lda, const T* b, std::ptrdiff_t ldb, T beta, T* c, std::ptrdiff_t ldc,
+    int threads) {
+    const bool ta = transposed(trans_a, "trans_a"), tb = transposed(trans_b, "trans_b");
+    if (M < 0 || N < 0 || K < 0) {
+        throw std::invalid_argument("Matrix dimensions must be non-negative");
+    }
+    if (threads < 0) {
+        throw std::invalid_argument("`threads` must be non-negative");
+    }
+    // 行距至少为所存矩阵的列数, 空矩阵也至少为 1
+    auto check = [](const char* name, std::ptrdiff_t ld, int cols) {
+        const int least = std::max(cols, 1);
+        if (ld < least) {
+            throw std::invalid_argument(
+                std::string("`") + name + "` must be at least " + std::to_string(least));
+        }
+    };
+    check("lda", lda, ta ? M : K);
+    check("ldb", ldb, tb ? K : N);
+    check("ldc", ldc, N);
+    if ((!a && M > 0 && K > 0) || (!b && K > 0 && N > 0) || (!c && M > 0 && N > 0)) {
+        throw std::invalid_argument("Matrix pointers must not be NULL");
+    }
+    operands<T> in{
+        {a, M, K, ta ? 1 : lda, ta ? lda : 1}, {b, K, N, tb ? 1 : ldb, tb ? ldb : 1}};
+    const epilogue<T> ep{alpha, beta};
+    tuning::choice choice{kernel ? kernel : "auto"};
+    if (choice.kernel == "auto") {
+        choice = autotune::choose<T>(in, ldc);
+    }
+    auto run = prepare(choice.kernel, resolve<T>(find_kernel(choice.kernel)), in, c, ldc, ep);
+    threading::scope limit(threads > 0 ? threads : choice.threads);
+    tuning::scope block(choice.block);
+    run();
+}
+
+// 把异常转换为错误码, 说明留给 libmatmul_last_error
+template <typename F> int guarded(F&& f) {
+    try {
+        f();
+        return LIBMATMUL_OK;
+    } catch (const std::invalid_argument& e) {
+        last_error = e.what();
+        return LIBMATMUL_INVALID_ARGUMENT;
+    } catch (const std::exception& e) {
+        last_error = e.what();
+        return LIBMATMUL_RUNTIME_ERROR;
+    } catch (...) {
+        last_error = "Unknown error";
+        return LIBMATMUL_RUNTIME_ERROR;
+    }
+}
+
+template <typename T>
+int typed(
+    const char* kernel, char trans_a, char trans_b, int M, int N, int K, const T* alpha,
+    const T* a, std::ptrdiff_t lda, const T* b, std::ptrdiff_t ldb, const T* beta, T* c,
+    std::ptrdiff_t ldc, int threads) {
+    return guarded([&] {
+        gemm<T>(
+            kernel, trans_a, trans_b, M, N, K, alpha ? *alpha : T(1), a, lda, b, ldb,
+            beta ? *beta : T(0), c, ldc, threads);
+    });
+}
+
+}  // namespace capi
+
 extern "C" {
 void matrixmultiply(int N, int** matrixA, int** matrixB, int** matrixC) {
-    return c_matmul<kernel::auto_simd>(N, matrixA, matrixB, matrixC);
+    return c_matmul(dispatch::active().of<int>().auto_simd, N, matrixA, matrixB, matrixC);
+}
+
+int libmatmul_gemm(
+    const char* kernel, int dtype, char trans_a, char trans_b, int M, int N, int K,
+    const void* alpha, const void* a, ptrdiff_t lda, const void* b, ptrdiff_t ldb,
+    const void* beta, void* c, ptrdiff_t ldc, int threads) {
+    // 先检查原始整数, 超出枚举范围的值转换为 libmatmul_dtype 是未定义行为
+    if (dtype < LIBMATMUL_INT32 || dtype > LIBMATMUL_FLOAT64) {
+        capi::last_error = "Unknown dtype: " + std::to_string(dtype);
+        return LIBMATMUL_INVALID_ARGUMENT;
+    }
+    auto call = [&](auto t) {
+        using T = element_t<decltype(t)>;
+        return capi::typed<T>(
+            kernel, trans_a, trans_b, M, N, K, static_cast<const T*>(alpha),
+            static_cast<const T*>(a), lda, static_cast<const T*>(b), ldb,
+            static_cast<const T*>(beta), static_cast<T*>(c), ldc, threads);
+    };
+    switch (static_cast<libmatmul_dtype>(dtype)) {
+    case LIBMATMUL_INT32:
+        return call(tag<std::int32_t>{});
+    case LIBMATMUL_INT64:
+        return call(tag<std::int64_t>{});
+    case LIBMATMUL_FLOAT32:
+        return call(tag<float>{});
+    case LIBMATMUL_FLOAT64:
+        break;
+    }
+    return call(tag<double>{});
+}
+
+int libmatmul_sgemm(
+    const char* kernel, char trans_a, char trans_b, int M, int N, int K, float alpha,
+    const float* a, ptrdiff_t lda, const float* b, ptrdiff_t ldb, float beta, float* c,
+    ptrdiff_t ldc, int threads) {
+    return capi::typed(
+        kernel, trans_a, trans_b, M, N, K, &alpha, a, lda, b, ldb, &beta, c, ldc, threads);
+}
+
+int libmatmul_dgemm(
+    const char* kernel, char trans_a, char trans_b, int M, int N, int K, double alpha,
+    const double* a, ptrdiff_t lda, const double* b, ptrdiff_t ldb, double beta, double* c,
+    ptrdiff_t ldc, int threads) {
+    return capi::typed(
+        kernel, trans_a, trans_b, M, N, K, &alpha, a, lda, b, ldb, &beta, c, ldc, threads);
+}
+
+int libmatmul_igemm(
+    const char* kernel, char trans_a, char trans_b, int M, int N, int K, int32_t alpha,
+    const int32_t* a, ptrdiff_t lda, const int32_t* b, ptrdiff_t ldb, int32_t beta, int32_t* c,
+    ptrdiff_t ldc, int threads) {
+    return capi::typed(
+        kernel, trans_a, trans_b, M, N, K, &alpha, a, lda, b, ldb, &beta, c, ldc, threads);
+}
+
+int libmatmul_lgemm(
+    const char* kernel, char trans_a, char trans_b, int M, int N, int K, int64_t alpha,
+    const int64_t* a, ptrdiff_t lda, const int64_t* b, ptrdiff_t ldb, int64_t beta, int64_t* c,
+    ptrdiff_t ldc, int threads) {
+    return capi::typed(
+        kernel, trans_a, trans_b, M, N, K, &alpha, a, lda, b, ldb, &beta, c, ldc, threads);
+}
+
+const char* libmatmul_last_error(void) { return capi::last_error.c_str(); }
+
+int libmatmul_kernel_count(void) { return static_cast<int>(builtins().size()); }
+
+const char* libmatmul_kernel_name(int index) {
+    if (index < 0 || index >= libmatmul_kernel_count()) {
+        return nullptr;
+    }
+    return builtins()[index].name;
 }
 }
 
@@ -178,38 +2279,435 @@ PYBIND11_MODULE(libmatmul, m) {
     m.def("has_neon", &isa::check::has_neon, "Check if NEON is available");
     m.def("has_fma", &isa::check::has_fma, "Check if FMA is available");
 
-    auto bind = [&m](const char* name, auto func, const char* desc) {
-        m.def(name, func, desc, py::arg("a"), py::arg("b"));
-    };
-    bind(
-        "trivial", &np_matmul<kernel::trivial>,
-        "Matrix multiplication using a trivial implementation");
-    bind(
-        "transpose_iter", &np_matmul<kernel::transpose_iter>,
-        "Matrix multiplication using a transposed loop iterator implementation");
-    bind(
-        "multithread", &np_matmul<kernel::multithread>,
-        "Matrix multiplication using a multithreaded implementation");
-    bind(
-        "multithread_chunk", &np_matmul<kernel::multithread_chunk>,
-        "Matrix multiplication using a multithreaded chunked implementation");
-    bind(
-        "auto_simd", &np_matmul<kernel::auto_simd>,
-        "Matrix multiplication using a SIMD implementation (auto generated by libomp)");
-    bind("chunk", &np_matmul<kernel::chunk>, "Matrix multiplication using a chunked implementation");
-    bind(
-        "transpose", &np_matmul<kernel::transpose_data>,
-        "Matrix multiplication using a transposed implementation");
-    bind(
-        "multithread_simd", &np_matmul<kernel::multithread_simd>,
-        "Matrix multiplication using a multithreaded SIMD implementation");
-    bind(
-        "simd", &np_matmul<kernel::simd>,
-        "Matrix multiplication using a SIMD implementation (manually generated)");
-    bind(
-        "simd_optimized", &np_matmul<kernel::simd_optimized>,
-        "Matrix multiplication using an optimized SIMD implementation with prefetch");
-    bind(
-        "simd_arm_sme", &np_matmul<kernel::simd_arm_sme>,
-        "Matrix multiplication using ARM SME instructions");
+    m.def(
+        "get_dispatch_isa", [] { return std::string(dispatch::active().isa); },
+        "Get the instruction set variant the SIMD kernels are dispatched to");
+    m.def(
+        "get_supported_isas",
+        [] {
+            std::vector<std::string> names;
+            for (auto t : dispatch::supported()) {
+                names.emplace_back(t->isa);
+            }
+            return names;
+        },
+        "Get the kernel variants supported by this CPU, fastest first");
+    m.def(
+        "set_dispatch_isa", &dispatch::select,
+        "Dispatch the SIMD kernels to the given instruction set variant", py::arg("isa"));
+
+    m.def(
+        "set_num_threads", &threading::set_num_threads,
+        "Set the number of threads the kernels use (0 restores the OpenMP default); a per-call "
+        "`threads=` takes precedence",
+        py::arg("n"));
+    m.def(
+        "get_num_threads", &threading::count,
+        "Get the number of threads the kernels use when no `threads=` is given");
+    m.def(
+        "set_affinity",
+        [](const std::string& mode) { threading::set_affinity(threading::parse_affinity(mode)); },
+        "Pin kernel threads to cores: 'none', 'compact' (consecutive cores) or 'spread' (round "
+        "robin over NUMA nodes); pinned runs keep one copy of the packed panels per node",
+        py::arg("mode"));
+    m.def(
+        "get_affinity",
+        [] { return std::string(threading::affinity_name(threading::get_affinity())); },
+        "Get the thread affinity mode");
+
+    py::class_<packed_matrix>(
+        m, "PackedMatrix",
+        "Right-hand operand stored once in kernel layout, reusable across multiplications")
+        .def(
+            py::init([](const any_array& b, const std::string& kernel) {
+                const auto& f = find_kernel(kernel);
+                return std::visit(
+                    [&](const auto& b) {
+                        using T = element_of<decltype(b)>;
+                        auto packed = std::make_unique<packed_matrix>(b);
+                        const auto& typed = std::get<packed_operand<T>>(packed->typed);
+                        const auto k = resolve<T>(f);
+                        if (k.prepacked) {
+                            typed.layouts->packed(k.b_packing, typed.view());
+                        } else if (k.bt) {
+                            typed.layouts->transposed(typed.view());
+                        }
+                        return packed;
+                    },
+                    b);
+            }),
+            "Copy b and pack it for the given kernel; layouts for other kernels are built on "
+            "first use",
+            py::arg("b").noconvert(), py::arg("kernel") = "gemm")
+        .def_property_readonly(
+            "shape", [](const packed_matrix& p) { return py::make_tuple(p.M, p.P); })
+        .def_property_readonly(
+            "dtype",
+            [](const packed_matrix& p) {
+                return std::visit(
+                    [](const auto& typed) { return py::dtype::of<element_of<decltype(typed)>>(); },
+                    p.typed);
+            })
+        .def_property_readonly(
+            "nbytes",
+            [](const packed_matrix& p) {
+                return std::visit(
+                    [](const auto& typed) {
+                        using T = element_of<decltype(typed)>;
+                        return static_cast<std::size_t>(typed.M) * typed.P * sizeof(T) +
+                               typed.layouts->nbytes();
+                    },
+                    p.typed);
+            })
+        .def(
+            "numpy",
+            [](const packed_matrix& p) {
+                return std::visit(
+                    [](const auto& typed) -> py::array {
+                        auto b = ndarray<element_of<decltype(typed)>>({typed.M, typed.P});
+                        std::memcpy(b.mutable_data(), typed.rows.get(), b.nbytes());
+                        return b;
+                    },
+                    p.typed);
+            },
+            "Return a copy of the packed matrix as a NumPy array");
+
+    m.def(
+        "set_pack_cache_size",
+        [](std::size_t nbytes) { prepack::cache().set_capacity(nbytes); },
+        "Set the byte budget of the LRU cache of packed right-hand operands (0 disables it)",
+        py::arg("nbytes"));
+    m.def(
+        "clear_pack_cache", [] { prepack::cache().clear(); },
+        "Drop all entries of the pack cache");
+    m.def(
+        "invalidate_pack_cache",
+        [](const any_array& b) {
+            std::visit(
+                [](const py::array& x) {
+                    prepack::cache().invalidate(x.data(), registered_owner(x));
+                },
+                b);
+        },
+        "Bump the version of b in the pack cache after modifying it in place",
+        py::arg("b").noconvert());
+    m.def(
+        "pack_cache_info",
+        [] {
+            const auto s = prepack::cache().info();
+            return py::dict(
+                "hits"_a = s.hits, "misses"_a = s.misses, "entries"_a = s.entries,
+                "nbytes"_a = s.nbytes, "capacity"_a = s.capacity);
+        },
+        "Get pack cache statistics");
+
+    for (const auto& k : builtins()) {
+        m.def(
+            k.name,
+            [name = k.name, f = k.f](
+                const any_array& a, const operand_b& b, const std::optional<output_array>& out,
+                py::object alpha, py::object beta, const std::optional<int>& threads,
+                py::object bias, py::object scale, py::object shift, py::object clip,
+                py::object dtype) {
+                threading::scope limit(threads_of(threads));
+                return np_matmul(
+                    name, f, a, b, out, alpha, beta, {bias, scale, shift, clip, dtype});
+            },
+            k.desc, py::arg("a").noconvert(), py::arg("b").noconvert(), py::kw_only(),
+            py::arg("out").noconvert() = py::none(), py::arg("alpha") = 1, py::arg("beta") = 0,
+            py::arg("threads") = py::none(), py::arg("bias") = py::none(),
+            py::arg("scale") = py::none(), py::arg("shift") = py::none(),
+            py::arg("clip") = py::none(), py::arg("dtype") = py::none());
+    }
+
+    m.def(
+        "set_strassen_cutoff",
+        [](int n) {
+            if (n < 1) {
+                throw std::invalid_argument("Strassen cutoff must be positive");
+            }
+            strassen::cutoff().store(n, std::memory_order_relaxed);
+        },
+        "Set the size at or below which strassen stops recursing and calls gemm",
+        py::arg("n"));
+    m.def(
+        "get_strassen_cutoff", [] { return strassen::cutoff().load(std::memory_order_relaxed); },
+        "Get the size at or below which strassen stops recursing and calls gemm");
+
+    // resolve 对 tag<TA> 返回 A 的元素类型为 TA 的 int8 内核
+    auto bind_int8 = [&m](const char* name, auto resolve, const char* desc) {
+        m.def(
+            name,
+            [resolve](
+                const int8_array& a, const ndarray<std::int8_t>& b,
+                const std::optional<output_array>& out, py::object alpha, py::object beta,
+                const std::optional<int>& threads, py::object bias, py::object scale,
+                py::object shift, py::object clip, py::object dtype) {
+                threading::scope limit(threads_of(threads));
+                return std::visit(
+                    [&](const auto& a) {
+                        using TA = element_of<decltype(a)>;
+                        return np_matmul_int8(
+                            resolve(tag<TA>{}), a, b, out,
+                            epilogue_of<std::int32_t>(alpha, beta),
+                            {bias, scale, shift, clip, dtype});
+                    },
+                    a);
+            },
+            desc, py::arg("a").noconvert(), py::arg("b").noconvert(), py::kw_only(),
+            py::arg("out").noconvert() = py::none(), py::arg("alpha") = 1, py::arg("beta") = 0,
+            py::arg("threads") = py::none(), py::arg("bias") = py::none(),
+            py::arg("scale") = py::none(), py::arg("shift") = py::none(),
+            py::arg("clip") = py::none(), py::arg("dtype") = py::none());
+    };
+    bind_int8(
+        "gemm_int8",
+        [](auto t) { return dispatch::active().int8_of<element_t<decltype(t)>>().gemm; },
+        "Quantized multiplication of uint8/int8 `a` by int8 `b`, accumulated into int32");
+    bind_int8(
+        "multithread_gemm_int8",
+        [](auto t) {
+            return dispatch::active().int8_of<element_t<decltype(t)>>().multithread_gemm;
+        },
+        "Multithreaded quantized multiplication of uint8/int8 `a` by int8 `b` into int32");
+
+    m.def(
+        "csr_dense",
+        [](const py::object& a, const any_array& b, const std::optional<any_array>& out,
+           py::object alpha, py::object beta, const std::optional<int>& threads) {
+            threading::scope limit(threads_of(threads));
+            const auto csr = sparse::parse(a, "csr", "a");
+            return sparse::visit(csr, b, "b", [&](const auto& a, const auto& b) {
+                using T = element_of<decltype(b)>;
+                return sparse::csr_dense(a, b, out, epilogue_of<T>(alpha, beta));
+            });
+        },
+        "Multiply a sparse CSR `a` (a scipy.sparse CSR matrix or a (data, indices, indptr) "
+        "tuple, used without copying) by a dense `b`, vectorized over the columns of `b`; "
+        "falls back to gemm when `a` is denser than get_sparse_density_threshold()",
+        py::arg("a"), py::arg("b").noconvert(), py::kw_only(),
+        py::arg("out").noconvert() = py::none(), py::arg("alpha") = 1, py::arg("beta") = 0,
+        py::arg("threads") = py::none());
+    m.def(
+        "dense_csc",
+        [](const any_array& a, const py::object& b, const std::optional<any_array>& out,
+           py::object alpha, py::object beta, const std::optional<int>& threads) {
+            threading::scope limit(threads_of(threads));
+            const auto csc = sparse::parse(b, "csc", "b");
+            return sparse::visit(csc, a, "a", [&](const auto& b, const auto& a) {
+                using T = element_of<decltype(a)>;
+                return sparse::dense_csc(a, b, out, epilogue_of<T>(alpha, beta));
+            });
+        },
+        "Multiply a dense `a` by a sparse CSC `b` (a scipy.sparse CSC matrix or a (data, "
+        "indices, indptr) tuple, used without copying), vectorized over blocks of rows of "
+        "`a`; falls back to gemm when `b` is denser than get_sparse_density_threshold()",
+        py::arg("a").noconvert(), py::arg("b"), py::kw_only(),
+        py::arg("out").noconvert() = py::none(), py::arg("alpha") = 1, py::arg("beta") = 0,
+        py::arg("threads") = py::none());
+    m.def(
+        "set_sparse_density_threshold",
+        [](double density) {
+            if (!(density >= 0)) {
+                throw std::invalid_argument("Density threshold must be non-negative");
+            }
+            sparse::density_threshold().store(density, std::memory_order_relaxed);
+        },
+        "Set the fraction of nonzeros at or above which csr_dense/dense_csc expand the sparse "
+        "operand and use gemm (above 1 disables the fallback)",
+        py::arg("density"));
+    m.def(
+        "get_sparse_density_threshold",
+        [] { return sparse::density_threshold().load(std::memory_order_relaxed); },
+        "Get the fraction of nonzeros at or above which the sparse kernels use gemm");
+    m.def(
+        "matmul_batched",
+        [](const any_array& a, const operand_b& b, const std::optional<any_array>& out,
+           py::object alpha, py::object beta, const std::optional<int>& threads) {
+            threading::scope limit(threads_of(threads));
+            return np_matmul_batched(a, b, out, alpha, beta);
+        },
+        "Batched matrix multiplication of (batch, N, M) and (batch, M, P) arrays; a 2-D or "
+        "batch-1 operand (or a PackedMatrix) is broadcast over the batch",
+        py::arg("a").noconvert(), py::arg("b").noconvert(), py::kw_only(),
+        py::arg("out").noconvert() = py::none(), py::arg("alpha") = 1, py::arg("beta") = 0,
+        py::arg("threads") = py::none());
+    m.def(
+        "matmul_out_of_core",
+        [](py::object a, py::object b, py::object out, const py::object& dtype,
+           const std::optional<std::vector<py::ssize_t>>& a_shape,
+           const std::optional<std::vector<py::ssize_t>>& b_shape, std::size_t memory,
+           py::object alpha, py::object beta, const std::optional<int>& threads) {
+            threading::scope limit(threads_of(threads));
+            const auto x = mapped::as_array(mapped::open_input(a, dtype, a_shape, "a"), "a");
+            const auto y = mapped::as_array(mapped::open_input(b, dtype, b_shape, "b"), "b");
+            return std::visit(
+                [&](const auto& a) {
+                    using T = element_of<decltype(a)>;
+                    return np_matmul_out_of_core(a, y, out, epilogue_of<T>(alpha, beta), memory);
+                },
+                x);
+        },
+        "Multiply operands that may not fit in memory: `a`, `b` are arrays (e.g. np.memmap) or "
+        "paths to .npy or raw files (raw files need `dtype` and `a_shape`/`b_shape`). Tiles "
+        "are streamed through `memory` bytes of buffers, the next tiles are read in the "
+        "background while the current ones are multiplied, and C is written directly into "
+        "`out` (an array or a file path, created unless beta != 0)",
+        py::arg("a"), py::arg("b"), py::arg("out") = py::none(), py::kw_only(),
+        py::arg("dtype") = py::none(), py::arg("a_shape") = py::none(),
+        py::arg("b_shape") = py::none(), py::arg("memory") = std::size_t(256) << 20,
+        py::arg("alpha") = 1, py::arg("beta") = 0, py::arg("threads") = py::none());
+    m.def(
+        "profile",
+        [](py::object kernel, const any_array& a, const operand_b& b,
+           const std::optional<std::vector<std::string>>& events,
+           const std::optional<int>& threads) {
+            return profiling::profile(kernel, a, b, events, threads);
+        },
+        "Run one kernel call under Linux perf_event_open counters and return a dict with "
+        "`seconds`, totals per event in `events`, per-thread counts in `threads` and the events "
+        "the host cannot count in `unavailable` (their values are None)",
+        py::arg("kernel"), py::arg("a").noconvert(), py::arg("b").noconvert(),
+        py::arg("events") = py::none(), py::kw_only(), py::arg("threads") = py::none());
+    m.def(
+        "set_phase_timing", &phases::set_enabled,
+        "Turn per-phase timing of kernel calls on or off (initially on when the "
+        "LIBMATMUL_PHASE_TIMING environment variable is set and not 0)",
+        py::arg("enabled"));
+    m.def("get_phase_timing", &phases::enabled, "Whether per-phase timing is on");
+    m.def(
+        "phase_stats",
+        [] {
+            py::list result;
+            for (const auto& s : phases::stats()) {
+                py::dict phase_dict;
+                for (int i = 0; i < phases::phase_count; ++i) {
+                    phase_dict[phases::phase_name(static_cast<phases::phase>(i))] =
+                        py::dict("mean"_a = s.mean[i], "p99"_a = s.p99[i]);
+                }
+                result.append(py::dict(
+                    "kernel"_a = s.kernel, "shape"_a = py::make_tuple(s.N, s.M, s.P),
+                    "count"_a = s.count, "phases"_a = phase_dict,
+                    "total"_a = py::dict("mean"_a = s.total_mean, "p99"_a = s.total_p99)));
+            }
+            return result;
+        },
+        "Aggregate the timed calls in the ring buffer (the most recent 4096) by kernel and shape "
+        "bucket (each dimension rounded up to a power of two): count, and mean and p99 "
+        "nanoseconds of every phase (convert, output, init, transpose, compute, wrap) and of "
+        "the whole call");
+    m.def("clear_phase_stats", &phases::clear, "Drop all recorded phase timings");
+    m.def(
+        "get_profile_events", [] { return profile::event_names(); },
+        "List the event names accepted by profile()");
+    m.def(
+        "submit",
+        [](const any_array& a, const operand_b& b, const std::string& kernel,
+           const std::optional<any_array>& out, py::object alpha, py::object beta,
+           const std::optional<int>& threads) {
+            return async::submit(a, b, kernel, out, alpha, beta, threads);
+        },
+        "Submit a matrix multiplication to the native worker queue, returning a "
+        "concurrent.futures.Future",
+        py::arg("a").noconvert(), py::arg("b").noconvert(), py::arg("kernel") = "gemm",
+        py::kw_only(), py::arg("out").noconvert() = py::none(), py::arg("alpha") = 1,
+        py::arg("beta") = 0, py::arg("threads") = py::none());
+    m.def(
+        "matmul_async",
+        [](const any_array& a, const operand_b& b, const std::string& kernel,
+           const std::optional<any_array>& out, py::object alpha, py::object beta,
+           const std::optional<int>& threads) {
+            return py::module_::import("asyncio").attr("wrap_future")(
+                async::submit(a, b, kernel, out, alpha, beta, threads));
+        },
+        "Submit a matrix multiplication and return an awaitable asyncio future",
+        py::arg("a").noconvert(), py::arg("b").noconvert(), py::arg("kernel") = "gemm",
+        py::kw_only(), py::arg("out").noconvert() = py::none(), py::arg("alpha") = 1,
+        py::arg("beta") = 0, py::arg("threads") = py::none());
+    m.def(
+        "matmul",
+        [](const any_array& a, const operand_b& b, const std::optional<any_array>& out,
+           py::object alpha, py::object beta, const std::optional<int>& threads) {
+            const int n = threads_of(threads);
+            return std::visit(
+                [&](const auto& a) -> py::array {
+                    using T = element_of<decltype(a)>;
+                    return autotune::matmul(a, b, out, epilogue_of<T>(alpha, beta), n);
+                },
+                a);
+        },
+        "Matrix multiplication dispatched to the kernel that `tune` found fastest for this "
+        "shape bucket and dtype on this host (gemm/multithread_gemm when untuned)",
+        py::arg("a").noconvert(), py::arg("b").noconvert(), py::kw_only(),
+        py::arg("out").noconvert() = py::none(), py::arg("alpha") = 1, py::arg("beta") = 0,
+        py::arg("threads") = py::none());
+    m.def(
+        "matmul_plan",
+        [](const any_array& a, const operand_b& b) {
+            return std::visit(
+                [&](const auto& a) {
+                    using T = element_of<decltype(a)>;
+                    const auto in = check_shapes(a, b);
+                    const auto [c, source] = autotune::plan_of<T>(in.a.rows, in.a.cols, in.b.cols);
+                    return py::dict(
+                        "kernel"_a = c.kernel, "threads"_a = c.threads, "block"_a = c.block,
+                        "source"_a = source);
+                },
+                a);
+        },
+        "Get the kernel, thread count and block parameter matmul would use for a @ b, and "
+        "whether they come from this shape bucket ('tuned'), the nearest tuned bucket "
+        "('nearest') or the untuned default ('default')",
+        py::arg("a").noconvert(), py::arg("b").noconvert());
+    m.def(
+        "matmul_chain",
+        [](const std::vector<any_array>& matrices, const std::optional<any_array>& out,
+           const std::optional<int>& threads) {
+            return chain::matmul(matrices, out, threads_of(threads));
+        },
+        "Multiply a sequence of matrices, choosing the parenthesization by dynamic programming "
+        "over the tuned per-shape throughput (or multiply-add counts when untuned) and the "
+        "kernel per step as matmul does; intermediates reuse a small pool of scratch buffers",
+        py::arg("matrices").noconvert(), py::kw_only(), py::arg("out").noconvert() = py::none(),
+        py::arg("threads") = py::none());
+    m.def(
+        "matrix_power",
+        [](const any_array& a, long long k, const std::optional<long long>& mod,
+           const std::optional<any_array>& out, const std::optional<int>& threads) {
+            return std::visit(
+                [&](const auto& a) -> py::array {
+                    return power::matrix_power(a, k, mod, out, threads_of(threads));
+                },
+                a);
+        },
+        "Raise the square matrix `a` to the non-negative integer power `k` by repeated "
+        "squaring; with `mod`, integer results are reduced modulo `mod` during accumulation "
+        "so they stay exact",
+        py::arg("a").noconvert(), py::arg("k"), py::kw_only(), py::arg("mod") = py::none(),
+        py::arg("out").noconvert() = py::none(), py::arg("threads") = py::none());
+    m.def(
+        "matmul_chain_plan", &chain::plan,
+        "Get the parenthesization matmul_chain would use as nested index pairs, its number of "
+        "multiply-adds and, when tuning results exist, the estimated seconds",
+        py::arg("matrices").noconvert());
+    m.def(
+        "tune", &autotune::tune,
+        "Benchmark the kernels with their thread and block settings on each shape (default: "
+        "squares 64..1024) and dtype, record the fastest per shape bucket and, if `save`, "
+        "write the results to the tuning cache; returns the winners",
+        py::arg("shapes") = py::none(), py::arg("dtypes") = py::none(),
+        py::arg("kernels") = py::none(), py::arg("repeat") = 3, py::arg("save") = true);
+    m.def(
+        "get_tuning_cache_path", [] { return tuning::results().path(); },
+        "Get the tuning cache file (LIBMATMUL_TUNING_CACHE, else "
+        "$XDG_CACHE_HOME/libmatmul/tuning.txt or ~/.cache/libmatmul/tuning.txt)");
+    m.def(
+        "set_tuning_cache_path",
+        [](const std::string& path) { tuning::results().set_path(path); },
+        "Use another tuning cache file; its results replace the ones in memory",
+        py::arg("path"));
+    m.def(
+        "clear_tuning_cache", [] { tuning::results().clear(); },
+        "Forget all tuning results and delete the tuning cache file");
+    py::module_::import("atexit").attr("register")(py::cpp_function(&async::shutdown));
 }
@@ -0,0 +1,19 @@
+#pragma once
+
+#include <cstddef>
+
+// 二维矩阵的只读视图, 步长以元素为单位
+template <typename T> struct matrix_view {
+    const T* data;
+    int rows, cols;
+    std::ptrdiff_t rs, cs;
+
+    // 空矩阵的步长可以是任意值 (NumPy 给出 (0, 0) 等), 按任一布局读取都不会访问元素
+    bool empty() const { return rows == 0 || cols == 0; }
+    bool row_major() const {
+        return empty() || ((cols <= 1 || cs == 1) && (rows <= 1 || rs == cols));
+    }
+    bool col_major() const {
+        return empty() || ((rows <= 1 || rs == 1) && (cols <= 1 || cs == rows));
+    }
+};
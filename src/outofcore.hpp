@@ -0,0 +1,162 @@
+#pragma once
+
+#include "dispatch.hpp"
+#include "epilogue.hpp"
+#include "matrix.hpp"
+
+#include <algorithm>
+#include <cmath>
+#include <cstddef>
+#include <cstdint>
+#include <cstring>
+#include <future>
+#include <memory>
+#include <stdexcept>
+#include <vector>
+
+#if defined(__unix__) || defined(__APPLE__)
+#include <sys/mman.h>
+#include <unistd.h>
+#endif
+
+// 核外乘法: A, B 可以是比内存大的内存映射文件. A, B 的 tile 被复制到两组固定大小的缓冲区,
+// 后台线程读入下一组 tile 的同时计算当前一组, C 的 tile 直接写入 (可能同样是内存映射的) 输出
+namespace outofcore {
+
+// tile 的尺寸: 每组缓冲区容纳 rows x depth 的 A tile 与 depth x cols 的 B tile
+struct tiling {
+    int rows, depth, cols;
+};
+
+// 在 budget 字节内 (两组缓冲区) 选择 tile 尺寸: 先取接近正方形的 depth,
+// 较小的维度用不完的空间留给另外两维
+inline tiling tiles_of(int N, int M, int P, std::size_t itemsize, std::size_t budget) {
+    const std::size_t elements = budget / itemsize / 2;
+    const int side = static_cast<int>(std::sqrt(static_cast<double>(elements) / 2));
+    if (side < 16) {
+        throw std::invalid_argument("Memory budget is too small for out-of-core tiles");
+    }
+    tiling t{};
+    t.depth = std::min(M, side);
+    const std::size_t per_line = elements / t.depth;
+    t.rows = static_cast<int>(std::min<std::size_t>(N, per_line / 2));
+    t.cols = static_cast<int>(std::min<std::size_t>(P, per_line - t.rows));
+    t.rows = static_cast<int>(std::min<std::size_t>(N, per_line - t.cols));
+    return t;
+}
+
+// 提示内核预读 [p, p + bytes) 所在的页; 对普通内存无副作用
+inline void advise(const void* p, std::size_t bytes) {
+#if defined(MADV_WILLNEED)
+    static const std::uintptr_t page = static_cast<std::uintptr_t>(sysconf(_SC_PAGESIZE));
+    const auto lo = reinterpret_cast<std::uintptr_t>(p) & ~(page - 1);
+    const auto hi = reinterpret_cast<std::uintptr_t>(p) + bytes;
+    madvise(reinterpret_cast<void*>(lo), hi - lo, MADV_WILLNEED);
+#else
+    (void)p, (void)bytes;
+#endif
+}
+
+// 把 src 的 [r0, r0 + rows) x [c0, c0 + cols) 复制为行主序连续的 dst
+template <typename T>
+void copy_tile(const matrix_view<T>& src, int r0, int c0, int rows, int cols, T* dst) {
+    for (int i = 0; i < rows; ++i) {
+        const T* row = src.data + (r0 + i) * src.rs + c0 * src.cs;
+        if (src.cs == 1) {
+            std::memcpy(dst + static_cast<std::ptrdiff_t>(i) * cols, row, cols * sizeof(T));
+            continue;
+        }
+        for (int j = 0; j < cols; ++j) {
+            dst[static_cast<std::ptrdiff_t>(i) * cols + j] = row[j * src.cs];
+        }
+    }
+}
+
+// 提示预读 src 中 tile 覆盖的各行 (列主序时为各列)
+template <typename T>
+void advise_tile(const matrix_view<T>& src, int r0, int c0, int rows, int cols) {
+    if (src.rs < 0 || src.cs < 0) {
+        return;
+    }
+    if (src.rs == 1) {
+        for (int j = 0; j < cols; ++j) {
+            advise(src.data + r0 * src.rs + (c0 + j) * src.cs, rows * sizeof(T));
+        }
+        return;
+    }
+    if (src.cs == 1 && src.rs == src.cols) {
+        const auto span = static_cast<std::size_t>(rows - 1) * src.rs + cols;
+        advise(src.data + r0 * src.rs + c0, span * sizeof(T));
+        return;
+    }
+    const auto width = static_cast<std::size_t>(cols - 1) * src.cs + 1;
+    for (int i = 0; i < rows; ++i) {
+        advise(src.data + (r0 + i) * src.rs + c0 * src.cs, width * sizeof(T));
+    }
+}
+
+// C = alpha * A @ B + beta * C, C 行主序, 行距 ldc. 按 (C 的行块, 列块, 深度块) 的顺序
+// 逐步计算, 第一个深度块应用 beta, 其余深度块累加. gemm 为 strided 入口
+template <typename T>
+void multiply(
+    const matrix_view<T>& a, const matrix_view<T>& b, T* c, std::ptrdiff_t ldc,
+    const epilogue<T>& ep, std::size_t budget, dispatch::kernel_strided_fn<T> gemm) {
+    const int N = a.rows, M = a.cols, P = b.cols;
+    if (N == 0 || P == 0) {
+        return;
+    }
+    if (M == 0) {
+        return ep.init(c, N, P, ldc);
+    }
+    const auto t = tiles_of(N, M, P, sizeof(T), budget);
+
+    struct step {
+        int i0, k0, j0, rows, depth, cols;
+    };
+    std::vector<step> steps;
+    for (int i0 = 0; i0 < N; i0 += t.rows) {
+        for (int j0 = 0; j0 < P; j0 += t.cols) {
+            for (int k0 = 0; k0 < M; k0 += t.depth) {
+                steps.push_back(
+                    {i0, k0, j0, std::min(t.rows, N - i0), std::min(t.depth, M - k0),
+                     std::min(t.cols, P - j0)});
+            }
+        }
+    }
+
+    const std::size_t a_size = static_cast<std::size_t>(t.rows) * t.depth;
+    const std::size_t b_size = static_cast<std::size_t>(t.depth) * t.cols;
+    std::unique_ptr<T[]> buffers[2] = {
+        std::make_unique<T[]>(a_size + b_size), std::make_unique<T[]>(a_size + b_size)};
+    auto load = [&](const step& s, T* buffer) {
+        copy_tile(a, s.i0, s.k0, s.rows, s.depth, buffer);
+        copy_tile(b, s.k0, s.j0, s.depth, s.cols, buffer + a_size);
+    };
+    auto prefetch = [&](const step& s) {
+        advise_tile(a, s.i0, s.k0, s.rows, s.depth);
+        advise_tile(b, s.k0, s.j0, s.depth, s.cols);
+    };
+
+    load(steps[0], buffers[0].get());
+    for (std::size_t n = 0; n < steps.size(); ++n) {
+        // 读入下一组 tile 与计算当前一组重叠, 再下一组交给内核预读
+        std::future<void> next;
+        if (n + 1 < steps.size()) {
+            next = std::async(std::launch::async, load, steps[n + 1], buffers[(n + 1) % 2].get());
+        }
+        if (n + 2 < steps.size()) {
+            prefetch(steps[n + 2]);
+        }
+        const auto& s = steps[n];
+        const T* tile = buffers[n % 2].get();
+        const epilogue<T> step_ep{ep.alpha, s.k0 == 0 ? ep.beta : T(1)};
+        gemm(
+            s.rows, s.depth, s.cols, tile, s.depth, 1, tile + a_size, s.cols, 1,
+            c + s.i0 * ldc + s.j0, ldc, step_ep);
+        if (next.valid()) {
+            next.get();
+        }
+    }
+}
+
+}  // namespace outofcore
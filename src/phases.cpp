@@ -0,0 +1,177 @@
+#include "phases.hpp"
+
+#include "tuning.hpp"
+
+#include <algorithm>
+#include <atomic>
+#include <chrono>
+#include <cstdlib>
+#include <cstring>
+#include <map>
+#include <mutex>
+#include <tuple>
+
+namespace phases {
+
+namespace {
+
+constexpr std::size_t ring_size = 4096;
+
+std::atomic<bool>& flag() {
+    static std::atomic<bool> on = [] {
+        const char* env = std::getenv("LIBMATMUL_PHASE_TIMING");
+        return env != nullptr && *env != '\0' && std::strcmp(env, "0") != 0;
+    }();
+    return on;
+}
+
+thread_local call* current = nullptr;
+
+std::uint64_t now() {
+    return std::chrono::duration_cast<std::chrono::nanoseconds>(
+               std::chrono::steady_clock::now().time_since_epoch())
+        .count();
+}
+
+// 最近 ring_size 次调用, next 为下一次写入的位置, 已写入 size 条
+struct ring {
+    std::mutex mutex;
+    std::vector<record> records = std::vector<record>(ring_size);
+    std::size_t next = 0, size = 0;
+
+    void push(const record& r) {
+        std::lock_guard lock(mutex);
+        records[next] = r;
+        next = (next + 1) % ring_size;
+        size = std::min(size + 1, ring_size);
+    }
+};
+
+ring& buffer() {
+    static ring r;
+    return r;
+}
+
+// 升序样本的第 q 分位数 (最近秩)
+double quantile(const std::vector<double>& sorted, double q) {
+    const auto rank = static_cast<std::size_t>(q * (sorted.size() - 1) + 0.5);
+    return sorted[std::min(rank, sorted.size() - 1)];
+}
+
+}  // namespace
+
+const char* phase_name(phase p) {
+    switch (p) {
+    case phase::convert:
+        return "convert";
+    case phase::output:
+        return "output";
+    case phase::init:
+        return "init";
+    case phase::transpose:
+        return "transpose";
+    case phase::compute:
+        return "compute";
+    case phase::wrap:
+        return "wrap";
+    }
+    return "?";
+}
+
+bool enabled() { return flag().load(std::memory_order_relaxed); }
+
+void set_enabled(bool on) { flag().store(on, std::memory_order_relaxed); }
+
+call::call(const std::string& kernel) : active(enabled()) {
+    if (!active) {
+        return;
+    }
+    const auto n = std::min(kernel.size(), sizeof(r.kernel) - 1);
+    std::memcpy(r.kernel, kernel.data(), n);
+    r.kernel[n] = '\0';
+    saved = current;
+    current = this;
+    start = now();
+}
+
+call::~call() {
+    if (!active) {
+        return;
+    }
+    r.total = now() - start;
+    current = saved;
+    buffer().push(r);
+}
+
+void call::shape(int N, int M, int P) {
+    r.N = N, r.M = M, r.P = P;
+}
+
+scope::scope(phase p) : owner(current), p(p) {
+    if (owner) {
+        saved_nested = owner->nested;
+        owner->nested = 0;
+        start = now();
+    }
+}
+
+scope::~scope() {
+    if (owner) {
+        const auto elapsed = now() - start;
+        owner->r.ns[static_cast<int>(p)] += elapsed - owner->nested;
+        owner->nested = saved_nested + elapsed;
+    }
+}
+
+std::vector<summary> stats() {
+    std::vector<record> records;
+    {
+        auto& b = buffer();
+        std::lock_guard lock(b.mutex);
+        records.assign(b.records.begin(), b.records.begin() + b.size);
+    }
+    using group_key = std::tuple<std::string, int, int, int>;
+    std::map<group_key, std::vector<const record*>> groups;
+    for (const auto& r : records) {
+        const auto bucket = tuning::bucket_of(r.N, r.M, r.P);
+        groups[{r.kernel, bucket.n, bucket.m, bucket.p}].push_back(&r);
+    }
+    std::vector<summary> result;
+    for (const auto& [k, rs] : groups) {
+        summary s{};
+        s.kernel = std::get<0>(k);
+        s.N = tuning::size_of(std::get<1>(k));
+        s.M = tuning::size_of(std::get<2>(k));
+        s.P = tuning::size_of(std::get<3>(k));
+        s.count = rs.size();
+        auto describe = [&](auto value, double& mean, double& p99) {
+            std::vector<double> v;
+            for (const auto* r : rs) {
+                v.push_back(static_cast<double>(value(*r)));
+            }
+            std::sort(v.begin(), v.end());
+            double sum = 0;
+            for (double x : v) {
+                sum += x;
+            }
+            mean = sum / v.size();
+            p99 = quantile(v, 0.99);
+        };
+        for (int i = 0; i < phase_count; ++i) {
+            describe([i](const record& r) { return r.ns[i]; }, s.mean[i], s.p99[i]);
+        }
+        describe([](const record& r) { return r.total; }, s.total_mean, s.total_p99);
+        result.push_back(std::move(s));
+    }
+    return result;
+}
+
+void clear() {
+    auto& b = buffer();
+    std::lock_guard lock(b.mutex);
+    b.next = b.size = 0;
+}
+
+std::size_t capacity() { return ring_size; }
+
+}  // namespace phases
@@ -0,0 +1,85 @@
+#pragma once
+
+#include <array>
+#include <cstdint>
+#include <string>
+#include <vector>
+
+// 分阶段计时: 记录每次调用中输入检查, 分配输出, 初始化 C, 转置 B, 计算与返回结果各自的
+// 纳秒数, 存入定长环形缓冲区, 供 Python 查询按内核与形状桶汇总的统计. 关闭时每个计时点
+// 只读取一次线程局部变量. 与指令集无关, 实现在 phases.cpp 中以基础指令集编译
+namespace phases {
+
+enum class phase { convert, output, init, transpose, compute, wrap };
+
+constexpr int phase_count = 6;
+
+const char* phase_name(phase p);
+
+// 初始状态由环境变量 LIBMATMUL_PHASE_TIMING 决定 (非空且不为 "0" 时开启)
+bool enabled();
+void set_enabled(bool on);
+
+// 一次调用的记录, total 为整个调用的耗时 (含未划入任何阶段的部分)
+struct record {
+    char kernel[32];
+    int N, M, P;
+    std::array<std::uint64_t, phase_count> ns;
+    std::uint64_t total;
+};
+
+// 一次调用: 在调用方线程上构造, 析构时写入环形缓冲区. 未开启计时时什么也不做
+class call {
+public:
+    explicit call(const std::string& kernel);
+    ~call();
+
+    call(const call&) = delete;
+    call& operator=(const call&) = delete;
+
+    // 形状已知后设置, 用于分桶
+    void shape(int N, int M, int P);
+
+private:
+    friend class scope;
+
+    bool active;
+    call* saved = nullptr;
+    std::uint64_t start = 0;
+    // 当前阶段内嵌套阶段的耗时, 从外层阶段中扣除
+    std::uint64_t nested = 0;
+    record r{};
+};
+
+// 把作用域内的耗时计入当前线程正在计时的调用的阶段 p; 嵌套的阶段只计入最内层.
+// 并行区域中的其他线程没有正在计时的调用, 不计时
+class scope {
+public:
+    explicit scope(phase p);
+    ~scope();
+
+    scope(const scope&) = delete;
+    scope& operator=(const scope&) = delete;
+
+private:
+    call* owner;
+    phase p;
+    std::uint64_t start = 0, saved_nested = 0;
+};
+
+// 按内核与形状桶 (各维向上取整到 2 的幂) 汇总的统计, 单位为纳秒
+struct summary {
+    std::string kernel;
+    int N, M, P;
+    std::size_t count;
+    std::array<double, phase_count> mean, p99;
+    double total_mean, total_p99;
+};
+
+std::vector<summary> stats();
+void clear();
+
+// 环形缓冲区中保留的最近调用数
+std::size_t capacity();
+
+}  // namespace phases
@@ -0,0 +1,220 @@
+#pragma once
+
+#include "dispatch.hpp"
+#include "gemm.hpp"
+#include "matrix.hpp"
+#include "simd.hpp"
+
+#include <cstdint>
+#include <list>
+#include <map>
+#include <memory>
+#include <mutex>
+#include <tuple>
+#include <typeindex>
+#include <typeinfo>
+#include <utility>
+
+namespace prepack {
+
+// 不同元素类型的 operand 共用一个缓存
+class operand_base {
+public:
+    virtual ~operand_base() = default;
+    virtual std::size_t nbytes() = 0;
+};
+
+// B 在各内核所需布局下的副本, 首次使用时由源矩阵生成, 之后重复使用
+template <typename T> class operand : public operand_base {
+public:
+    operand(int M, int P) : M(M), P(P) {}
+
+    operand(const operand&) = delete;
+    operand& operator=(const operand&) = delete;
+
+    // P x M 行主序的转置, 供 *_bt 入口使用
+    const T* transposed(const matrix_view<T>& b) {
+        std::lock_guard<std::mutex> lock(mutex);
+        if (!b_tr) {
+            b_tr.reset(kernel::transpose(b.data, b.rs, b.cs, M, P));
+        }
+        return b_tr.get();
+    }
+
+    // 按 format 打包的 B, 供 prepacked 入口使用
+    const T* packed(const dispatch::packing<T>* format, const matrix_view<T>& b) {
+        std::lock_guard<std::mutex> lock(mutex);
+        auto& [buf, count] = panels[format];
+        if (!buf) {
+            count = format->size(M, P);
+            buf = kernel::packed::make_buffer<T>(count);
+            format->pack(b.data, b.rs, b.cs, M, P, buf.get());
+        }
+        return buf.get();
+    }
+
+    std::size_t nbytes() override {
+        std::lock_guard<std::mutex> lock(mutex);
+        std::size_t count = b_tr ? static_cast<std::size_t>(M) * P : 0;
+        for (const auto& [format, panel] : panels) {
+            count += panel.second;
+        }
+        return count * sizeof(T);
+    }
+
+private:
+    const int M, P;
+    std::mutex mutex;
+    std::unique_ptr<T[]> b_tr;
+    std::map<const dispatch::packing<T>*, std::pair<kernel::packed::buffer<T>, std::size_t>>
+        panels;
+};
+
+// 以 (地址, 所有者, 元素类型, 形状, 步长, 版本) 为键缓存普通数组 B 的打包结果, 总字节数超过
+// 上限时淘汰最久未使用的项. owner 是持有 B 缓冲区的对象, 它被回收时调用方须调用 release(),
+// 否则新数组复用同一地址时会取到旧的打包结果. 缓存无法感知原地修改, 修改后需调用
+// invalidate() 递增版本; 版本号随 owner 一起在 release() 中丢弃
+class lru_cache {
+public:
+    struct stats {
+        std::size_t hits, misses, entries, nbytes, capacity;
+    };
+
+    bool enabled() {
+        std::lock_guard<std::mutex> lock(mutex);
+        return capacity != 0;
+    }
+
+    // capacity 为 0 时禁用缓存
+    void set_capacity(std::size_t bytes) {
+        std::lock_guard<std::mutex> lock(mutex);
+        capacity = bytes;
+        evict();
+    }
+
+    // 返回 b 对应的缓存项, 未命中时插入一个空项; 缓存禁用或 owner 为空时返回空指针
+    template <typename T>
+    std::shared_ptr<operand<T>> acquire(const matrix_view<T>& b, const void* owner) {
+        std::lock_guard<std::mutex> lock(mutex);
+        if (capacity == 0 || !owner) {
+            return nullptr;
+        }
+        const auto k = key_of(b, owner);
+        if (auto it = index.find(k); it != index.end()) {
+            ++hits;
+            entries.splice(entries.begin(), entries, it->second);
+            return std::static_pointer_cast<operand<T>>(it->second->op);
+        }
+        ++misses;
+        auto op = std::make_shared<operand<T>>(b.rows, b.cols);
+        entries.push_front({k, op, 0});
+        index[k] = entries.begin();
+        return op;
+    }
+
+    // 缓存项在使用中生成了新的布局后, 更新其字节数并按需淘汰
+    template <typename T> void account(const matrix_view<T>& b, const void* owner) {
+        std::lock_guard<std::mutex> lock(mutex);
+        auto it = index.find(key_of(b, owner));
+        if (it == index.end()) {
+            return;
+        }
+        const std::size_t nbytes = it->second->op->nbytes();
+        used = used - it->second->nbytes + nbytes;
+        it->second->nbytes = nbytes;
+        evict();
+    }
+
+    // 丢弃 data 处数组的所有缓存项; owner 非空时递增 (owner, data) 的版本号
+    void invalidate(const void* data, const void* owner) {
+        std::lock_guard<std::mutex> lock(mutex);
+        if (owner) {
+            ++versions[{owner, data}];
+        }
+        for (auto it = entries.begin(); it != entries.end();) {
+            it = it->k.data == data ? erase(it) : std::next(it);
+        }
+    }
+
+    // owner 已被回收, 丢弃它的所有缓存项和版本号
+    void release(const void* owner) {
+        std::lock_guard<std::mutex> lock(mutex);
+        for (auto it = entries.begin(); it != entries.end();) {
+            it = it->k.owner == owner ? erase(it) : std::next(it);
+        }
+        auto it = versions.lower_bound({owner, nullptr});
+        while (it != versions.end() && it->first.first == owner) {
+            it = versions.erase(it);
+        }
+    }
+
+    void clear() {
+        std::lock_guard<std::mutex> lock(mutex);
+        entries.clear();
+        index.clear();
+        used = 0;
+    }
+
+    stats info() {
+        std::lock_guard<std::mutex> lock(mutex);
+        return {hits, misses, entries.size(), used, capacity};
+    }
+
+private:
+    struct key {
+        const void* data;
+        const void* owner;
+        std::type_index type;
+        int rows, cols;
+        std::ptrdiff_t rs, cs;
+        std::uint64_t version;
+
+        bool operator<(const key& o) const {
+            return std::tie(data, owner, type, rows, cols, rs, cs, version) <
+                   std::tie(o.data, o.owner, o.type, o.rows, o.cols, o.rs, o.cs, o.version);
+        }
+    };
+
+    struct entry {
+        key k;
+        std::shared_ptr<operand_base> op;
+        std::size_t nbytes;
+    };
+
+    template <typename T> key key_of(const matrix_view<T>& b, const void* owner) const {
+        auto it = versions.find({owner, b.data});
+        return {
+            b.data, owner, typeid(T), b.rows, b.cols, b.rs, b.cs,
+            it == versions.end() ? 0 : it->second};
+    }
+
+    std::list<entry>::iterator erase(std::list<entry>::iterator it) {
+        used -= it->nbytes;
+        index.erase(it->k);
+        return entries.erase(it);
+    }
+
+    void evict() {
+        while (used > capacity && !entries.empty()) {
+            erase(std::prev(entries.end()));
+        }
+        if (capacity == 0) {
+            entries.clear();
+            index.clear();
+            used = 0;
+        }
+    }
+
+    std::mutex mutex;
+    std::list<entry> entries;
+    std::map<key, std::list<entry>::iterator> index;
+    std::map<std::pair<const void*, const void*>, std::uint64_t> versions;
+    std::size_t capacity = 0, used = 0, hits = 0, misses = 0;
+};
+
+inline lru_cache& cache() {
+    static lru_cache c;
+    return c;
+}
+
+}  // namespace prepack
@@ -0,0 +1,220 @@
+#include "profile.hpp"
+
+#include "threading.hpp"
+
+#include <algorithm>
+#include <cerrno>
+#include <chrono>
+#include <cstdint>
+#include <cstring>
+#include <mutex>
+#include <stdexcept>
+
+#if defined(__linux__)
+#include <linux/perf_event.h>
+#include <sys/ioctl.h>
+#include <sys/syscall.h>
+#include <unistd.h>
+#endif
+
+namespace profile {
+
+namespace {
+
+struct event {
+    const char* name;
+    std::uint32_t type;
+    std::uint64_t config;
+};
+
+// 事件的 type 与 config; 其他平台上只保留名称, measure 直接报错
+#if defined(__linux__)
+#define HARDWARE(config) PERF_TYPE_HARDWARE, PERF_COUNT_HW_##config
+#define SOFTWARE(config) PERF_TYPE_SOFTWARE, PERF_COUNT_SW_##config
+#define CACHE(cache, result)                                                                   \
+    PERF_TYPE_HW_CACHE, PERF_COUNT_HW_CACHE_##cache | (PERF_COUNT_HW_CACHE_OP_READ << 8) |     \
+                            (PERF_COUNT_HW_CACHE_RESULT_##result << 16)
+#else
+#define HARDWARE(config) 0, 0
+#define SOFTWARE(config) 0, 0
+#define CACHE(cache, result) 0, 0
+#endif
+
+const std::vector<event>& events() {
+    static const std::vector<event> table{
+        {"cycles", HARDWARE(CPU_CYCLES)},
+        {"instructions", HARDWARE(INSTRUCTIONS)},
+        {"branches", HARDWARE(BRANCH_INSTRUCTIONS)},
+        {"branch-misses", HARDWARE(BRANCH_MISSES)},
+        {"cache-references", HARDWARE(CACHE_REFERENCES)},
+        {"cache-misses", HARDWARE(CACHE_MISSES)},
+        {"l1d-loads", CACHE(L1D, ACCESS)},
+        {"l1d-misses", CACHE(L1D, MISS)},
+        {"llc-loads", CACHE(LL, ACCESS)},
+        {"llc-misses", CACHE(LL, MISS)},
+        {"dtlb-loads", CACHE(DTLB, ACCESS)},
+        {"dtlb-misses", CACHE(DTLB, MISS)},
+        {"task-clock", SOFTWARE(TASK_CLOCK)},
+        {"page-faults", SOFTWARE(PAGE_FAULTS)},
+        {"context-switches", SOFTWARE(CONTEXT_SWITCHES)},
+        {"cpu-migrations", SOFTWARE(CPU_MIGRATIONS)},
+    };
+    return table;
+}
+
+#undef HARDWARE
+#undef SOFTWARE
+#undef CACHE
+
+#if defined(__linux__)
+// 为调用线程打开一个计数器 (只统计用户态, 初始为停止状态), 失败时返回 -1 并保留 errno
+int open_counter(const event& e) {
+    perf_event_attr attr;
+    std::memset(&attr, 0, sizeof(attr));
+    attr.size = sizeof(attr);
+    attr.type = e.type;
+    attr.config = e.config;
+    attr.disabled = 1;
+    attr.exclude_kernel = 1;
+    attr.exclude_hv = 1;
+    attr.read_format = PERF_FORMAT_TOTAL_TIME_ENABLED | PERF_FORMAT_TOTAL_TIME_RUNNING;
+    return static_cast<int>(syscall(SYS_perf_event_open, &attr, 0, -1, -1, 0));
+}
+
+std::optional<double> read_counter(int fd) {
+    std::uint64_t values[3] = {};
+    if (fd < 0 || ::read(fd, values, sizeof(values)) != sizeof(values)) {
+        return std::nullopt;
+    }
+    // 线程在计数期间没有运行时计数为 0; 运行了却从未分到计数器时无法估计
+    if (values[1] == 0) {
+        return 0.0;
+    }
+    if (values[2] == 0) {
+        return std::nullopt;
+    }
+    return static_cast<double>(values[0]) * values[1] / values[2];
+}
+#endif
+
+const event& find(const std::string& name) {
+    for (const auto& e : events()) {
+        if (name == e.name) {
+            return e;
+        }
+    }
+    std::string known;
+    for (const auto& e : events()) {
+        known += (known.empty() ? "" : ", ") + std::string(e.name);
+    }
+    throw std::invalid_argument("Unknown event: " + name + " (available: " + known + ")");
+}
+
+}  // namespace
+
+const std::vector<std::string>& event_names() {
+    static const std::vector<std::string> names = [] {
+        std::vector<std::string> v;
+        for (const auto& e : events()) {
+            v.emplace_back(e.name);
+        }
+        return v;
+    }();
+    return names;
+}
+
+const std::vector<std::string>& default_events() {
+    static const std::vector<std::string> names{
+        "cycles", "instructions", "l1d-misses", "llc-misses", "dtlb-misses"};
+    return names;
+}
+
+std::optional<double> report::total(std::size_t event) const {
+    std::optional<double> sum;
+    for (const auto& t : threads) {
+        if (t.values[event]) {
+            sum = sum.value_or(0) + *t.values[event];
+        }
+    }
+    return sum;
+}
+
+report measure(
+    const std::vector<std::string>& names, int n_threads, const std::function<void()>& run) {
+    std::vector<const event*> selected;
+    for (const auto& name : names) {
+        selected.push_back(&find(name));
+    }
+#if defined(__linux__)
+    n_threads = std::max(n_threads, 1);
+    // 每个线程为自己打开计数器: 计数器跟随线程而不是 CPU, 线程池中的线程是常驻的,
+    // 之后同样多线程的并行区域复用这些线程, 因而内核在这些线程上的执行都被计入
+    std::vector<long> tids(n_threads, -1);
+    std::vector<std::vector<int>> fds(n_threads, std::vector<int>(selected.size(), -1));
+    std::vector<int> errors(selected.size(), 0);
+    std::mutex error_mutex;
+    threading::parallel(n_threads, [&] {
+        const int t = threading::thread_num();
+        tids[t] = static_cast<long>(syscall(SYS_gettid));
+        for (std::size_t e = 0; e < selected.size(); ++e) {
+            fds[t][e] = open_counter(*selected[e]);
+            if (fds[t][e] < 0) {
+                std::lock_guard lock(error_mutex);
+                errors[e] = errno;
+            }
+        }
+    });
+    auto for_each_fd = [&](auto&& f) {
+        for (auto& row : fds) {
+            for (int fd : row) {
+                if (fd >= 0) {
+                    f(fd);
+                }
+            }
+        }
+    };
+    const bool any = std::any_of(fds.begin(), fds.end(), [](const std::vector<int>& row) {
+        return std::any_of(row.begin(), row.end(), [](int fd) { return fd >= 0; });
+    });
+    if (!any && !selected.empty()) {
+        const int error = *std::max_element(errors.begin(), errors.end());
+        throw std::runtime_error(
+            std::string("perf_event_open failed: ") + std::strerror(error) +
+            " (check /proc/sys/kernel/perf_event_paranoid)");
+    }
+
+    report r;
+    r.events = names;
+    for_each_fd([](int fd) { ioctl(fd, PERF_EVENT_IOC_RESET, 0); });
+    for_each_fd([](int fd) { ioctl(fd, PERF_EVENT_IOC_ENABLE, 0); });
+    const auto start = std::chrono::steady_clock::now();
+    try {
+        run();
+    } catch (...) {
+        for_each_fd([](int fd) { close(fd); });
+        throw;
+    }
+    r.seconds = std::chrono::duration<double>(std::chrono::steady_clock::now() - start).count();
+    for_each_fd([](int fd) { ioctl(fd, PERF_EVENT_IOC_DISABLE, 0); });
+
+    for (int t = 0; t < n_threads; ++t) {
+        thread_counts counts{tids[t], {}};
+        for (int fd : fds[t]) {
+            counts.values.push_back(read_counter(fd));
+        }
+        r.threads.push_back(std::move(counts));
+    }
+    for_each_fd([](int fd) { close(fd); });
+    for (std::size_t e = 0; e < selected.size(); ++e) {
+        if (!r.total(e)) {
+            r.unavailable.push_back(names[e]);
+        }
+    }
+    return r;
+#else
+    (void)n_threads, (void)run;
+    throw std::runtime_error("profile requires Linux perf_event_open");
+#endif
+}
+
+}  // namespace profile
@@ -0,0 +1,42 @@
+#pragma once
+
+#include <functional>
+#include <optional>
+#include <string>
+#include <vector>
+
+// 硬件性能计数器: 用 Linux perf_event_open 统计一次内核调用中各线程的周期数, 指令数,
+// 缓存与 TLB 缺失等. 与指令集无关, 实现在 profile.cpp 中以基础指令集编译
+namespace profile {
+
+// 支持的事件名称, 如 "cycles", "instructions", "l1d-misses", "llc-misses", "dtlb-misses"
+const std::vector<std::string>& event_names();
+
+// 未指定事件时统计的事件
+const std::vector<std::string>& default_events();
+
+// 一个线程的计数, 与 report::events 一一对应; 无法在该线程上计数的事件为 nullopt.
+// 计数器被复用 (多路复用) 时按启用时间与运行时间之比放大
+struct thread_counts {
+    long tid;
+    std::vector<std::optional<double>> values;
+};
+
+struct report {
+    std::vector<std::string> events;
+    // 当前主机或权限下无法打开的事件 (如虚拟机中没有硬件计数器)
+    std::vector<std::string> unavailable;
+    std::vector<thread_counts> threads;
+    double seconds;
+
+    // 各线程之和; 没有任何线程能统计的事件为 nullopt
+    std::optional<double> total(std::size_t event) const;
+};
+
+// 在线程池的 n_threads 个线程 (内核并行区域复用的线程) 上为 events 打开计数器, 只在 run
+// 运行期间计数. 未知事件抛出 std::invalid_argument; 所有事件都无法打开或平台不支持
+// perf_event_open 时抛出 std::runtime_error
+report measure(
+    const std::vector<std::string>& events, int n_threads, const std::function<void()>& run);
+
+}  // namespace profile
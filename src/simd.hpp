@@ -10,161 +10,245 @@
 #define __arm_streaming
 #endif
 
-#include "typedef.h"
-
+#include "epilogue.hpp"
+#include "phases.hpp"
+#include "skinny.hpp"
+#include "target.hpp"
+#include "threading.hpp"
+#include "tuning.hpp"
+
+#include <cstddef>
+#include <cstdint>
+#include <cstring>
 #include <memory>
+#include <type_traits>
 
 namespace kernel {
 
-T* transpose(const T* b, int M, int P);
+inline namespace MATMUL_ISA {
 
-inline void auto_simd(const T* a, const T* b, T* c, int N, int M, int P) {
-    memset(c, 0, N * P * sizeof(T));
-    std::unique_ptr<T[]> b_tr(transpose(b, M, P));
-    for (int i = 0; i < N; ++i) {
+// B 的行/列步长 (以元素为单位) 任意, 结果为 P x M 的行主序矩阵
+template <typename T>
+inline T* transpose(const T* b, std::ptrdiff_t rsb, std::ptrdiff_t csb, int M, int P) {
+    phases::scope timing(phases::phase::transpose);
+    T* b_tr = new T[M * P];
+    for (int i = 0; i < M; ++i) {
         for (int j = 0; j < P; ++j) {
-            T sum = 0;
-#pragma omp simd
-            for (int k = 0; k < M; ++k) {
-                sum += a[i * M + k] * b_tr[j * M + k];
-            }
-            c[i * P + j] = sum;
+            b_tr[j * M + i] = b[i * rsb + j * csb];
         }
     }
+    return b_tr;
 }
 
-inline void multithread_simd(const T* a, const T* b, T* c, int N, int M, int P) {
-    memset(c, 0, N * P * sizeof(T));
-    std::unique_ptr<T[]> b_tr(transpose(b, M, P));
-#pragma omp parallel for
+template <typename T>
+inline T* transpose(const T* b, int M, int P) {
+    return transpose(b, P, 1, M, P);
+}
+
+// 只有一列的 B (M x 1) 与其转置 (1 x M) 的存储相同, 无需复制
+template <typename T>
+inline std::unique_ptr<T[]> transpose_of(const T* b, int M, int P) {
+    return std::unique_ptr<T[]>(P == 1 ? nullptr : transpose(b, M, P));
+}
+
+// *_bt 版本直接接收 B 的转置 b_tr (P x M, 行主序), 例如 Fortran 序的 B
+template <typename T>
+inline void auto_simd_bt(
+    const T* a, const T* b_tr, T* c, int N, int M, int P, const epilogue<T>& ep) {
     for (int i = 0; i < N; ++i) {
         for (int j = 0; j < P; ++j) {
             T sum = 0;
-#pragma omp simd
+#pragma omp simd reduction(+ : sum)
             for (int k = 0; k < M; ++k) {
                 sum += a[i * M + k] * b_tr[j * M + k];
             }
-            c[i * P + j] = sum;
+            ep.store(&c[i * P + j], sum);
         }
     }
 }
 
-inline void simd(const T* a, const T* b, T* c, int N, int M, int P) {
-    memset(c, 0, N * P * sizeof(T));
-    std::unique_ptr<T[]> b_tr(transpose(b, M, P));
-#if defined(__ARM_NEON) || defined(__ARM_NEON__)
-    const int simd_width = 4;
+template <typename T>
+inline void auto_simd(const T* a, const T* b, T* c, int N, int M, int P, const epilogue<T>& ep) {
+    auto b_tr = transpose_of(b, M, P);
+    auto_simd_bt(a, b_tr ? b_tr.get() : b, c, N, M, P, ep);
+}
 
-    for (int i = 0; i < N; ++i) {
-        for (int j = 0; j < P; ++j) {
-            int32x4_t sum_vec = vdupq_n_s32(0);
-            int k = 0;
-
-            // 处理完整的SIMD向量
-            for (; k <= M - simd_width; k += simd_width) {
-                int32x4_t a_vec = vld1q_s32(&a[i * M + k]);
-                int32x4_t b_vec = vld1q_s32(&b_tr[j * M + k]);
-                sum_vec = vmlaq_s32(sum_vec, a_vec, b_vec);
+template <typename T>
+inline void multithread_simd_bt(
+    const T* a, const T* b_tr, T* c, int N, int M, int P, const epilogue<T>& ep) {
+    if (skinny::applies(N, M, P)) {
+        return skinny::gemm(N, M, P, a, M, 1, b_tr, 1, M, c, P, ep, true);
+    }
+    // 每个元素独立计算, C 按二维 tile 分配给线程
+    threading::for_each_tile(N, M, P, [&](const threading::grid::range& r) {
+        for (int i = r.i0; i < r.i1; ++i) {
+            for (int j = r.j0; j < r.j1; ++j) {
+                T sum = 0;
+#pragma omp simd reduction(+ : sum)
+                for (int k = 0; k < M; ++k) {
+                    sum += a[i * M + k] * b_tr[j * M + k];
+                }
+                ep.store(&c[i * P + j], sum);
             }
+        }
+    }, 1);
+}
 
-            // 水平求和
-            T sum = vaddvq_s32(sum_vec);
+template <typename T>
+inline void multithread_simd(
+    const T* a, const T* b, T* c, int N, int M, int P, const epilogue<T>& ep) {
+    if (skinny::applies(N, M, P)) {
+        return skinny::gemm(N, M, P, a, M, 1, b, P, 1, c, P, ep, true);
+    }
+    std::unique_ptr<T[]> b_tr(transpose(b, M, P));
+    multithread_simd_bt(a, b_tr.get(), c, N, M, P, ep);
+}
 
-            // 处理剩余的标量元素
-            for (; k < M; ++k) {
-                sum += a[i * M + k] * b_tr[j * M + k];
+template <typename T>
+inline void simd_bt(const T* a, const T* b_tr, T* c, int N, int M, int P, const epilogue<T>& ep) {
+#if defined(__ARM_NEON) || defined(__ARM_NEON__)
+    // NEON 版本只实现了 int32
+    if constexpr (std::is_same_v<T, std::int32_t>) {
+        const int simd_width = 4;
+
+        for (int i = 0; i < N; ++i) {
+            for (int j = 0; j < P; ++j) {
+                int32x4_t sum_vec = vdupq_n_s32(0);
+                int k = 0;
+
+                // 处理完整的SIMD向量
+                for (; k <= M - simd_width; k += simd_width) {
+                    int32x4_t a_vec = vld1q_s32(&a[i * M + k]);
+                    int32x4_t b_vec = vld1q_s32(&b_tr[j * M + k]);
+                    sum_vec = vmlaq_s32(sum_vec, a_vec, b_vec);
+                }
+
+                // 水平求和
+                T sum = vaddvq_s32(sum_vec);
+
+                // 处理剩余的标量元素
+                for (; k < M; ++k) {
+                    sum += a[i * M + k] * b_tr[j * M + k];
+                }
+
+                ep.store(&c[i * P + j], sum);
             }
-
-            c[i * P + j] = sum;
         }
+        return;
     }
-#else
-    return auto_simd(a, b, c, N, M, P);
 #endif
+    return auto_simd_bt(a, b_tr, c, N, M, P, ep);
+}
+
+template <typename T>
+inline void simd(const T* a, const T* b, T* c, int N, int M, int P, const epilogue<T>& ep) {
+    auto b_tr = transpose_of(b, M, P);
+    simd_bt(a, b_tr ? b_tr.get() : b, c, N, M, P, ep);
 }
 
-inline void simd_arm_sme(const T* a, const T* b, T* c, int N, int M, int P) {
-    auto_simd(a, b, c, N, M, P);
+template <typename T>
+inline void simd_arm_sme(const T* a, const T* b, T* c, int N, int M, int P, const epilogue<T>& ep) {
+    auto_simd(a, b, c, N, M, P, ep);
 }
 
-inline void simd_optimized(const T* a, const T* b, T* c, int N, int M, int P) {
-    if (N < 64 || M < 64 || P < 64) {
-        return simd(a, b, c, N, M, P);
+template <typename T>
+inline void simd_optimized_bt(
+    const T* a, const T* b_tr, T* c, int N, int M, int P, const epilogue<T>& ep) {
+    // 任一维度小于阈值时展开与预取得不偿失, 阈值可由调优器按调用覆盖
+    const int threshold = tuning::block(64);
+    if (skinny::applies(N, M, P)) {
+        return skinny::gemm(N, M, P, a, M, 1, b_tr, 1, M, c, P, ep, false);
+    }
+    if (N < threshold || M < threshold || P < threshold) {
+        return simd_bt(a, b_tr, c, N, M, P, ep);
     }
-    memset(c, 0, N * P * sizeof(T));
-    std::unique_ptr<T[]> b_tr(transpose(b, M, P));
 #if defined(__ARM_NEON) || defined(__ARM_NEON__)
-    const int simd_width = 4;
-    const int unroll_factor = 8;
-
-#define SIMD_LOAD_AND_MULTIPLY(idx)                                                  \
-    do {                                                                             \
-        int32x4_t a_vec##idx = vld1q_s32(&a[i * M + k + simd_width * (idx - 1)]);    \
-        int32x4_t b_vec##idx = vld1q_s32(&b_tr[j * M + k + simd_width * (idx - 1)]); \
-        sum_vec##idx = vmlaq_s32(sum_vec##idx, a_vec##idx, b_vec##idx);              \
-    } while (0)
+    // NEON 版本只实现了 int32
+    if constexpr (std::is_same_v<T, std::int32_t>) {
+        const int simd_width = 4;
+        const int unroll_factor = 8;
+
+#define SIMD_LOAD_AND_MULTIPLY(idx)                                                      \
+        do {                                                                             \
+            int32x4_t a_vec##idx = vld1q_s32(&a[i * M + k + simd_width * (idx - 1)]);    \
+            int32x4_t b_vec##idx = vld1q_s32(&b_tr[j * M + k + simd_width * (idx - 1)]); \
+            sum_vec##idx = vmlaq_s32(sum_vec##idx, a_vec##idx, b_vec##idx);              \
+        } while (0)
 
 #define DECLARE_SUM_VEC(idx) int32x4_t sum_vec##idx = vdupq_n_s32(0)
 
-    for (int i = 0; i < N; ++i) {
-        for (int j = 0; j < P; ++j) {
-            // 声明8个累加器
-            DECLARE_SUM_VEC(1);
-            DECLARE_SUM_VEC(2);
-            DECLARE_SUM_VEC(3);
-            DECLARE_SUM_VEC(4);
-            DECLARE_SUM_VEC(5);
-            DECLARE_SUM_VEC(6);
-            DECLARE_SUM_VEC(7);
-            DECLARE_SUM_VEC(8);
-            int k = 0;
-
-            // 循环展开：每次处理8个SIMD向量
-            for (; k <= M - simd_width * unroll_factor; k += simd_width * unroll_factor) {
-                SIMD_LOAD_AND_MULTIPLY(1);
-                SIMD_LOAD_AND_MULTIPLY(2);
-                SIMD_LOAD_AND_MULTIPLY(3);
-                SIMD_LOAD_AND_MULTIPLY(4);
-                SIMD_LOAD_AND_MULTIPLY(5);
-                SIMD_LOAD_AND_MULTIPLY(6);
-                SIMD_LOAD_AND_MULTIPLY(7);
-                SIMD_LOAD_AND_MULTIPLY(8);
-            }
-
-            // 合并累加器：分层合并减少延迟
-            sum_vec1 = vaddq_s32(sum_vec1, sum_vec2);
-            sum_vec3 = vaddq_s32(sum_vec3, sum_vec4);
-            sum_vec5 = vaddq_s32(sum_vec5, sum_vec6);
-            sum_vec7 = vaddq_s32(sum_vec7, sum_vec8);
-
-            sum_vec1 = vaddq_s32(sum_vec1, sum_vec3);
-            sum_vec5 = vaddq_s32(sum_vec5, sum_vec7);
-
-            sum_vec1 = vaddq_s32(sum_vec1, sum_vec5);
-
-            // 处理剩余的完整SIMD向量
-            for (; k <= M - simd_width; k += simd_width) {
-                int32x4_t a_vec = vld1q_s32(&a[i * M + k]);
-                int32x4_t b_vec = vld1q_s32(&b_tr[j * M + k]);
-                sum_vec1 = vmlaq_s32(sum_vec1, a_vec, b_vec);
+        for (int i = 0; i < N; ++i) {
+            for (int j = 0; j < P; ++j) {
+                // 声明8个累加器
+                DECLARE_SUM_VEC(1);
+                DECLARE_SUM_VEC(2);
+                DECLARE_SUM_VEC(3);
+                DECLARE_SUM_VEC(4);
+                DECLARE_SUM_VEC(5);
+                DECLARE_SUM_VEC(6);
+                DECLARE_SUM_VEC(7);
+                DECLARE_SUM_VEC(8);
+                int k = 0;
+
+                // 循环展开：每次处理8个SIMD向量
+                for (; k <= M - simd_width * unroll_factor; k += simd_width * unroll_factor) {
+                    SIMD_LOAD_AND_MULTIPLY(1);
+                    SIMD_LOAD_AND_MULTIPLY(2);
+                    SIMD_LOAD_AND_MULTIPLY(3);
+                    SIMD_LOAD_AND_MULTIPLY(4);
+                    SIMD_LOAD_AND_MULTIPLY(5);
+                    SIMD_LOAD_AND_MULTIPLY(6);
+                    SIMD_LOAD_AND_MULTIPLY(7);
+                    SIMD_LOAD_AND_MULTIPLY(8);
+                }
+
+                // 合并累加器：分层合并减少延迟
+                sum_vec1 = vaddq_s32(sum_vec1, sum_vec2);
+                sum_vec3 = vaddq_s32(sum_vec3, sum_vec4);
+                sum_vec5 = vaddq_s32(sum_vec5, sum_vec6);
+                sum_vec7 = vaddq_s32(sum_vec7, sum_vec8);
+
+                sum_vec1 = vaddq_s32(sum_vec1, sum_vec3);
+                sum_vec5 = vaddq_s32(sum_vec5, sum_vec7);
+
+                sum_vec1 = vaddq_s32(sum_vec1, sum_vec5);
+
+                // 处理剩余的完整SIMD向量
+                for (; k <= M - simd_width; k += simd_width) {
+                    int32x4_t a_vec = vld1q_s32(&a[i * M + k]);
+                    int32x4_t b_vec = vld1q_s32(&b_tr[j * M + k]);
+                    sum_vec1 = vmlaq_s32(sum_vec1, a_vec, b_vec);
+                }
+
+                T sum = vaddvq_s32(sum_vec1);
+
+                // 处理剩余的标量元素
+                for (; k < M; ++k) {
+                    sum += a[i * M + k] * b_tr[j * M + k];
+                }
+
+                ep.store(&c[i * P + j], sum);
             }
-
-            T sum = vaddvq_s32(sum_vec1);
-
-            // 处理剩余的标量元素
-            for (; k < M; ++k) {
-                sum += a[i * M + k] * b_tr[j * M + k];
-            }
-
-            c[i * P + j] = sum;
         }
-    }
 
 #undef SIMD_LOAD_AND_MULTIPLY
 #undef DECLARE_SUM_VEC
-#else
-    return auto_simd(a, b, c, N, M, P);
+        return;
+    }
 #endif
+    return auto_simd_bt(a, b_tr, c, N, M, P, ep);
+}
+
+template <typename T>
+inline void simd_optimized(
+    const T* a, const T* b, T* c, int N, int M, int P, const epilogue<T>& ep) {
+    if (skinny::applies(N, M, P)) {
+        return skinny::gemm(N, M, P, a, M, 1, b, P, 1, c, P, ep, false);
+    }
+    std::unique_ptr<T[]> b_tr(transpose(b, M, P));
+    simd_optimized_bt(a, b_tr.get(), c, N, M, P, ep);
 }
 
+}  // namespace MATMUL_ISA
+
 }  // namespace kernel
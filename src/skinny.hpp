@@ -0,0 +1,234 @@
+#pragma once
+
+#include "epilogue.hpp"
+#include "target.hpp"
+#include "threading.hpp"
+
+#include <algorithm>
+#include <cstddef>
+#include <vector>
+
+namespace kernel {
+
+inline namespace MATMUL_ISA {
+
+// 窄矩阵乘法: C 只有几列 (GEMV, P <= WIDTH) 或只有几行 (向量乘矩阵, N <= WIDTH).
+// 这时乘法受内存带宽限制, 打包 B 的开销无法摊销. 这里的内核只读一遍 A 与 B,
+// 沿长的维度划分给线程, 长维度不足时再沿 M 切分, 只使用栈上的缓冲区
+namespace skinny {
+
+constexpr int WIDTH = 8;
+// 一次处理的 M 的长度
+constexpr int KB = 256;
+// narrow 中每个任务的行数
+constexpr int RB = 64;
+// wide 中每个任务的最大列数
+constexpr int SEG = 512;
+
+inline bool applies(int N, int M, int P) {
+    return M > 0 && N > 0 && P > 0 && (N <= WIDTH || P <= WIDTH);
+}
+
+// 按 LANES 路分别累加, 使相邻的乘加互不依赖
+template <typename T> inline T dot(int n, const T* x, const T* y) {
+    constexpr int LANES = 64 / sizeof(T) * 2;
+    T part[LANES] = {};
+    int k = 0;
+    for (; k + LANES <= n; k += LANES) {
+#pragma omp simd
+        for (int l = 0; l < LANES; ++l) {
+            part[l] += x[k + l] * y[k + l];
+        }
+    }
+    T sum = 0;
+    for (; k < n; ++k) {
+        sum += x[k] * y[k];
+    }
+#pragma omp simd reduction(+ : sum)
+    for (int l = 0; l < LANES; ++l) {
+        sum += part[l];
+    }
+    return sum;
+}
+
+template <typename T> inline void axpy(int n, T alpha, const T* x, T* y) {
+#pragma omp simd
+    for (int j = 0; j < n; ++j) {
+        y[j] += alpha * x[j];
+    }
+}
+
+// tasks 个任务不足以分给所有线程时, M 切分的段数与每段的长度 (KB 的倍数)
+struct split {
+    int count, depth;
+};
+
+inline split split_of(int tasks, int n_threads, int M) {
+    int count = 1;
+    if (tasks < n_threads) {
+        count = std::max(1, std::min((n_threads + tasks - 1) / tasks, M / (4 * KB)));
+    }
+    const int depth = ((M + count - 1) / count + KB - 1) / KB * KB;
+    return {(M + depth - 1) / depth, depth};
+}
+
+// 各段的部分和 partial[s][i][j] 按段的顺序相加后写回 C
+template <typename T>
+inline void reduce(
+    const std::vector<T>& partial, int splits, int N, int P, T* c, std::ptrdiff_t ldc,
+    const epilogue<T>& ep) {
+    const std::size_t plane = static_cast<std::size_t>(N) * P;
+    for (int i = 0; i < N; ++i) {
+        for (int j = 0; j < P; ++j) {
+            T sum = 0;
+            for (int s = 0; s < splits; ++s) {
+                sum += partial[s * plane + static_cast<std::size_t>(i) * P + j];
+            }
+            ep.store(&c[i * ldc + j], sum);
+        }
+        ep.finish(c + i * ldc, 1, P);
+    }
+}
+
+// P <= WIDTH: 每行 A 与 B 的 P 列各做一次点积. 任务为 (RB 行, 一段 M);
+// B 按行存储时把当前 KB 行转置到栈上, 使各列连续
+template <typename T>
+inline void narrow(
+    int N, int M, int P, const T* a, std::ptrdiff_t rsa, std::ptrdiff_t csa, const T* b,
+    std::ptrdiff_t rsb, std::ptrdiff_t csb, T* c, std::ptrdiff_t ldc, const epilogue<T>& ep,
+    int n_threads) {
+    const int row_blocks = (N + RB - 1) / RB;
+    const auto sp = split_of(row_blocks, n_threads, M);
+    std::vector<T> partial(sp.count > 1 ? static_cast<std::size_t>(sp.count) * N * P : 0);
+    threading::parallel(n_threads, [&] {
+        threading::pin();
+        threading::for_each(row_blocks * sp.count, [&](int task) {
+            const int rb = task / sp.count, s = task % sp.count;
+            const int i0 = rb * RB, rows = std::min(RB, N - i0);
+            const int k_begin = s * sp.depth, k_end = std::min(M, k_begin + sp.depth);
+            T acc[RB][WIDTH] = {};
+            T bt[WIDTH * KB];
+            T row[KB];
+            const T* cols[WIDTH];
+            for (int k0 = k_begin; k0 < k_end; k0 += KB) {
+                const int kc = std::min(KB, k_end - k0);
+                for (int j = 0; j < P; ++j) {
+                    cols[j] = b + k0 * rsb + j * csb;
+                }
+                if (rsb != 1) {
+                    for (int k = 0; k < kc; ++k) {
+                        for (int j = 0; j < P; ++j) {
+                            bt[j * KB + k] = cols[j][k * rsb];
+                        }
+                    }
+                    for (int j = 0; j < P; ++j) {
+                        cols[j] = bt + j * KB;
+                    }
+                }
+                for (int r = 0; r < rows; ++r) {
+                    const T* x = a + (i0 + r) * rsa + k0 * csa;
+                    if (csa != 1) {
+                        for (int k = 0; k < kc; ++k) {
+                            row[k] = x[k * csa];
+                        }
+                        x = row;
+                    }
+                    for (int j = 0; j < P; ++j) {
+                        acc[r][j] += dot(kc, x, cols[j]);
+                    }
+                }
+            }
+            for (int r = 0; r < rows; ++r) {
+                for (int j = 0; j < P; ++j) {
+                    if (sp.count == 1) {
+                        ep.store(&c[(i0 + r) * ldc + j], acc[r][j]);
+                    } else {
+                        partial[(static_cast<std::size_t>(s) * N + i0 + r) * P + j] = acc[r][j];
+                    }
+                }
+            }
+            if (sp.count == 1) {
+                ep.finish(c + i0 * ldc, rows, P);
+            }
+        });
+    });
+    if (sp.count > 1) {
+        reduce(partial, sp.count, N, P, c, ldc, ep);
+    }
+}
+
+// N <= WIDTH: B 的每一行乘以 A 的 N 个元素累加到 C 的 N 行 (axpy). 任务为 (一段列, 一段 M);
+// B 的行不连续时把当前段复制到栈上
+template <typename T>
+inline void wide(
+    int N, int M, int P, const T* a, std::ptrdiff_t rsa, std::ptrdiff_t csa, const T* b,
+    std::ptrdiff_t rsb, std::ptrdiff_t csb, T* c, std::ptrdiff_t ldc, const epilogue<T>& ep,
+    int n_threads) {
+    // 每个线程至少分到几段, 段宽为 16 的倍数
+    const int seg = std::clamp(((P + 4 * n_threads - 1) / (4 * n_threads) + 15) / 16 * 16, 64, SEG);
+    const int segments = (P + seg - 1) / seg;
+    const auto sp = split_of(segments, n_threads, M);
+    std::vector<T> partial(sp.count > 1 ? static_cast<std::size_t>(sp.count) * N * P : 0);
+    threading::parallel(n_threads, [&] {
+        threading::pin();
+        threading::for_each(segments * sp.count, [&](int task) {
+            const int sg = task / sp.count, s = task % sp.count;
+            const int j0 = sg * seg, width = std::min(seg, P - j0);
+            const int k_begin = s * sp.depth, k_end = std::min(M, k_begin + sp.depth);
+            T acc[WIDTH][SEG];
+            T row[SEG];
+            for (int i = 0; i < N; ++i) {
+                std::fill(acc[i], acc[i] + width, T(0));
+            }
+            for (int k = k_begin; k < k_end; ++k) {
+                const T* y = b + k * rsb + j0 * csb;
+                if (csb != 1) {
+                    for (int j = 0; j < width; ++j) {
+                        row[j] = y[j * csb];
+                    }
+                    y = row;
+                }
+                for (int i = 0; i < N; ++i) {
+                    axpy(width, a[i * rsa + k * csa], y, acc[i]);
+                }
+            }
+            for (int i = 0; i < N; ++i) {
+                for (int j = 0; j < width; ++j) {
+                    if (sp.count == 1) {
+                        ep.store(&c[i * ldc + j0 + j], acc[i][j]);
+                    } else {
+                        partial[(static_cast<std::size_t>(s) * N + i) * P + j0 + j] = acc[i][j];
+                    }
+                }
+            }
+            if (sp.count == 1) {
+                ep.finish(c + j0, N, width);
+            }
+        });
+    });
+    if (sp.count > 1) {
+        reduce(partial, sp.count, N, P, c, ldc, ep);
+    }
+}
+
+// C[N x P] = A @ B, 需满足 applies(N, M, P). A, B 的步长任意, C 行主序, 行距 ldc.
+// parallel 为 false 时单线程运行
+template <typename T>
+inline void gemm(
+    int N, int M, int P, const T* a, std::ptrdiff_t rsa, std::ptrdiff_t csa, const T* b,
+    std::ptrdiff_t rsb, std::ptrdiff_t csb, T* c, std::ptrdiff_t ldc, const epilogue<T>& ep,
+    bool parallel) {
+    const int n_threads =
+        parallel ? threading::threads_for(std::int64_t(N) * M * P, threading::count()) : 1;
+    if (P <= WIDTH) {
+        narrow(N, M, P, a, rsa, csa, b, rsb, csb, c, ldc, ep, n_threads);
+    } else {
+        wide(N, M, P, a, rsa, csa, b, rsb, csb, c, ldc, ep, n_threads);
+    }
+}
+
+}  // namespace skinny
+
+}  // namespace MATMUL_ISA
+
+}  // namespace kernel
@@ -0,0 +1,134 @@
+#pragma once
+
+#include "epilogue.hpp"
+#include "target.hpp"
+#include "threading.hpp"
+
+#include <algorithm>
+#include <cstddef>
+#include <cstdint>
+#include <memory>
+#include <vector>
+
+namespace kernel {
+
+inline namespace MATMUL_ISA {
+
+// 稀疏 x 稠密乘法. 非零元逐个展开为沿稠密维度的向量乘加 (axpy), 只做 nnz x P 次乘法
+namespace sparse {
+
+// y[0, n) += x * src[j * stride]; 连续时向量化
+template <typename T>
+inline void axpy(int n, T x, const T* src, std::ptrdiff_t stride, T* y) {
+    if (stride == 1) {
+#pragma omp simd
+        for (int j = 0; j < n; ++j) {
+            y[j] += x * src[j];
+        }
+        return;
+    }
+    for (int j = 0; j < n; ++j) {
+        y[j] += x * src[j * stride];
+    }
+}
+
+// C 的一行中一次处理的列数, 使这一段 C 在累加所有非零元期间留在 L1 中
+template <typename T> constexpr int row_block = 4096 / sizeof(T);
+
+// 把 [0, N) 行分成 parts 段, 使各段的 (非零元个数 + 行数) 大致相同. 每行另计 1
+// 是为了计入初始化并写回 C 的开销, 空行多的矩阵也能均匀划分
+template <typename I> std::vector<int> balance(int N, const I* indptr, int parts) {
+    auto weight = [&](int r) { return static_cast<double>(indptr[r] - indptr[0]) + r; };
+    const double total = weight(N);
+    std::vector<int> bounds(parts + 1, N);
+    bounds[0] = 0;
+    int r = 0;
+    for (int t = 1; t < parts; ++t) {
+        const double target = total * t / parts;
+        while (r < N && weight(r) < target) {
+            ++r;
+        }
+        bounds[t] = r;
+    }
+    return bounds;
+}
+
+// C[N x P] = A @ B, A 为 CSR (indptr 长 N + 1, 第 i 行的非零元为 indices/values 的
+// [indptr[i], indptr[i + 1]) 段), B 步长任意, C 行主序, 行距 ldc.
+// 各行按 row_block 列分段, 同一段 B 的各行在相邻行之间复用
+template <typename T, typename I>
+void csr_dense(
+    int N, int M, int P, const I* indptr, const I* indices, const T* values, const T* b,
+    std::ptrdiff_t rsb, std::ptrdiff_t csb, T* c, std::ptrdiff_t ldc, const epilogue<T>& ep) {
+    const std::int64_t nnz = indptr[N] - indptr[0];
+    const int n_threads = threading::threads_for((nnz + N) * P, threading::count());
+    const int parts = n_threads > 1 ? 4 * n_threads : 1;
+    const auto bounds = balance(N, indptr, parts);
+    threading::parallel(n_threads, [&] {
+        threading::pin();
+        threading::for_each(parts, [&](int t) {
+            for (int j0 = 0; j0 < P; j0 += row_block<T>) {
+                const int width = std::min(row_block<T>, P - j0);
+                for (int i = bounds[t]; i < bounds[t + 1]; ++i) {
+                    T* row = c + i * ldc + j0;
+                    ep.init(row, 1, width, ldc);
+                    for (auto p = indptr[i]; p < indptr[i + 1]; ++p) {
+                        axpy(
+                            width, ep.alpha * values[p], b + indices[p] * rsb + j0 * csb, csb,
+                            row);
+                    }
+                }
+            }
+        });
+    });
+}
+
+// C[N x P] = A @ B, A 步长任意, B 为 CSC (indptr 长 P + 1, 第 j 列的非零元为 indices 中的
+// 行号与对应的 values). 每次处理 A 的 rows 行, 每个非零元贡献一次长 rows 的向量乘加;
+// A 按行存储且非零元不少于 M 时, 先把这些行转置为 M x rows 的连续缓冲区
+template <typename T, typename I>
+void dense_csc(
+    int N, int M, int P, const T* a, std::ptrdiff_t rsa, std::ptrdiff_t csa, const I* indptr,
+    const I* indices, const T* values, T* c, std::ptrdiff_t ldc, const epilogue<T>& ep) {
+    constexpr int max_rows = 64;
+    // 转置缓冲区不超过 256 KiB
+    const int rows = static_cast<int>(std::clamp<std::size_t>(
+        (std::size_t(256) << 10) / (std::max(M, 1) * sizeof(T)) / 8 * 8, 8, max_rows));
+    const std::int64_t nnz = indptr[P] - indptr[0];
+    const bool transposed = rsa != 1 && nnz >= M;
+    const int blocks = (N + rows - 1) / rows;
+    const int n_threads = threading::threads_for((nnz + P) * N, threading::count());
+    threading::parallel(n_threads, [&] {
+        threading::pin();
+        std::unique_ptr<T[]> at(transposed ? new T[static_cast<std::size_t>(M) * rows] : nullptr);
+        T acc[max_rows];
+        threading::for_each(blocks, [&](int blk) {
+            const int i0 = blk * rows, n = std::min(rows, N - i0);
+            const T* base = a + i0 * rsa;
+            std::ptrdiff_t rs = rsa, cs = csa;
+            if (transposed) {
+                for (int ii = 0; ii < n; ++ii) {
+                    for (int k = 0; k < M; ++k) {
+                        at[k * rows + ii] = base[ii * rsa + k * csa];
+                    }
+                }
+                base = at.get(), rs = 1, cs = rows;
+            }
+            for (int j = 0; j < P; ++j) {
+                std::fill(acc, acc + n, T(0));
+                for (auto p = indptr[j]; p < indptr[j + 1]; ++p) {
+                    axpy(n, values[p], base + indices[p] * cs, rs, acc);
+                }
+                for (int ii = 0; ii < n; ++ii) {
+                    ep.store(&c[(i0 + ii) * ldc + j], acc[ii]);
+                }
+            }
+        });
+    });
+}
+
+}  // namespace sparse
+
+}  // namespace MATMUL_ISA
+
+}  // namespace kernel
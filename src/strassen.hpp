@@ -0,0 +1,304 @@
+#pragma once
+
+#include "epilogue.hpp"
+#include "gemm.hpp"
+#include "target.hpp"
+#include "threading.hpp"
+#include "tuning.hpp"
+
+#include <algorithm>
+#include <atomic>
+#include <cstddef>
+#include <cstdint>
+#include <vector>
+
+// 递归的截止尺寸: 最小维度不超过该值的子问题交给分块 gemm. 与指令集无关, 所有内核表共用
+namespace strassen {
+
+inline std::atomic<int>& cutoff() {
+    static std::atomic<int> n{256};
+    return n;
+}
+
+}  // namespace strassen
+
+namespace kernel {
+
+inline namespace MATMUL_ISA {
+
+// Strassen-Winograd 递归: 每层用 7 次半尺寸乘法与 15 次加减代替 8 次乘法.
+// 入口把 A, B 复制到各维补齐为 2^levels 倍数的连续缓冲区, 递归中的所有临时矩阵
+// 都从一次分配的工作区中划分. 顶部 par_levels 层逐层展开为 7^par_levels 个子乘积,
+// 在线程池上并行计算, 每个子乘积使用自己的工作区; 更深的层按 Douglas 等人的顺序复用
+// C 的四个象限, 只需三个临时矩阵
+namespace strassen {
+
+// z = x + y 或 z = x - y, 均为行主序, 行距分别为 ldx/ldy/ldz; z 可以与 x 或 y 相同
+template <typename T, bool subtract>
+inline void combine(
+    int rows, int cols, const T* x, std::ptrdiff_t ldx, const T* y, std::ptrdiff_t ldy, T* z,
+    std::ptrdiff_t ldz) {
+    for (int i = 0; i < rows; ++i) {
+        const T* xr = x + i * ldx;
+        const T* yr = y + i * ldy;
+        T* zr = z + i * ldz;
+#pragma omp simd
+        for (int j = 0; j < cols; ++j) {
+            zr[j] = subtract ? xr[j] - yr[j] : xr[j] + yr[j];
+        }
+    }
+}
+
+template <typename T>
+inline void add(
+    int rows, int cols, const T* x, std::ptrdiff_t ldx, const T* y, std::ptrdiff_t ldy, T* z,
+    std::ptrdiff_t ldz) {
+    combine<T, false>(rows, cols, x, ldx, y, ldy, z, ldz);
+}
+
+template <typename T>
+inline void sub(
+    int rows, int cols, const T* x, std::ptrdiff_t ldx, const T* y, std::ptrdiff_t ldy, T* z,
+    std::ptrdiff_t ldz) {
+    combine<T, true>(rows, cols, x, ldx, y, ldy, z, ldz);
+}
+
+// 在 (n, m, p) 上递归 levels 层所需的工作区元素数, 顶部 par_levels 层按并行方式计算
+inline std::size_t workspace_size(
+    std::size_t n, std::size_t m, std::size_t p, int levels, int par_levels) {
+    if (levels == 0) {
+        return 0;
+    }
+    n /= 2, m /= 2, p /= 2;
+    const std::size_t child = workspace_size(n, m, p, levels - 1, par_levels - 1);
+    if (par_levels > 0) {
+        // S1..S4, T1..T4 与 P1, P2, P4; 其余子乘积直接写入 C 的象限
+        return 4 * n * m + 4 * m * p + 3 * n * p + 7 * child;
+    }
+    return n * m + m * p + n * p + child;
+}
+
+// 叶子乘法 C = A * B 使用的打包缓冲区, 每个串行递归的子树一份
+template <typename T> struct leaf_buffers {
+    packed::buffer<T> a_pack = packed::make_buffer<T>(
+        static_cast<std::size_t>(packed::MC<T>) * packed::KC);
+    packed::buffer<T> b_pack = packed::make_buffer<T>(
+        static_cast<std::size_t>(packed::KC) * packed::NC<T>);
+};
+
+// C = A * B, A 为 n x m, B 为 m x p, 均为行主序, 各维可被 2^levels 整除. ws 为工作区,
+// leaf 为叶子乘法使用的打包缓冲区
+template <typename T>
+void multiply(
+    int n, int m, int p, const T* a, std::ptrdiff_t lda, const T* b, std::ptrdiff_t ldb, T* c,
+    std::ptrdiff_t ldc, int levels, T* ws, leaf_buffers<T>* leaf) {
+    if (levels == 0) {
+        return packed::gemm_serial<T>(
+            n, m, p, a, lda, 1, b, ldb, 1, nullptr, c, ldc, epilogue<T>{}, leaf->a_pack.get(),
+            leaf->b_pack.get());
+    }
+    const int n2 = n / 2, m2 = m / 2, p2 = p / 2;
+    const T *a11 = a, *a12 = a + m2, *a21 = a + n2 * lda, *a22 = a21 + m2;
+    const T *b11 = b, *b12 = b + p2, *b21 = b + m2 * ldb, *b22 = b21 + p2;
+    T *c11 = c, *c12 = c + p2, *c21 = c + n2 * ldc, *c22 = c21 + p2;
+    const std::size_t nm = std::size_t(n2) * m2, mp = std::size_t(m2) * p2,
+                      np = std::size_t(n2) * p2;
+
+    T *x = ws, *y = x + nm, *z = y + mp;
+    T* child = z + np;
+    auto recurse = [&](const T* lhs, std::ptrdiff_t ldl, const T* rhs, std::ptrdiff_t ldr, T* out,
+                       std::ptrdiff_t ldo) {
+        multiply(n2, m2, p2, lhs, ldl, rhs, ldr, out, ldo, levels - 1, child, leaf);
+    };
+    sub(n2, m2, a11, lda, a21, lda, x, m2);     // S3
+    sub(m2, p2, b22, ldb, b12, ldb, y, p2);     // T3
+    recurse(x, m2, y, p2, c21, ldc);            // P7
+    add(n2, m2, a21, lda, a22, lda, x, m2);     // S1
+    sub(m2, p2, b12, ldb, b11, ldb, y, p2);     // T1
+    recurse(x, m2, y, p2, c22, ldc);            // P5
+    sub(n2, m2, x, m2, a11, lda, x, m2);        // S2
+    sub(m2, p2, b22, ldb, y, p2, y, p2);        // T2
+    recurse(x, m2, y, p2, c12, ldc);            // P6
+    sub(n2, m2, a12, lda, x, m2, x, m2);        // S4
+    recurse(x, m2, b22, ldb, c11, ldc);         // P3
+    recurse(a11, lda, b11, ldb, z, p2);         // P1
+    add(n2, p2, c12, ldc, z, p2, c12, ldc);     // U2 = P1 + P6
+    add(n2, p2, c21, ldc, c12, ldc, c21, ldc);  // U3 = U2 + P7
+    add(n2, p2, c12, ldc, c22, ldc, c12, ldc);  // U4 = U2 + P5
+    add(n2, p2, c22, ldc, c21, ldc, c22, ldc);  // C22 = U3 + P5
+    add(n2, p2, c12, ldc, c11, ldc, c12, ldc);  // C12 = U4 + P3
+    sub(m2, p2, y, p2, b21, ldb, y, p2);        // T4
+    recurse(a22, lda, y, p2, c11, ldc);         // P4
+    sub(n2, p2, c21, ldc, c11, ldc, c21, ldc);  // C21 = U3 - P4
+    recurse(a12, lda, b21, ldb, c11, ldc);      // P2
+    add(n2, p2, c11, ldc, z, p2, c11, ldc);     // C11 = P1 + P2
+}
+
+// 并行层中的一次乘法 C = A * B 及其工作区
+template <typename T> struct node {
+    int n, m, p;
+    const T* a;
+    std::ptrdiff_t lda;
+    const T* b;
+    std::ptrdiff_t ldb;
+    T* c;
+    std::ptrdiff_t ldc;
+    T* ws;
+};
+
+// 并行层的前半部分: 在工作区中算出 S1..S4 与 T1..T4, 把 7 个子乘积写入 children.
+// P1, P2, P4 写入工作区中的临时矩阵, 其余直接写入 C 的象限. levels 与 par_levels 为 x 处的层数
+template <typename T>
+void split(const node<T>& x, int levels, int par_levels, node<T>* children) {
+    const int n2 = x.n / 2, m2 = x.m / 2, p2 = x.p / 2;
+    const auto lda = x.lda, ldb = x.ldb, ldc = x.ldc;
+    const T *a11 = x.a, *a12 = x.a + m2, *a21 = x.a + n2 * lda, *a22 = a21 + m2;
+    const T *b11 = x.b, *b12 = x.b + p2, *b21 = x.b + m2 * ldb, *b22 = b21 + p2;
+    T *c11 = x.c, *c12 = x.c + p2, *c21 = x.c + n2 * ldc, *c22 = c21 + p2;
+    const std::size_t nm = std::size_t(n2) * m2, mp = std::size_t(m2) * p2,
+                      np = std::size_t(n2) * p2;
+    T *s1 = x.ws, *s2 = s1 + nm, *s3 = s2 + nm, *s4 = s3 + nm;
+    T *t1 = s4 + nm, *t2 = t1 + mp, *t3 = t2 + mp, *t4 = t3 + mp;
+    T *q1 = t4 + mp, *q2 = q1 + np, *q4 = q2 + np;
+    T* child = q4 + np;
+    const std::size_t child_size = workspace_size(n2, m2, p2, levels - 1, par_levels - 1);
+
+    add(n2, m2, a21, lda, a22, lda, s1, m2);
+    sub(n2, m2, s1, m2, a11, lda, s2, m2);
+    sub(n2, m2, a11, lda, a21, lda, s3, m2);
+    sub(n2, m2, a12, lda, s2, m2, s4, m2);
+    sub(m2, p2, b12, ldb, b11, ldb, t1, p2);
+    sub(m2, p2, b22, ldb, t1, p2, t2, p2);
+    sub(m2, p2, b22, ldb, b12, ldb, t3, p2);
+    sub(m2, p2, t2, p2, b21, ldb, t4, p2);
+
+    const node<T> products[7] = {
+        {n2, m2, p2, a11, lda, b11, ldb, q1, p2, nullptr},   // P1
+        {n2, m2, p2, a12, lda, b21, ldb, q2, p2, nullptr},   // P2
+        {n2, m2, p2, s4, m2, b22, ldb, c11, ldc, nullptr},   // P3
+        {n2, m2, p2, a22, lda, t4, p2, q4, p2, nullptr},     // P4
+        {n2, m2, p2, s1, m2, t1, p2, c22, ldc, nullptr},     // P5
+        {n2, m2, p2, s2, m2, t2, p2, c12, ldc, nullptr},     // P6
+        {n2, m2, p2, s3, m2, t3, p2, c21, ldc, nullptr},     // P7
+    };
+    for (int i = 0; i < 7; ++i) {
+        children[i] = products[i];
+        children[i].ws = child + i * child_size;
+    }
+}
+
+// 并行层的后半部分: 7 个子乘积完成后合并为 C 的四个象限
+template <typename T> void merge(const node<T>& x) {
+    const int n2 = x.n / 2, m2 = x.m / 2, p2 = x.p / 2;
+    const auto ldc = x.ldc;
+    T *c11 = x.c, *c12 = x.c + p2, *c21 = x.c + n2 * ldc, *c22 = c21 + p2;
+    const std::size_t nm = std::size_t(n2) * m2, mp = std::size_t(m2) * p2,
+                      np = std::size_t(n2) * p2;
+    const T* q1 = x.ws + 4 * nm + 4 * mp;
+    const T *q2 = q1 + np, *q4 = q2 + np;
+    // U2 = P1 + P6, U3 = U2 + P7, U4 = U2 + P5
+    // C11 = P1 + P2, C12 = U4 + P3, C21 = U3 - P4, C22 = U3 + P5
+    for (int i = 0; i < n2; ++i) {
+#pragma omp simd
+        for (int j = 0; j < p2; ++j) {
+            const T p1 = q1[i * p2 + j], p2_ = q2[i * p2 + j], p4 = q4[i * p2 + j];
+            const T p3 = c11[i * ldc + j], p5 = c22[i * ldc + j];
+            const T p6 = c12[i * ldc + j], p7 = c21[i * ldc + j];
+            const T u2 = p1 + p6, u3 = u2 + p7, u4 = u2 + p5;
+            c11[i * ldc + j] = p1 + p2_;
+            c12[i * ldc + j] = u4 + p3;
+            c21[i * ldc + j] = u3 - p4;
+            c22[i * ldc + j] = u3 + p5;
+        }
+    }
+}
+
+// C[N x P] = A[N x M] * B[M x P], A/B 的步长任意, C 行主序. 最小维度不超过截止尺寸时
+// 直接使用分块 gemm. 浮点类型的舍入误差略大于普通乘法
+template <typename T>
+inline void gemm(
+    int N, int M, int P, const T* a, std::ptrdiff_t rsa, std::ptrdiff_t csa, const T* b,
+    std::ptrdiff_t rsb, std::ptrdiff_t csb, T* c, std::ptrdiff_t ldc, const epilogue<T>& ep) {
+    // 调优器可按调用覆盖全局截止尺寸
+    const int cutoff = ::strassen::cutoff().load(std::memory_order_relaxed);
+    const int limit = std::max(1, tuning::block(cutoff));
+    int levels = 0;
+    for (int n = N, m = M, p = P; std::min({n, m, p}) > limit; ++levels) {
+        n = (n + 1) / 2, m = (m + 1) / 2, p = (p + 1) / 2;
+    }
+    if (levels == 0) {
+        return packed::gemm_blocked_parallel<T>(
+            N, M, P, a, rsa, csa, b, rsb, csb, nullptr, c, ldc, ep);
+    }
+    const int n_threads = threading::count();
+    // 顶层 7 个任务足以占满 7 个以内的线程, 线程更多时展开两层 (49 个任务)
+    const int par_levels = n_threads == 1 ? 0 : std::min(levels, n_threads > 7 ? 2 : 1);
+    const int unit = 1 << levels;
+    auto round_up = [unit](int x) { return (x + unit - 1) / unit * unit; };
+    const int Np = round_up(N), Mp = round_up(M), Pp = round_up(P);
+    const std::size_t a_size = std::size_t(Np) * Mp, b_size = std::size_t(Mp) * Pp,
+                      c_size = std::size_t(Np) * Pp;
+    auto buf = packed::make_buffer<T>(
+        a_size + b_size + c_size + workspace_size(Np, Mp, Pp, levels, par_levels));
+    T *a_pad = buf.get(), *b_pad = a_pad + a_size, *c_pad = b_pad + b_size;
+    T* ws = c_pad + c_size;
+    for (int i = 0; i < Np; ++i) {
+        for (int k = 0; k < Mp; ++k) {
+            a_pad[i * Mp + k] = i < N && k < M ? a[i * rsa + k * csa] : 0;
+        }
+    }
+    for (int k = 0; k < Mp; ++k) {
+        for (int j = 0; j < Pp; ++j) {
+            b_pad[k * Pp + j] = k < M && j < P ? b[k * rsb + j * csb] : 0;
+        }
+    }
+    if (par_levels == 0) {
+        leaf_buffers<T> leaf;
+        multiply<T>(Np, Mp, Pp, a_pad, Mp, b_pad, Pp, c_pad, Pp, levels, ws, &leaf);
+    } else {
+        // layers[l] 为第 l 层的 7^l 个乘法, 逐层展开, 叶子之间并行, 再逐层合并
+        std::vector<std::vector<node<T>>> layers(par_levels + 1);
+        layers[0] = {{Np, Mp, Pp, a_pad, Mp, b_pad, Pp, c_pad, Pp, ws}};
+        for (int l = 1; l <= par_levels; ++l) {
+            layers[l].resize(layers[l - 1].size() * 7);
+        }
+        const int leaf_levels = levels - par_levels;
+        threading::parallel(n_threads, [&] {
+            threading::pin();
+            leaf_buffers<T> leaf;
+            for (int l = 0; l < par_levels; ++l) {
+                threading::for_each(static_cast<int>(layers[l].size()), [&](int i) {
+                    split(layers[l][i], levels - l, par_levels - l, &layers[l + 1][7 * i]);
+                });
+            }
+            const auto& leaves = layers[par_levels];
+            threading::for_each(static_cast<int>(leaves.size()), [&](int i) {
+                const auto& x = leaves[i];
+                multiply(
+                    x.n, x.m, x.p, x.a, x.lda, x.b, x.ldb, x.c, x.ldc, leaf_levels, x.ws, &leaf);
+            });
+            for (int l = par_levels - 1; l >= 0; --l) {
+                threading::for_each(
+                    static_cast<int>(layers[l].size()), [&](int i) { merge(layers[l][i]); });
+            }
+        });
+    }
+    for (int i = 0; i < N; ++i) {
+        for (int j = 0; j < P; ++j) {
+            ep.store(&c[i * ldc + j], c_pad[i * Pp + j]);
+        }
+        ep.finish(c + i * ldc, 1, P);
+    }
+}
+
+}  // namespace strassen
+
+template <typename T>
+inline void strassen_gemm(
+    const T* a, const T* b, T* c, int N, int M, int P, const epilogue<T>& ep) {
+    strassen::gemm(N, M, P, a, M, 1, b, P, 1, c, P, ep);
+}
+
+}  // namespace MATMUL_ISA
+
+}  // namespace kernel
@@ -0,0 +1,595 @@
+#include "threading.hpp"
+
+#include <algorithm>
+#include <atomic>
+#include <condition_variable>
+#include <exception>
+#include <fstream>
+#include <mutex>
+#include <sstream>
+#include <stdexcept>
+#include <string>
+#include <thread>
+#include <vector>
+
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
+#if defined(__linux__)
+#include <filesystem>
+
+#include <pthread.h>
+#include <sched.h>
+#endif
+
+namespace threading {
+
+namespace {
+
+std::atomic<int> default_threads{0};
+thread_local int call_threads = 0;
+
+std::atomic<affinity> mode{affinity::none};
+// 每次修改绑定方式时递增, 线程据此判断是否需要重新绑定
+std::atomic<unsigned> generation{0};
+
+// 进程可用的 CPU 及其所在的 NUMA 节点
+struct topology {
+    std::vector<int> cpus;
+    // node[i] 为 cpus[i] 所在节点的序号 (0 .. nodes - 1)
+    std::vector<int> node;
+    int nodes = 1;
+    // spread 方式下依次使用的 cpus 下标: 各节点轮流取一个 CPU
+    std::vector<int> spread;
+};
+
+#if defined(__linux__)
+// 解析 /sys 中 "0-3,8-11" 格式的 CPU 列表
+std::vector<int> parse_cpulist(const std::string& text) {
+    std::vector<int> cpus;
+    std::stringstream ss(text);
+    std::string part;
+    while (std::getline(ss, part, ',')) {
+        if (part.find_first_of("0123456789") == std::string::npos) {
+            continue;
+        }
+        const auto dash = part.find('-');
+        const int lo = std::stoi(part.substr(0, dash));
+        const int hi = dash == std::string::npos ? lo : std::stoi(part.substr(dash + 1));
+        for (int c = lo; c <= hi; ++c) {
+            cpus.push_back(c);
+        }
+    }
+    return cpus;
+}
+#endif
+
+const topology& topo() {
+    static const topology t = [] {
+        topology t;
+#if defined(__linux__)
+        cpu_set_t set;
+        CPU_ZERO(&set);
+        if (sched_getaffinity(0, sizeof(set), &set) == 0) {
+            for (int c = 0; c < CPU_SETSIZE; ++c) {
+                if (CPU_ISSET(c, &set)) {
+                    t.cpus.push_back(c);
+                }
+            }
+        }
+        // 按节点号排序的各节点 CPU 列表, 没有 NUMA 信息时视为一个节点
+        std::vector<std::pair<int, std::vector<int>>> nodes;
+        std::error_code ec;
+        for (const auto& entry :
+             std::filesystem::directory_iterator("/sys/devices/system/node", ec)) {
+            const auto name = entry.path().filename().string();
+            if (name.rfind("node", 0) != 0 || name.size() == 4 ||
+                name.find_first_not_of("0123456789", 4) != std::string::npos) {
+                continue;
+            }
+            std::ifstream file(entry.path() / "cpulist");
+            std::string text;
+            std::getline(file, text);
+            nodes.emplace_back(std::stoi(name.substr(4)), parse_cpulist(text));
+        }
+        std::sort(nodes.begin(), nodes.end());
+        t.node.assign(t.cpus.size(), 0);
+        int used = 0;
+        for (const auto& [id, cpus] : nodes) {
+            bool any = false;
+            for (std::size_t i = 0; i < t.cpus.size(); ++i) {
+                if (std::find(cpus.begin(), cpus.end(), t.cpus[i]) != cpus.end()) {
+                    t.node[i] = used;
+                    any = true;
+                }
+            }
+            used += any;
+        }
+        t.nodes = std::max(1, used);
+#endif
+        if (t.cpus.empty()) {
+            t.cpus.push_back(0);
+            t.node.push_back(0);
+        }
+        for (std::size_t round = 0; t.spread.size() < t.cpus.size(); ++round) {
+            for (int n = 0; n < t.nodes; ++n) {
+                std::size_t seen = 0;
+                for (std::size_t i = 0; i < t.cpus.size(); ++i) {
+                    if (t.node[i] == n && seen++ == round) {
+                        t.spread.push_back(static_cast<int>(i));
+                    }
+                }
+            }
+        }
+        return t;
+    }();
+    return t;
+}
+
+// 自旋等待的轮数 (每轮一条 pause, 合计约数十微秒), 之后让出 CPU 或休眠.
+// 线程数超过可用 CPU 数时自旋只会占用被等待线程的 CPU, 直接让出
+constexpr int spin_rounds = 1 << 11;
+
+int spin_limit(int n_threads) {
+    static const int cpus = static_cast<int>(topo().cpus.size());
+    return n_threads <= cpus ? spin_rounds : 0;
+}
+
+inline void relax() {
+#if defined(__x86_64__) || defined(__i386__)
+    __builtin_ia32_pause();
+#elif defined(__aarch64__)
+    asm volatile("yield");
+#endif
+}
+
+// 等待 done() 为真: 先自旋 limit 轮, 之后每轮让出 CPU
+template <typename F> void spin_until(int limit, F&& done) {
+    for (int i = 0; !done(); ++i) {
+        if (i < limit) {
+            relax();
+        } else {
+            std::this_thread::yield();
+        }
+    }
+}
+
+// for_each 中一个线程剩余的下标 [begin, end), 打包为一个 64 位整数以便原子地整体修改.
+// 独占一个缓存行, 避免线程间的伪共享
+struct alignas(64) queue {
+    std::atomic<std::uint64_t> range{0};
+};
+
+std::uint64_t pack(int begin, int end) {
+    return static_cast<std::uint64_t>(static_cast<std::uint32_t>(begin)) << 32 |
+           static_cast<std::uint32_t>(end);
+}
+
+int begin_of(std::uint64_t r) { return static_cast<int>(r >> 32); }
+int end_of(std::uint64_t r) { return static_cast<int>(r & 0xffffffffu); }
+
+// 一个并行区域中的线程组
+struct team {
+    int size = 1;
+    void (*body)(void*) = nullptr;
+    void* context = nullptr;
+    // barrier: 到达的线程数与已完成的轮数
+    std::atomic<int> arrived{0};
+    std::atomic<unsigned> round{0};
+    std::vector<queue> queues;
+    std::mutex error_mutex;
+    std::exception_ptr error;
+    // 有线程抛出异常后置位, 在 barrier 中等待的线程随即退出, 不再等待它
+    std::atomic<bool> aborted{false};
+
+    void fail(std::exception_ptr e) {
+        {
+            std::lock_guard lock(error_mutex);
+            if (!error) {
+                error = e;
+            }
+        }
+        aborted.store(true, std::memory_order_release);
+    }
+};
+
+// 线程组已中止时由 barrier 抛出, 使其余线程退出 body; 不会覆盖 team::error 中的原始异常
+struct abort_region {};
+
+thread_local team* current = nullptr;
+thread_local int rank = 0;
+// 线程池的常驻工作线程; 其余线程 (Python 线程, submit 的工作线程) 是调用方
+thread_local bool worker = false;
+
+#if defined(__linux__)
+// 调用方作为 0 号线程绑定前的 CPU 集合, 区域结束时由 restore_caller 恢复
+thread_local bool caller_pinned = false;
+thread_local cpu_set_t caller_mask;
+#endif
+
+void restore_caller() {
+#if defined(__linux__)
+    if (caller_pinned) {
+        sched_setaffinity(0, sizeof(caller_mask), &caller_mask);
+        caller_pinned = false;
+    }
+#endif
+}
+
+// 在线程组 t 中以 r 号线程的身份运行 body
+void run_as(team& t, int r) {
+    team* saved_team = current;
+    const int saved_rank = rank;
+    current = &t, rank = r;
+    try {
+        t.body(t.context);
+    } catch (...) {
+        t.fail(std::current_exception());
+    }
+    current = saved_team, rank = saved_rank;
+}
+
+// 常驻工作线程. 发布一个并行区域时递增 epoch 的高位并把线程数写入低位,
+// 编号小于线程数的工作线程参与, 完成后递减 pending. 同一时刻只有一个区域 (busy)
+class pool {
+public:
+    static pool& instance() {
+        static bool registered = [] {
+#if defined(__linux__)
+            // fork 出的子进程中没有父进程的工作线程, 改为在子进程中按需重新创建
+            pthread_atfork(nullptr, nullptr, [] { self = nullptr; });
+#endif
+            return true;
+        }();
+        (void)registered;
+        // 有意不析构: 进程退出时工作线程可能仍在休眠
+        if (!self) {
+            self = new pool;
+        }
+        return *self;
+    }
+
+    bool try_acquire() { return !busy.exchange(true, std::memory_order_acquire); }
+
+    void run(int n_threads, void (*body)(void*), void* context) {
+        try {
+            grow(n_threads - 1);
+        } catch (...) {
+            busy.store(false, std::memory_order_release);
+            throw;
+        }
+        shared.size = n_threads;
+        shared.body = body;
+        shared.context = context;
+        shared.error = nullptr;
+        // 上一个区域中止时可能有线程停在 barrier 中途
+        shared.arrived.store(0, std::memory_order_relaxed);
+        shared.aborted.store(false, std::memory_order_relaxed);
+        pending.store(n_threads - 1, std::memory_order_relaxed);
+        const std::uint64_t e = (epoch.load(std::memory_order_relaxed) >> size_bits) + 1;
+        epoch.store(e << size_bits | static_cast<std::uint64_t>(n_threads));
+        if (sleeping.load() > 0) {
+            std::lock_guard lock(mutex);
+            wake.notify_all();
+        }
+        run_as(shared, 0);
+        restore_caller();
+        spin_until(spin_limit(n_threads), [&] {
+            return pending.load(std::memory_order_acquire) == 0;
+        });
+        const auto error = shared.error;
+        shared.size = 1;
+        busy.store(false, std::memory_order_release);
+        if (error) {
+            std::rethrow_exception(error);
+        }
+    }
+
+private:
+    static constexpr int size_bits = 24;
+    static inline pool* self = nullptr;
+
+    void grow(int n_workers) {
+        if (static_cast<int>(shared.queues.size()) < n_workers + 1) {
+            shared.queues = std::vector<queue>(n_workers + 1);
+        }
+        while (static_cast<int>(workers.size()) < n_workers) {
+            const int r = static_cast<int>(workers.size()) + 1;
+            workers.emplace_back([this, r, seen = epoch.load()] { work(r, seen); });
+        }
+    }
+
+    void work(int r, std::uint64_t seen) {
+        worker = true;
+        for (;;) {
+            std::uint64_t e = seen;
+            for (int i = 0, limit = spin_limit(r + 1); i < limit && e == seen; ++i) {
+                relax();
+                e = epoch.load(std::memory_order_acquire);
+            }
+            if (e == seen) {
+                std::unique_lock lock(mutex);
+                ++sleeping;
+                wake.wait(lock, [&] { return (e = epoch.load()) != seen; });
+                --sleeping;
+            }
+            seen = e;
+            if (r < static_cast<int>(e & ((1u << size_bits) - 1))) {
+                run_as(shared, r);
+                pending.fetch_sub(1, std::memory_order_release);
+            }
+        }
+    }
+
+    std::vector<std::thread> workers;
+    team shared;
+    std::atomic<bool> busy{false};
+    std::atomic<std::uint64_t> epoch{0};
+    std::atomic<int> pending{0};
+    std::atomic<int> sleeping{0};
+    std::mutex mutex;
+    std::condition_variable wake;
+};
+
+// 第 t 个线程绑定的 CPU 在 topo().cpus 中的下标
+int place(affinity m, int t) {
+    const auto& topology = topo();
+    const int i = t % static_cast<int>(topology.cpus.size());
+    return m == affinity::spread ? topology.spread[i] : i;
+}
+
+}  // namespace
+
+void set_num_threads(int n) {
+    if (n < 0) {
+        throw std::invalid_argument("Number of threads must be non-negative");
+    }
+    default_threads.store(n, std::memory_order_relaxed);
+}
+
+int count() {
+    if (call_threads > 0) {
+        return call_threads;
+    }
+    if (const int n = default_threads.load(std::memory_order_relaxed); n > 0) {
+        return n;
+    }
+#ifdef _OPENMP
+    return omp_get_max_threads();
+#else
+    return 1;
+#endif
+}
+
+scope::scope(int n) : saved(call_threads) {
+    if (n > 0) {
+        call_threads = n;
+    }
+}
+
+scope::~scope() { call_threads = saved; }
+
+int thread_num() { return current ? rank : 0; }
+
+int team_size() { return current ? current->size : 1; }
+
+int threads_for(std::int64_t work, int n_threads) {
+    const std::int64_t shares = work / min_work_per_thread;
+    return static_cast<int>(std::clamp<std::int64_t>(shares, 1, std::max(n_threads, 1)));
+}
+
+void parallel(int n_threads, void (*body)(void*), void* context) {
+    if (n_threads > 1 && !current) {
+        auto& p = pool::instance();
+        if (p.try_acquire()) {
+            return p.run(n_threads, body, context);
+        }
+    }
+    team single;
+    single.body = body;
+    single.context = context;
+    run_as(single, 0);
+    if (single.error) {
+        std::rethrow_exception(single.error);
+    }
+}
+
+void barrier() {
+    team* t = current;
+    if (!t || t->size == 1) {
+        return;
+    }
+    // 抛出异常的线程不会到达 barrier, 其余线程不能一直等待它
+    if (t->aborted.load(std::memory_order_acquire)) {
+        throw abort_region{};
+    }
+    const unsigned round = t->round.load(std::memory_order_acquire);
+    if (t->arrived.fetch_add(1, std::memory_order_acq_rel) == t->size - 1) {
+        t->arrived.store(0, std::memory_order_relaxed);
+        t->round.store(round + 1, std::memory_order_release);
+        return;
+    }
+    spin_until(spin_limit(t->size), [&] {
+        return t->round.load(std::memory_order_acquire) != round ||
+               t->aborted.load(std::memory_order_acquire);
+    });
+    if (t->round.load(std::memory_order_acquire) == round) {
+        throw abort_region{};
+    }
+}
+
+void for_each(int n, void (*f)(void*, int), void* context) {
+    team* t = current;
+    if (!t || t->size == 1) {
+        for (int i = 0; i < n; ++i) {
+            f(context, i);
+        }
+        return;
+    }
+    const int size = t->size, r = rank;
+    auto& own = t->queues[r].range;
+    // 其他线程在此之前看到的是上一次 for_each 留下的空区间, 不会从中窃取
+    const auto bound = [&](int k) { return static_cast<int>(std::int64_t(n) * k / size); };
+    own.store(pack(bound(r), bound(r + 1)), std::memory_order_release);
+    // 从自己的区间头部取一个下标
+    auto pop = [&](int& i) {
+        std::uint64_t v = own.load(std::memory_order_acquire);
+        while (begin_of(v) < end_of(v)) {
+            if (own.compare_exchange_weak(v, pack(begin_of(v) + 1, end_of(v)))) {
+                i = begin_of(v);
+                return true;
+            }
+        }
+        return false;
+    };
+    // 从其他线程的区间尾部取走一半, 放入自己的 (此时为空) 区间
+    auto steal = [&] {
+        for (int k = 1; k < size; ++k) {
+            auto& victim = t->queues[(r + k) % size].range;
+            std::uint64_t v = victim.load(std::memory_order_acquire);
+            while (begin_of(v) < end_of(v)) {
+                const int mid = begin_of(v) + (end_of(v) - begin_of(v)) / 2;
+                if (victim.compare_exchange_weak(v, pack(begin_of(v), mid))) {
+                    own.store(pack(mid, end_of(v)), std::memory_order_release);
+                    return true;
+                }
+            }
+        }
+        return false;
+    };
+    int i;
+    do {
+        while (pop(i)) {
+            try {
+                f(context, i);
+            } catch (...) {
+                t->fail(std::current_exception());
+            }
+        }
+    } while (steal());
+    barrier();
+}
+
+grid tiles(int N, int P, int n_threads, int min_cols) {
+    auto ceil_div = [](int x, int y) { return (x + y - 1) / y; };
+    grid g{N, P, std::max(N, 1), std::max(P, 1), N > 0, P > 0};
+    const int target = n_threads > 1 ? 4 * n_threads : 1;
+    while (g.size() > 0 && g.size() < target) {
+        if (g.tile_rows > 1 && (g.tile_rows >= g.tile_cols || g.tile_cols < 2 * min_cols)) {
+            g.tile_rows = ceil_div(g.tile_rows, 2);
+        } else if (g.tile_cols >= 2 * min_cols) {
+            g.tile_cols = ceil_div(ceil_div(g.tile_cols, 2), min_cols) * min_cols;
+        } else {
+            break;
+        }
+        g.row_tiles = ceil_div(N, g.tile_rows);
+        g.col_tiles = ceil_div(P, g.tile_cols);
+    }
+    return g;
+}
+
+void set_affinity(affinity m) {
+#if !defined(__linux__)
+    if (m != affinity::none) {
+        throw std::runtime_error("Thread affinity is only supported on Linux");
+    }
+#endif
+    mode.store(m, std::memory_order_relaxed);
+    generation.fetch_add(1, std::memory_order_relaxed);
+}
+
+affinity get_affinity() { return mode.load(std::memory_order_relaxed); }
+
+affinity parse_affinity(const std::string& name) {
+    for (auto m : {affinity::none, affinity::compact, affinity::spread}) {
+        if (name == affinity_name(m)) {
+            return m;
+        }
+    }
+    throw std::invalid_argument("Unknown affinity: " + name);
+}
+
+const char* affinity_name(affinity m) {
+    switch (m) {
+    case affinity::compact:
+        return "compact";
+    case affinity::spread:
+        return "spread";
+    default:
+        return "none";
+    }
+}
+
+void pin() {
+#if defined(__linux__)
+    if (!worker) {
+        // 调用方只在多线程区域中作为 0 号线程绑定, 区域结束时恢复; 单线程运行时不绑定,
+        // 否则用户的线程会一直固定在一个 CPU 上
+        const auto m = mode.load(std::memory_order_relaxed);
+        if (m == affinity::none || team_size() == 1 || caller_pinned ||
+            sched_getaffinity(0, sizeof(caller_mask), &caller_mask) != 0) {
+            return;
+        }
+        cpu_set_t set;
+        CPU_ZERO(&set);
+        CPU_SET(topo().cpus[place(m, thread_num())], &set);
+        caller_pinned = sched_setaffinity(0, sizeof(set), &set) == 0;
+        return;
+    }
+    thread_local unsigned applied = 0;
+    thread_local int applied_slot = -1;
+    thread_local bool pinned = false;
+    const unsigned gen = generation.load(std::memory_order_relaxed);
+    const int t = thread_num();
+    if (gen == applied && t == applied_slot) {
+        return;
+    }
+    applied = gen;
+    applied_slot = t;
+    const auto m = mode.load(std::memory_order_relaxed);
+    if (m == affinity::none && !pinned) {
+        return;
+    }
+    const auto& topology = topo();
+    cpu_set_t set;
+    CPU_ZERO(&set);
+    if (m == affinity::none) {
+        // 解除绑定: 恢复为进程启动时的 CPU 集合
+        for (int c : topology.cpus) {
+            CPU_SET(c, &set);
+        }
+    } else {
+        CPU_SET(topology.cpus[place(m, t)], &set);
+    }
+    const bool ok = sched_setaffinity(0, sizeof(set), &set) == 0;
+    pinned = m != affinity::none && ok;
+#endif
+}
+
+int replicas(int n_threads) {
+    if (mode.load(std::memory_order_relaxed) == affinity::none) {
+        return 1;
+    }
+    return n_threads > 1 ? topo().nodes : 1;
+}
+
+slot slot_of(int t, int n_threads) {
+    const auto m = mode.load(std::memory_order_relaxed);
+    if (m == affinity::none || topo().nodes == 1 || n_threads <= 1) {
+        return {0, t, n_threads};
+    }
+    const auto& topology = topo();
+    auto node_of = [&](int i) { return topology.node[place(m, i)]; };
+    const int node = node_of(t);
+    slot s{node, 0, 0};
+    for (int i = 0; i < n_threads; ++i) {
+        if (node_of(i) == node) {
+            s.rank += i < t;
+            ++s.size;
+        }
+    }
+    return s;
+}
+
+}  // namespace threading
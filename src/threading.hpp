@@ -0,0 +1,129 @@
+#pragma once
+
+#include <cstdint>
+#include <string>
+#include <type_traits>
+
+// 内核的线程数, 常驻线程池, C 的二维划分与线程绑定. 与指令集无关, 实现在 threading.cpp 中
+// 以基础指令集编译, 避免各指令集翻译单元中的内联副本被链接器合并到不支持的 CPU 上
+namespace threading {
+
+// 全局线程数, 0 表示使用 OpenMP 的默认值 (OMP_NUM_THREADS 或 CPU 数)
+void set_num_threads(int n);
+
+// 当前线程发起的内核使用的线程数: 调用级设置 (scope) 优先, 其次为全局设置
+int count();
+
+// 在作用域内把当前线程发起的内核限制为 n 个线程, n 为 0 时不改变
+class scope {
+public:
+    explicit scope(int n);
+    ~scope();
+
+    scope(const scope&) = delete;
+    scope& operator=(const scope&) = delete;
+
+private:
+    int saved;
+};
+
+// 并行区域内的线程编号与线程数, 区域外为 0 与 1
+int thread_num();
+int team_size();
+
+// 每个线程至少分到的乘加次数. 唤醒并同步工作线程需要数微秒, 更小的问题少用线程,
+// 不足两份时直接在调用方线程上运行
+constexpr std::int64_t min_work_per_thread = std::int64_t(1) << 16;
+
+// 按 min_work_per_thread 估计 work 次乘加适合的线程数, 不超过 n_threads
+int threads_for(std::int64_t work, int n_threads);
+
+// 常驻线程池: 在 n_threads 个线程上各运行一次 body, 调用方线程为 0 号, 其余为常驻工作线程,
+// 按需创建后一直保留. 空闲的工作线程先自旋等待下一个并行区域, 超时后休眠,
+// 因而连续的内核调用几乎没有启动开销. 线程池正被其他线程使用或在并行区域内嵌套调用时,
+// body 在调用方线程上单线程运行. body 抛出的第一个异常在所有线程结束后重新抛出
+void parallel(int n_threads, void (*body)(void*), void* context);
+
+template <typename F> void parallel(int n_threads, F&& body) {
+    using function = std::remove_reference_t<F>;
+    parallel(
+        n_threads, [](void* f) { (*static_cast<function*>(f))(); },
+        const_cast<void*>(static_cast<const void*>(&body)));
+}
+
+// 等待并行区域内的所有线程都到达; 区域外或单线程时立即返回. 有线程抛出异常后, 其余线程
+// 在 barrier 中退出 body, 异常由 parallel 在调用方线程上重新抛出
+void barrier();
+
+// 由并行区域内的所有线程共同调用: 对 [0, n) 中的每个 i 恰好调用一次 f(i), 返回前隐含 barrier.
+// 每个线程先处理自己的连续一段, 做完后从其他线程剩余部分的末尾窃取一半, 负载不均时也能保持
+// 所有线程忙碌
+void for_each(int n, void (*f)(void*, int), void* context);
+
+template <typename F> void for_each(int n, F&& f) {
+    using function = std::remove_reference_t<F>;
+    for_each(
+        n, [](void* g, int i) { (*static_cast<function*>(g))(i); },
+        const_cast<void*>(static_cast<const void*>(&f)));
+}
+
+// C 的二维划分: row_tiles x col_tiles 个 tile, 按行主序编号
+struct grid {
+    int N, P;
+    int tile_rows, tile_cols;
+    int row_tiles, col_tiles;
+
+    struct range {
+        int i0, i1, j0, j1;
+    };
+
+    int size() const { return row_tiles * col_tiles; }
+
+    range tile(int t) const {
+        const int i0 = t / col_tiles * tile_rows, j0 = t % col_tiles * tile_cols;
+        return {i0, i0 + tile_rows < N ? i0 + tile_rows : N, j0,
+                j0 + tile_cols < P ? j0 + tile_cols : P};
+    }
+};
+
+// 把 N x P 的 C 划分为至少 4 * n_threads 个 tile (尺寸允许时): 每次把较长的一边减半,
+// 列宽不小于 min_cols 以保持内层循环的向量化. 矮而宽的 C 因此也能按列分给所有线程
+grid tiles(int N, int P, int n_threads, int min_cols = 16);
+
+// 线程绑定方式: none 不绑定; compact 依次绑定到进程可用的 CPU;
+// spread 在 NUMA 节点间轮流分配. 绑定后, 打包缓冲区按 NUMA 节点各保留一份副本,
+// 由该节点上的线程首次写入, 因而位于读取它的节点上
+enum class affinity { none, compact, spread };
+
+// 不支持线程绑定的平台上设置 compact/spread 时抛出 std::runtime_error
+void set_affinity(affinity mode);
+affinity get_affinity();
+affinity parse_affinity(const std::string& name);
+const char* affinity_name(affinity mode);
+
+// 在并行区域开头调用, 按当前绑定方式把调用线程绑定到第 thread_num() 个位置;
+// 位置没有变化时只做一次比较. 发起区域的线程只在多线程区域内绑定, 区域结束时恢复原来的
+// CPU 集合
+void pin();
+
+// 共 n 个线程时打包缓冲区需要的副本数 (NUMA 节点数, 不绑定时为 1)
+int replicas(int n_threads);
+
+// 线程 t 使用的副本编号, 以及它在使用同一副本的线程中的序号与这些线程的个数
+struct slot {
+    int replica, rank, size;
+};
+
+slot slot_of(int t, int n_threads);
+
+// 依次处理 N x M x P 乘法中 C 的各个 tile, tile 之间并行
+template <typename F> void for_each_tile(int N, int M, int P, F&& f, int min_cols = 16) {
+    const int n_threads = threads_for(std::int64_t(N) * M * P, count());
+    const auto g = tiles(N, P, n_threads, min_cols);
+    parallel(n_threads, [&] {
+        pin();
+        for_each(g.size(), [&](int t) { f(g.tile(t)); });
+    });
+}
+
+}  // namespace threading
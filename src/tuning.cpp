@@ -0,0 +1,189 @@
+#include "tuning.hpp"
+
+#include <algorithm>
+#include <cstdio>
+#include <cstdlib>
+#include <filesystem>
+#include <fstream>
+#include <sstream>
+#include <stdexcept>
+#include <string>
+
+#include <unistd.h>
+
+namespace tuning {
+
+namespace {
+
+thread_local int call_block = 0;
+
+int exponent_of(int n) {
+    int e = 0;
+    while ((1 << e) < n && e < 30) {
+        ++e;
+    }
+    return e;
+}
+
+constexpr const char* header =
+    "# libmatmul tuning cache: host dtype N M P kernel threads block seconds";
+
+// 每行一个结果, 尺寸记为桶的代表尺寸; 无法解析的行被忽略
+std::map<key, choice> read(const std::string& path) {
+    std::map<key, choice> table;
+    std::ifstream file(path);
+    std::string line;
+    while (std::getline(file, line)) {
+        if (line.empty() || line[0] == '#') {
+            continue;
+        }
+        std::istringstream ss(line);
+        key k;
+        choice c;
+        int N, M, P;
+        if (ss >> k.host >> k.dtype >> N >> M >> P >> c.kernel >> c.threads >> c.block >>
+            c.seconds) {
+            k.shape = bucket_of(N, M, P);
+            table[k] = c;
+        }
+    }
+    return table;
+}
+
+}  // namespace
+
+int block(int fallback) { return call_block > 0 ? call_block : fallback; }
+
+scope::scope(int n) : saved(call_block) {
+    if (n > 0) {
+        call_block = n;
+    }
+}
+
+scope::~scope() { call_block = saved; }
+
+bucket bucket_of(int N, int M, int P) { return {exponent_of(N), exponent_of(M), exponent_of(P)}; }
+
+int size_of(int exponent) { return 1 << exponent; }
+
+std::string default_path() {
+    if (const char* env = std::getenv("LIBMATMUL_TUNING_CACHE"); env && *env) {
+        return env;
+    }
+    std::filesystem::path dir;
+    if (const char* xdg = std::getenv("XDG_CACHE_HOME"); xdg && *xdg) {
+        dir = xdg;
+    } else if (const char* home = std::getenv("HOME"); home && *home) {
+        dir = std::filesystem::path(home) / ".cache";
+    } else {
+        dir = std::filesystem::temp_directory_path();
+    }
+    return (dir / "libmatmul" / "tuning.txt").string();
+}
+
+cache::cache(std::string path) : file(std::move(path)) {}
+
+std::string cache::path() {
+    std::lock_guard lock(mutex);
+    return file;
+}
+
+void cache::set_path(std::string path) {
+    std::lock_guard lock(mutex);
+    file = std::move(path);
+    table.clear();
+    loaded = false;
+}
+
+void cache::load() {
+    if (!loaded) {
+        table = read(file);
+        loaded = true;
+    }
+}
+
+std::optional<choice> cache::find(const key& k) {
+    std::lock_guard lock(mutex);
+    load();
+    if (auto it = table.find(k); it != table.end()) {
+        return it->second;
+    }
+    return std::nullopt;
+}
+
+std::optional<choice> cache::nearest(const key& k, int max_distance) {
+    std::lock_guard lock(mutex);
+    load();
+    std::optional<choice> best;
+    int best_distance = max_distance + 1;
+    for (const auto& [other, c] : table) {
+        if (other.host != k.host || other.dtype != k.dtype) {
+            continue;
+        }
+        const int distance = std::abs(other.shape.n - k.shape.n) +
+                             std::abs(other.shape.m - k.shape.m) +
+                             std::abs(other.shape.p - k.shape.p);
+        if (distance < best_distance) {
+            best = c;
+            best_distance = distance;
+        }
+    }
+    return best;
+}
+
+void cache::store(const key& k, const choice& c) {
+    std::lock_guard lock(mutex);
+    load();
+    table[k] = c;
+}
+
+std::vector<std::pair<key, choice>> cache::entries() {
+    std::lock_guard lock(mutex);
+    load();
+    return {table.begin(), table.end()};
+}
+
+void cache::save() {
+    std::lock_guard lock(mutex);
+    load();
+    // 其他进程可能在此期间写入了别的桶, 以本进程的结果为准合并
+    auto merged = read(file);
+    for (const auto& [k, c] : table) {
+        merged[k] = c;
+    }
+    const std::filesystem::path target(file);
+    if (target.has_parent_path()) {
+        std::filesystem::create_directories(target.parent_path());
+    }
+    // 临时文件名带上进程号, 同时保存的多个进程不会写同一个文件; 同一进程内由 mutex 串行
+    const auto tmp = file + ".tmp." + std::to_string(::getpid());
+    {
+        std::ofstream out(tmp);
+        if (!out) {
+            throw std::runtime_error("Cannot write tuning cache: " + tmp);
+        }
+        out << header << '\n';
+        for (const auto& [k, c] : merged) {
+            out << k.host << ' ' << k.dtype << ' ' << size_of(k.shape.n) << ' '
+                << size_of(k.shape.m) << ' ' << size_of(k.shape.p) << ' ' << c.kernel << ' '
+                << c.threads << ' ' << c.block << ' ' << c.seconds << '\n';
+        }
+    }
+    std::filesystem::rename(tmp, target);
+    table = std::move(merged);
+}
+
+void cache::clear() {
+    std::lock_guard lock(mutex);
+    table.clear();
+    loaded = true;
+    std::error_code ec;
+    std::filesystem::remove(file, ec);
+}
+
+cache& results() {
+    static cache c(default_path());
+    return c;
+}
+
+}  // namespace tuning
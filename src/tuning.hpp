@@ -0,0 +1,96 @@
+#pragma once
+
+#include <map>
+#include <mutex>
+#include <optional>
+#include <string>
+#include <tuple>
+#include <vector>
+
+// 自动调优的结果: 按形状桶记录在当前主机上最快的内核及其线程数与分块参数,
+// 保存在磁盘缓存中供 matmul 分派. 与指令集无关, 实现在 tuning.cpp 中以基础指令集编译
+namespace tuning {
+
+// 当前线程发起的调用使用的分块参数: 调用级设置 (scope) 优先, 否则为 fallback.
+// 对 chunk 内核是块大小, 对 strassen 是递归截止尺寸, 对 simd_optimized 是回退到 simd 的阈值
+int block(int fallback);
+
+// 在作用域内设置当前线程的分块参数, n 为 0 时不改变
+class scope {
+public:
+    explicit scope(int n);
+    ~scope();
+
+    scope(const scope&) = delete;
+    scope& operator=(const scope&) = delete;
+
+private:
+    int saved;
+};
+
+// 形状桶: 各维向上取整到 2 的幂后的指数
+struct bucket {
+    int n, m, p;
+
+    bool operator<(const bucket& o) const { return std::tie(n, m, p) < std::tie(o.n, o.m, o.p); }
+    bool operator==(const bucket& o) const { return n == o.n && m == o.m && p == o.p; }
+};
+
+bucket bucket_of(int N, int M, int P);
+
+// 桶内的代表尺寸 2^n x 2^m x 2^p
+int size_of(int exponent);
+
+struct key {
+    // 内核版本与硬件线程数, 如 "avx2/8"; 同一缓存文件可被不同机器共用
+    std::string host;
+    std::string dtype;
+    bucket shape;
+
+    bool operator<(const key& o) const {
+        return std::tie(host, dtype, shape) < std::tie(o.host, o.dtype, o.shape);
+    }
+};
+
+struct choice {
+    std::string kernel;
+    // 0 表示使用全局设置或内核默认值
+    int threads = 0, block = 0;
+    double seconds = 0;
+};
+
+// 缓存文件: LIBMATMUL_TUNING_CACHE, 其次 $XDG_CACHE_HOME/libmatmul/tuning.txt,
+// 最后 ~/.cache/libmatmul/tuning.txt
+std::string default_path();
+
+class cache {
+public:
+    explicit cache(std::string path);
+
+    std::string path();
+    // 切换缓存文件, 下次访问时重新读取
+    void set_path(std::string path);
+
+    std::optional<choice> find(const key& k);
+    // 同一主机与 dtype 下, 指数的 L1 距离不超过 max_distance 的最近的桶
+    std::optional<choice> nearest(const key& k, int max_distance);
+    void store(const key& k, const choice& c);
+    std::vector<std::pair<key, choice>> entries();
+
+    // 与文件中的现有内容合并后写回, 先写临时文件再改名
+    void save();
+    // 清空内存中的结果并删除缓存文件
+    void clear();
+
+private:
+    void load();
+
+    std::mutex mutex;
+    std::string file;
+    bool loaded = false;
+    std::map<key, choice> table;
+};
+
+cache& results();
+
+}  // namespace tuning
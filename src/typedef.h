@@ -1 +1,23 @@
-using T = int;
\ No newline at end of file
+#pragma once
+
+#include <cstdint>
+#include <tuple>
+#include <variant>
+
+// 内核支持的元素类型, Python 侧按输入数组的 dtype 选择实例
+template <typename... Ts> struct type_list {
+    template <template <typename> class F> using tuple = std::tuple<F<Ts>...>;
+    template <template <typename> class F> using variant = std::variant<F<Ts>...>;
+};
+
+using element_types = type_list<std::int32_t, std::int64_t, float, double>;
+
+// int8 内核中 A 的元素类型 (B 固定为 int8, 结果为 int32)
+using int8_types = type_list<std::uint8_t, std::int8_t>;
+
+// 稀疏矩阵的下标类型, 与 scipy.sparse 的 indptr/indices 相同
+using index_types = type_list<std::int32_t, std::int64_t>;
+
+// 融合后处理 (postops) 可写出的元素类型, 包括所有 element_types
+using output_types =
+    type_list<std::int8_t, std::uint8_t, std::int16_t, std::int32_t, std::int64_t, float, double>;
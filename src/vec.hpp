@@ -0,0 +1,149 @@
+#pragma once
+
+#include "target.hpp"
+
+#include <cstdint>
+
+namespace kernel {
+
+inline namespace MATMUL_ISA {
+
+// 按元素类型封装一个 SIMD 寄存器的常用操作, 供模板化的内核使用.
+// enabled 为 false 表示当前指令集没有对应的向量乘法, 内核改用标量实现
+template <typename T> struct vec {
+    static constexpr bool enabled = false;
+    static constexpr int lanes = 1;
+};
+
+#if defined(__AVX512F__)
+
+template <> struct vec<std::int32_t> {
+    using type = __m512i;
+    static constexpr bool enabled = true;
+    static constexpr int lanes = 16;
+
+    static type zero() { return _mm512_setzero_si512(); }
+    static type set1(std::int32_t x) { return _mm512_set1_epi32(x); }
+    static type load(const std::int32_t* p) { return _mm512_load_si512(p); }
+    static type loadu(const std::int32_t* p) { return _mm512_loadu_si512(p); }
+    static void storeu(std::int32_t* p, type v) { _mm512_storeu_si512(p, v); }
+    static type add(type x, type y) { return _mm512_add_epi32(x, y); }
+    static type mul(type x, type y) { return _mm512_mullo_epi32(x, y); }
+    // acc + x * y
+    static type madd(type acc, type x, type y) { return add(acc, mul(x, y)); }
+};
+
+#if defined(__AVX512DQ__)
+template <> struct vec<std::int64_t> {
+    using type = __m512i;
+    static constexpr bool enabled = true;
+    static constexpr int lanes = 8;
+
+    static type zero() { return _mm512_setzero_si512(); }
+    static type set1(std::int64_t x) { return _mm512_set1_epi64(x); }
+    static type load(const std::int64_t* p) { return _mm512_load_si512(p); }
+    static type loadu(const std::int64_t* p) { return _mm512_loadu_si512(p); }
+    static void storeu(std::int64_t* p, type v) { _mm512_storeu_si512(p, v); }
+    static type add(type x, type y) { return _mm512_add_epi64(x, y); }
+    static type mul(type x, type y) { return _mm512_mullo_epi64(x, y); }
+    static type madd(type acc, type x, type y) { return add(acc, mul(x, y)); }
+};
+#endif
+
+template <> struct vec<float> {
+    using type = __m512;
+    static constexpr bool enabled = true;
+    static constexpr int lanes = 16;
+
+    static type zero() { return _mm512_setzero_ps(); }
+    static type set1(float x) { return _mm512_set1_ps(x); }
+    static type load(const float* p) { return _mm512_load_ps(p); }
+    static type loadu(const float* p) { return _mm512_loadu_ps(p); }
+    static void storeu(float* p, type v) { _mm512_storeu_ps(p, v); }
+    static type add(type x, type y) { return _mm512_add_ps(x, y); }
+    static type mul(type x, type y) { return _mm512_mul_ps(x, y); }
+    static type madd(type acc, type x, type y) { return _mm512_fmadd_ps(x, y, acc); }
+};
+
+template <> struct vec<double> {
+    using type = __m512d;
+    static constexpr bool enabled = true;
+    static constexpr int lanes = 8;
+
+    static type zero() { return _mm512_setzero_pd(); }
+    static type set1(double x) { return _mm512_set1_pd(x); }
+    static type load(const double* p) { return _mm512_load_pd(p); }
+    static type loadu(const double* p) { return _mm512_loadu_pd(p); }
+    static void storeu(double* p, type v) { _mm512_storeu_pd(p, v); }
+    static type add(type x, type y) { return _mm512_add_pd(x, y); }
+    static type mul(type x, type y) { return _mm512_mul_pd(x, y); }
+    static type madd(type acc, type x, type y) { return _mm512_fmadd_pd(x, y, acc); }
+};
+
+#elif defined(__AVX2__)
+
+// AVX2 没有 64 位整数乘法, int64 使用标量实现
+template <> struct vec<std::int32_t> {
+    using type = __m256i;
+    static constexpr bool enabled = true;
+    static constexpr int lanes = 8;
+
+    static type zero() { return _mm256_setzero_si256(); }
+    static type set1(std::int32_t x) { return _mm256_set1_epi32(x); }
+    static type load(const std::int32_t* p) {
+        return _mm256_load_si256(reinterpret_cast<const __m256i*>(p));
+    }
+    static type loadu(const std::int32_t* p) {
+        return _mm256_loadu_si256(reinterpret_cast<const __m256i*>(p));
+    }
+    static void storeu(std::int32_t* p, type v) {
+        _mm256_storeu_si256(reinterpret_cast<__m256i*>(p), v);
+    }
+    static type add(type x, type y) { return _mm256_add_epi32(x, y); }
+    static type mul(type x, type y) { return _mm256_mullo_epi32(x, y); }
+    static type madd(type acc, type x, type y) { return add(acc, mul(x, y)); }
+};
+
+template <> struct vec<float> {
+    using type = __m256;
+    static constexpr bool enabled = true;
+    static constexpr int lanes = 8;
+
+    static type zero() { return _mm256_setzero_ps(); }
+    static type set1(float x) { return _mm256_set1_ps(x); }
+    static type load(const float* p) { return _mm256_load_ps(p); }
+    static type loadu(const float* p) { return _mm256_loadu_ps(p); }
+    static void storeu(float* p, type v) { _mm256_storeu_ps(p, v); }
+    static type add(type x, type y) { return _mm256_add_ps(x, y); }
+    static type mul(type x, type y) { return _mm256_mul_ps(x, y); }
+#if defined(__FMA__)
+    static type madd(type acc, type x, type y) { return _mm256_fmadd_ps(x, y, acc); }
+#else
+    static type madd(type acc, type x, type y) { return add(acc, mul(x, y)); }
+#endif
+};
+
+template <> struct vec<double> {
+    using type = __m256d;
+    static constexpr bool enabled = true;
+    static constexpr int lanes = 4;
+
+    static type zero() { return _mm256_setzero_pd(); }
+    static type set1(double x) { return _mm256_set1_pd(x); }
+    static type load(const double* p) { return _mm256_load_pd(p); }
+    static type loadu(const double* p) { return _mm256_loadu_pd(p); }
+    static void storeu(double* p, type v) { _mm256_storeu_pd(p, v); }
+    static type add(type x, type y) { return _mm256_add_pd(x, y); }
+    static type mul(type x, type y) { return _mm256_mul_pd(x, y); }
+#if defined(__FMA__)
+    static type madd(type acc, type x, type y) { return _mm256_fmadd_pd(x, y, acc); }
+#else
+    static type madd(type acc, type x, type y) { return add(acc, mul(x, y)); }
+#endif
+};
+
+#endif
+
+}  // namespace MATMUL_ISA
+
+}  // namespace kernel
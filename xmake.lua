@@ -41,6 +41,7 @@ target("matmul")
     set_extension(".so")
     set_languages("c99", "c++17")
     add_files("src/*.cpp")
+    add_headerfiles("src/libmatmul.h")
     add_packages("pybind11")
     add_packages("python")
     add_cxxflags("-fopenmp")
@@ -55,6 +56,17 @@ target("matmul")
         add_asflags("-march=native+sme", {force = true})
         add_defines("FORCE_SME_SUPPORT")
         print("SME support enabled (forced)")
+    elseif is_arch("x86_64", "x64") then
+        -- 基础代码按通用 x86-64 编译, 以便同一个库可在不同机器上运行;
+        -- 各指令集版本的内核单独编译, 导入时根据 cpuid 选择 (见 src/dispatch.cpp)
+        add_cxflags("-march=x86-64", "-mtune=generic")
+        add_defines("MATMUL_DISPATCH_X86")
+        add_files("src/dispatch/sse4.cpp", {cxflags = {"-msse4.2", "-mpopcnt"}})
+        add_files("src/dispatch/avx2.cpp", {cxflags = {"-mavx2", "-mfma"}})
+        add_files("src/dispatch/avx_vnni.cpp", {cxflags = {"-mavx2", "-mfma", "-mavxvnni"}})
+        add_files("src/dispatch/avx512.cpp", {cxflags = {"-mavx512f", "-mavx512bw", "-mavx512dq", "-mavx512vl", "-mavx2", "-mfma"}})
+        add_files("src/dispatch/avx512_vnni.cpp", {cxflags = {"-mavx512f", "-mavx512bw", "-mavx512dq", "-mavx512vl", "-mavx512vnni", "-mavx2", "-mfma"}})
+        print("Using runtime ISA dispatch (sse4/avx2/avx_vnni/avx512/avx512_vnni)")
     else
         -- 使用 native 优化
         add_cxflags("-march=native")